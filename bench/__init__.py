@@ -0,0 +1,89 @@
+"""
+Performance benchmarks
+
+Run individual benchmarks as modules from the project root, e.g.
+
+    python -m bench.scheduler --help
+"""
+
+from typing import List, Dict
+import json
+
+
+def percentile(values: List[float], p: float) -> float:
+    """
+    Percentile (linear interpolation between closest ranks)
+    :param values: Sorted values
+    :param p: Percentile [%]
+    :return: Percentile value or None if there are no values
+    """
+    if not values:
+        return None
+
+    rank = (len(values) - 1) * p / 100.0
+    lo = int(rank)
+    hi = min(lo + 1, len(values) - 1)
+
+    return values[lo] + (values[hi] - values[lo]) * (rank - lo)
+
+
+def distribution(values: List[float]) -> Dict[str, float]:
+    """
+    Values distribution summary
+    :param values: Values
+    :return: Count, mean, min, max and percentiles
+    """
+    values = sorted(values)
+    count = len(values)
+
+    return {
+        "count" : count,
+        "mean" : sum(values) / count if count else None,
+        "min" : values[0] if count else None,
+        "p50" : percentile(values, 50),
+        "p90" : percentile(values, 90),
+        "p99" : percentile(values, 99),
+        "p99.9" : percentile(values, 99.9),
+        "max" : values[-1] if count else None,
+    }
+
+
+def histogram(values: List[float], bounds: List[float]) -> Dict[str, int]:
+    """
+    Values histogram
+    :param values: Values
+    :param bounds: Bucket upper bounds (ascending)
+    :return: Bucket counts (the last bucket is unbounded)
+    """
+    buckets = [0] * (len(bounds) + 1)
+    for value in values:
+        for i, bound in enumerate(bounds):
+            if value <= bound:
+                buckets[i] += 1
+                break
+        else:
+            buckets[-1] += 1
+
+    labels = [f"<={bound}" for bound in bounds] + [f">{bounds[-1]}"]
+    return dict(zip(labels, buckets))
+
+
+def print_report(report: Dict, as_json: bool = False, indent: int = 0) -> None:
+    """
+    Print report
+    :param report: Report
+    :param as_json: Print as JSON (otherwise in human readable form)
+    :param indent: Indentation
+    """
+    if as_json:
+        print(json.dumps(report, indent=4, default=str))
+        return
+
+    for key, value in report.items():
+        if isinstance(value, dict):
+            print(" " * indent + f"{key}:")
+            print_report(value, False, indent + 4)
+        elif isinstance(value, float):
+            print(" " * indent + f"{key}: {value:.3f}")
+        else:
+            print(" " * indent + f"{key}: {value}")
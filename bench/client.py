@@ -0,0 +1,145 @@
+"""
+Downstream decoder benchmark
+
+Decodes a synthetic downstream response (telemetry-like sample chunks,
+as produced by Backend.downstream) fed in reads of the given sizes by
+* the incremental decoder (wipi.client.StreamDecoder),
+* re-parsing the received data with json.JSONDecoder.raw_decode at every
+  read (the naive incremental approach; only if the chunks are small),
+* json.loads of the whole response (the lower bound, not incremental).
+
+Reports decoding throughput (MB/s and chunks/s) per method and read size.
+
+Usage:
+    python -m bench.client [OPTIONS]
+"""
+
+from typing import List, Dict
+import argparse
+import json
+import logging
+import sys
+from time import perf_counter
+
+# wipi.controller loads controllers from configuration given by the first
+# command line argument (uWSGI pyargv); hide the benchmark options from it
+_argv, sys.argv = sys.argv, sys.argv[:1]
+from wipi.client import StreamDecoder
+sys.argv = _argv
+
+from . import print_report
+
+
+def response(chunks: int) -> bytes:
+    """
+    Synthetic downstream response
+    :param chunks: Number of chunks
+    :return: Response body
+    """
+    return ("[" + ", ".join(json.dumps({
+        "timestamp" : 1600000000.0 + i * 0.005,
+        "accel_data" : {"x": 0.01 * i, "y": -0.02 * i, "z": 0.981},
+        "gyro_data" : {"x": 1.5, "y": -0.5, "z": 0.25},
+        "label" : f"sample \"{i}\"",
+    }) for i in range(chunks)) + "]").encode()
+
+
+def incremental(data: bytes, read: int) -> int:
+    """
+    :param data: Response body
+    :param read: Read size [B]
+    :return: Number of decoded chunks
+    """
+    decoder = StreamDecoder()
+    count = 0
+    for pos in range(0, len(data), read):
+        count += len(decoder.feed(data[pos:pos + read]))
+
+    return count
+
+
+def naive(data: bytes, read: int) -> int:
+    """
+    :param data: Response body
+    :param read: Read size [B]
+    :return: Number of decoded chunks
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    count = 0
+    for pos in range(0, len(data), read):
+        buffer += data[pos:pos + read].decode()
+        while True:
+            start = len(buffer) - len(buffer.lstrip(" ,[]"))
+            try:
+                _, end = decoder.raw_decode(buffer, start)
+            except json.JSONDecodeError:
+                break
+
+            count += 1
+            buffer = buffer[end:]
+
+    return count
+
+
+def measure(method, data: bytes, read: int, chunks: int) -> Dict:
+    """
+    :param method: Decoding method
+    :param data: Response body
+    :param read: Read size [B]
+    :param chunks: Number of chunks
+    :return: Throughput
+    """
+    t0 = perf_counter()
+    decoded = method(data, read)
+    duration = perf_counter() - t0
+    assert decoded == chunks, f"{decoded} chunks decoded, {chunks} expected"
+
+    return {
+        "MB_per_s" : len(data) / duration / 1e6,
+        "chunks_per_s" : chunks / duration,
+    }
+
+
+def run(args: argparse.Namespace) -> Dict:
+    """
+    Run benchmark
+    :param args: Command line arguments
+    :return: Report
+    """
+    data = response(args.chunks)
+    report: Dict = {"response_kB" : len(data) / 1024}
+    for read in args.reads:
+        report[f"read_{read}B"] = {
+            "incremental" : measure(incremental, data, read, args.chunks),
+            "naive" : measure(naive, data, read, args.chunks),
+        }
+
+    t0 = perf_counter()
+    json.loads(data)
+    report["whole_json_loads_MB_per_s"] = len(data) / (perf_counter() - t0) / 1e6
+
+    report["parameters"] = vars(args)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Downstream decoder benchmark")
+    parser.add_argument("--chunks", type=int, default=20000,
+        help="number of chunks in the response (default: %(default)s)")
+    parser.add_argument("--reads", type=int, nargs="+", default=[64, 1500, 65536],
+        help="read sizes [B] (default: %(default)s)")
+    parser.add_argument("--log-level", default=None,
+        help="logging level (default: as configured)")
+    parser.add_argument("--json", action="store_true",
+        help="print report as JSON")
+    args = parser.parse_args()
+
+    if args.log_level is not None:
+        logging.getLogger().setLevel(args.log_level.upper())
+
+    print_report(run(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Exporter throughput and delivery latency benchmark
+
+Starts a local stand-in listener (UDP, TCP or Unix socket) which parses
+the received lines and feeds the exporter with synthetic sample blocks
+(1 kHz by default) and occasional state changes.
+
+Reports
+* samples exported, dropped and failed to send,
+* lines received by the listener,
+* delivery latency (receive time minus sample timestamp) distribution,
+* exporter append call latency distribution.
+
+Usage:
+    python -m bench.exporter [OPTIONS]
+"""
+
+from typing import List, Dict
+import argparse
+import logging
+import os
+import socket
+import sys
+import tempfile
+from threading import Thread
+from time import perf_counter, time
+
+import numpy as np
+
+# wipi.controller loads controllers from configuration given by the first
+# command line argument (uWSGI pyargv); hide the benchmark options from it
+_argv, sys.argv = sys.argv, sys.argv[:1]
+from wipi.controller.sampler import Sampler
+from wipi.controller.exporter import Exporter
+sys.argv = _argv
+
+from . import distribution, print_report
+
+
+_channels = [f"{group}.{axis}" for group in ("accel_data", "gyro_data") for axis in "xyz"]
+
+
+class Listener:
+    """
+    Stand-in time-series database listener
+    """
+
+    def __init__(self, transport: str, format: str, directory: str):
+        """
+        :param transport: "udp", "tcp", "unix" or "unixgram"
+        :param format: Export format (for timestamp parsing)
+        :param directory: Directory for Unix socket
+        """
+        family = socket.AF_UNIX if transport.startswith("unix") else socket.AF_INET
+        kind = socket.SOCK_STREAM if transport in ("tcp", "unix") else socket.SOCK_DGRAM
+
+        self._socket = socket.socket(family, kind)
+        if family == socket.AF_UNIX:
+            path = os.path.join(directory, "listener.sock")
+            self._socket.bind(path)
+            self.address = f"{transport}://{path}"
+        else:
+            self._socket.bind(("127.0.0.1", 0))
+            self.address = f"{transport}://127.0.0.1:{self._socket.getsockname()[1]}"
+
+        if kind == socket.SOCK_STREAM:
+            self._socket.listen(1)
+
+        self._stream = kind == socket.SOCK_STREAM
+        self._ts_scale = 1e-9 if format == "influx" else 1e-3
+        self.lines = 0
+        self.connections = 0
+        self.latencies: List[float] = []
+        self._thread = Thread(target=self._routine, daemon=True)
+
+    def _receive(self, data: bytes) -> None:
+        now = time()
+        for line in data.split(b"\n"):
+            if line:
+                self.lines += 1
+                ts = float(line.rsplit(b" ", 1)[1]) * self._ts_scale
+                self.latencies.append((now - ts) * 1e3)
+
+    def _routine(self) -> None:
+        if not self._stream:
+            while True:
+                self._receive(self._socket.recv(65536))
+
+        while True:
+            connection, _ = self._socket.accept()
+            self.connections += 1
+            with connection:
+                rest = b""
+                while True:
+                    data = connection.recv(65536)
+                    if not data:
+                        break
+                    lines, _, rest = (rest + data).rpartition(b"\n")
+                    self._receive(lines)
+
+    def start(self) -> "Listener":
+        self._thread.start()
+        return self
+
+
+def run(args: argparse.Namespace) -> Dict:
+    """
+    Run benchmark
+    :param args: Command line arguments
+    :return: Report
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        listener = Listener(args.transport, args.format, directory).start()
+        exporter = Exporter("bench", _channels, listener.address,
+            format=args.format, batch=args.batch, flush=args.flush, buffer=args.buffer)
+
+        sampler = Sampler(args.block / args.rate, args.duration)
+        values = np.random.default_rng(args.seed).normal(size=(args.block, len(_channels)))
+        offsets = np.arange(args.block) / args.rate
+        latencies: List[float] = []
+
+        for n, tick in enumerate(sampler):
+            t0 = perf_counter()
+            exporter.append(tick - offsets[::-1], values)
+            if n % 100 == 0:
+                exporter.state({"relay1": "open" if n % 200 else "closed", "n": n})
+            latencies.append((perf_counter() - t0) * 1e6)
+
+        exporter.close()
+        sent = perf_counter()
+        while listener.lines < exporter.sent_lines and perf_counter() - sent < 1.0:
+            pass  # let the listener receive the rest
+
+        return {
+            "exporter" : exporter.stats(),
+            "listener" : {
+                "lines" : listener.lines,
+                "connections" : listener.connections,
+                "delivery_latency_ms" : distribution(listener.latencies),
+            },
+            "append_us" : distribution(latencies),
+            "parameters" : vars(args),
+        }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Exporter throughput and delivery latency benchmark")
+    parser.add_argument("--transport", default="udp",
+        choices=["udp", "tcp", "unix", "unixgram"],
+        help="transport (default: %(default)s)")
+    parser.add_argument("--format", default="influx",
+        choices=["influx", "prometheus"],
+        help="export format (default: %(default)s)")
+    parser.add_argument("--rate", type=float, default=1000.0,
+        help="sample rate [Hz] (default: %(default)s)")
+    parser.add_argument("--block", type=int, default=50,
+        help="samples per block (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=10.0,
+        help="duration [s] (default: %(default)s)")
+    parser.add_argument("--batch", type=int, default=1000,
+        help="exporter batch size [samples] (default: %(default)s)")
+    parser.add_argument("--flush", type=float, default=1.0,
+        help="exporter flush interval [s] (default: %(default)s)")
+    parser.add_argument("--buffer", type=int, default=100000,
+        help="exporter buffer size limit [samples] (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+        help="random generator seed (default: %(default)s)")
+    parser.add_argument("--log-level", default=None,
+        help="logging level (default: as configured)")
+    parser.add_argument("--json", action="store_true",
+        help="print report as JSON")
+    args = parser.parse_args()
+
+    if args.log_level is not None:
+        logging.getLogger().setLevel(args.log_level.upper())
+
+    print_report(run(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
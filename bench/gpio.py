@@ -0,0 +1,176 @@
+"""
+GPIO backends multi-channel output benchmark
+
+Switches a set of output channels between two patterns (all channels change
+in each transition, half of them go high and half low unless --uniform is
+given) using the memory mapped backend (wipi.controller.gpiomem) and
+the RPi.GPIO module (if available, i.e. on the Pi) or its simulator.
+Off-Pi, the memory mapped backend works on a file-backed fake register map.
+Then does the same with RelayBoard.set_state (all 3 relays toggled).
+
+Reports (per backend)
+* transition (output call) duration distribution,
+* register writes duration distribution (memory mapped backend, set & clear
+  masks precomputed),
+* writes per transition: register writes (memory mapped backend) or channel
+  writes (simulator; RPi.GPIO writes the channels one by one, so the transition
+  duration is also the skew between the first and the last channel switch),
+* RelayBoard.set_state duration distribution.
+
+Usage:
+    python -m bench.gpio [OPTIONS]
+"""
+
+from typing import List, Dict
+import argparse
+import logging
+import os
+import sys
+import tempfile
+from time import perf_counter
+
+# wipi.controller loads controllers from configuration given by the first
+# command line argument (uWSGI pyargv); hide the benchmark options from it
+_argv, sys.argv = sys.argv, sys.argv[:1]
+from wipi.controller.relay_board import gpio, RelayBoard
+sys.argv = _argv
+
+from . import distribution, print_report
+
+
+def transitions(gpio_if, channels: List[int], count: int, uniform: bool) -> Dict:
+    """
+    Measure multi-channel transitions
+    :param gpio_if: GPIO interface
+    :param channels: Output channels
+    :param count: Number of transitions
+    :param uniform: All channels go the same direction
+    :return: Transition duration distribution [us] and writes per transition
+             (if counted by the backend)
+    """
+    gpio_if.setwarnings(False)
+    gpio_if.setmode(gpio_if.BCM)
+    gpio_if.setup(channels, gpio_if.OUT, initial=gpio_if.LOW)
+
+    if uniform:
+        patterns = [[1] * len(channels), [0] * len(channels)]
+    else:
+        pattern = [i % 2 for i in range(len(channels))]
+        patterns = [pattern, [1 - v for v in pattern]]
+
+    writes = getattr(gpio_if, "writes", None)
+    durations: List[float] = []
+    for i in range(count):
+        values = patterns[i % 2]
+        t0 = perf_counter()
+        gpio_if.output(channels, values)
+        durations.append((perf_counter() - t0) * 1e6)
+
+    for channel, value in zip(channels, patterns[(count - 1) % 2]):
+        assert gpio_if.input(channel) == value, f"Channel {channel} not set"
+
+    report = {"transition_us" : distribution(durations)}
+    if writes is not None:
+        report["writes_per_transition"] = (gpio_if.writes - writes) / count
+
+    if hasattr(gpio_if, "masks"):  # register writes only (masks precomputed)
+        masks = [gpio_if.masks(channels, values) for values in patterns]
+        durations = []
+        for i in range(count):
+            t0 = perf_counter()
+            gpio_if.write(*masks[i % 2])
+            durations.append((perf_counter() - t0) * 1e6)
+
+        report["register_write_us"] = distribution(durations)
+
+    gpio_if.cleanup()
+    return report
+
+
+def relay_board(backend: str, kwargs: Dict, count: int) -> Dict:
+    """
+    Measure RelayBoard.set_state toggling all relays
+    :param backend: GPIO backend
+    :param kwargs: GPIO backend parameters
+    :param count: Number of set_state calls
+    :return: set_state duration distribution [us]
+    """
+    board = RelayBoard("bench", backend=backend, **{backend: kwargs} if kwargs else {})
+    board.setup()
+    states = [
+        {"relay1": "closed", "relay2": "closed", "relay3": "closed"},
+        {"relay1": "open", "relay2": "open", "relay3": "open"},
+    ]
+
+    durations: List[float] = []
+    for i in range(count):
+        t0 = perf_counter()
+        board.set_state(states[i % 2])
+        durations.append((perf_counter() - t0) * 1e6)
+
+    board.shutdown()
+    del board
+    return distribution(durations)
+
+
+def run(args: argparse.Namespace) -> Dict:
+    """
+    Run benchmark
+    :param args: Command line arguments
+    :return: Report
+    """
+    channels = list(range(args.first_channel, args.first_channel + args.channels))
+    report: Dict = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = args.device
+        if path is None:
+            path = os.path.join(directory, "gpiomem")
+            open(path, "wb").close()
+
+        backends = {"gpiomem" : {"path" : path}}
+        try:
+            import RPi.GPIO  # noqa: F401
+            backends["RPi.GPIO"] = {}
+        except (ImportError, RuntimeError):
+            backends["simulator"] = {}  # models RPi.GPIO on RPi Zero
+
+        for backend, kwargs in backends.items():
+            report[backend] = transitions(
+                gpio(backend, **kwargs), channels, args.count, args.uniform)
+            report[backend]["relay_board_set_state_us"] = \
+                relay_board(backend, kwargs, args.count)
+
+        report["register_map"] = "device" if args.device else "file-backed fake"
+
+    report["parameters"] = vars(args)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="GPIO backends multi-channel output benchmark")
+    parser.add_argument("--channels", type=int, default=8,
+        help="number of output channels (default: %(default)s)")
+    parser.add_argument("--first-channel", type=int, default=16,
+        help="first BCM channel (default: %(default)s)")
+    parser.add_argument("--count", type=int, default=10000,
+        help="number of transitions (default: %(default)s)")
+    parser.add_argument("--uniform", action="store_true",
+        help="all channels go high, then all go low (single register write)")
+    parser.add_argument("--device", default=None,
+        help="GPIO memory device, e.g. /dev/gpiomem (default: file-backed fake)")
+    parser.add_argument("--log-level", default=None,
+        help="logging level (default: as configured)")
+    parser.add_argument("--json", action="store_true",
+        help="print report as JSON")
+    args = parser.parse_args()
+
+    if args.log_level is not None:
+        logging.getLogger().setLevel(args.log_level.upper())
+
+    print_report(run(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+"""
+Hot path logging overhead benchmark
+
+Runs the scheduler worker (executing a task every millisecond, each
+execution is logged) and a controller-like sampling loop (1 kHz, logging
+a record per tick, as a rule triggering at each sample would) with
+* logging off (hot path records below the level),
+* synchronous logging (to a file),
+* non-blocking logging (queue and background writer, see wipi.log),
+* non-blocking, rate limited logging.
+The log file writes may be delayed, to model a slow sink (e.g. the journal
+on an SD card).
+
+Reports per mode
+* scheduler task execution lateness and jitter,
+* sampling lateness and jitter and the logging call latency distribution.
+
+Usage:
+    python -m bench.log [OPTIONS]
+"""
+
+from typing import List, Dict
+import argparse
+import logging
+import os
+import sys
+import tempfile
+from datetime import datetime, timedelta
+from time import perf_counter, sleep
+
+# wipi.controller loads controllers from configuration given by the first
+# command line argument (uWSGI pyargv); hide the benchmark options from it
+_argv, sys.argv = sys.argv, sys.argv[:1]
+from wipi.controller.sampler import Sampler
+sys.argv = _argv
+
+from wipi.log import get_logger, fields, configure
+from wipi.scheduler import Scheduler
+
+from . import distribution, print_report
+
+
+log = get_logger("bench.log")
+
+
+class SlowFileHandler(logging.FileHandler):
+    """
+    File handler with delayed writes
+    """
+
+    def __init__(self, filename: str, delay: float):
+        """
+        :param filename: Log file
+        :param delay: Delay of each write [s]
+        """
+        super().__init__(filename)
+        self._delay = delay
+
+    def emit(self, record: logging.LogRecord) -> None:
+        super().emit(record)
+        if self._delay:
+            sleep(self._delay)
+
+
+def _noop() -> None:
+    """
+    Scheduled task action: do nothing (the execution is logged by the scheduler)
+    """
+
+
+class Benchmark:
+    """
+    Logging overhead benchmark
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        """
+        :param args: Command line arguments
+        """
+        self._args = args
+
+    def _scheduler(self) -> Dict:
+        """
+        Scheduler phase
+        :return: Report
+        """
+        args = self._args
+        scheduler = Scheduler().start()
+
+        start = datetime.now() + timedelta(seconds=0.5)  # the worker starts meanwhile
+        scheduler.schedule(Scheduler.Task(_noop, start).repeat(
+            int(args.duration * args.rate) - 1, 1.0 / args.rate))
+
+        sleep(max(0.0, (start - datetime.now()).total_seconds() + args.duration + 0.1))
+        timing = scheduler.timing()
+        scheduler.stop()
+
+        return {
+            "executed" : timing["executed"],
+            "lateness_us" : timing["lateness"] * 1e6,
+            "max_lateness_us" : timing["max_lateness"] * 1e6,
+            "jitter_us" : timing["jitter"] * 1e6,
+        }
+
+    def _controller(self) -> Dict:
+        """
+        Controller loop phase
+        :return: Report
+        """
+        args = self._args
+        sampler = Sampler(1.0 / args.rate, args.duration)
+        latencies: List[float] = []
+
+        for tick in sampler:
+            t0 = perf_counter()
+            log.info("sensor: Rule %s %s", "overload", "triggered", extra=fields(value=tick))
+            latencies.append((perf_counter() - t0) * 1e6)
+
+        stats = sampler.stats()
+        return {
+            "lateness_us" : stats["lateness"] * 1e6,
+            "max_lateness_us" : stats["max_lateness"] * 1e6,
+            "jitter_us" : stats["jitter"] * 1e6,
+            "overruns" : stats["overruns"],
+            "log_call_us" : distribution(latencies),
+        }
+
+    def run(self) -> Dict:
+        """
+        Run benchmark
+        :return: Report
+        """
+        args = self._args
+        root = logging.getLogger()
+
+        with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+            output = SlowFileHandler(os.path.join(directory, "log"), args.write_delay * 1e-3)
+            output.setFormatter(logging.Formatter(
+                "%(asctime)s %(process)d %(name)s %(levelname)s: %(message)s"))
+
+            report: Dict = {}
+            for mode, level, queue, rate in (
+                ("off", logging.WARNING, 0, 0.0),
+                ("sync", logging.INFO, 0, 0.0),
+                ("queue", logging.INFO, args.queue, 0.0),
+                ("queue_rate_limited", logging.INFO, args.queue, args.limit),
+            ):
+                configure(queue=queue, rate=rate, handlers=[output])
+                root.setLevel(level)
+                report[mode] = {
+                    "scheduler" : self._scheduler(),
+                    "controller" : self._controller(),
+                }
+
+            configure(handlers=[output])  # pending records are written
+            report["log_kB"] = os.path.getsize(os.path.join(directory, "log")) / 1024
+            output.close()
+
+        report["parameters"] = vars(args)
+        return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Hot path logging overhead benchmark")
+    parser.add_argument("--rate", type=float, default=1000.0,
+        help="task execution and sample rate [Hz] (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=3.0,
+        help="duration (per phase) [s] (default: %(default)s)")
+    parser.add_argument("--queue", type=int, default=10000,
+        help="log queue size [records] (default: %(default)s)")
+    parser.add_argument("--limit", type=float, default=10.0,
+        help="rate limit [records/s] per call site (default: %(default)s)")
+    parser.add_argument("--write-delay", type=float, default=0.1,
+        help="log file write delay [ms] (default: %(default)s)")
+    parser.add_argument("--directory", default=None,
+        help="directory for the log file (default: system temp. directory)")
+    parser.add_argument("--json", action="store_true",
+        help="print report as JSON")
+    args = parser.parse_args()
+
+    print_report(Benchmark(args).run(), args.json)
+
+
+if __name__ == "__main__":
+    main()
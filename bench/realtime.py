@@ -0,0 +1,193 @@
+"""
+Worker real-time settings benchmark
+
+Runs a sampling worker (a 1 kHz sampling loop, as the mpu6050 acquisition
+does) and the scheduler worker (executing a task every 10 ms) under
+competing CPU load (busy processes, as uWSGI workers and nginx under load),
+first with the default settings and then with the given real-time settings
+(see wipi.realtime).
+
+Reports per phase
+* sampling lateness, jitter and overruns,
+* scheduler task execution lateness and jitter,
+* the real-time settings the workers actually got (and failures).
+
+Usage:
+    python -m bench.realtime [OPTIONS]
+"""
+
+from typing import Dict, Optional
+import argparse
+import logging
+import os
+import sys
+from multiprocessing import Process, Pipe, Event
+from multiprocessing.connection import Connection
+from datetime import datetime, timedelta
+from time import sleep
+
+# wipi.controller loads controllers from configuration given by the first
+# command line argument (uWSGI pyargv); hide the benchmark options from it
+_argv, sys.argv = sys.argv, sys.argv[:1]
+from wipi.controller.sampler import Sampler
+sys.argv = _argv
+
+from wipi.realtime import Realtime
+from wipi.scheduler import Scheduler
+
+from . import print_report
+
+
+def _hog(stop: Event) -> None:
+    """
+    Load process: busy loop till stopped
+    :param stop: Stop event
+    """
+    while not stop.is_set():
+        sum(range(10000))
+
+
+def _noop() -> None:
+    """
+    Scheduled task action: do nothing (the scheduler measures the lateness)
+    """
+
+
+def _sampling_worker(realtime: Optional[Dict], args: argparse.Namespace, pipe_we: Connection) -> None:
+    """
+    Sampling worker routine
+    :param realtime: Real-time settings (or None)
+    :param args: Command line arguments
+    :param pipe_we: Report pipe writing end
+    """
+    errors = [] if realtime is None else Realtime("Sampler", realtime).apply()
+
+    sampler = Sampler(1.0 / args.rate, args.duration, spin=args.spin)
+    for _ in sampler:
+        pass
+
+    pipe_we.send((sampler.stats(), errors, Realtime.current(os.getpid())))
+
+
+class Benchmark:
+    """
+    Real-time settings benchmark
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        """
+        :param args: Command line arguments
+        """
+        self._args = args
+
+    def _phase(self, realtime: Optional[Dict]) -> Dict:
+        """
+        Run the sampling and scheduler workers (concurrently, under load)
+        :param realtime: Real-time settings (or None)
+        :return: Report
+        """
+        args = self._args
+
+        stop = Event()
+        hogs = [Process(target=_hog, args=(stop,)) for _ in range(args.load)]
+        for hog in hogs:
+            hog.start()
+
+        pipe_re, pipe_we = Pipe(duplex=False)
+        sampling = Process(target=_sampling_worker, args=(realtime, args, pipe_we))
+        scheduler = Scheduler(realtime=realtime).start()
+
+        # One task executed repeatedly (in the task interval)
+        start = datetime.now() + timedelta(seconds=0.5)  # the worker sets itself up meanwhile
+        scheduler.schedule(Scheduler.Task(_noop, start).repeat(
+            int(args.duration / args.interval) - 1, args.interval))
+
+        sampling.start()
+        stats, errors, current = pipe_re.recv()
+        sampling.join()
+
+        sleep(max(0.0, (start - datetime.now()).total_seconds() + args.duration + 0.1))
+        timing = scheduler.timing()
+        scheduler_rt = scheduler.realtime_status()
+        scheduler.stop()
+
+        stop.set()
+        for hog in hogs:
+            hog.join()
+
+        return {
+            "sampling" : {
+                "lateness_us" : stats["lateness"] * 1e6,
+                "max_lateness_us" : stats["max_lateness"] * 1e6,
+                "jitter_us" : stats["jitter"] * 1e6,
+                "overruns" : stats["overruns"],
+                "settings" : current,
+                "errors" : errors,
+            },
+            "scheduler" : {
+                "executed" : timing["executed"],
+                "lateness_us" : timing["lateness"] * 1e6,
+                "max_lateness_us" : timing["max_lateness"] * 1e6,
+                "jitter_us" : timing["jitter"] * 1e6,
+                "settings" : None if scheduler_rt is None else scheduler_rt["worker"],
+            },
+        }
+
+    def run(self) -> Dict:
+        """
+        Run benchmark
+        :return: Report
+        """
+        args = self._args
+
+        realtime = {
+            key : value
+            for key, value in (("cpus", args.cpus), ("nice", args.nice), ("fifo", args.fifo))
+            if value is not None}
+        if args.mlock:
+            realtime["mlock"] = True
+        if not realtime:
+            realtime = {"fifo": 50, "mlock": True}
+
+        report: Dict = {"default" : self._phase(None)}
+        report["realtime"] = self._phase(realtime)
+        report["realtime"]["config"] = realtime
+        report["parameters"] = vars(args)
+        return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Worker real-time settings benchmark")
+    parser.add_argument("--rate", type=float, default=1000.0,
+        help="sample rate [Hz] (default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=0.01,
+        help="scheduled task interval [s] (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=5.0,
+        help="duration (per phase) [s] (default: %(default)s)")
+    parser.add_argument("--spin", type=float, default=0.0,
+        help="sampler busy-wait before deadlines [s] (default: %(default)s)")
+    parser.add_argument("--load", type=int, default=os.cpu_count(),
+        help="number of busy load processes (default: %(default)s, the CPU count)")
+    parser.add_argument("--cpus", type=int, nargs="+", default=None,
+        help="CPU affinity of the workers")
+    parser.add_argument("--nice", type=int, default=None,
+        help="nice level of the workers")
+    parser.add_argument("--fifo", type=int, default=None,
+        help="SCHED_FIFO priority of the workers")
+    parser.add_argument("--mlock", action="store_true",
+        help="lock the workers memory "
+             "(if no real-time settings are given, --fifo 50 --mlock is used)")
+    parser.add_argument("--log-level", default=None,
+        help="logging level (default: as configured)")
+    parser.add_argument("--json", action="store_true",
+        help="print report as JSON")
+    args = parser.parse_args()
+
+    if args.log_level is not None:
+        logging.getLogger().setLevel(args.log_level.upper())
+
+    print_report(Benchmark(args).run(), args.json)
+
+
+if __name__ == "__main__":
+    main()
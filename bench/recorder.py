@@ -0,0 +1,156 @@
+"""
+Recorder write cost and range read benchmark
+
+Runs a sampling loop (1 kHz by default) appending synthetic samples
+to the recorder, the same way the acquisition thread does, and compares
+the sampling clock statistics with those of the same loop without recording.
+Then reads the recorded range back (full and decimated).
+
+Reports
+* append call latency distribution (incl. the batched writes),
+* sampling lateness, jitter and overruns with and without recording,
+* range read throughput.
+
+Usage:
+    python -m bench.recorder [OPTIONS]
+"""
+
+from typing import List, Dict
+import argparse
+import logging
+import sys
+import tempfile
+from time import perf_counter
+
+import numpy as np
+
+# wipi.controller loads controllers from configuration given by the first
+# command line argument (uWSGI pyargv); hide the benchmark options from it
+_argv, sys.argv = sys.argv, sys.argv[:1]
+from wipi.controller.sampler import Sampler, timestamp
+from wipi.controller.recorder import Recorder
+sys.argv = _argv
+
+from . import distribution, print_report
+
+
+_channels = [f"{group}.{axis}" for group in ("accel_data", "gyro_data") for axis in "xyz"]
+
+
+class Benchmark:
+    """
+    Recorder benchmark
+    """
+
+    def __init__(self, args: argparse.Namespace):
+        """
+        :param args: Command line arguments
+        """
+        self._args = args
+
+    def _sampling(self, recorder: Recorder = None) -> Dict:
+        """
+        Sampling loop phase
+        :param recorder: Recorder (or None to only sample)
+        :return: Report
+        """
+        args = self._args
+        sampler = Sampler(1.0 / args.rate, args.duration)
+        values = np.random.default_rng(args.seed).normal(size=(1, len(_channels)))
+        latencies: List[float] = []
+
+        for tick in sampler:
+            if recorder is not None:
+                t0 = perf_counter()
+                recorder.append(np.array([tick]), values)
+                latencies.append((perf_counter() - t0) * 1e6)
+
+        stats = sampler.stats()
+        report = {
+            "lateness_us" : stats["lateness"] * 1e6,
+            "max_lateness_us" : stats["max_lateness"] * 1e6,
+            "jitter_us" : stats["jitter"] * 1e6,
+            "overruns" : stats["overruns"],
+        }
+        if recorder is not None:
+            recorder.close()
+            report["append_us"] = distribution(latencies)
+            report["recorder"] = recorder.stats()
+
+        return report
+
+    def _reads(self, recorder: Recorder, start: float) -> Dict:
+        """
+        Range reads phase
+        :param recorder: Recorder
+        :param start: Recording start timestamp
+        :return: Report
+        """
+        report = {}
+        for decimate in (1, 10, 100):
+            t0 = perf_counter()
+            _, blocks = recorder.query({"from": start, "decimate": decimate})
+            samples = sum(len(times) for times, _ in blocks)
+            elapsed = perf_counter() - t0
+
+            report[f"decimate_{decimate}"] = {
+                "samples" : samples,
+                "samples_per_s" : samples / elapsed if elapsed > 0.0 else None,
+            }
+
+        return report
+
+    def run(self) -> Dict:
+        """
+        Run benchmark
+        :return: Report
+        """
+        args = self._args
+
+        with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+            recorder = Recorder(_channels, directory,
+                segment_size=args.segment_size, batch=args.batch, flush=args.flush,
+                fsync=args.fsync)
+
+            report = {"baseline" : self._sampling()}
+            start = timestamp()
+            report["recording"] = self._sampling(recorder)
+            report["reads"] = self._reads(recorder, start)
+
+        report["parameters"] = vars(args)
+        return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Recorder write cost and range read benchmark")
+    parser.add_argument("--rate", type=float, default=1000.0,
+        help="sample rate [Hz] (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=10.0,
+        help="sampling duration (per phase) [s] (default: %(default)s)")
+    parser.add_argument("--directory", default=None,
+        help="directory for the recording (default: system temp. directory)")
+    parser.add_argument("--segment-size", type=int, default=1 << 20,
+        help="segment size [B] (default: %(default)s)")
+    parser.add_argument("--batch", type=int, default=4096,
+        help="write buffer size [samples] (default: %(default)s)")
+    parser.add_argument("--flush", type=float, default=5.0,
+        help="write buffer flush interval [s] (default: %(default)s)")
+    parser.add_argument("--fsync", action="store_true",
+        help="sync segments after each write")
+    parser.add_argument("--seed", type=int, default=0,
+        help="random generator seed (default: %(default)s)")
+    parser.add_argument("--log-level", default=None,
+        help="logging level (default: as configured)")
+    parser.add_argument("--json", action="store_true",
+        help="print report as JSON")
+    args = parser.parse_args()
+
+    if args.log_level is not None:
+        logging.getLogger().setLevel(args.log_level.upper())
+
+    print_report(Benchmark(args).run(), args.json)
+
+
+if __name__ == "__main__":
+    main()
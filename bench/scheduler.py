@@ -0,0 +1,347 @@
+"""
+Scheduler timing accuracy benchmark
+
+Schedules a mix of one-shot, repeated and "forever" tasks (optionally under
+concurrent API load, i.e. other processes scheduling tasks and listing them)
+and records the actual task execution times.
+
+Reports
+* task execution lateness (actual vs. intended execution time) distribution,
+* schedule operations throughput,
+* task listing latency and
+* scheduler worker memory per pending task.
+
+Usage:
+    python -m bench.scheduler [OPTIONS]
+"""
+
+from typing import List, Dict, Tuple, Iterator
+import argparse
+import logging
+import pickle
+from random import Random
+from threading import Thread, Event
+from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from datetime import datetime, timedelta
+from functools import partial
+from time import perf_counter, sleep
+
+from wipi.scheduler import Scheduler
+from wipi.util import rss
+
+from . import distribution, histogram, print_report
+
+
+# Lateness histogram bucket bounds [ms]
+_lateness_buckets = [0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 500.0]
+
+
+def _fire(tid: int, probe: Connection) -> None:
+    """
+    Benchmark task action: report execution time
+    :param tid: Task ID
+    :param probe: Probe pipe writing end
+    """
+    probe.send((tid, datetime.now()))
+
+
+def _noop(probe: Connection) -> None:
+    """
+    Load task action: do nothing
+    """
+
+
+class Probe:
+    """
+    Task executions collector
+    """
+
+    def __init__(self):
+        self._pipe_re, self.pipe_we = Pipe(duplex=False)
+        self.fires: Dict[int, List[datetime]] = {}
+        self._thread = Thread(target=self._collect)
+
+    def _collect(self) -> None:
+        while True:
+            fire = self._pipe_re.recv()
+            if fire is None:
+                break
+
+            tid, at = fire
+            self.fires.setdefault(tid, []).append(at)
+
+    def start(self) -> "Probe":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.pipe_we.send(None)
+        self._thread.join()
+
+
+class Load:
+    """
+    Concurrent API load generator
+    Each thread alternates between scheduling (far future) tasks
+    and listing scheduled tasks, as API workers would.
+    """
+
+    def __init__(self, scheduler: Scheduler, rate: float, threads: int, list_ratio: float):
+        """
+        :param scheduler: Scheduler
+        :param rate: Total operations rate [1/s]
+        :param threads: Number of load threads
+        :param list_ratio: Ratio of task listing operations
+        """
+        self._scheduler = scheduler
+        self._interval = threads / rate if rate > 0 else None
+        self._list_ratio = list_ratio
+        self._stop = Event()
+        self._threads = [
+            Thread(target=self._routine, args=(seed,)) for seed in range(threads)
+        ] if self._interval else []
+
+        self.ops = 0
+        self.list_latencies: List[float] = []  # [ms]
+
+    def _routine(self, seed: int) -> None:
+        rand = Random(seed)
+        pipe = Pipe(duplex=False)
+        far_future = datetime.now() + timedelta(days=1)
+
+        next_op = perf_counter()
+        while not self._stop.is_set():
+            if rand.random() < self._list_ratio:
+                start = perf_counter()
+                self._scheduler.tasks(pipe)
+                self.list_latencies.append((perf_counter() - start) * 1e3)
+            else:
+                self._scheduler.schedule(Scheduler.Task(_noop, far_future))
+            self.ops += 1
+
+            next_op += self._interval
+            sleep(max(0.0, next_op - perf_counter()))
+
+    def start(self) -> "Load":
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+
+def expected(task: Scheduler.Task, until: datetime) -> Iterator[datetime]:
+    """
+    Intended execution times of a task
+    :param task: Task (before it's scheduled)
+    :param until: Time limit
+    :return: Intended execution times (up to the limit)
+    """
+    for at in task.at:
+        if at > until:
+            return
+        yield at
+
+    if task.forever_interval is not None:
+        at = task.at[-1] + task.forever_interval
+        while at <= until:
+            yield at
+            at += task.forever_interval
+
+
+class Benchmark:
+    """
+    Scheduler benchmark
+    """
+
+    _kinds = ("oneshot", "repeated", "forever")
+
+    def __init__(self, args: argparse.Namespace):
+        """
+        :param args: Command line arguments
+        """
+        self._args = args
+        self._rand = Random(args.seed)
+
+    def _tasks(self, start: datetime) -> List[Tuple[str, Scheduler.Task]]:
+        """
+        Create benchmark tasks
+        :param start: Earliest execution time
+        :return: List of (task kind, task), task IDs are list indices
+        """
+        args = self._args
+        kinds = \
+            ["oneshot"] * args.oneshot + \
+            ["repeated"] * args.repeated + \
+            ["forever"] * args.forever
+
+        tasks = []
+        for tid, kind in enumerate(kinds):
+            at = start + timedelta(seconds=self._rand.uniform(0.0, args.span / 2))
+            task = Scheduler.Task(partial(_fire, tid), at)
+
+            if kind == "repeated":
+                task.repeat(args.times, args.interval)
+            elif kind == "forever":
+                task.repeat("forever", args.interval)
+
+            tasks.append((kind, task))
+
+        return tasks
+
+    def _timing(self, scheduler: Scheduler, probe: Probe) -> Dict:
+        """
+        Timing accuracy and throughput phase
+        :param scheduler: Scheduler
+        :param probe: Task executions collector
+        :return: Report
+        """
+        args = self._args
+        pipe = Pipe(duplex=False)
+
+        start = datetime.now() + timedelta(seconds=args.lead)
+        end = start + timedelta(seconds=args.span)
+        tasks = self._tasks(start)
+        intended = [list(expected(task, end)) for _, task in tasks]
+
+        # Schedule operations throughput (incl. the final round trip)
+        t0 = perf_counter()
+        for _, task in tasks:
+            scheduler.schedule(task)
+        scheduler.tasks(pipe)
+        schedule_time = perf_counter() - t0
+
+        if datetime.now() > start:
+            logging.warning("Scheduling took longer than lead time, "
+                "some tasks were scheduled late (increase --lead)")
+
+        sleep(max(0.0, (end - datetime.now()).total_seconds() + args.grace))
+
+        lateness: Dict[str, List[float]] = {kind: [] for kind in Benchmark._kinds}
+        missed: Dict[str, int] = {kind: 0 for kind in Benchmark._kinds}
+        for tid, (kind, _) in enumerate(tasks):
+            fires = probe.fires.get(tid, [])
+            for i, at in enumerate(intended[tid]):
+                if i < len(fires):
+                    lateness[kind].append((fires[i] - at).total_seconds() * 1e3)
+                else:
+                    missed[kind] += 1
+
+        overall = sum(lateness.values(), [])
+        return {
+            "schedule_ops_per_s" : len(tasks) / schedule_time,
+            "lateness_ms" : dict(
+                [(kind, distribution(lateness[kind])) for kind in Benchmark._kinds] +
+                [("all", distribution(overall))]),
+            "lateness_histogram_ms" : histogram(overall, _lateness_buckets),
+            "missed" : missed,
+        }
+
+    def _memory(self, scheduler: Scheduler) -> Dict:
+        """
+        Memory footprint phase
+        :param scheduler: Scheduler
+        :return: Report
+        """
+        args = self._args
+        pipe = Pipe(duplex=False)
+        far_future = datetime.now() + timedelta(days=1)
+
+        scheduler.tasks(pipe)  # make sure the worker is idle
+        rss_before = rss(scheduler._worker.pid)
+
+        task = Scheduler.Task(_noop, far_future)
+        for _ in range(args.pending):
+            scheduler.schedule(Scheduler.Task(_noop, far_future))
+
+        t0 = perf_counter()
+        scheduler.tasks(pipe)
+        list_latency = perf_counter() - t0
+
+        rss_after = rss(scheduler._worker.pid)
+
+        return {
+            "pending_tasks" : args.pending,
+            "bytes_per_pending_task" :
+                (rss_after - rss_before) / args.pending
+                if rss_before is not None and rss_after is not None else None,
+            "pickled_task_bytes" : len(pickle.dumps(task)),
+            "list_latency_ms" : list_latency * 1e3,
+        }
+
+    def run(self) -> Dict:
+        """
+        Run benchmark
+        :return: Report
+        """
+        args = self._args
+
+        probe = Probe().start()
+        scheduler = Scheduler(kwargs={"probe": probe.pipe_we}).start()
+        load = Load(scheduler, args.load, args.load_threads, args.load_list_ratio).start()
+
+        try:
+            report = self._timing(scheduler, probe)
+            load.stop()
+            report["load"] = {
+                "ops" : load.ops,
+                "list_latency_ms" : distribution(load.list_latencies),
+            }
+            report["memory"] = self._memory(scheduler)
+
+        finally:
+            load.stop()
+            scheduler.stop()
+            probe.stop()
+
+        report["parameters"] = vars(args)
+        return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Scheduler timing accuracy benchmark")
+    parser.add_argument("--oneshot", type=int, default=200,
+        help="number of one-shot tasks (default: %(default)s)")
+    parser.add_argument("--repeated", type=int, default=50,
+        help="number of repeated tasks (default: %(default)s)")
+    parser.add_argument("--times", type=int, default=5,
+        help="repetitions of repeated tasks (default: %(default)s)")
+    parser.add_argument("--forever", type=int, default=20,
+        help="number of forever repeated tasks (default: %(default)s)")
+    parser.add_argument("--interval", type=float, default=0.5,
+        help="repetition interval [s] (default: %(default)s)")
+    parser.add_argument("--span", type=float, default=10.0,
+        help="benchmark time span [s] (default: %(default)s)")
+    parser.add_argument("--lead", type=float, default=1.0,
+        help="time before the first execution [s] (default: %(default)s)")
+    parser.add_argument("--grace", type=float, default=0.5,
+        help="time allowed for late executions [s] (default: %(default)s)")
+    parser.add_argument("--load", type=float, default=0.0,
+        help="concurrent API operations rate [1/s] (default: %(default)s)")
+    parser.add_argument("--load-threads", type=int, default=4,
+        help="number of API load threads (default: %(default)s)")
+    parser.add_argument("--load-list-ratio", type=float, default=0.5,
+        help="ratio of task listing API operations (default: %(default)s)")
+    parser.add_argument("--pending", type=int, default=10000,
+        help="pending tasks for memory measurement (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0,
+        help="random generator seed (default: %(default)s)")
+    parser.add_argument("--log-level", default=None,
+        help="logging level (default: as configured)")
+    parser.add_argument("--json", action="store_true",
+        help="print report as JSON")
+    args = parser.parse_args()
+
+    if args.log_level is not None:
+        logging.getLogger().setLevel(args.log_level.upper())
+
+    print_report(Benchmark(args).run(), args.json)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+System telemetry collector cost benchmark
+
+Measures the cost of a telemetry sample (snapshot of all the sources
+and metrics computation, as done by System.blocks) and runs the sampling
+loop at the given rates, measuring the CPU time it takes.
+
+Reports
+* sources (channels) available on the machine,
+* sample (snapshot + metrics) duration distribution,
+* sampling loop CPU usage per rate (fraction of one CPU; process time
+  used by the loop over the wall time).
+
+Usage:
+    python -m bench.telemetry [OPTIONS]
+"""
+
+from typing import List, Dict
+import argparse
+import logging
+import sys
+from time import perf_counter, process_time
+
+# wipi.controller loads controllers from configuration given by the first
+# command line argument (uWSGI pyargv); hide the benchmark options from it
+_argv, sys.argv = sys.argv, sys.argv[:1]
+from wipi.controller.sampler import Sampler
+from wipi.controller.telemetry import Telemetry
+sys.argv = _argv
+
+from . import distribution, print_report
+
+
+def sample_cost(telemetry: Telemetry, count: int) -> Dict:
+    """
+    Measure telemetry sample cost
+    :param telemetry: Telemetry collector
+    :param count: Number of samples
+    :return: Sample duration distribution [us]
+    """
+    prev = telemetry.snapshot()
+    durations: List[float] = []
+    for _ in range(count):
+        t0 = perf_counter()
+        snapshot = telemetry.snapshot()
+        telemetry.metrics(snapshot, prev)
+        durations.append((perf_counter() - t0) * 1e6)
+        prev = snapshot
+
+    return distribution(durations)
+
+
+def cpu_usage(telemetry: Telemetry, rate: float, duration: float) -> float:
+    """
+    Measure sampling loop CPU usage
+    :param telemetry: Telemetry collector
+    :param rate: Sample rate [Hz]
+    :param duration: Measurement duration [s]
+    :return: CPU usage (fraction of one CPU)
+    """
+    prev = telemetry.snapshot()
+    t0, c0 = perf_counter(), process_time()
+    for _ in Sampler(interval=1.0 / rate, duration=duration):
+        snapshot = telemetry.snapshot()
+        telemetry.metrics(snapshot, prev)
+        prev = snapshot
+
+    return (process_time() - c0) / (perf_counter() - t0)
+
+
+def run(args: argparse.Namespace) -> Dict:
+    """
+    Run benchmark
+    :param args: Command line arguments
+    :return: Report
+    """
+    telemetry = Telemetry(interface=args.interface)
+    report: Dict = {
+        "channels" : ", ".join(telemetry.channels),
+        "sample_us" : sample_cost(telemetry, args.count),
+        "cpu_usage" : {
+            f"{rate:g}Hz" : cpu_usage(telemetry, rate, args.duration)
+            for rate in args.rates
+        },
+        "parameters" : vars(args),
+    }
+
+    telemetry.close()
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="System telemetry collector cost benchmark")
+    parser.add_argument("--interface", default="wlan0",
+        help="network interface (default: %(default)s)")
+    parser.add_argument("--count", type=int, default=10000,
+        help="number of samples measured (default: %(default)s)")
+    parser.add_argument("--rates", type=float, nargs="+", default=[1.0, 10.0],
+        help="sampling rates [Hz] (default: %(default)s)")
+    parser.add_argument("--duration", type=float, default=10.0,
+        help="sampling duration per rate [s] (default: %(default)s)")
+    parser.add_argument("--log-level", default=None,
+        help="logging level (default: as configured)")
+    parser.add_argument("--json", action="store_true",
+        help="print report as JSON")
+    args = parser.parse_args()
+
+    if args.log_level is not None:
+        logging.getLogger().setLevel(args.log_level.upper())
+
+    print_report(run(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
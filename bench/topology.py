@@ -0,0 +1,147 @@
+"""
+Worker process topology memory benchmark
+
+Forks controller-like workers from a parent which has loaded the controllers
+(given configuration) and either
+* has also imported the web stack (Flask etc., as much of it as is
+  installed) before forking, i.e. the original topology ("late"),
+* forks before importing the web stack, with the GC freeze done by Backend
+  ("lean"),
+* or the former with the GC freeze ("late_frozen"), to tell the effects apart.
+
+The workers run garbage collections (as the real ones eventually do; that
+touches all the tracked objects and copies their memory pages unless they're
+frozen) and idle. Each topology is measured in a fresh interpreter.
+
+Reports (per topology) the workers' memory usage (see wipi.util.memory):
+mean RSS, PSS and private size per worker and their totals.
+
+Usage:
+    python -m bench.topology [OPTIONS]
+"""
+
+from typing import List, Dict
+import argparse
+import gc
+import json
+import logging
+import subprocess
+import sys
+from importlib import import_module
+from multiprocessing import Process, Event
+from time import sleep
+
+# wipi.controller loads controllers from configuration given by the first
+# command line argument (uWSGI pyargv); hide the benchmark options from it
+_argv, sys.argv = sys.argv, sys.argv[:1]
+from wipi.controller import load_controllers
+from wipi.util import memory
+sys.argv = _argv
+
+from . import print_report
+
+
+_web_stack = ["flask", "flask_voluptuous", "voluptuous", "werkzeug", "jinja2"]
+
+
+def worker(stop: Event) -> None:
+    """
+    Worker routine: collect garbage and idle
+    :param stop: Stop event
+    """
+    while not stop.is_set():
+        gc.collect()
+        stop.wait(0.1)
+
+
+def child(args: argparse.Namespace) -> Dict:
+    """
+    Measure topology (in this interpreter)
+    :param args: Command line arguments
+    :return: Workers memory usage
+    """
+    with open(args.config) as config:
+        load_controllers(json.load(config))
+
+    imported: List[str] = []
+    if args.child != "lean":
+        for module in _web_stack:
+            try:
+                import_module(module)
+                imported.append(module)
+            except ImportError:
+                pass  # not installed
+
+    if args.child != "late":
+        gc.freeze()
+
+    stop = Event()
+    workers = [Process(target=worker, args=(stop,)) for _ in range(args.workers)]
+    for process in workers:
+        process.start()
+
+    sleep(args.settle)
+    usage = [memory(process.pid) for process in workers]
+
+    stop.set()
+    for process in workers:
+        process.join()
+
+    report: Dict = {"web_stack" : ", ".join(imported) or "-"}
+    for field in ("rss", "pss", "private"):
+        values = [u[field] for u in usage if u[field] is not None]
+        if values:
+            report[f"{field}_mean_kB"] = sum(values) / len(values) / 1024
+            report[f"{field}_total_kB"] = sum(values) / 1024
+
+    return report
+
+
+def run(args: argparse.Namespace) -> Dict:
+    """
+    Run benchmark (each topology in a subprocess)
+    :param args: Command line arguments
+    :return: Report
+    """
+    report: Dict = {}
+    for topology in ("late", "late_frozen", "lean"):
+        output = subprocess.run(
+            [sys.executable, "-m", "bench.topology", "--child", topology,
+                "--config", args.config, "--workers", str(args.workers),
+                "--settle", str(args.settle), "--log-level", "WARNING"],
+            check=True, capture_output=True, text=True).stdout
+        report[topology] = json.loads(output)
+
+    report["parameters"] = vars(args)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Worker process topology memory benchmark")
+    parser.add_argument("--config", default="etc/simulator.json",
+        help="controllers configuration (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=5,
+        help="number of workers (default: %(default)s)")
+    parser.add_argument("--settle", type=float, default=2.0,
+        help="time for the workers to settle before measurement [s] (default: %(default)s)")
+    parser.add_argument("--child", default=None, choices=("late", "late_frozen", "lean"),
+        help=argparse.SUPPRESS)
+    parser.add_argument("--log-level", default=None,
+        help="logging level (default: as configured)")
+    parser.add_argument("--json", action="store_true",
+        help="print report as JSON")
+    args = parser.parse_args()
+
+    if args.log_level is not None:
+        logging.getLogger().setLevel(args.log_level.upper())
+
+    if args.child is not None:
+        print(json.dumps(child(args)))
+        return
+
+    print_report(run(args), args.json)
+
+
+if __name__ == "__main__":
+    main()
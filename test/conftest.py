@@ -0,0 +1,12 @@
+import importlib.util
+import sys
+
+# wipi.controller loads controllers from configuration given by the first
+# command line argument (uWSGI pyargv); hide the pytest arguments from it
+_argv, sys.argv = sys.argv, sys.argv[:1]
+import wipi.controller
+sys.argv = _argv
+
+# wipi.api is the uWSGI application module (it creates the backend and
+# the web application on import); the tests use its modules only
+sys.modules["wipi.api"] = importlib.util.module_from_spec(importlib.util.find_spec("wipi.api"))
@@ -0,0 +1,89 @@
+from time import monotonic, sleep
+
+import numpy as np
+
+from wipi.controller import Controller
+from wipi.controller.acquisition import Acquisition, Sink
+
+
+class Source(Controller):
+    """
+    Sample blocks producer (fails after "fail_after" blocks if set)
+    """
+
+    def __init__(self, fail_after: int = None):
+        super().__init__("source")
+        self._fail_after = fail_after
+
+    def get_state(self):
+        return {}
+
+    def set_state(self, state):
+        return {}
+
+    def channels(self, query):
+        return ["value.x"]
+
+    def blocks(self, query, stop):
+        index = 0
+        while not stop.wait(0.01):
+            if index == self._fail_after:
+                raise OSError("Device is gone")
+
+            yield monotonic(), np.array([float(index)]), np.array([[float(index)]])
+            index += 1
+
+
+class Collector(Sink):
+    def __init__(self):
+        self.values = []
+        self.closed = False
+
+    def append(self, times, values):
+        self.values.extend(values[:, 0])
+
+    def close(self):
+        self.closed = True
+
+
+def test_sinks_and_subscription():
+    sink = Collector()
+    acquisition = Acquisition(Source(), {}, [sink]).start()
+    blocks = acquisition.subscribe().blocks(duration=0.1, timeout=0.05)
+
+    received = [values[0, 0] for _, _, values in blocks if len(values)]
+    acquisition.stop()
+
+    assert received == sorted(received)
+    assert len(received) >= 5
+    assert sink.values[:len(received)] == list(np.arange(received[0], received[0] + len(received)))
+    assert sink.closed
+    assert not acquisition._subscriptions  # unsubscribed
+
+
+def test_stop_ends_subscription():
+    acquisition = Acquisition(Source(), {}, []).start()
+    blocks = acquisition.subscribe().blocks(timeout=0.05)
+    next(blocks)
+
+    acquisition.stop()
+    assert not acquisition.running()
+    assert len(list(blocks)) <= 1
+
+
+def test_failure_ends_subscription():
+    acquisition = Acquisition(Source(fail_after=3), {}, []).start()
+    blocks = acquisition.subscribe().blocks(timeout=0.05)
+
+    # The subscriber isn't left waiting for ever
+    started = monotonic()
+    received = [values[0, 0] for _, _, values in blocks if len(values)]
+    assert received == [0.0, 1.0, 2.0]
+    assert monotonic() - started < 1.0
+    assert not acquisition.running()
+
+    # Restart (e.g. after settings change) resumes it
+    acquisition.restart()
+    sleep(0.02)
+    assert acquisition.running()
+    acquisition.stop()
@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+from wipi.controller.aggregate import Decimator, Aggregator, pipeline
+
+
+CHANNELS = ["accel_data.x", "accel_data.y", "accel_data.z"]
+RATE = 200.0
+
+
+def _samples(n: int, start: int = 0):
+    """
+    Sample block (x: sample index, y: 10 Hz sine, z: 60 Hz sine)
+    """
+    index = np.arange(start, start + n)
+    times = index / RATE
+    values = np.column_stack([
+        index.astype(float),
+        np.sin(2 * np.pi * 10.0 * times),
+        np.sin(2 * np.pi * 60.0 * times),
+    ])
+    return times, values
+
+
+def test_decimator_phase():
+    decimator = Decimator(CHANNELS, ["accel_data.z", "accel_data.x"], 3)
+    assert decimator.channels == ["accel_data.z", "accel_data.x"]
+
+    # Every 3rd sample is kept across block boundaries
+    kept = [decimator.push(*_samples(n, start))
+        for n, start in ((5, 0), (1, 5), (7, 6))]
+    times = np.concatenate([block[0] for block in kept])
+    values = np.concatenate([block[1] for block in kept])
+
+    assert (values[:, 1] == [0, 3, 6, 9, 12]).all()
+    assert (times == values[:, 1] / RATE).all()
+
+
+def test_decimator_invalid():
+    with pytest.raises(ValueError):
+        Decimator(CHANNELS, ["accel_data.w"])
+
+    with pytest.raises(ValueError):
+        Decimator(CHANNELS, factor=0)
+
+
+def test_aggregator_windows():
+    aggregator = Aggregator(CHANNELS, 4, ["mean", "min", "max", "peak"])
+
+    # Windows span blocks; the incomplete one is kept
+    chunks = [chunk for n, start in ((3, 0), (6, 3), (2, 9))
+        for chunk in aggregator.push(*_samples(n, start))]
+
+    assert len(chunks) == 2
+    assert [chunk["accel_data"]["x"] for chunk in chunks] == [
+        {"mean": 1.5, "min": 0.0, "max": 3.0, "peak": 3.0},
+        {"mean": 5.5, "min": 4.0, "max": 7.0, "peak": 7.0},
+    ]
+    assert chunks[1]["samples"] == 4
+    assert chunks[1]["duration"] == pytest.approx(3 / RATE)
+
+
+def test_aggregator_rms_bands():
+    aggregator = Aggregator(CHANNELS, 200, ["rms"], [[5, 20], [50, 70]])
+    chunk, = aggregator.push(*_samples(200))
+
+    # Sine power (mean square 0.5) is found in its band
+    y, z = chunk["accel_data"]["y"], chunk["accel_data"]["z"]
+    assert y["rms"] == pytest.approx(np.sqrt(0.5), rel=0.01)
+    assert y["bands"][0] == pytest.approx(0.5, rel=0.1)
+    assert y["bands"][1] < 0.01
+    assert z["bands"][1] == pytest.approx(0.5, rel=0.1)
+    assert z["bands"][0] < 0.01
+
+
+def test_aggregator_invalid():
+    with pytest.raises(ValueError):
+        Aggregator(CHANNELS, 10, ["median"])
+
+    with pytest.raises(ValueError):
+        Aggregator(CHANNELS, 0)
+
+    with pytest.raises(ValueError):
+        Aggregator(CHANNELS, 10, bands=[[50, 10]])
+
+
+def test_pipeline():
+    decimator, aggregator = pipeline(
+        {"axes": ["accel_data.x"], "decimate": 2, "window": 5, "functions": ["max"]}, CHANNELS)
+
+    times, values = decimator.push(*_samples(20))
+    chunks = list(aggregator.push(times, values))
+    assert [chunk["accel_data"]["x"]["max"] for chunk in chunks] == [8.0, 18.0]
+
+    assert pipeline({"decimate": 2}, CHANNELS)[1] is None
+
+    for spec in ([], {"axes": "accel_data.x"}, {"window": 5, "bands": [1, 2]}):
+        with pytest.raises(ValueError):
+            pipeline(spec, CHANNELS)
@@ -0,0 +1,97 @@
+from math import floor
+
+import pytest
+
+from wipi.api.align import Aligner, samples
+from wipi.controller.sampler import timestamp
+
+
+T0 = float(floor(timestamp())) - 100.0  # past tick (not due by delay)
+
+
+def _push(aligner: Aligner, name: str, ts, **values):
+    return list(aligner.push(name, dict(values, timestamp=ts)))
+
+
+def test_samples():
+    assert samples({"timestamp": T0, "x": {"y": 1}}) == [(T0, {"x.y": 1})]
+
+    # Per-sample values of a block only
+    assert samples({"timestamp": [T0, T0 + 1], "v": [1, 2], "unit": "C", "w": [1]}) == [
+        (T0, {"v": 1}), (T0 + 1, {"v": 2})]
+
+
+def test_hold():
+    aligner = Aligner(["a", "b"], 1.0, delay=3600.0)
+
+    # Ticks wait for all the streams (watermark)
+    assert _push(aligner, "a", T0, v=1) == []
+    assert _push(aligner, "b", T0 + 0.2, x={"y": 5}) == [
+        {"timestamp": T0, "a": {"v": 1}, "b": None}]
+
+    assert _push(aligner, "a", [T0 + 0.6, T0 + 1.4], v=[2, 3]) == []
+    assert _push(aligner, "b", T0 + 1.5, x={"y": 7}) == [
+        {"timestamp": T0 + 1, "a": {"v": 2}, "b": {"x": {"y": 5}}}]
+
+    # Stream b lags, then the streams end
+    assert _push(aligner, "a", T0 + 2.5, v=4) == []
+    assert list(aligner.flush(final=True)) == [
+        {"timestamp": T0 + 2, "a": {"v": 3}, "b": {"x": {"y": 7}}}]
+
+
+def test_interpolate():
+    aligner = Aligner(["a"], 0.5, method=Aligner.INTERPOLATE, delay=3600.0)
+    assert _push(aligner, "a", T0, v=0, on=True, state="off") == [
+        {"timestamp": T0, "a": {"v": 0, "on": True, "state": "off"}}]
+
+    # Non-numeric values are held
+    assert _push(aligner, "a", T0 + 1, v=4, on=False, state="on") == [
+        {"timestamp": T0 + 0.5, "a": {"v": 2.0, "on": True, "state": "off"}},
+        {"timestamp": T0 + 1, "a": {"v": 4, "on": False, "state": "on"}}]
+
+
+def test_tolerance():
+    aligner = Aligner(["a"], 1.0, tolerance=0.5, delay=3600.0)
+    _push(aligner, "a", T0, v=0)
+
+    records = _push(aligner, "a", T0 + 2.2, v=1)
+    assert [record["a"] for record in records] == [None, None]
+
+
+def test_delay():
+    aligner = Aligner(["a", "b"], 1.0, delay=1.0)
+
+    # Ticks older than delay are produced despite the lagging stream
+    records = _push(aligner, "a", T0, v=1)
+    assert len(records) >= 98
+    assert records[0] == {"timestamp": T0, "a": {"v": 1}, "b": None}
+    assert records[1] == {"timestamp": T0 + 1, "a": {"v": 1}, "b": None}
+    assert records[2]["a"] is None
+    assert records[-1]["timestamp"] <= timestamp() - 1.0
+
+
+def test_join():
+    aligner = Aligner(["a", "b"], 1.0, delay=3600.0)
+    chunks = [
+        {"name": "a", "data": {"timestamp": T0, "v": 1}},
+        None,
+        {"name": "b", "data": {"stats": {"dropped": 0}}},
+        {"name": "b", "data": {"timestamp": T0 + 0.5, "v": 2}},
+        {"name": "a", "data": {"timestamp": T0 + 1.5, "v": 3}},
+    ]
+
+    # Heartbeats, passed-through chunks and the final records
+    assert list(aligner.join(iter(chunks))) == [
+        None,
+        {"name": "b", "data": {"stats": {"dropped": 0}}},
+        {"timestamp": T0, "a": {"v": 1}, "b": None},
+        {"timestamp": T0 + 1, "a": {"v": 1}, "b": {"v": 2}},
+    ]
+
+
+def test_invalid():
+    with pytest.raises(ValueError):
+        Aligner(["a"], 1.0, method="nearest")
+
+    with pytest.raises(ValueError):
+        Aligner(["a"], 0.0)
@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+from wipi.client import StreamDecoder
+
+
+CHUNKS = [
+    {"s": "x\\\"]}{[é", "a": [1, {"b": []}], "n": -12.5e3},
+    "\\\"}]",
+    12,
+    3.25,
+    True,
+    [[["]"]]],
+    "é€",
+]
+
+STREAM = (" [ " + ",\n ".join(json.dumps(chunk, ensure_ascii=False) for chunk in CHUNKS)
+    + " ] ").encode()
+
+
+def _decode(reads):
+    decoder = StreamDecoder()
+    chunks = [chunk for data in reads for chunk in decoder.feed(data)]
+    assert decoder.finished
+    return [chunk for chunk in chunks if chunk is not None]
+
+
+def test_split_chunks():
+    # Chunks split anywhere (incl. escapes and multi-byte characters)
+    for i in range(len(STREAM) + 1):
+        assert _decode([STREAM[:i], STREAM[i:]]) == CHUNKS
+
+    assert _decode([STREAM[i:i + 1] for i in range(len(STREAM))]) == CHUNKS
+
+
+def test_heartbeats():
+    decoder = StreamDecoder()
+    assert decoder.feed(b"[") == []
+    assert decoder.feed(b" ") == [None]
+    assert decoder.feed(b'{"a": ') == []
+    assert decoder.feed(b" ") == []  # within chunk
+    assert decoder.feed(b'1}, 2') == [{"a": 1}]
+    assert decoder.feed(b"]") == [2]
+
+
+def test_invalid_stream():
+    for data in (b"{}", b"[{]", b'[{"a": tru}', b"[1] 2"):
+        with pytest.raises(ValueError):
+            StreamDecoder().feed(data)
+
+    decoder = StreamDecoder()
+    decoder.feed(b'[{"a": ')
+    with pytest.raises(ValueError):
+        decoder.feed(b"x}")
@@ -0,0 +1,149 @@
+import os
+import socket
+import tempfile
+
+import numpy as np
+import pytest
+
+from wipi.controller.exporter import Exporter, InfluxFormat, PrometheusFormat
+from wipi.controller.sampler import timestamp
+
+
+CHANNELS = ["accel_data.x", "accel_data.y"]
+
+
+def _block(n: int, t0: float = 100.0):
+    times = t0 + 0.001 * np.arange(n)
+    values = np.column_stack([np.arange(n, dtype=float), -np.arange(n, dtype=float)])
+    return times, values
+
+
+def test_influx_format():
+    fmt = InfluxFormat("wipi", {"controller": "acc", "site": "lab 1"})
+    lines = list(fmt.samples(np.array([1.5, 2.5]), np.array([[1.0, 2.0], [3.0, 4.0]]), CHANNELS))
+
+    assert lines == [
+        b"wipi,controller=acc,site=lab\\ 1 accel_data.x=1.0,accel_data.y=2.0 1500000000\n",
+        b"wipi,controller=acc,site=lab\\ 1 accel_data.x=3.0,accel_data.y=4.0 2500000000\n",
+    ]
+
+    state = list(fmt.state(3.0, {"relay1": "open", "on": True, "level": 2}))
+    assert state == [
+        b'wipi,controller=acc,site=lab\\ 1,kind=state relay1="open",on=true,level=2.0 3000000000\n']
+
+
+def test_prometheus_format():
+    fmt = PrometheusFormat("wipi", {"controller": "acc"})
+    lines = list(fmt.samples(np.array([1.5]), np.array([[1.0, 2.0]]), CHANNELS))
+
+    assert lines == [
+        b'wipi_accel_data_x{controller="acc"} 1.0 1500\n',
+        b'wipi_accel_data_y{controller="acc"} 2.0 1500\n',
+    ]
+
+    state = list(fmt.state(3.0, {"relay1": "open", "on": True}))
+    assert state == [
+        b'wipi_state_relay1{controller="acc",state="open"} 1.0 3000\n',
+        b'wipi_state_on{controller="acc"} 1.0 3000\n',
+    ]
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError):
+        Exporter("acc", CHANNELS, "udp://127.0.0.1:8094", format="graphite")
+
+
+def test_udp_export():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    receiver.settimeout(5.0)
+    port = receiver.getsockname()[1]
+
+    exporter = Exporter("acc", CHANNELS, f"udp://127.0.0.1:{port}",
+        batch=10, flush=60.0, buffer=1000)
+    times, values = _block(25)
+    exporter.append(times, values)  # over the batch size, sent at once
+    exporter.state({"range": {"accel": 2}})
+
+    lines = []
+    while len(lines) < 25:
+        lines += receiver.recv(65536).decode().splitlines()
+
+    exporter.close()
+    while len(lines) < 26:
+        lines += receiver.recv(65536).decode().splitlines()
+    receiver.close()
+
+    assert len(lines) == 26
+    fields, ts = lines[3].split(" ")[1:]
+    assert fields == "accel_data.x=3.0,accel_data.y=-3.0"
+    assert abs(int(ts) - timestamp(times[3]) * 1e9) < 1e3  # epoch timestamps [ns]
+    assert lines[-1].startswith("wipi,controller=acc,kind=state range.accel=2.0 ")
+
+    stats = exporter.stats()
+    assert stats["exported"] == 26
+    assert stats["sent_lines"] == 26
+    assert stats["dropped"] == stats["failed"] == 0
+    assert stats["connects"] == 1
+
+
+def test_unix_stream_export():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "agent.sock")
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(path)
+        listener.listen(1)
+        listener.settimeout(5.0)
+
+        exporter = Exporter("acc", CHANNELS, f"unix://{path}", format="prometheus",
+            batch=1000, flush=0.05)
+        exporter.append(*_block(5))  # below the batch size, sent by the flush
+        connection, _ = listener.accept()
+        connection.settimeout(5.0)
+
+        data = b""
+        while data.count(b"\n") < 10:
+            data += connection.recv(65536)
+
+        exporter.close()
+        connection.close()
+        listener.close()
+
+    lines = data.decode().splitlines()
+    assert len(lines) == 10
+    assert lines[0].startswith('wipi_accel_data_x{controller="acc"} 0.0 ')
+    assert lines[1].startswith('wipi_accel_data_y{controller="acc"} -0.0 ')
+    assert exporter.stats()["exported"] == 5
+
+
+def test_buffer_limit():
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(("127.0.0.1", 0))
+    port = receiver.getsockname()[1]
+
+    exporter = Exporter("acc", CHANNELS, f"udp://127.0.0.1:{port}",
+        batch=1000, flush=60.0, buffer=10)
+    exporter.append(*_block(8))
+    exporter.append(*_block(8))  # doesn't fit, dropped as a whole
+    exporter.close()
+    receiver.close()
+
+    stats = exporter.stats()
+    assert stats["exported"] == 8
+    assert stats["dropped"] == 8
+
+
+def test_send_failure():
+    # Nobody listens on the port, the connection is refused
+    probe = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    probe.bind(("127.0.0.1", 0))
+    port = probe.getsockname()[1]
+    probe.close()
+
+    exporter = Exporter("acc", CHANNELS, f"tcp://127.0.0.1:{port}", batch=1, flush=60.0)
+    exporter.append(*_block(3))
+    exporter.close()
+
+    stats = exporter.stats()
+    assert stats["failed"] == 3
+    assert stats["exported"] == 0
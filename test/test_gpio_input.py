@@ -0,0 +1,112 @@
+from threading import Event, Thread
+from time import sleep
+
+import numpy as np
+import pytest
+
+from wipi.controller.gpio_input import GpioInput
+
+
+SIGNALS = {
+    "17": {"frequency": 200.0, "duty": 0.5},
+    "27": {"frequency": 50.0, "duty": 0.5, "bounce": 2, "bounce_time": 0.001},
+}
+
+
+def _controller(**inputs) -> GpioInput:
+    return GpioInput("inputs", inputs or {
+        "flow": {"channel": 17, "edge": "rising"},
+        "button": {"channel": 27, "edge": "both", "debounce": 0.005},
+    }, backend="simulator", batch=0.01, simulator={"signals": SIGNALS})
+
+
+@pytest.fixture
+def inputs():
+    controller = _controller()
+    controller.postfork()  # starts the events acquisition
+    yield controller
+    controller.shutdown()
+
+
+def test_unknown_edge():
+    with pytest.raises(ValueError):
+        _controller(flow={"channel": 17, "edge": "up"})
+
+
+def test_blocks():
+    controller = _controller()
+    stop = Event()
+    times, values = [], []
+    for _, t, v in controller.blocks({}, stop):
+        times.append(t)
+        values.append(v)
+        if sum(len(t) for t in times) >= 50:
+            stop.set()
+
+    times, values = np.concatenate(times), np.concatenate(values)
+    assert (np.diff(times) > -1e-9).all()  # sorted
+    assert ((values != 0.0).sum(axis=1) == 1).all()  # one edge per event
+
+    flow, button = values[:, 0], values[:, 1]
+    assert set(flow[flow != 0.0]) == {1.0}  # rising edges only
+    assert set(button[button != 0.0]) == {1.0, -1.0}
+
+    # Debounced button edges alternate
+    edges = button[button != 0.0]
+    assert (edges[1:] != edges[:-1]).all()
+
+
+def test_counters(inputs):
+    sleep(0.5)
+    state = inputs.get_state()
+
+    assert state["flow"]["channel"] == 17
+    assert state["flow"]["level"] in (0, 1)
+    assert 80 <= state["flow"]["count"] <= 100 + 2  # 200 Hz for ~0.5 s
+    assert state["flow"]["bounces"] == 0
+    assert state["flow"]["last"] is not None
+
+    assert 40 <= state["button"]["count"] <= 50 + 2  # both edges of 50 Hz
+    assert state["button"]["bounces"] > 0
+
+    state = inputs.set_state({"reset": ["flow"]})
+    assert state["flow"]["count"] < 10
+    assert state["button"]["count"] >= 40
+
+
+def test_downstream(inputs):
+    chunks = list(inputs.downstream({"inputs": ["flow"], "duration": 0.2}))
+
+    assert chunks
+    assert all(set(chunk) == {"timestamp", "edge"} for chunk in chunks)
+    assert all(chunk["edge"]["flow"] == [1.0] * len(chunk["timestamp"]) for chunk in chunks)
+    assert 20 <= sum(len(chunk["timestamp"]) for chunk in chunks) <= 50
+
+    assert list(inputs.downstream({"inputs": ["nozzle"]}))[0]["error"]
+
+
+def test_state_while_acquisition_stops():
+    # Levels are read while the acquisition thread closes the source
+    for _ in range(5):
+        controller = _controller()
+        controller.postfork()
+
+        reader_stop = Event()
+        errors = []
+
+        def reader():
+            while not reader_stop.is_set():
+                try:
+                    controller.get_state()
+                except Exception as x:
+                    errors.append(x)
+
+        thread = Thread(target=reader)
+        thread.start()
+        sleep(0.02)
+        controller.shutdown()
+        reader_stop.set()
+        thread.join()
+
+        assert not errors
+        assert controller.get_state()["flow"]["level"] is None
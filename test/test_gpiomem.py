@@ -0,0 +1,129 @@
+import struct
+
+import pytest
+
+from wipi.controller.gpiomem import GPIO
+from wipi.controller.relay_board import RelayBoard
+
+
+def _registers(path) -> tuple:
+    """
+    :return: Register map file content (32 bit registers)
+    """
+    with open(path, "rb") as regs:
+        data = regs.read()
+
+    return struct.unpack(f"<{len(data) // 4}I", data)
+
+
+@pytest.fixture
+def regmap(tmp_path):
+    path = tmp_path / "gpiomem"
+    path.write_bytes(b"")
+    return path
+
+
+@pytest.fixture
+def gpio(regmap):
+    gpio = GPIO(str(regmap))
+    gpio.setmode(GPIO.BCM)
+    return gpio
+
+
+def test_file_backed_register_map(regmap):
+    gpio = GPIO(str(regmap))
+    assert gpio.emulated
+    assert regmap.stat().st_size == 4096
+    assert not any(_registers(regmap))
+
+
+def test_mode(regmap):
+    gpio = GPIO(str(regmap))
+    with pytest.raises(RuntimeError):
+        gpio.setup(26, GPIO.OUT)
+    with pytest.raises(ValueError):
+        gpio.setmode(GPIO.BOARD)
+
+
+def test_output_setup(gpio, regmap):
+    gpio.setup([20, 21, 26], GPIO.OUT, initial=GPIO.HIGH)
+
+    regs = _registers(regmap)
+    assert regs[GPIO._GPFSEL0 + 2] == (0b001 << 0) | (0b001 << 3) | (0b001 << 18)
+    assert regs[GPIO._GPSET0] == (1 << 20) | (1 << 21) | (1 << 26)
+    assert [gpio.input(ch) for ch in (20, 21, 26)] == [1, 1, 1]
+
+
+def test_output_single_write_per_register(gpio, regmap):
+    gpio.setup([20, 21, 26, 40], GPIO.OUT, initial=GPIO.LOW)
+    writes = gpio.writes
+
+    gpio.output([20, 21, 26], [GPIO.HIGH, GPIO.LOW, GPIO.HIGH])
+    assert gpio.writes == writes + 2  # one set and one clear
+
+    regs = _registers(regmap)
+    assert regs[GPIO._GPSET0] == (1 << 20) | (1 << 26)
+    assert regs[GPIO._GPCLR0] == 1 << 21
+    assert regs[GPIO._GPLEV0] == (1 << 20) | (1 << 26)
+
+    gpio.output(40, GPIO.HIGH)  # bank 1
+    regs = _registers(regmap)
+    assert regs[GPIO._GPSET0 + 1] == 1 << 8
+    assert regs[GPIO._GPLEV0 + 1] == 1 << 8
+    assert gpio.input(40) == 1
+
+
+def test_output_errors(gpio):
+    with pytest.raises(ValueError):
+        gpio.setup(54, GPIO.OUT)
+    with pytest.raises(ValueError):
+        gpio.output([20, 21], [GPIO.HIGH])
+
+
+def test_input_pull_bcm2711(gpio, regmap):
+    gpio.setup(17, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+    gpio.setup(18, GPIO.IN, pull_up_down=GPIO.PUD_DOWN)
+
+    regs = _registers(regmap)
+    assert regs[GPIO._GPFSEL0 + 1] & (0b111 << 21) == 0
+    assert regs[GPIO._GPPUPPDN0 + 1] == (0b01 << 2) | (0b10 << 4)
+
+    gpio.cleanup()
+    assert _registers(regmap)[GPIO._GPPUPPDN0 + 1] == 0
+
+
+def test_input_pull_bcm283x(regmap):
+    with open(regmap, "r+b") as regs:  # unimplemented registers read "gpio"
+        regs.truncate(4096)
+        regs.seek((GPIO._GPPUPPDN0 + 3) * 4)
+        regs.write(struct.pack("<I", GPIO._LEGACY_PUD))
+
+    gpio = GPIO(str(regmap))
+    gpio.setmode(GPIO.BCM)
+    gpio.setup(17, GPIO.IN, pull_up_down=GPIO.PUD_UP)
+
+    regs = _registers(regmap)
+    assert regs[GPIO._GPPUD] == 0  # the control signal is removed after clocking
+    assert regs[GPIO._GPPUDCLK0] == 0
+    assert regs[GPIO._GPPUPPDN0 + 0] == 0
+
+
+def test_cleanup(gpio, regmap):
+    gpio.setup(26, GPIO.OUT, initial=GPIO.LOW)
+    gpio.cleanup(26)
+    assert _registers(regmap)[GPIO._GPFSEL0 + 2] == 0
+
+
+def test_relay_board_switches_relays_at_once(regmap):
+    board = RelayBoard("relays", backend="gpiomem", gpiomem={"path": str(regmap)})
+    board.setup()
+    writes = board._gpio.writes
+
+    board.set_state({"relay1": "closed", "relay2": "closed", "relay3": "closed"})
+    assert board._gpio.writes == writes + 1  # one clear register write
+
+    regs = _registers(regmap)
+    assert regs[GPIO._GPCLR0] == (1 << 20) | (1 << 21) | (1 << 26)
+    assert regs[GPIO._GPLEV0] == 0
+
+    board.shutdown()
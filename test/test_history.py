@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from wipi.controller.history import History
+from wipi.controller.sampler import timestamp
+
+
+CHANNELS = ["temperature.a", "temperature.b"]
+
+
+def _block(start: int, n: int):
+    """
+    Sample block (time = sample index, values = index and -index)
+    """
+    times = np.arange(start, start + n, dtype=float)
+    return times, np.column_stack([times, -times])
+
+
+@pytest.fixture
+def history():
+    return History(CHANNELS, 8)
+
+
+def test_append_read(history):
+    history.append(*_block(0, 5))
+    times, values = history.read()
+
+    assert (times == np.arange(5)).all()
+    assert (values[:, 1] == -times).all()
+
+
+def test_wraparound(history):
+    for start in range(0, 20, 3):
+        history.append(*_block(start, 3))
+
+    # The last capacity samples are kept, in order
+    times, values = history.read()
+    assert (times == np.arange(13, 21)).all()
+    assert (values[:, 0] == times).all()
+    assert history.stats() == {"capacity": 8, "written": 21, "span": 7.0}
+
+
+def test_block_larger_than_capacity(history):
+    history.append(*_block(0, 3))
+    history.append(*_block(3, 20))
+
+    times, _ = history.read()
+    assert (times == np.arange(15, 23)).all()
+    assert history.stats()["written"] == 23
+
+
+def test_write_in_progress(history):
+    history.append(*_block(0, 10))
+
+    # Samples being overwritten (reserved, not written yet) are discarded
+    history._reserved.value = 13
+    times, _ = history.read()
+    assert (times == np.arange(5, 10)).all()
+
+
+def test_query(history):
+    history.append(*_block(0, 8))
+
+    times, values, channels = history.query({"seconds": 3})
+    assert (times == [4, 5, 6, 7]).all()
+
+    times, _, _ = history.query({"from": timestamp(2.0), "to": timestamp(5.0), "decimate": 2})
+    assert (times == [2, 4]).all()
+
+    _, values, channels = history.query({"axes": ["temperature.b"]})
+    assert channels == ["temperature.b"]
+    assert values.shape == (8, 1)
+
+    with pytest.raises(ValueError):
+        history.query({"axes": ["pressure.a"]})
+
+    with pytest.raises(ValueError):
+        history.query({"decimate": 0})
+
+
+def test_empty(history):
+    times, values, _ = history.query({"seconds": 10})
+    assert len(times) == 0 and values.shape == (0, 2)
+    assert history.stats()["span"] == 0.0
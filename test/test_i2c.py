@@ -0,0 +1,89 @@
+import pytest
+
+from wipi.controller import i2c
+from wipi.controller.simulator import SMBus, MPU6050Device
+
+
+BUS = 7
+
+
+@pytest.fixture
+def arbiter():
+    SMBus.attach(BUS, 0x68, MPU6050Device(seed=1))
+    arbiter = i2c.Arbiter(BUS, "simulator", window=0.1)
+    client = arbiter.client(priority=1)
+    arbiter.start()
+    yield arbiter, client
+    arbiter.stop()
+
+
+def test_coalesce():
+    merged = i2c.coalesce([
+        ("read_byte", 0x68, 0x3B),
+        ("read_byte", 0x68, 0x3C),
+        ("read_byte", 0x68, 0x3D),
+        ("read_byte", 0x69, 0x3E),
+        ("write_byte", 0x68, 0x1B, 0),
+    ])
+
+    assert merged == [
+        (("read_block", 0x68, 0x3B, 3), True),
+        (("read_byte", 0x69, 0x3E), False),
+        (("write_byte", 0x68, 0x1B, 0), False),
+    ]
+
+
+def test_transact(arbiter):
+    arbiter, client = arbiter
+
+    who_am_i, *block = client.transact([
+        ("read_byte", 0x68, MPU6050Device.WHO_AM_I),
+        ("read_byte", 0x68, MPU6050Device.ACCEL_XOUT0),
+        ("read_byte", 0x68, MPU6050Device.ACCEL_XOUT0 + 1),
+    ])
+
+    assert who_am_i == 0x68
+    assert len(block) == 2
+    assert arbiter.stats()["coalesced"] == 1
+
+
+def test_errors(arbiter):
+    arbiter, client = arbiter
+
+    with pytest.raises(OSError):  # no device
+        client.read_byte_data(0x69, MPU6050Device.WHO_AM_I)
+
+    with pytest.raises(OSError):  # malformed transaction
+        client.transact([("read_byte", 0x68)])
+
+    with pytest.raises(OSError):  # unknown transaction
+        client.transact([("swap", 0x68, 0)])
+
+    # The arbiter survives
+    assert client.read_byte_data(0x68, MPU6050Device.WHO_AM_I) == 0x68
+    assert arbiter.stats()["errors"] == 3
+
+
+def test_timeout():
+    arbiter = i2c.Arbiter(BUS + 1, "simulator")
+    client = arbiter.client(timeout=0.1)  # the arbiter isn't running
+
+    with pytest.raises(OSError):
+        client.read_byte_data(0x68, MPU6050Device.WHO_AM_I)
+
+
+def test_late_reply():
+    SMBus.attach(BUS + 2, 0x68, MPU6050Device(seed=1))
+    arbiter = i2c.Arbiter(BUS + 2, "simulator", clock=1e3)  # block read takes ~0.3 s
+    client = arbiter.client(timeout=0.1)
+    arbiter.start()
+    try:
+        with pytest.raises(OSError):
+            client.read_i2c_block_data(0x68, MPU6050Device.ACCEL_XOUT0, 32)
+
+        # The late reply (block) isn't taken for the next request's one
+        client.timeout = 5.0
+        assert client.read_byte_data(0x68, MPU6050Device.WHO_AM_I) == 0x68
+
+    finally:
+        arbiter.stop()
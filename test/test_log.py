@@ -0,0 +1,56 @@
+import io
+import json
+import logging
+
+import pytest
+
+from wipi import log
+
+
+class UpperFormatter(logging.Formatter):
+    def format(self, record):
+        return super().format(record).upper()
+
+
+@pytest.fixture
+def output():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(UpperFormatter("{levelname} {message}", style="{"))
+    handlers = list(log._handlers)
+    yield handler, stream
+    log.configure(handlers=handlers)
+
+
+def test_formatter_kept(output):
+    handler, stream = output
+    log.configure(handlers=[handler])
+    log.get_logger("test").warning("hello %s", "x", extra=log.fields(n=1))
+    assert stream.getvalue() == "WARNING HELLO X n=1\n"
+
+    log.configure(fields=False, handlers=[handler])
+    assert isinstance(handler.formatter, UpperFormatter)
+    log.get_logger("test").warning("hello", extra=log.fields(n=1))
+    assert stream.getvalue().endswith("WARNING HELLO\n")
+
+
+def test_structured(output):
+    handler, stream = output
+    log.configure(structured=True, handlers=[handler])
+    log.get_logger("test").warning("hello", extra=log.fields(n=1))
+    entry = json.loads(stream.getvalue())
+    assert entry["message"] == "hello" and entry["n"] == 1
+
+
+def test_flush(output):
+    handler, stream = output
+    log.configure(queue=100, handlers=[handler])
+    for i in range(10):
+        log.get_logger("test").warning("record %d", i)
+
+    log.flush()
+    assert len(stream.getvalue().splitlines()) == 10
+
+    log.get_logger("test").warning("after flush")  # the writer is started again
+    log.flush()
+    assert stream.getvalue().endswith("AFTER FLUSH\n")
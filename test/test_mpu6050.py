@@ -0,0 +1,31 @@
+import pytest
+
+from wipi.controller.mpu6050 import mpu6050
+
+
+@pytest.fixture
+def controller():
+    controller = mpu6050("accel_gyro", backend="simulator", simulator={"seed": 1})
+    controller.setup()
+    return controller
+
+
+def test_fifo_in_use(controller):
+    first = controller.downstream({"fifo": True, "rate": 200, "duration": 0.2})
+    assert "timestamp" in next(first)
+
+    # Only one FIFO stream at a time, polling isn't affected
+    assert list(controller.downstream({"fifo": True, "duration": 0.1})) == [
+        {"error": "accel_gyro: FIFO is in use by another stream"}]
+    assert list(controller.downstream({"interval": 0.01, "duration": 0.05}))
+
+    list(first)
+    assert list(controller.downstream({"fifo": True, "duration": 0.1}))
+
+
+def test_fifo_released_on_close(controller):
+    stream = controller.downstream({"fifo": True, "rate": 200})
+    next(stream)
+    stream.close()  # consumer is gone
+
+    assert "error" not in next(controller.downstream({"fifo": True, "duration": 0.1}))
@@ -0,0 +1,147 @@
+import os
+
+import numpy as np
+import pytest
+
+from wipi.controller.recorder import Recorder
+from wipi.controller.sampler import timestamp
+
+
+CHANNELS = ["temperature.a", "temperature.b"]
+ROWS = 10  # rows per segment
+SEGMENT = Recorder.HEADER + ROWS * (1 + len(CHANNELS)) * 8
+START = 1000.0  # first sample time (monotonic clock)
+
+
+def _block(start: int, n: int):
+    """
+    Sample block (10 samples per second, values = index and -index)
+    """
+    index = np.arange(start, start + n, dtype=float)
+    return START + index / 10, np.column_stack([index, -index])
+
+
+def _recorder(directory, **kwargs) -> Recorder:
+    return Recorder(CHANNELS, str(directory),
+        **dict({"segment_size": SEGMENT, "batch": 4, "index_stride": 3}, **kwargs))
+
+
+def _query(recorder: Recorder, **query):
+    """
+    :return: Channels and all the queried samples (times and values)
+    """
+    channels, blocks = recorder.query(query)
+    blocks = list(blocks)
+    if not blocks:
+        return channels, np.empty(0), np.empty((0, len(channels)))
+
+    return channels, np.concatenate([times for times, _ in blocks]), \
+        np.concatenate([values for _, values in blocks])
+
+
+def test_segment_rollover(tmp_path):
+    recorder = _recorder(tmp_path)
+    for start in range(0, 25, 5):
+        recorder.append(*_block(start, 5))
+    recorder.close()
+
+    # Segments are named by their first sample timestamp
+    names = sorted(os.listdir(tmp_path))
+    assert names == sorted(
+        f"{int(timestamp(START + first / 10) * 1e6):020d}{suffix}"
+        for first in (0, 10, 20) for suffix in (Recorder.SUFFIX, Recorder.INDEX_SUFFIX))
+    assert os.path.getsize(tmp_path / names[1]) == SEGMENT
+
+    _, times, values = _query(recorder)
+    assert (values[:, 0] == np.arange(25)).all()
+    assert (values[:, 1] == -values[:, 0]).all()
+    assert times == pytest.approx(_block(0, 25)[0])
+    assert recorder.stats()["opened"] == 3
+
+
+def test_buffering(tmp_path):
+    recorder = _recorder(tmp_path, flush=3600.0)
+
+    # Buffered samples aren't available
+    recorder.append(*_block(0, 3))
+    assert len(_query(recorder)[1]) == 0
+    assert recorder.stats()["buffered"] == 3
+
+    # Full buffer is written
+    recorder.append(*_block(3, 2))
+    assert len(_query(recorder)[1]) == 4
+    assert recorder.stats()["buffered"] == 1
+
+    recorder.close()
+    assert len(_query(recorder)[1]) == 5
+    assert recorder.stats()["written"] == 5
+
+
+def test_retention_size(tmp_path):
+    recorder = _recorder(tmp_path, max_size=2 * SEGMENT)
+    recorder.append(*_block(0, 35))
+    recorder.close()
+
+    # Removed when the new segment is opened (it counts, too)
+    _, _, values = _query(recorder)
+    assert (values[:, 0] == np.arange(20, 35)).all()
+    assert recorder.stats()["removed"] == 2
+    assert len(os.listdir(tmp_path)) == 4
+
+
+def test_retention_age(tmp_path):
+    recorder = _recorder(tmp_path, max_age=60.0)
+    recorder.append(*_block(0, 10))
+    recorder.flush()  # the segment is full (no more writes)
+
+    old, = recorder._paths()
+    os.utime(old, (0, 0))
+
+    recorder.append(*_block(10, 15))
+    recorder.close()
+
+    _, _, values = _query(recorder)
+    assert (values[:, 0] == np.arange(10, 25)).all()
+    assert recorder.stats()["removed"] == 1
+
+
+def test_query_range(tmp_path):
+    recorder = _recorder(tmp_path)
+    recorder.append(*_block(0, 30))
+    recorder.close()
+
+    # Range spanning segments (bounds included)
+    _, _, values = _query(recorder, **{
+        "from": timestamp(START + 0.75), "to": timestamp(START + 2.2)})
+    assert (values[:, 0] == np.arange(8, 23)).all()
+
+    channels, _, values = _query(recorder, axes=["temperature.b"], block=4)
+    assert channels == ["temperature.b"]
+    assert (values[:, 0] == -np.arange(30)).all()
+    assert max(len(times) for times, _ in recorder.query({"block": 4})[1]) == 4
+
+    for query in ({"axes": ["pressure.a"]}, {"decimate": 0}, {"block": 0}):
+        with pytest.raises(ValueError):
+            recorder.query(query)
+
+
+def test_query_decimated(tmp_path):
+    recorder = _recorder(tmp_path)
+    recorder.append(*_block(0, 25))
+    recorder.close()
+
+    # Decimation continues across segments
+    _, _, values = _query(recorder, decimate=3)
+    assert (values[:, 0] == np.arange(0, 25, 3)).all()
+
+    _, _, values = _query(recorder, decimate=4, block=2, **{"from": timestamp(START + 0.5)})
+    assert (values[:, 0] == np.arange(5, 25, 4)).all()
+
+
+def test_channels_differ(tmp_path):
+    recorder = _recorder(tmp_path)
+    recorder.append(*_block(0, 5))
+    recorder.close()
+
+    with pytest.raises(ValueError):
+        _query(Recorder(["temperature.a"], str(tmp_path)))
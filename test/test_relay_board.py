@@ -0,0 +1,96 @@
+from time import sleep
+
+import pytest
+
+from wipi.controller.relay_board import RelayBoard
+
+
+@pytest.fixture
+def board():
+    board = RelayBoard("relays", backend="simulator")
+    board.setup()
+    yield board
+    board.shutdown()
+
+
+def _levels(board: RelayBoard):
+    """
+    :return: Simulated GPIO output levels (by relay)
+    """
+    return dict(
+        (relay, board._gpio.input(channel)) for relay, channel in RelayBoard._relays.items())
+
+
+def test_pulse(board):
+    state = board.set_state({"pulse": {"relay": "relay1", "duration": 0.1}})
+    assert state["relay1"] == "closed"
+    assert state["programs"] == {"relay1": "pulse"}
+    assert _levels(board)["relay1"] == board._gpio.LOW
+
+    sleep(0.2)
+    state = board.get_state()
+    assert state["relay1"] == "open"
+    assert state["programs"] == {}
+    assert _levels(board)["relay1"] == board._gpio.HIGH
+
+
+def test_retriggered_pulse_restores_state_before_pulse(board):
+    board.set_state({"pulse": {"relay": ["relay1", "relay2"], "duration": 0.1}})
+    sleep(0.05)
+    board.set_state({"pulse": {"relay": "relay1", "duration": 0.2}})  # retrigger
+
+    sleep(0.1)  # the first pulse is over, relay1 is still pulsed
+    state = board.get_state()
+    assert state["relay1"] == "closed"
+    assert state["relay2"] == "open"
+    assert state["programs"] == {"relay1": "pulse"}
+
+    sleep(0.2)
+    state = board.get_state()
+    assert state["relay1"] == "open"
+    assert state["programs"] == {}
+
+
+def test_pulse_after_pwm_restores_current_state(board):
+    board.set_state({"relay1": "closed"})
+    board.set_state({"pwm": {"relay": "relay1", "period": 1.0, "duty": 0.5, "state": "open"}})
+    board.set_state({"pulse": {"relay": "relay1", "duration": 0.05}})  # PWM opened it
+
+    sleep(0.1)
+    state = board.get_state()
+    assert state["relay1"] == "open"
+    assert state["programs"] == {}
+
+
+def test_plain_state_change_cancels_program(board):
+    board.set_state({"pwm": {"relay": "relay2", "period": 0.05, "duty": 0.5}})
+    assert board.get_state()["programs"] == {"relay2": "pwm"}
+
+    state = board.set_state({"relay2": "open"})
+    assert state["programs"] == {}
+
+    sleep(0.1)
+    assert board.get_state()["relay2"] == "open"
+
+
+def test_sequence(board):
+    board.set_state({"sequence": {"steps": [
+        {"at": 0.0, "state": {"relay1": "closed"}},
+        {"at": 0.05, "state": {"relay1": "open", "relay3": "closed"}},
+        {"at": 0.1, "state": {"relay3": "open"}},
+    ]}})
+    assert board.get_state()["relay1"] == "closed"
+
+    sleep(0.075)
+    state = board.get_state()
+    assert (state["relay1"], state["relay3"]) == ("open", "closed")
+
+    sleep(0.1)
+    state = board.get_state()
+    assert (state["relay1"], state["relay3"]) == ("open", "open")
+    assert state["programs"] == {}
+
+
+def test_del_of_incomplete_instance():
+    board = RelayBoard.__new__(RelayBoard)  # e.g. the constructor failed
+    board.__del__()
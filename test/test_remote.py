@@ -0,0 +1,202 @@
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+from threading import Thread
+from time import monotonic, sleep
+import json
+
+import pytest
+
+from wipi.controller.remote import Remote
+
+
+class Node(ThreadingHTTPServer):
+    """
+    Emulated wipi node (the federation API subset) on localhost
+    """
+
+    daemon_threads = True
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, obj, status: int = 200) -> None:
+            data = json.dumps(obj).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _chunk(self, text: str) -> None:
+            data = text.encode()
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        def _states(self):
+            return {"controllers": [
+                {"name": name, "state": state} for name, state in self.server.state.items()]}
+
+        def do_GET(self):
+            node = self.server
+            node.connections.add(self.client_address)
+            node.requests += 1
+            sleep(node.delay)
+
+            cname = self.path.split("/")[2] if self.path.count("/") > 1 else None
+            if cname is None:
+                self._send(self._states())
+            elif cname in node.state:
+                self._send(node.state[cname])
+            else:
+                self._send({"error": "No such controller or not enabled"}, 404)
+
+        def do_POST(self):
+            node = self.server
+            node.connections.add(self.client_address)
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+
+            if self.path.startswith("/set_state/"):
+                cname = self.path.split("/")[2]
+                node.state[cname].update(body)
+                self._send(node.state[cname])
+
+            elif self.path == "/set_state":
+                for ctrl in body["controllers"]:
+                    node.state[ctrl["name"]].update(ctrl["state"])
+                self._send(self._states())
+
+            elif self.path.startswith("/downstream"):
+                self.send_response(200)
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self._chunk("[")
+                for i in range(body.get("count", 3)):
+                    sleep(0.05)
+                    self._chunk(" ")  # heartbeat
+                    chunk = json.dumps({"port": node.server_port, "i": i})
+                    self._chunk(("" if i == 0 else ", ") + chunk[:5])  # split chunk
+                    self._chunk(chunk[5:])
+                self._chunk("]")
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+
+    def __init__(self, delay: float = 0.0):
+        """
+        :param delay: State request processing time [s]
+        """
+        super().__init__(("127.0.0.1", 0), Node.Handler)
+        self.delay = delay
+        self.state = {"relays": {"r1": "open"}, "system": {"power": "on"}}
+        self.connections = set()  # client addresses
+        self.requests = 0         # state requests
+        self._thread = Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_port}"
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+
+
+@pytest.fixture
+def nodes():
+    nodes = [Node(delay=0.2) for _ in range(3)]
+    yield nodes
+    for node in nodes:
+        node.stop()
+
+
+def _remote(node: Node, controller: str = None, **kwargs) -> Remote:
+    remote = Remote(f"node{node.server_port}", node.url, controller, **kwargs)
+    remote.setup()
+    return remote
+
+
+def test_federation(nodes):
+    remotes = [_remote(node) for node in nodes]
+
+    # The nodes are queried concurrently (the worker pool threads)
+    started = monotonic()
+    with ThreadPoolExecutor(len(remotes)) as pool:
+        states = list(pool.map(lambda remote: remote.get_state(), remotes))
+    elapsed = monotonic() - started
+
+    assert all(state["controllers"][0] == {"name": "relays", "state": {"r1": "open"}}
+        for state in states)
+    assert elapsed < 0.5
+
+    for remote in remotes:
+        remote.shutdown()
+
+
+def test_state_cache(nodes):
+    node = nodes[0]
+    remote = _remote(node, "relays", cache_ttl=0.3)
+
+    # Concurrent requests of expired state wait for one fetch
+    with ThreadPoolExecutor(4) as pool:
+        states = list(pool.map(lambda _: remote.get_state(), range(4)))
+    assert states == [{"r1": "open"}] * 4
+    assert node.requests == 1
+
+    # State change updates the cache
+    assert remote.set_state({"r1": "closed"}) == {"r1": "closed"}
+    assert remote.get_state() == {"r1": "closed"}
+    assert node.requests == 1
+
+    sleep(0.3)
+    assert remote.get_state() == {"r1": "closed"}
+    assert node.requests == 2
+
+    # Keep-alive connection is reused
+    assert len(node.connections) == 1
+
+    remote.shutdown()
+
+
+def test_node_set_state(nodes):
+    remote = _remote(nodes[1])
+    state = remote.set_state({"controllers": [{"name": "system", "state": {"power": "off"}}]})
+
+    assert {"name": "system", "state": {"power": "off"}} in state["controllers"]
+    assert nodes[1].state["system"] == {"power": "off"}
+
+    remote.shutdown()
+
+
+def test_downstream(nodes):
+    remotes = [_remote(node, "relays") for node in nodes]
+
+    for node, remote in zip(nodes, remotes):
+        chunks = list(remote.downstream({"count": 3}))
+        assert [chunk for chunk in chunks if chunk is not None] == [
+            {"port": node.server_port, "i": i} for i in range(3)]
+        assert None in chunks  # heartbeats are proxied
+
+        remote.shutdown()
+
+
+def test_unreachable_node(nodes):
+    node = nodes[2]
+    remote = _remote(node, "relays", timeout=1.0)
+    node.stop()
+
+    assert "error" in remote.get_state()
+    assert "error" in remote.set_state({"r1": "closed"})
+    assert "error" in list(remote.downstream({}))[-1]
+    assert remote._cache == (None, None)  # errors aren't cached
+
+    remote.shutdown()
+
+
+def test_unknown_controller(nodes):
+    remote = _remote(nodes[0], "thermometer")
+    assert "error" in remote.get_state()
+
+    remote.shutdown()
@@ -0,0 +1,105 @@
+from time import sleep
+
+import numpy as np
+import pytest
+
+from wipi.controller.rules import Rule, Rules
+
+
+CHANNELS = ["accel_data.x", "accel_data.y"]
+RATE = 10.0
+
+
+def _rules(**rule) -> Rules:
+    """
+    Rules with single rule (mean of 2 samples, dispatched actions collected)
+    """
+    rules = Rules("accel", CHANNELS, RATE, [dict({
+        "name": "cutoff", "target": "relays", "function": "mean", "window": 0.2,
+        "state": {"relay1": "open"}, "release_state": {"relay1": "closed"}}, **rule)])
+
+    rules.actions = []
+    rules.dispatch = lambda target, state, source, i, since: rules.actions.append(
+        (target, state["relay1"]))
+
+    return rules
+
+
+def _feed(rules: Rules, *xs: float) -> None:
+    """
+    Append samples one by one (y is always 0)
+    """
+    for x in xs:
+        rules.append(np.array([0.0]), np.array([[x, 0.0]]))
+
+
+def test_hysteresis():
+    rules = _rules(above=10.0, release=5.0)
+
+    # The window must fill up first, then mean 11 triggers
+    _feed(rules, 12.0)
+    assert rules.actions == []
+    _feed(rules, 10.0)
+    assert rules.actions == [("relays", "open")]
+
+    # Still above the release threshold
+    _feed(rules, 6.0, 6.0, 10.0)
+    assert rules.actions == [("relays", "open")]
+    assert rules.stats()[0]["active"]
+
+    _feed(rules, 2.0, 2.0)
+    assert rules.actions == [("relays", "open"), ("relays", "closed")]
+
+    stats, = rules.stats()
+    assert (stats["triggers"], stats["releases"], stats["active"], stats["value"]) == (
+        1, 1, False, 2.0)
+
+
+def test_below():
+    rules = _rules(below=-1.0, release=0.0, axes=["accel_data.x"])
+    _feed(rules, -2.0, -2.0, -0.5, -0.5, 1.0)
+    assert rules.actions == [("relays", "open"), ("relays", "closed")]
+
+
+def test_any_axis():
+    rules = _rules(above=1.0)
+    rules.append(np.zeros(2), np.array([[0.0, 3.0], [0.0, 3.0]]))
+    assert rules.actions == [("relays", "open")]
+
+
+def test_rate_limit():
+    rules = _rules(above=10.0, min_interval=0.2)
+    _feed(rules, 20.0, 20.0, 0.0, 0.0)
+
+    # The release is suppressed (and retried with the next block)
+    assert rules.actions == [("relays", "open")]
+    assert rules.stats()[0]["suppressed"] == 2
+
+    sleep(0.2)
+    _feed(rules, 0.0)
+    assert rules.actions == [("relays", "open"), ("relays", "closed")]
+    assert rules.stats()[0]["suppressed"] == 2
+
+
+def test_reacted():
+    rules = _rules(above=10.0)
+    rules.reacted(0, 0.0)
+    latency = rules.stats()[0]["latency"]
+    assert latency["last"] == latency["mean"] == latency["max"] > 0.0
+
+
+def test_invalid():
+    for rule in ({}, {"above": 1.0, "below": 0.0}, {"above": 1.0, "function": "median"},
+            {"above": 1.0, "axes": ["accel_data.w"]},
+            {"above": 10.0, "release": 12.0}, {"below": 10.0, "release": 8.0}):
+        with pytest.raises(ValueError):
+            _rules(**rule)
+
+    # Release at the trigger threshold is fine
+    assert _rules(above=10.0, release=10.0).rules[0]._release == 10.0
+
+
+def test_no_release_state():
+    rule = Rule(CHANNELS, RATE, "relays", {"relay1": "open"}, above=1.0, window=0.1)
+    assert rule.transition(rule.evaluate(np.array([[2.0, 0.0]]))) == {"relay1": "open"}
+    assert rule.transition(rule.evaluate(np.array([[0.0, 0.0]]))) == {}
@@ -0,0 +1,83 @@
+from time import sleep, time
+
+import pytest
+
+from wipi.controller.sampler import Sampler, timestamp, from_timestamp
+
+
+INTERVAL = 0.01
+
+
+def _ticks(sampler: Sampler, stall_at: int = None, stall: float = 0.0):
+    """
+    Run sampler, stall the loop once
+    :param sampler: Sampler
+    :param stall_at: Stalled tick index
+    :param stall: Stall duration [s]
+    :return: Tick times
+    """
+    ticks = []
+    for tick in sampler:
+        if len(ticks) == stall_at:
+            sleep(stall)
+        ticks.append(tick)
+
+    return ticks
+
+
+def test_timestamp():
+    assert abs(timestamp() - time()) < 0.01
+    assert from_timestamp(timestamp(123.0)) == pytest.approx(123.0)
+
+
+def test_schedule():
+    sampler = Sampler(INTERVAL, duration=0.2)
+    ticks = _ticks(sampler)
+
+    # Ticks are at the deadlines (start + n * interval), no drift
+    assert 19 <= len(ticks) <= 20
+    for index, tick in enumerate(ticks):
+        assert 0.0 <= tick - (ticks[0] + index * INTERVAL) < INTERVAL
+
+    stats = sampler.stats()
+    assert stats["samples"] == len(ticks)
+    assert stats["rate"] == pytest.approx(1 / INTERVAL, rel=0.05)
+    assert stats["overruns"] == stats["skipped"] == 0
+
+
+def test_skip():
+    sampler = Sampler(INTERVAL, duration=0.2, policy=Sampler.SKIP)
+    ticks = _ticks(sampler, stall_at=5, stall=5.5 * INTERVAL)
+
+    # The missed ticks are skipped, the clock keeps the schedule
+    stats = sampler.stats()
+    assert stats["overruns"] == 1
+    assert 4 <= stats["skipped"] <= 5
+    assert len(ticks) + stats["skipped"] in (19, 20)
+    for tick in ticks[7:]:
+        assert (tick - ticks[0] + INTERVAL / 4) % INTERVAL < INTERVAL / 2
+
+
+def test_catch_up():
+    sampler = Sampler(INTERVAL, duration=0.2, policy=Sampler.CATCH_UP)
+    ticks = _ticks(sampler, stall_at=5, stall=5.5 * INTERVAL)
+
+    # The missed ticks are produced at once (the overrun is counted once)
+    stats = sampler.stats()
+    assert stats["overruns"] == 1
+    assert stats["skipped"] == 0
+    assert 19 <= len(ticks) <= 20
+    assert ticks[8] - ticks[6] < INTERVAL / 2
+    assert stats["max_lateness"] >= 4 * INTERVAL
+
+
+def test_free_running():
+    sampler = Sampler(duration=0.01)
+    ticks = _ticks(sampler)
+    assert len(ticks) > 10
+    assert sampler.stats()["lateness"] == 0.0
+
+
+def test_invalid_policy():
+    with pytest.raises(ValueError):
+        Sampler(INTERVAL, policy="wait")
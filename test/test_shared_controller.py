@@ -0,0 +1,71 @@
+from multiprocessing import Pipe
+from time import sleep, monotonic
+import os
+
+import pytest
+
+from wipi.controller import Controller
+from wipi.api.shared_controller import SharedController
+
+
+class Faulty(Controller):
+    """
+    Controller failing on odd state changes
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self.value = 0
+
+    def get_state(self):
+        return {"value": self.value, "pid": os.getpid()}
+
+    def set_state(self, state):
+        if state["value"] % 2:
+            raise OSError(f"Remote I/O error: {state['value']}")
+
+        self.value = state["value"]
+        return self.get_state()
+
+
+def _ready(controller: SharedController) -> SharedController:
+    deadline = monotonic() + 5.0
+    while controller.status()["status"] != "ready":
+        assert monotonic() < deadline
+        sleep(0.01)
+
+    return controller
+
+
+@pytest.fixture
+def pipe():
+    return Pipe(duplex=False)
+
+
+def test_failed_task(pipe):
+    controller = _ready(SharedController(Faulty("faulty")).start())
+    try:
+        state = controller.set_state({"value": 2}, *pipe)
+
+        # The task fails, the worker goes on (its state is kept)
+        assert controller.set_state({"value": 3}, *pipe) == {"error": "OSError: Remote I/O error: 3"}
+        assert controller.get_state(*pipe) == state
+        assert controller.status()["status"] == "ready"
+
+    finally:
+        controller.stop(1.0)
+
+
+def test_failed_task_shared_worker(pipe):
+    owner, other = SharedController(Faulty("owner")), SharedController(Faulty("other"))
+    owner.share(other)
+    owner.start()
+    _ready(owner), _ready(other)
+    try:
+        assert "error" in other.set_state({"value": 1}, *pipe)
+        assert owner.set_state({"value": 4}, *pipe)["value"] == 4
+        assert other.get_state(*pipe)["value"] == 0
+
+    finally:
+        other.drain()
+        owner.stop(1.0)
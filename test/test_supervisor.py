@@ -0,0 +1,201 @@
+from multiprocessing import Process
+from multiprocessing.sharedctypes import RawArray, RawValue
+from time import monotonic, sleep
+import os
+import signal
+
+import pytest
+
+import wipi.controller
+from wipi.supervisor import Supervisor, Supervised, Restarts
+from wipi.api.backend import Backend
+from wipi.api.shared_controller import SharedController
+
+
+def _wait(condition, timeout: float = 5.0):
+    """
+    Wait for condition (NotReady controllers are waited for, too)
+    :param condition: Condition function
+    :param timeout: Timeout [s]
+    :return: Condition result
+    """
+    deadline = monotonic() + timeout
+    while True:
+        try:
+            result = condition()
+            if result:
+                return result
+        except SharedController.NotReady:
+            pass
+
+        assert monotonic() < deadline, "Timed out"
+        sleep(0.01)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+
+
+class Worker(Supervised):
+    """
+    Supervised worker recording its starts (crashing at once if set)
+    """
+
+    def __init__(self, crash: bool = False):
+        self.restarts = Restarts()
+        self.pid = RawValue('i', 0)
+        self.starts = RawArray('d', 32)  # start times (monotonic clock)
+        self.started = RawValue('i', 0)
+        self._crash = crash
+        self._process: Process = None
+
+    def _routine(self) -> None:
+        self.pid.value = os.getpid()
+        self.starts[self.started.value] = monotonic()
+        self.started.value += 1
+        if self._crash:
+            os._exit(3)
+
+        self.restarts.recovered()
+        sleep(60.0)
+
+    def start(self) -> None:
+        self._process = Process(target=self._routine, daemon=True)
+        self._process.start()
+
+    def stop(self) -> None:
+        self._process.kill()
+        self._process.join()
+
+    def processes(self):
+        return [self._process]
+
+    def expected(self, index, process):
+        return False
+
+    def crashed(self, index, exitcode):
+        self.restarts.crashed(exitcode)
+
+    def respawn(self, index):
+        self.start()
+
+
+def _supervisor(worker: Worker) -> Supervisor:
+    return Supervisor(worker.start, lambda: [worker], lambda config: {}, lambda: None,
+        worker.stop).start()
+
+
+def test_respawn(monkeypatch):
+    monkeypatch.setattr(Supervisor, "BACKOFF_MIN", 0.05)
+    worker = Worker()
+    supervisor = _supervisor(worker)
+    try:
+        pid = _wait(lambda: worker.pid.value)
+        os.kill(pid, signal.SIGKILL)
+
+        _wait(lambda: worker.started.value == 2)
+        assert worker.pid.value != pid
+        assert 0.05 <= worker.starts[1] - worker.starts[0]
+
+        stats = _wait(lambda: (lambda stats: not stats["down"] and stats)(worker.restarts.stats()))
+        assert stats["restarts"] == 1
+        assert stats["exitcode"] == -signal.SIGKILL
+        assert stats["recovery"]["last"] >= 0.05
+
+    finally:
+        supervisor.stop()
+
+
+def test_respawn_backoff(monkeypatch):
+    monkeypatch.setattr(Supervisor, "BACKOFF_MIN", 0.05)
+    worker = Worker(crash=True)
+    supervisor = _supervisor(worker)
+    try:
+        _wait(lambda: worker.started.value >= 5)
+
+        # Respawn delays double (0.05, 0.1, 0.2, 0.4 s)
+        delays = [b - a for a, b in zip(worker.starts[:4], worker.starts[1:5])]
+        for index, delay in enumerate(delays):
+            assert 0.05 * 2 ** index <= delay < 0.05 * 2 ** (index + 1)
+
+        stats = worker.restarts.stats()
+        assert stats["restarts"] >= 4
+        assert stats["exitcode"] == 3
+        assert stats["down"]
+
+    finally:
+        supervisor.stop()
+
+
+def _thermometer(name: str, **kwargs):
+    return {"name": name, "class": "wipi.controller.Thermometer", "enabled": True,
+        "kwargs": dict({"backend": "simulator", "resolution": 9}, **kwargs)}
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(Supervisor, "BACKOFF_MIN", 0.05)
+    config = {"controllers": [_thermometer("t1"), _thermometer("t2")], "reload": {"slots": 2}}
+    wipi.controller.load_controllers(config)
+    backend = Backend()
+    backend.worker_postfork()
+    _wait(lambda: all(
+        backend.get_state(cname) for cname in ("t1", "t2")))
+
+    yield backend, config
+
+    backend.shutdown()
+    wipi.controller._controllers.clear()
+    wipi.controller._config.clear()
+
+
+def test_backend_respawn(backend):
+    backend, _ = backend
+    t1 = backend._get_ctrl("t1")
+    (_, pid), = t1.pids()
+    os.kill(pid, signal.SIGKILL)
+
+    # The crash is reported, the worker is set up again
+    assert _wait(lambda: backend.get_state("t1"))["temperature"]
+    assert t1.pids()[0][1] != pid
+
+    stats = next(c for c in backend.supervision()["controllers"] if c["name"] == "t1")
+    assert stats["restarts"] == 1
+    assert stats["exitcode"] == -signal.SIGKILL
+    assert not stats["down"]
+
+
+def test_reload(backend):
+    backend, config = backend
+    t1, t2 = backend._get_ctrl("t1"), backend._get_ctrl("t2")
+    (_, t1_pid), = t1.pids()
+    (_, t2_pid), = t2.pids()
+
+    result = backend.reload(dict(config, controllers=[
+        _thermometer("t1"),                  # unchanged
+        _thermometer("t2", resolution=12),   # reconfigured
+        _thermometer("t3"),                  # added
+    ]))
+    assert (result["added"], result["removed"], result["reconfigured"], result["unchanged"]) == (
+        ["t3"], [], ["t2"], ["t1"])
+
+    # The new controllers are live, the old worker is reaped
+    assert _wait(lambda: backend.get_state("t2"))["resolution"] == 12
+    assert _wait(lambda: backend.get_state("t3"))["temperature"]
+    assert backend._get_ctrl("t1") is t1
+    assert backend._get_ctrl("t2") is not t2
+    _wait(lambda: not _alive(t2_pid))
+    assert _alive(t1_pid)
+
+    # No spare slot is free now (t2 and t3 hold them)
+    with pytest.raises(Backend.Error):
+        backend.reload(dict(config, controllers=[_thermometer("t1"), _thermometer("t4")]))
+
+    result = backend.reload(dict(config, controllers=[_thermometer("t1")]))
+    assert result["removed"] == ["t2", "t3"]
+    assert backend.get_state("t2") is None
+    assert set(backend.controllers()) == {"t1"}
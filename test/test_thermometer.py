@@ -0,0 +1,88 @@
+from time import monotonic
+import asyncio
+
+import pytest
+
+from wipi.controller.thermometer import Thermometer
+
+
+def _run(test) -> None:
+    """
+    Run test coroutine on started thermometer (9 bit resolution, ~94 ms
+    conversions)
+    :param test: Test coroutine function (gets the thermometer)
+    """
+    async def main():
+        thermometer = Thermometer("thermometer", resolution=9, backend="simulator",
+            simulator={"temperature": 20.0, "swing": 0.0, "noise": 0.0})
+        thermometer.setup()
+        await thermometer.started()
+        try:
+            await test(thermometer)
+        finally:
+            await thermometer.stopping()
+
+    asyncio.run(main())
+
+
+def test_resolution():
+    with pytest.raises(ValueError):
+        Thermometer("thermometer", resolution=8, backend="simulator")
+
+    async def test(thermometer):
+        state = await thermometer.set_state({"resolution": 10})
+        assert state == {"sensor": "28-000000000001", "resolution": 10, "temperature": 20.0}
+
+        with pytest.raises(ValueError):
+            await thermometer.set_state({"resolution": 13})
+
+    _run(test)
+
+
+def test_shared_conversion():
+    async def test(thermometer):
+        started = monotonic()
+        states = await asyncio.gather(*(thermometer.get_state() for _ in range(10)))
+        elapsed = monotonic() - started
+
+        assert all(state["temperature"] == 20.0 for state in states)
+        assert thermometer._sensor.conversions == 1
+        assert elapsed < 0.3
+
+    _run(test)
+
+
+def test_cancelled_reader():
+    async def test(thermometer):
+        reader = asyncio.ensure_future(thermometer.temperature())
+        other = asyncio.ensure_future(thermometer.temperature())
+        await asyncio.sleep(0.01)
+        reader.cancel()
+
+        assert await other == 20.0
+        assert thermometer._sensor.conversions == 1
+
+    _run(test)
+
+
+def test_downstream():
+    async def test(thermometer):
+        readings, state = [], None
+
+        async def stream():
+            async for reading in thermometer.downstream({"interval": 0.1, "duration": 0.5}):
+                readings.append(reading)
+
+        async def request():
+            nonlocal state
+            await asyncio.sleep(0.15)
+            state = await thermometer.get_state()  # served while streaming
+
+        await asyncio.gather(stream(), request())
+
+        assert 4 <= len(readings) <= 6
+        assert all(reading["temperature"] == 20.0 for reading in readings)
+        assert all(b["timestamp"] > a["timestamp"] for a, b in zip(readings, readings[1:]))
+        assert state["temperature"] == 20.0
+
+    _run(test)
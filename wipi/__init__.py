@@ -0,0 +1,3 @@
+from time import monotonic
+
+import_started = monotonic()  # startup timing (see wipi.controller.startup)
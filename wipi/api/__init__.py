@@ -1,12 +1,18 @@
-from flask import Flask
-import uwsgi
-
+# The backend is created (i.e. the controller and scheduler workers are forked)
+# before the web stack is imported, so that the workers don't carry it
 from .backend import Backend
 
 backend = Backend()
+
+# Imported after the workers are forked (see above)
+from flask import Flask  # noqa: E402
+import uwsgi  # noqa: E402
+
 uwsgi.post_fork_hook = backend.worker_postfork
 uwsgi.atexit = backend.shutdown
 
 app = Flask(__name__)
 
-from . import routes
+from . import routes  # noqa: E402, F401
+
+backend.loaded()
@@ -0,0 +1,232 @@
+"""
+Time-aligned join of multiple controller streams
+
+Samples from the streams (data chunks with numeric "timestamp", either
+a single one or a list of them, see wipi.controller.block) are joined
+on a common timebase: one merged record is produced per tick
+(each "interval" seconds).
+Controllers timestamp samples by the same (monotonic) clock, so the streams
+may be joined without any clock synchronisation.
+
+For each stream, the record contains its sample values at the tick time,
+either
+* "hold": values of the last sample before the tick or
+* "interpolate": values linearly interpolated between the samples around
+  the tick (non-numeric values are held).
+Samples further from the tick than "tolerance" seconds aren't used;
+if there's no such sample, the stream value is null.
+
+Ticks are produced as soon as all the streams have samples past them,
+but not later than "delay" seconds after the tick (lagging streams then
+get held values or nulls).
+Chunks without timestamp (e.g. statistics) are passed through.
+"""
+
+from typing import List, Dict, Tuple, Iterator, Any
+from math import ceil
+
+from wipi.controller.sampler import timestamp
+
+
+def flatten(data: Dict, prefix: str = "") -> Dict[str, Any]:
+    """
+    Flatten nested data chunk
+    :param data: Data chunk (without timestamp)
+    :param prefix: Keys prefix
+    :return: Flat dict with dot-separated key paths
+    """
+    flat = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        else:
+            flat[prefix + key] = value
+
+    return flat
+
+
+def unflatten(flat: Dict[str, Any]) -> Dict:
+    """
+    Nest flat dict (inverse of flatten)
+    :param flat: Flat dict with dot-separated key paths
+    :return: Nested dict
+    """
+    data: Dict = {}
+    for path, value in flat.items():
+        *groups, key = path.split('.')
+        node = data
+        for group in groups:
+            node = node.setdefault(group, {})
+        node[key] = value
+
+    return data
+
+
+def samples(chunk: Dict) -> List[Tuple[float, Dict[str, Any]]]:
+    """
+    Split data chunk to timestamped samples
+    Values of a block of samples which aren't lists of the block length
+    (i.e. not per-sample values) are skipped.
+    :param chunk: Data chunk
+    :return: List of samples (timestamp and flat values)
+    """
+    ts = chunk["timestamp"]
+    values = flatten(dict((k, v) for k, v in chunk.items() if k != "timestamp"))
+
+    if isinstance(ts, list):  # block of samples
+        values = dict(
+            (k, v) for k, v in values.items() if isinstance(v, list) and len(v) == len(ts))
+        return [
+            (t, dict((k, v[i]) for k, v in values.items()))
+            for i, t in enumerate(ts)
+        ]
+
+    return [(float(ts), values)]
+
+
+class Aligner:
+    """
+    Streams join on common timebase
+    """
+
+    HOLD = "hold"
+    INTERPOLATE = "interpolate"
+
+    def __init__(self, names: List[str], interval: float, tolerance: float = None,
+        method: str = HOLD, delay: float = 1.0):
+        """
+        :param names: Stream names
+        :param interval: Tick interval [s]
+        :param tolerance: Max. distance of sample from tick [s] (default: interval)
+        :param method: Resampling method (Aligner.HOLD or Aligner.INTERPOLATE)
+        :param delay: Max. tick delay [s]
+        """
+        if method not in (Aligner.HOLD, Aligner.INTERPOLATE):
+            raise ValueError(f"Unknown alignment method: {method}")
+
+        if not interval > 0.0:
+            raise ValueError(f"Invalid alignment interval: {interval}")
+
+        self._names = list(names)
+        self._interval = float(interval)
+        self._tolerance = self._interval if tolerance is None else float(tolerance)
+        self._method = method
+        self.delay = float(delay)
+
+        self._samples: Dict[str, List[Tuple[float, Dict]]] = {name: [] for name in names}
+        self._tick: int = None  # next tick (number of intervals since epoch)
+
+    def push(self, name: str, data: Dict) -> Iterator[Dict]:
+        """
+        Add stream data chunk
+        :param name: Stream name
+        :param data: Data chunk
+        :return: Generator of passed-through chunks and due merged records
+        """
+        if not isinstance(data, dict) or "timestamp" not in data:
+            yield {"name" : name, "data" : data}
+            return
+
+        new = samples(data)
+        if not new:
+            return
+
+        self._samples[name].extend(new)
+        if self._tick is None:
+            self._tick = ceil(new[0][0] / self._interval)
+
+        yield from self.flush()
+
+    def _value(self, samples: List[Tuple[float, Dict]], tick: float) -> Dict:
+        """
+        Stream values at tick
+        :param samples: Stream samples
+        :param tick: Tick time
+        :return: Values (or None)
+        """
+        before = after = None
+        for sample in samples:
+            if sample[0] <= tick:
+                before = sample
+            else:
+                after = sample
+                break
+
+        if before is not None and tick - before[0] > self._tolerance:
+            before = None
+        if after is not None and after[0] - tick > self._tolerance:
+            after = None
+
+        if self._method == Aligner.INTERPOLATE and before is not None and after is not None:
+            t0, v0 = before
+            t1, v1 = after
+            w = (tick - t0) / (t1 - t0)
+            return dict(
+                (k, v0[k] + w * (v1[k] - v0[k])
+                    if isinstance(v0[k], (int, float)) and isinstance(v1.get(k), (int, float))
+                    and not isinstance(v0[k], bool) else v0[k])
+                for k in v0)
+
+        return None if before is None else before[1]
+
+    def _record(self, tick: float) -> Dict:
+        """
+        Produce merged record, discard samples not needed any more
+        :param tick: Tick time
+        :return: Merged record
+        """
+        record: Dict = {"timestamp" : tick}
+        for name, samples in self._samples.items():
+            value = self._value(samples, tick)
+            record[name] = None if value is None else unflatten(value)
+
+            # Keep the last sample before the next tick and all after it
+            keep = 0
+            for i, sample in enumerate(samples):
+                if sample[0] <= tick + self._interval:
+                    keep = i
+            del samples[:keep]
+
+        return record
+
+    def flush(self, final: bool = False) -> Iterator[Dict]:
+        """
+        Produce due merged records
+        :param final: Streams ended (produce records till the last sample)
+        :return: Generator of merged records
+        """
+        if self._tick is None:
+            return
+
+        latest = [samples[-1][0] for samples in self._samples.values() if samples]
+        if final:
+            watermark = max(latest) if latest else -float("inf")
+            due = watermark
+        else:
+            watermark = min(latest) if len(latest) == len(self._samples) else -float("inf")
+            due = max(watermark, timestamp() - self.delay)
+
+        while self._tick * self._interval <= due:
+            yield self._record(self._tick * self._interval)
+            self._tick += 1
+
+    def join(self, chunks: Iterator[Dict]) -> Iterator[Dict]:
+        """
+        Join streams
+        :param chunks: Stream chunks ({"name": stream name, "data": chunk})
+                       and None (heartbeats, at least each delay/2 seconds)
+        :return: Generator of merged records, passed-through chunks and
+                 None (heartbeats)
+        """
+        for chunk in chunks:
+            if chunk is None:
+                produced = False
+                for record in self.flush():
+                    produced = True
+                    yield record
+                if not produced:
+                    yield None
+            else:
+                yield from self.push(chunk["name"], chunk["data"])
+
+        yield from self.flush(final=True)
@@ -1,19 +1,29 @@
-from typing import List, Dict, Tuple, Iterator
+from typing import List, Dict, Tuple, Iterator, Callable, Union
 from json import dumps as jsonify
 from threading import Thread
 from queue import SimpleQueue as Queue, Empty as QueueEmpty
 from multiprocessing import Pipe
+from multiprocessing.connection import Connection
+from multiprocessing.sharedctypes import RawValue
 from os import getpid
+import gc
 from multiprocessing.util import _exit_function as multiprocessing_exit_function
 import atexit
 from datetime import datetime
 from functools import partial
+from time import monotonic
 
-from wipi.controller import Controller, controllers
+from wipi.controller import controllers, startup as controllers_startup
+from wipi.controller import create_controller, read_config, configuration
+from wipi.controller import i2c
+from wipi.controller.sampler import Sampler, timestamp
 from wipi.scheduler import Scheduler
-from wipi.log import get_logger
+from wipi.supervisor import Supervisor, Supervised
+from wipi.log import get_logger, flush as flush_log
+from wipi.util import memory, started
 
 from .shared_controller import SharedController
+from .align import Aligner
 
 
 log = get_logger(__name__)
@@ -29,6 +39,9 @@ class Backend:
         Backend errors
         """
 
+    SPARE_SLOTS = 2      # default number of spare controller slots (see reload)
+    STOP_TIMEOUT = 5.0   # removed controller drain timeout [s]
+
     def __init__(self, chunking_timeout: float = 20.0):
         """
         :param chunking_timeout: When downstreaming, generate connection "heartbeats"
@@ -36,24 +49,90 @@ class Backend:
                                  if connection is idle for this time [s]
         """
         self._chunking_timeout = chunking_timeout
+        self._created = monotonic()  # startup timing (see startup)
+        self._loaded: float = None
 
         # Controllers (shared by all API workers)
-        self._controllers: Dict[str, Controller] = {
-            controller.name: SharedController(controller).start()
+        # All of them are created before the workers start, so that each
+        # worker may dispatch rule actions to any other one directly.
+        self._controllers: Dict[str, SharedController] = {
+            controller.name: SharedController(controller)
             for controller in controllers()
         }
 
+        for controller in controllers():
+            if controller.rules is not None:
+                for rule in controller.rules.rules:
+                    if rule.target not in self._controllers:
+                        raise Backend.Error(
+                            f"{controller.name}: Rule {rule.name} target {rule.target} "
+                            "doesn't exist or isn't enabled")
+
+                controller.rules.dispatch = self._dispatch
+
+        # Controllers sharing worker process (of the same configured "worker" name)
+        owners: Dict[str, SharedController] = {}
+        for controller in controllers():
+            if controller.worker is not None:
+                shared = self._controllers[controller.name]
+                owner = owners.setdefault(controller.worker, shared)
+                if owner is not shared:
+                    owner.share(shared)
+
+        # Spare controller slots (for controllers added by reload) and
+        # the controllers view version (odd while being updated, see _sync)
+        self._originals: List[SharedController] = list(self._controllers.values())
+        self._spares: List[SharedController] = [
+            SharedController()
+            for _ in range(int(configuration().get("reload", {}).get("slots", Backend.SPARE_SLOTS)))]
+        self._slots = self._originals + self._spares
+        self._generation = RawValue('i', 0)
+        self._view_generation = 0
+
+        # Running controllers configuration and removed controllers being
+        # stopped (maintained by the supervisor)
+        self._configs: Dict[str, Dict] = dict(
+            (config["name"], config)
+            for config in configuration().get("controllers", [])
+            if config.get("enabled", False) and config["name"] in self._controllers)
+        self._stopping: List[SharedController] = []
+
+        # Objects allocated so far (modules, controllers) are moved to the GC
+        # permanent generation, so that collections in the forked workers
+        # don't write to (and therefore copy) their memory pages
+        gc.freeze()
+
+        # Shared I2C bus arbiters (all clients are created with the controllers)
+        for arbiter in i2c.arbiters():
+            arbiter.start()
+
         # Deferred actions scheduler
-        self._scheduler = Scheduler(kwargs={"self": self}).start()
+        self._scheduler = Scheduler(
+            kwargs={"self": self}, realtime=configuration().get("scheduler", {}).get("realtime"))
+
+        # Workers supervisor (starts the controller and scheduler workers,
+        # respawns crashed ones and executes reconfiguration)
+        self._supervisor = Supervisor(
+            self._start_workers, self._supervised, self._reconfigure, self._reap,
+            self._stop_workers).start()
+        self._forked = monotonic()
 
         # Master API worker PID (needed for correct shared resources shutdown)
         self._master_pid = getpid()
 
-        # SharedController worker -> API worker communication pipe
+        # SharedController worker -> API worker communication pipes
         self._pipe: Tuple[Connection, Connection] = None
+        self._fanout_pipes: List[Tuple[Connection, Connection]] = []  # see get_state
 
         log.info(f"Backend created")
 
+    def loaded(self) -> None:
+        """
+        Called when the API application is loaded (for startup timing)
+        """
+        self._loaded = monotonic()
+        log.info(f"API loaded in {self._loaded - self._created:.3f} s since backend creation")
+
     def worker_postfork(self) -> None:
         """
         uWSGI postfork hook
@@ -73,19 +152,61 @@ class Backend:
             atexit.unregister(multiprocessing_exit_function)
             log.info("Worker ready")
 
+    def _sync(self) -> None:
+        """
+        Update the controllers view (after reload)
+        The view is rebuilt from the controller slots (shared memory) if their
+        version changed; if the slots are being updated (odd version) or they
+        change meanwhile, the current view is kept (till the next time).
+        So, each process switches from the previous view to the new one at once.
+        """
+        generation = self._generation.value
+        if generation == self._view_generation or generation % 2:
+            return
+
+        view: Dict[str, SharedController] = {}
+        for slot in self._slots:
+            label = slot.label()
+            if label is not None:
+                slot.name, slot.baseclass = label
+                view[slot.name] = slot
+
+        if self._generation.value == generation:
+            self._controllers = view
+            self._view_generation = generation
+
     def controllers(self) -> Dict[str, str]:
         """
         :return: List of enabled controllers' names and their types
         """
+        self._sync()
         return dict(
             (c.name, c.baseclass)
             for c in self._controllers.values())
 
-    def _get_ctrl(self, cname: str) -> Controller:
+    def _dispatch(self, cname: str, state: Dict, source: str, rule: int, since: float) -> None:
+        """
+        Dispatch rule action
+        Called in the rule source controller worker.
+        :param cname: Target controller name
+        :param state: State change
+        :param source: Rule source controller name
+        :param rule: Rule index
+        :param since: Triggering sample time (monotonic clock)
+        """
+        controller = self._get_ctrl(cname)
+        if controller is None:
+            log.warning(f"{source}: Rule {rule} target {cname} doesn't exist (any more)")
+            return
+
+        controller.rule_set_state(state, source, rule, since)
+
+    def _get_ctrl(self, cname: str) -> SharedController:
         """
         :param cname: Controller name
         :return: Controller or None if it doesn't exist
         """
+        self._sync()
         return self._controllers.get(cname)
 
     def get_state(self, cname: str = None) -> Dict:
@@ -93,14 +214,34 @@ class Backend:
         Get controller state
         :param cname: Controller name or None
         :return: Current constroller state or dict of (name, state) of all of them
+                 (controllers which aren't ready have "error" instead of "state")
         """
         if cname is None:
-            return {
-                "controllers" : [{
-                    "name" : cname,
-                    "state" : self.get_state(cname),
-                } for cname in self._controllers.keys()]
-            }
+            self._sync()
+
+            # The requests are sent to all the controllers first (each has
+            # its own pipe), so that they're executed in parallel (fan-out)
+            while len(self._fanout_pipes) < len(self._controllers):
+                self._fanout_pipes.append(Pipe(duplex=False))
+
+            requests: List[Tuple[str, Union[Callable[[], Dict], Exception]]] = []
+            for (cname, controller), pipe in zip(self._controllers.items(), self._fanout_pipes):
+                try:
+                    requests.append((cname, controller.request_state(*pipe)))
+                except SharedController.NotReady as x:
+                    requests.append((cname, x))
+
+            states: List[Dict] = []
+            for cname, request in requests:
+                try:
+                    if isinstance(request, Exception):
+                        raise request
+
+                    states.append({"name" : cname, "state" : request()})
+                except SharedController.NotReady as x:
+                    states.append({"name" : cname, "error" : str(x)})
+
+            return {"controllers" : states}
 
         controller = self._get_ctrl(cname)
         return None if controller is None else controller.get_state(*self._pipe)
@@ -113,6 +254,7 @@ class Backend:
         :return: Current constroller state or dict of (name, state) of all of them
         """
         if cname is None:
+            self._check_ready(c["name"] for c in state["controllers"])  # all or nothing
             for controller in state["controllers"]:
                 self.set_state(controller["name"], controller["state"])
 
@@ -121,6 +263,17 @@ class Backend:
         controller = self._get_ctrl(cname)
         return None if controller is None else controller.set_state(state, *self._pipe)
 
+    def _check_ready(self, cnames: Iterator[str]) -> None:
+        """
+        Check that controllers are ready
+        :param cnames: Controller names (unknown ones are ignored)
+        :raise SharedController.NotReady: if any of them isn't
+        """
+        for cname in cnames:
+            controller = self._get_ctrl(cname)
+            if controller is not None:
+                controller.check_ready()
+
     def mute_set_state(self, cname: str = None, state: Dict = {}) -> None:
         """
         Set controller state discarding the result
@@ -195,10 +348,152 @@ class Backend:
         """
         self._scheduler.cancel()
 
-    def _async_chunks(self, cgens: List[Tuple[str, Iterator[Dict]]]) -> Iterator[Dict]:
+    def history(self, cname: str, query: Dict = {}) -> Dict:
+        """
+        Get recent samples from controller history buffer
+        :param cname: Controller name
+        :param query: History query (time range, decimation, axes)
+        :return: Samples (lists of timestamps and values) or None if
+                 the controller doesn't exist or doesn't keep history
+        """
+        controller = self._get_ctrl(cname)
+        return None if controller is None else controller.get_history(query)
+
+    def rules(self) -> List[Dict]:
+        """
+        Get rules statistics
+        :return: Rules (incl. reaction latency) per source controller
+        """
+        self._sync()
+        rules = [
+            (cname, controller.get_rules())
+            for cname, controller in self._controllers.items()]
+
+        return [{
+            "controller" : cname,
+            "rules" : stats,
+        } for cname, stats in rules if stats is not None]
+
+    def buses(self) -> List[Dict]:
+        """
+        Get shared I2C buses statistics
+        :return: Bus arbiters statistics (incl. utilisation)
+        """
+        return [arbiter.stats() for arbiter in i2c.arbiters()]
+
+    def processes(self) -> List[Dict]:
+        """
+        Get processes memory usage
+        :return: Master, API workers, controller workers, scheduler and bus
+                 arbiters processes and their memory usage (see wipi.util.memory),
+                 the last item is the total
+        """
+        self._sync()
+        known: Dict[int, str] = {self._master_pid: "master"}
+        for controller in self._controllers.values():
+            known.update((pid, name) for name, pid in controller.pids())
+        if self._scheduler.pid is not None:
+            known[self._scheduler.pid] = "Scheduler"
+        known[self._supervisor.pid] = "Supervisor"
+        known.update(
+            (arbiter.pid, f"Arbiter(i2c-{arbiter.number})")
+            for arbiter in i2c.arbiters() if arbiter.pid is not None)
+
+        pids = list(known)
+        try:  # API workers are the other master's children
+            with open(f"/proc/{self._master_pid}/task/{self._master_pid}/children") as children:
+                pids.extend(pid for pid in map(int, children.read().split()) if pid not in known)
+
+        except OSError:
+            if getpid() not in known:
+                pids.append(getpid())
+
+        processes = [
+            dict(name=known.get(pid, "API worker"), pid=pid, **usage)
+            for pid, usage in ((pid, memory(pid)) for pid in pids) if usage is not None
+        ]
+
+        total: Dict = {"name": "total", "pid": None}
+        for field in ("rss", "pss", "private"):
+            values = [p[field] for p in processes if p[field] is not None]
+            total[field] = sum(values) if values else None
+
+        return processes + [total]
+
+    def startup(self) -> Dict:
+        """
+        Get startup timing
+        Phases (durations [s]): "interpreter" (master process start till
+        the wipi package import), "import" (wipi packages, i.e. backend
+        and controllers package),
+        "load" (controllers modules import and instances creation),
+        "fork" (backend creation, i.e. controller workers start) and "app"
+        (web application load); "total" is the process start till the API
+        is loaded and "ready" till all controllers are set up (None till then;
+        failed ones are left out).
+        :return: Startup phases and controllers timing (module "import",
+                 instance "create", "setup" [s] and "ready" since the process
+                 start [s]) and status (see SharedController.status)
+        """
+        self._sync()
+        ctrl_startup = controllers_startup()
+        process_started = started(self._master_pid)
+        since = ctrl_startup["started"] if process_started is None else process_started
+
+        ctrls: List[Dict] = []
+        for cname, controller in self._controllers.items():
+            status = controller.status()
+            if status["ready"] is not None:
+                status["ready"] -= since
+
+            ctrls.append(dict(
+                name=cname, **ctrl_startup["controllers"].get(cname, {}), **status))
+
+        initializing = any(c["status"] == "initializing" for c in ctrls)
+        ready = [c["ready"] for c in ctrls if c["ready"] is not None]
+        return {
+            "phases" : {
+                "interpreter" : None if process_started is None else
+                                ctrl_startup["started"] - process_started,
+                "import" : ctrl_startup.get("import"),
+                "load" : ctrl_startup.get("load"),
+                "fork" : self._forked - self._created,
+                "app" : None if self._loaded is None else self._loaded - self._forked,
+                "total" : None if self._loaded is None else self._loaded - since,
+                "ready" : None if initializing else max(ready, default=self._forked - since),
+            },
+            "controllers" : ctrls,
+        }
+
+    def record(self, cname: str, query: Dict = {}) -> Iterator[str]:
+        """
+        Stream recorded samples
+        :param cname: Controller name
+        :param query: Recording query (time range, decimation, axes, block size)
+        :return: JSON list stream chunks generator or None if the controller
+                 doesn't exist or doesn't record
+        """
+        controller = self._get_ctrl(cname)
+        chunks = None if controller is None else controller.get_recording(query)
+        if chunks is None:
+            return None
+
+        def stream() -> Iterator[str]:
+            separator = "["
+            for chunk in chunks:
+                yield separator + jsonify(chunk)
+                separator = ", "
+
+            yield "[]" if separator == "[" else "]"  # finish the JSON list stream
+
+        return stream()
+
+    def _async_chunks(self, cgens: List[Tuple[str, Iterator[Dict]]], timeout: float = None) -> Iterator[Dict]:
         """
         Generate chunks of (aggregate) response stream asynchronously
         :param cgens: Chunk data generators
+        :param timeout: Interim chunk is generated if no chunk comes in time [s]
+                        (default: chunking timeout)
         :return: JSON response chunks generator
         """
         queue = Queue()
@@ -208,7 +503,8 @@ class Backend:
             nonlocal queue
             nonlocal done
             for chunk in cgen:
-                queue.put({"name": name, "data": chunk})
+                if chunk is not None:  # heartbeats are generated below
+                    queue.put({"name": name, "data": chunk})
             queue.put(done)  # signal that we're finished
 
         threads = [
@@ -221,7 +517,7 @@ class Backend:
         cgen_alive = len(threads)
         while cgen_alive > 0:
             try:
-                chunk = queue.get(timeout=self._chunking_timeout)
+                chunk = queue.get(timeout=timeout or self._chunking_timeout)
                 if chunk is done:
                     cgen_alive -= 1
                     continue
@@ -234,6 +530,19 @@ class Backend:
         for thread in threads:
             thread.join()
 
+    def _state_chunks(self, cname: str, query: Dict) -> Iterator[Dict]:
+        """
+        Controller state sampling chunks generator
+        :param cname: Controller name
+        :param query: State sampling query ("interval" [s] and "duration" [s])
+        :return: Timestamped controller states generator
+        """
+        controller = self._get_ctrl(cname)
+        pipe = Pipe(duplex=False)
+        sampler = Sampler(query.get("interval", 1.0), query.get("duration"))
+        for tick in sampler:
+            yield dict(controller.get_state(*pipe), timestamp=timestamp(tick))
+
     def _downstream_chunks(self, query: Dict, cname: str = None) -> Iterator[Dict]:
         """
         Downstream data chunks generator
@@ -242,12 +551,32 @@ class Backend:
         :return: Downstream data chunks generator
         """
         if cname is None:
-            return self._async_chunks(list(filter(lambda g: g is not None, (
-                (ctrl["name"], self._downstream_chunks(ctrl["query"], ctrl["name"]))
-                for ctrl in query["controllers"]))))
+            # All the streams start or none does
+            self._check_ready(ctrl["name"] for ctrl in query["controllers"])
+
+            cgens = [
+                (ctrl["name"], self._state_chunks(ctrl["name"], ctrl["state"])
+                    if "state" in ctrl else
+                    self._downstream_chunks(ctrl.get("query", {}), ctrl["name"]))
+                for ctrl in query["controllers"]
+                if self._get_ctrl(ctrl["name"]) is not None]
+
+            align = query.get("align")
+            if align is None:
+                return self._async_chunks(cgens)
+
+            try:
+                aligner = Aligner([name for name, _ in cgens], **align)
+            except (ValueError, TypeError) as x:
+                return iter([{"error" : str(x)}])
+
+            return aligner.join(self._async_chunks(
+                cgens, min(self._chunking_timeout, aligner.delay / 2)))
 
+        # Each stream has its own pipe (closed if the stream consumer is gone,
+        # so that the controller worker stops streaming, see SharedController.downstream)
         controller = self._get_ctrl(cname)
-        return None if controller is None else controller.downstream(query, *self_pipe)
+        return None if controller is None else controller.downstream(query, *Pipe(duplex=False))
 
     def downstream(self, cname: str = None, query: Dict = {}) -> Iterator[str]:
         """
@@ -265,30 +594,232 @@ class Backend:
         The same mechanism may be used by controllers themselves---by generating
         None chunk, the interim white space shall be sent.
 
+        Controller states may be streamed, too (sampled in "state" "interval").
+        If the query sets "align", the streams are joined on common timebase,
+        one merged record per tick is produced (see wipi.api.align).
+
         :param cname: Constroller name or None
         :param query: Downstream query
         :return: Downstream data chunks generator
+        :raise SharedController.NotReady: if a controller isn't ready
+                                          (before streaming starts)
         """
-        separator = "["
-        for chunk in self._downstream_chunks(query, cname):
-            yield ' ' if chunk is None else separator + jsonify(chunk)
-            separator = ", "
+        chunks = self._downstream_chunks(query, cname)
+
+        def stream() -> Iterator[str]:
+            separator = "["
+            for chunk in chunks:
+                if chunk is None:
+                    yield ' '  # heartbeat
+                else:
+                    yield separator + jsonify(chunk)
+                    separator = ", "
+
+            yield "[]" if separator == "[" else "]"  # finish the JSON list stream
 
-        yield "[]" if separator == "[" else "]"  # finish the JSON list stream
+        return stream()
+
+    def reload(self, config: Dict = None) -> Dict:
+        """
+        Reconfigure controllers (without restart)
+
+        The new configuration is compared to the running one: controllers
+        which configuration is the same keep running (incl. their state and
+        the deferred actions), removed ones stop accepting requests, finish
+        the queued ones and stop, added and reconfigured ones are started
+        (in spare controller slots, see the "reload" "slots" configuration).
+        All the processes switch to the new set of controllers at once.
+
+        Controllers added or reconfigured by reload can't share worker,
+        have process pool, history, recording, rules or use a bus arbiter
+        (their shared memory and workers must exist before the API workers
+        start).
+
+        :param config: New configuration (None means re-read the configuration file)
+        :return: Names of "added", "removed", "reconfigured" and "unchanged"
+                 controllers and the reconfiguration "duration" [s]
+        :raise Backend.Error: if the configuration can't be applied (nothing
+                              is changed then)
+        """
+        result = self._supervisor.reload(config, self._pipe)
+        if "error" in result:
+            raise Backend.Error(result["error"])
+
+        self._sync()
+        return result
+
+    def _reconfigure(self, config: Dict = None) -> Dict:
+        """
+        Apply new configuration (executed by the supervisor, see reload)
+        :param config: New configuration (None means re-read the configuration file)
+        :return: Reconfiguration result
+        """
+        started = monotonic()
+        if config is None:
+            config = read_config()
+
+        self._sync()
+        configs: Dict[str, Dict] = dict(
+            (ctrl["name"], ctrl)
+            for ctrl in config.get("controllers", []) if ctrl.get("enabled", False))
+
+        removed = [name for name in self._configs if name not in configs]
+        added = [name for name in configs if name not in self._configs]
+        changed = [name for name in configs if name in self._configs and configs[name] != self._configs[name]]
+        unchanged = [name for name in configs if name in self._configs and configs[name] == self._configs[name]]
+
+        # Check that the changes may be done
+        for name in removed + changed:
+            if self._configs[name].get("worker") is not None:
+                raise Backend.Error(f"{name}: Controller sharing worker can't be removed "
+                    "or reconfigured (restart required)")
+
+        for name in added + changed:
+            if name in self._controllers and name not in self._configs:
+                raise Backend.Error(f"{name}: Controller isn't configured")
+
+            restart = [key for key in ("worker", "history", "record", "rules") if key in configs[name]]
+            if "arbiter" in configs[name].get("kwargs", {}):  # clients are created before the arbiters start
+                restart.append("arbiter")
+            if restart:
+                raise Backend.Error(f"{name}: {', '.join(restart)} can't be set by reload "
+                    "(restart required)")
+
+        for controller in controllers():
+            if controller.name in unchanged and controller.rules is not None:
+                for rule in controller.rules.rules:
+                    if rule.target in removed:
+                        raise Backend.Error(f"{controller.name}: Rule {rule.name} target "
+                            f"{rule.target} can't be removed")
+
+        slots = [slot for slot in self._spares if slot.status()["status"] == "stopped"]
+        if len(added + changed) > len(slots):
+            raise Backend.Error(f"Not enough spare controller slots "
+                f"({len(added + changed)} needed, {len(slots)} free)")
+
+        # Create the new controllers (errors leave the running ones intact)
+        instances = [create_controller(configs[name]) for name in added + changed]
+
+        self._generation.value += 1  # the slots are being updated (see _sync)
+        bound: List[SharedController] = []
+        try:
+            for slot, instance in zip(slots, instances):
+                slot.bind(instance)
+                bound.append(slot)
+
+            for name in removed + changed:
+                controller = self._controllers[name]
+                controller.drain()
+                self._stopping.append(controller)
+
+        except Exception:
+            for slot in bound:
+                slot.unbind()
+            raise
+
+        finally:
+            self._generation.value += 1
+
+        for slot in bound:
+            slot.start()
+
+        self._configs = configs
+        self._sync()
+
+        result = {
+            "added" : added,
+            "removed" : removed,
+            "reconfigured" : changed,
+            "unchanged" : unchanged,
+            "duration" : monotonic() - started,
+        }
+
+        log.info(f"Reconfigured: {result}")
+        return result
+
+    def _reap(self) -> None:
+        """
+        Wait for the removed controllers workers to terminate
+        (executed by the supervisor after reconfiguration)
+        """
+        for controller in self._stopping:
+            controller.stop(Backend.STOP_TIMEOUT)
+
+        self._stopping = []
+
+    def _start_workers(self) -> None:
+        """
+        Start the controller and scheduler workers (executed by the supervisor)
+        """
+        for controller in self._controllers.values():
+            controller.start()
+
+        self._scheduler.start()
+
+    def _supervised(self) -> List[Supervised]:
+        """
+        :return: Objects which workers are supervised (see Supervisor)
+        """
+        return self._slots + [self._scheduler]
+
+    def _stop_workers(self) -> None:
+        """
+        Stop the scheduler and controller workers, incl. those started by
+        reload (executed by the supervisor when it terminates)
+        """
+        self._scheduler.stop()
+        self._reap()
+        for slot in self._spares:
+            if slot.label() is not None:
+                slot.stop()
+        for controller in self._originals:
+            controller.stop()
+
+    def supervision(self) -> Dict:
+        """
+        Get workers supervision statistics
+        :return: Controllers' and scheduler's worker "status" (see
+                 SharedController.status), restarts (see Restarts.stats)
+                 and "realtime" settings (if configured, see wipi.realtime),
+                 scheduler task execution "timing" (see Scheduler.timing)
+        """
+        self._sync()
+        controllers = []
+        for cname, controller in self._controllers.items():
+            stats = dict(name=cname, status=controller.status()["status"], **controller.restarts.stats())
+            realtime = controller.realtime_status()
+            if realtime is not None:
+                stats["realtime"] = realtime
+            controllers.append(stats)
+
+        scheduler = dict(
+            status="ready" if self._scheduler.pid is not None else "restarting",
+            **self._scheduler.restarts.stats(), timing=self._scheduler.timing())
+        realtime = self._scheduler.realtime_status()
+        if realtime is not None:
+            scheduler["realtime"] = realtime
+
+        return {
+            "controllers" : controllers,
+            "scheduler" : scheduler,
+        }
 
     def shutdown(self):
         """
         Shut backend down
+        Pending log records are written (uWSGI workers exit by os._exit).
         """
         if getpid() == self._master_pid:  # this worker is the master
-            self._scheduler.stop()
-            for controller in self._controllers.values():
-                controller.stop()
+            self._supervisor.stop()
+            for arbiter in i2c.arbiters():
+                arbiter.stop()
 
             log.info("Master worker shut down")
 
         else:
             log.info("Worker shut down")
 
+        flush_log()
+
     def __del__(self):
         self.shutdown()
@@ -1,4 +1,4 @@
-from typing import Union, Iterator, Dict
+from typing import Union, Iterator, Dict, List
 from json import dumps as jsonify
 from http import HTTPStatus
 
@@ -6,6 +6,8 @@ from flask import Response, request as req
 from flask_voluptuous import expect, Schema, Required, All, Union as Uni
 
 from . import app, backend
+from .backend import Backend
+from .shared_controller import SharedController
 
 
 def empty_resp(status: int = HTTPStatus.NO_CONTENT) -> Response:
@@ -24,7 +26,7 @@ def raw_resp(content: Union[str, Iterator[str]], mime_type: str, status: int) ->
     """
     return Response(content, status=status, mimetype=mime_type)
 
-def resp(content: Dict, status: int = HTTPStatus.OK, **kwargs) -> Response:
+def resp(content: Union[Dict, List], status: int = HTTPStatus.OK, **kwargs) -> Response:
     """
     Produce JSON responce
     :param content: JSON response content
@@ -53,6 +55,11 @@ def _contract(args) -> Response:
             "response" : {
                 "error" : "Error message"
             },
+            "initializing" : "Requests for controllers which aren't ready (still " +
+                             "initializing, restarting or failed to initialize) get error " +
+                             "response with status 503 (and Retry-After header while " +
+                             "initializing or restarting); so do requests in progress " +
+                             "when the controller worker crashes",
         },
 
         "requests" : [{
@@ -76,6 +83,7 @@ def _contract(args) -> Response:
                 "controllers" : [{
                     "name" : "controller name",
                     "state" : "{... controller state dict ...}",
+                    "error" : "Error message instead of state if the controller isn't ready",
                 }],
             },
         }, {
@@ -165,6 +173,171 @@ def _contract(args) -> Response:
             "method" : "GET",
             "description" : "Cancel all scheduled status sets/changes",
             "response" : "None, will just respond with 204 on successful scheduling",
+        }, {
+            "uri" : req.url_root + "history/<controller name>",
+            "method" : "POST",
+            "description" : "Get recent samples from controller history buffer " +
+                            "(if enabled in controller configuration)",
+            "request" : {
+                "seconds" : "Optional float, get the last N seconds of samples",
+                "from" : "Optional float, time range start (epoch timestamp)",
+                "to" : "Optional float, time range end (epoch timestamp)",
+                "decimate" : "Optional integer, get every N-th sample only",
+                "axes" : ["Optional list of channels, e.g. 'accel_data.x'"],
+            },
+            "response" : {
+                "timestamp" : ["sample timestamps"],
+                "<channel group>" : {
+                    "<channel>" : ["channel values"],
+                },
+            },
+        }, {
+            "uri" : req.url_root + "rules",
+            "method" : "GET",
+            "description" : "Get rules (evaluated on controller samples) statistics",
+            "response" : [{
+                "controller" : "Rule source controller name",
+                "rules" : [{
+                    "name" : "Rule name",
+                    "target" : "Target controller name",
+                    "active" : "Rule is triggered",
+                    "value" : "Last rule function value",
+                    "triggers" : "Number of triggers",
+                    "releases" : "Number of releases",
+                    "suppressed" : "Number of actions suppressed by rate limit",
+                    "reactions" : "Number of actions done",
+                    "latency" : {
+                        "last" : "Last reaction latency [s]",
+                        "mean" : "Mean reaction latency [s]",
+                        "max" : "Max. reaction latency [s]",
+                    },
+                }],
+            }],
+        }, {
+            "uri" : req.url_root + "buses",
+            "method" : "GET",
+            "description" : "Get shared I2C buses (arbiters) statistics",
+            "response" : [{
+                "bus" : "Bus number",
+                "clients" : "Number of client controllers",
+                "requests" : "Number of requests (transaction batches) done",
+                "transactions" : "Number of requested transactions",
+                "bus_transactions" : "Number of bus transactions (after coalescing)",
+                "coalesced" : "Number of byte reads done by block reads",
+                "errors" : "Number of failed requests",
+                "utilisation" : "Bus utilisation (fraction of time busy)",
+                "utilisation_recent" : "Bus utilisation in the last second",
+                "wait" : {
+                    "mean" : "Mean request waiting time [s]",
+                    "max" : "Max. request waiting time [s]",
+                },
+                "pending_max" : "Max. number of pending requests",
+            }],
+        }, {
+            "uri" : req.url_root + "processes",
+            "method" : "GET",
+            "description" : "Get processes memory usage (the last item is the total)",
+            "response" : [{
+                "name" : "Process name (master, API worker, controller worker...)",
+                "pid" : "Process ID",
+                "rss" : "Resident set size [B]",
+                "pss" : "Proportional set size (shared pages split among sharers) [B]",
+                "private" : "Private (not shared) memory size [B]",
+            }],
+        }, {
+            "uri" : req.url_root + "reload",
+            "method" : "POST",
+            "description" : "Reconfigure controllers without restart (controllers " +
+                            "of unchanged configuration keep running)",
+            "request" : {
+                "controllers" : ["Optional, controllers configuration (as in the " +
+                                 "configuration file, which is re-read if not set)"],
+            },
+            "response" : {
+                "added" : ["Started controllers"],
+                "removed" : ["Stopped controllers"],
+                "reconfigured" : ["Restarted controllers"],
+                "unchanged" : ["Controllers kept running"],
+                "duration" : "Reconfiguration duration [s]",
+            },
+        }, {
+            "uri" : req.url_root + "startup",
+            "method" : "GET",
+            "description" : "Get startup timing and controllers status",
+            "response" : {
+                "phases" : {
+                    "interpreter" : "Process start till wipi import [s]",
+                    "import" : "wipi packages import [s]",
+                    "load" : "Controllers modules import and creation [s]",
+                    "fork" : "Controller workers start [s]",
+                    "app" : "Web application load [s]",
+                    "total" : "Process start till the API is loaded [s]",
+                    "ready" : "Process start till all controllers are ready [s] " +
+                              "(null till then)",
+                },
+                "controllers" : [{
+                    "name" : "Controller name",
+                    "status" : "initializing, ready or failed",
+                    "import" : "Controller module import [s]",
+                    "create" : "Controller creation [s]",
+                    "setup" : "Controller (device) setup in its worker [s]",
+                    "ready" : "Process start till the controller is ready [s]",
+                    "error" : "Setup error (if failed)",
+                }],
+            },
+        }, {
+            "uri" : req.url_root + "supervision",
+            "method" : "GET",
+            "description" : "Get worker supervision statistics (crashed workers " +
+                            "are respawned)",
+            "response" : {
+                "controllers" : [{
+                    "name" : "Controller name",
+                    "status" : "initializing, ready, restarting...",
+                    "restarts" : "Number of worker restarts",
+                    "exitcode" : "Last crashed worker exit code (negative signal number)",
+                    "crashed_ago" : "Time since the last crash [s]",
+                    "down" : "Whether the worker is down (crashed, not ready again)",
+                    "recovery" : {
+                        "last" : "Last recovery time (crash till ready) [s]",
+                        "max" : "Max. recovery time [s]",
+                    },
+                    "realtime" : {
+                        "config" : "Configured worker real-time settings (if any)",
+                        "warnings" : "Settings the process lacks privileges for",
+                        "workers" : [{
+                            "cpus" : "CPU affinity",
+                            "policy" : "Scheduling policy (other, fifo...)",
+                            "priority" : "Real-time priority",
+                            "nice" : "Nice level",
+                            "locked" : "Locked memory [B]",
+                        }],
+                    },
+                }],
+                "scheduler" : "Scheduler worker status, restarts and real-time settings " +
+                              "(as above) and task execution timing (executed tasks, " +
+                              "mean and max. lateness and jitter [s])",
+            },
+        }, {
+            "uri" : req.url_root + "record/<controller name>",
+            "method" : "POST",
+            "description" : "Stream recorded samples from controller recorder " +
+                            "(if enabled in controller configuration, using " +
+                            "chunked-encoded HTML response)",
+            "request" : {
+                "seconds" : "Optional float, get the last N seconds of samples",
+                "from" : "Optional float, time range start (epoch timestamp)",
+                "to" : "Optional float, time range end (epoch timestamp)",
+                "decimate" : "Optional integer, get every N-th sample only",
+                "axes" : ["Optional list of channels, e.g. 'accel_data.x'"],
+                "block" : "Optional integer, max. number of samples per chunk",
+            },
+            "response" : [{
+                "timestamp" : ["sample timestamps"],
+                "<channel group>" : {
+                    "<channel>" : ["channel values"],
+                },
+            }],
         }, {
             "uri" : req.url_root + "downstream",
             "method" : "POST",
@@ -174,12 +347,30 @@ def _contract(args) -> Response:
                 "controllers": [{
                     "name" : "controller name",
                     "query" : "{... controller streaming query ...}",
+                    "state" : {
+                        "interval" : "Optional float, stream controller state " +
+                                     "sampled in this interval [s] instead " +
+                                     "of its data stream",
+                        "duration" : "Optional float, state sampling duration [s]",
+                    },
                 }],
+                "align" : {
+                    "interval" : "Required float, join the streams on common " +
+                                 "timebase, producing a record each interval [s]",
+                    "tolerance" : "Optional float, max. sample distance from " +
+                                  "record time [s] (default: interval)",
+                    "method" : "Optional 'hold' (last sample values, default) " +
+                               "or 'interpolate'",
+                    "delay" : "Optional float, max. record delay waiting for " +
+                              "lagging streams [s] (default: 1)",
+                },
             },
             "response" : [
                 "{... controllers' stream data chunks comming incrementally " +
                 "(note that they'll come in an interleaved manner, as individual " +
                 "controllers produce them) ...}",
+                "{... or, if aligned, records with 'timestamp' and data of " +
+                "each controller (or null if not available) ...}",
             ],
         }, {
             "uri" : req.url_root + "downstream/<controller name>",
@@ -301,10 +492,20 @@ def _cancel_deferred(args) -> Response:
 @expect(Schema({
     Required("controllers") : [{
         Required("name") : str,
-        Required("query") : {
+        "query" : {
             str : All(),
-        }
-    }]
+        },
+        "state" : {
+            "interval" : Uni(float, int),
+            "duration" : Uni(float, int),
+        },
+    }],
+    "align" : {
+        Required("interval") : Uni(float, int),
+        "tolerance" : Uni(float, int),
+        "method" : str,
+        "delay" : Uni(float, int),
+    },
 }))
 def _downstreams(json) -> Response:
     return chunked_resp(backend.downstream(query=json))
@@ -316,3 +517,111 @@ def _downstreams(json) -> Response:
 }))
 def _downstream(cname, json) -> Response:
     return chunked_resp(backend.downstream(cname, json))
+
+
+@app.route("/history/<cname>", methods=["POST"])
+@expect(Schema({
+    "seconds" : Uni(float, int),
+    "from" : Uni(float, int),
+    "to" : Uni(float, int),
+    "decimate" : int,
+    "axes" : [str],
+}))
+def _history(cname, json) -> Response:
+    try:
+        history = backend.history(cname, json)
+    except ValueError as x:
+        return resp({"error" : str(x)}, HTTPStatus.BAD_REQUEST)
+
+    if history is not None:
+        return resp(history)
+
+    return resp(
+        {"error" : "No such controller, not enabled or history not enabled"},
+        HTTPStatus.NOT_FOUND)
+
+
+@app.route("/record/<cname>", methods=["POST"])
+@expect(Schema({
+    "seconds" : Uni(float, int),
+    "from" : Uni(float, int),
+    "to" : Uni(float, int),
+    "decimate" : int,
+    "axes" : [str],
+    "block" : int,
+}))
+def _record(cname, json) -> Response:
+    try:
+        chunks = backend.record(cname, json)
+    except ValueError as x:
+        return resp({"error" : str(x)}, HTTPStatus.BAD_REQUEST)
+
+    if chunks is not None:
+        return chunked_resp(chunks)
+
+    return resp(
+        {"error" : "No such controller, not enabled or recorder not enabled"},
+        HTTPStatus.NOT_FOUND)
+
+
+@app.route("/rules", methods=["GET"])
+@expect(Schema({}), 'args')  # no arguments expected
+def _rules(args) -> Response:
+    return resp(backend.rules())
+
+
+@app.route("/buses", methods=["GET"])
+@expect(Schema({}), 'args')  # no arguments expected
+def _buses(args) -> Response:
+    return resp(backend.buses())
+
+
+@app.route("/processes", methods=["GET"])
+@expect(Schema({}), 'args')  # no arguments expected
+def _processes(args) -> Response:
+    return resp(backend.processes())
+
+
+@app.route("/startup", methods=["GET"])
+@expect(Schema({}), 'args')  # no arguments expected
+def _startup(args) -> Response:
+    return resp(backend.startup())
+
+
+@app.route("/supervision", methods=["GET"])
+@expect(Schema({}), 'args')  # no arguments expected
+def _supervision(args) -> Response:
+    return resp(backend.supervision())
+
+
+@app.route("/reload", methods=["POST"])
+@expect(Schema({
+    "controllers" : [{
+        Required("name") : str,
+        Required("class") : str,
+        str : All(),
+    }],
+    str : All(),
+}))
+def _reload(json) -> Response:
+    try:
+        return resp(backend.reload(json or None))
+    except Backend.Error as x:
+        return resp({"error" : str(x)}, HTTPStatus.BAD_REQUEST)
+
+
+@app.errorhandler(SharedController.NotReady)
+def _not_ready(error: SharedController.NotReady) -> Response:
+    response = resp({"error" : str(error)}, HTTPStatus.SERVICE_UNAVAILABLE)
+    if error.initializing:
+        response.headers["Retry-After"] = "1"
+
+    return response
+
+
+@app.errorhandler(ConnectionAbortedError)
+def _aborted(error: ConnectionAbortedError) -> Response:
+    response = resp({"error" : str(error)}, HTTPStatus.SERVICE_UNAVAILABLE)
+    response.headers["Retry-After"] = "1"
+
+    return response
@@ -1,23 +1,100 @@
 from __future__ import annotations
-from typing import Dict, Iterator, Callable, Any
+from typing import Dict, List, Set, Tuple, Iterator, Callable, Any, Optional, cast
 from abc import ABC, abstractmethod
 from multiprocessing import Process, Pipe, Lock
-from multiprocessing.connection import Connection
+from multiprocessing.connection import Connection, wait
+from multiprocessing.sharedctypes import RawValue, RawArray
+from threading import Thread
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from time import monotonic, sleep
+from zlib import crc32
+from functools import partial
+import asyncio
+import os
+import signal
 
-from wipi.controller import Controller
+from wipi.controller import Controller, AsyncController, controllers
 from wipi.log import get_logger
+from wipi.realtime import Realtime
+from wipi.supervisor import Supervised, Restarts
+from wipi.util import sequence, receive
 
 
 log = get_logger(__name__)
 
 
-class SharedController(Controller):
+class SharedController(Controller, Supervised):
     """
     Controller implementation wrapper, executing controller actions in a single
     wroker shared by all API workers.
     Allows for multiple API workers sharing a single controller instance.
+
+    Asynchronous controllers (see AsyncController) are run on an asyncio
+    event loop in the worker; the tasks are then executed concurrently.
+
+    Controllers which declare so (see Controller.concurrency) may be served
+    by a pool of workers, configured by the controller "pool":
+    * "kind": "threads" (thread safe controllers; threads in a single worker
+      process) or "processes" (stateless controllers; worker processes),
+    * "size": number of the pool workers.
+    State changes are executed in order per their ordering key (see
+    Controller.ordering_key), other tasks go to the least loaded thread
+    (or the processes in turn).
+    Acquisition runs in the primary (first) worker process, which therefore
+    serves the downstreams and (if the controller has any sinks) state changes.
+
+    Alternatively, several (single worker) controllers may share one worker
+    process (see share), saving memory; their tasks are then executed
+    in series.
+
+    The worker processes may run with real-time settings (CPU affinity,
+    nice level or SCHED_FIFO priority, memory locking) given by
+    the controller "realtime" configuration (see wipi.realtime).
+
+    The wrapped controller is set up (see Controller.setup) by the worker
+    once it starts; till then (or if the setup fails) the controller isn't
+    ready and requests for results are refused (see NotReady).
+    Tasks which don't give results (deferred and rule actions) are queued
+    in the meantime (and discarded if the setup fails).
+
+    Spare (controller-less) instances are slots for controllers added later
+    (see bind and Backend.reload); the controller name, type and worker
+    status are in shared memory, so that all the processes see them.
+
+    The workers are supervised (see wipi.supervisor); if a worker dies, the
+    requests it was executing or had queued fail at once and the worker is
+    respawned (and the controller set up again).
     """
 
+    THREADS = "threads"
+    PROCESSES = "processes"
+
+    THREADS_JOIN_TIMEOUT = 1.0  # pool threads may be busy with streams [s]
+
+    # Worker status
+    INITIALIZING = 0
+    READY = 1
+    FAILED = 2
+    STOPPING = 3  # draining tasks queued before stop
+    STOPPED = 4   # (or spare slot)
+    RESTARTING = 5  # the worker crashed
+
+    _status_names = ("initializing", "ready", "failed", "stopping", "stopped", "restarting")
+
+    class NotReady(Exception):
+        """
+        Controller isn't ready (it's initializing or its setup failed)
+        """
+
+        def __init__(self, message: str, initializing: bool):
+            """
+            :param message: Error message
+            :param initializing: The controller is initializing (may be ready later)
+            """
+            super().__init__(message)
+            self.initializing = initializing
+
     class Task(ABC):
         """
         Task for the shared controller (interface)
@@ -29,6 +106,30 @@ class SharedController(Controller):
             :param ctrl: Wrapped controller
             """
 
+        @abstractmethod
+        async def aexecute(self, ctrl: AsyncController) -> None:
+            """
+            Execute task on asynchronous controller
+            :param ctrl: Wrapped controller
+            """
+
+        def key(self, ctrl: Controller) -> Optional[str]:
+            """
+            Ordering key
+            The default implementation provides None (the task isn't ordered).
+            :param ctrl: Wrapped controller
+            :return: Ordering key or None
+            """
+            return None
+
+        def fail(self, error: str) -> None:
+            """
+            Report task failure (the task raised exception, or the controller
+            setup failed)
+            The default implementation does nothing.
+            :param error: Error message
+            """
+
     class ResultTask(Task):
         """
         Task which gives result back
@@ -39,13 +140,21 @@ class SharedController(Controller):
             :param pipe_we: Writing end of pipe (for results delivery)
             """
             self._pipe_we = pipe_we
+            self.seq = sequence()
 
         def send(self, result: Any) -> None:
             """
-            Send task result
+            Send task result (tagged by the task sequence number)
             :param result: Task result
             """
-            self._pipe_we.send(result)
+            self._pipe_we.send((self.seq, result))
+
+        def fail(self, error: str) -> None:
+            """
+            Send error as the task result
+            :param error: Error message
+            """
+            self.send({"error" : error})
 
     class GetStateTask(ResultTask):
         """
@@ -59,6 +168,9 @@ class SharedController(Controller):
             """
             self.send(ctrl.get_state())
 
+        async def aexecute(self, ctrl: AsyncController) -> None:
+            self.send(await ctrl.get_state())
+
     class SetStateTask(ResultTask):
         """
         Execute set_state on the shared controller
@@ -72,12 +184,22 @@ class SharedController(Controller):
             super().__init__(pipe_we)
             self._state = state
 
+        def key(self, ctrl: Controller) -> Optional[str]:
+            return ctrl.ordering_key(self._state)
+
         def execute(self, ctrl: Controller) -> None:
             """
             Execute ctrl.set_state
             :param ctrl: Wrapped controller
             """
-            self.send(ctrl.set_state(self._state))
+            state = ctrl.set_state(self._state)
+            self.send(state)
+            ctrl.state_changed(state)
+
+        async def aexecute(self, ctrl: AsyncController) -> None:
+            state = await ctrl.set_state(self._state)
+            self.send(state)
+            ctrl.state_changed(state)
 
     class MuteSetStateTask(Task):
         """
@@ -90,18 +212,72 @@ class SharedController(Controller):
             """
             self._state = state
 
+        def key(self, ctrl: Controller) -> Optional[str]:
+            return ctrl.ordering_key(self._state)
+
+        def execute(self, ctrl: Controller) -> None:
+            """
+            Execute ctrl.set_state
+            :param ctrl: Wrapped controller
+            """
+            ctrl.state_changed(ctrl.set_state(self._state))
+
+        async def aexecute(self, ctrl: AsyncController) -> None:
+            ctrl.state_changed(await ctrl.set_state(self._state))
+
+    class RuleSetStateTask(Task):
+        """
+        Execute set_state on the shared controller as a rule action,
+        record the reaction latency
+        """
+
+        def __init__(self, state: Dict, source: str, rule: int, since: float):
+            """
+            :param state: State changes
+            :param source: Rule source controller name
+            :param rule: Rule index
+            :param since: Triggering sample time (monotonic clock)
+            """
+            self._state = state
+            self._source = source
+            self._rule = rule
+            self._since = since
+
+        def key(self, ctrl: Controller) -> Optional[str]:
+            return ctrl.ordering_key(self._state)
+
         def execute(self, ctrl: Controller) -> None:
             """
             Execute ctrl.set_state
             :param ctrl: Wrapped controller
             """
-            ctrl.set_state(self._state)
+            state = ctrl.set_state(self._state)
+            self._reacted()
+            ctrl.state_changed(state)
+
+        async def aexecute(self, ctrl: AsyncController) -> None:
+            state = await ctrl.set_state(self._state)
+            self._reacted()
+            ctrl.state_changed(state)
+
+        def _reacted(self) -> None:
+            """
+            Record the reaction latency
+            """
+            for source in controllers():
+                if source.name == self._source and source.rules is not None:
+                    source.rules.reacted(self._rule, self._since)
 
     class DownstreamTask(ResultTask):
         """
         Execute downstream on the shared controller
+        None chunks (heartbeats) are passed through, the stream is concluded
+        by the END sentinel.
+        If the stream consumer is gone, the stream is closed.
         """
 
+        END = "end"  # end of stream sentinel
+
         def __init__(self, pipe_we: Connection, query: Dict):
             """
             :param pipe_we: Writing end of pipe (for results delivery)
@@ -112,48 +288,353 @@ class SharedController(Controller):
 
         def execute(self, ctrl: Controller):
             """
-            Stream via the pipe, finish by sending None
+            Stream via the pipe, finish by sending END
             :param ctrl: Wrapped controller
             """
-            for chunk in ctrl.downstream(self._query):
-                self.send(chunk)
-            self.send(None)
+            chunks = ctrl.downstream(self._query)
+            try:
+                for chunk in chunks:
+                    self.send(chunk)
+                self.send(SharedController.DownstreamTask.END)
+
+            except BrokenPipeError:
+                log.info(f"{ctrl.name}: Stream consumer is gone")
+                if hasattr(chunks, "close"):
+                    chunks.close()
+
+        async def aexecute(self, ctrl: AsyncController) -> None:
+            """
+            Stream via the pipe, finish by sending END
+            The chunks are sent by the stream's own sender thread, so that
+            slow stream consumers neither block the event loop nor hold up
+            other streams (or other executor jobs).
+            :param ctrl: Wrapped controller
+            """
+            loop = asyncio.get_running_loop()
+            sender = ThreadPoolExecutor(1, thread_name_prefix=f"{ctrl.name}-stream-{self.seq}")
+            chunks = ctrl.downstream(self._query)
+            try:
+                async for chunk in chunks:
+                    await loop.run_in_executor(sender, self.send, chunk)
+                await loop.run_in_executor(sender, self.send, SharedController.DownstreamTask.END)
+
+            except BrokenPipeError:
+                log.info(f"{ctrl.name}: Stream consumer is gone")
+                await chunks.aclose()
+
+            finally:
+                sender.shutdown(wait=False)
+
+        def fail(self, error: str) -> None:
+            """
+            Conclude the stream by error chunk
+            :param error: Error message
+            """
+            self.send({"error" : error})
+            self.send(SharedController.DownstreamTask.END)
 
-    def __init__(self, ctrl: Controller):
+    def __init__(self, ctrl: Controller = None):
         """
-        :param ctrl: Wrapped controller
+        :param ctrl: Wrapped controller (None creates spare slot, see bind)
         """
-        super().__init__(ctrl.name, ctrl.baseclass)
+        if ctrl is None:
+            super().__init__("", "")
+        else:
+            super().__init__(ctrl.name, ctrl.baseclass)
         self._ctrl = ctrl
+        self._workers: List[Process] = []
+        self._owner_pid: int = None  # the process which started the workers
+
+        # Controller name and type, worker status, setup duration [s] and ready
+        # time (monotonic clock) and setup error message (set by the worker)
+        # and restarts (see crashed); worker PIDs are set by the workers
+        # (see _configure)
+        self._label = RawArray('c', 256)
+        self._status = RawArray('d', 3)
+        self._error = RawArray('c', 256)
+        self.restarts = Restarts()
 
-        rend, wend = Pipe(duplex=False)
-        self._pipe_re = rend
-        self._pipe_we = wend
         self._pipe_wl = Lock()
-        self._worker = Process(
-            name=f"{self.__class__.__name__}({self._ctrl.__class__.__name__}.{self._ctrl.name})",
-            target=self._worker_routine)
+        self._next = RawValue('i', 0)  # next worker process (tasks in turn)
+
+        if ctrl is None:
+            self._pool_kind, self._pool_size = SharedController.THREADS, 1
+            self._realtime: Realtime = None
+            self._pipes = [Pipe(duplex=False)]
+            self._crashes = RawArray('i', 1)
+            self._pids = RawArray('i', 1)
+            self._status[0] = SharedController.STOPPED
+            log.info("Spare controller slot created")
+            return
+
+        self._configure()
+        log.info(f"{self.baseclass}.{self.name}: Controller created" +
+            (f" ({self._pool_size} {self._pool_kind})" if self._pool_size > 1 else ""))
+
+    def _configure(self) -> None:
+        """
+        Configure the worker(s) for the wrapped controller
+        """
+        self._members: List[SharedController] = [self]  # controllers served by the worker
+
+        pool = self._ctrl.pool or {}
+        self._pool_kind = pool.get("kind", SharedController.THREADS)
+        self._pool_size = int(pool.get("size", 1))
+        self._check_pool()
+        self._realtime = \
+            None if self._ctrl.realtime is None else Realtime(self.name, self._ctrl.realtime)
+
+        processes = self._pool_size if self._pool_kind == SharedController.PROCESSES else 1
+        if not hasattr(self, "_pipes"):
+            self._pipes = [Pipe(duplex=False) for _ in range(processes)]
+            self._crashes = RawArray('i', processes)  # per worker crash counters
+            self._pids = RawArray('i', processes)     # worker PIDs
+        elif len(self._pipes) < processes:
+            raise ValueError(f"{self.name}: Spare controller slot can't have process pool")
+
+        self._workers = [
+            Process(
+                name=f"{self.__class__.__name__}({self._ctrl.__class__.__name__}.{self._ctrl.name})" +
+                     (f"#{index}" if processes > 1 else ""),
+                target=self._worker_routine, args=(index,))
+            for index in range(processes)
+        ]
+
+        self._label.value = f"{self.name}\n{self.baseclass}".encode()[:len(self._label) - 1]
+
+    def bind(self, ctrl: Controller) -> None:
+        """
+        Bind controller to spare slot
+        The slot must be free (stopped and joined); the process which binds
+        the controller starts the worker (see start).
+        :param ctrl: Controller
+        """
+        assert int(self._status[0]) == SharedController.STOPPED, "Controller slot isn't free"
+
+        self.name, self.baseclass = ctrl.name, ctrl.baseclass
+        self._ctrl = ctrl
+        self._configure()
+
+        self._error.value = b""
+        self._status[1:] = [0.0, 0.0]
+        self._pids[:] = [0] * len(self._pids)
+        self._status[0] = SharedController.INITIALIZING
+        log.info(f"{self.baseclass}.{self.name}: Controller bound to spare slot")
+
+    def unbind(self) -> None:
+        """
+        Free spare slot (bound, but not started)
+        """
+        self._ctrl = None
+        self._workers = []
+        self._status[0] = SharedController.STOPPED
+
+    def label(self) -> Optional[Tuple[str, str]]:
+        """
+        Current controller name and type (read from shared memory)
+        :return: Name and type or None if the slot is free (or the controller
+                 is being stopped)
+        """
+        if int(self._status[0]) in (SharedController.STOPPING, SharedController.STOPPED):
+            return None
+
+        name, _, baseclass = self._label.value.decode().partition('\n')
+        return name, baseclass
+
+    def _check_pool(self) -> None:
+        """
+        Check the worker pool configuration against the controller
+        concurrency model
+        """
+        required = {
+            SharedController.THREADS : (Controller.THREAD_SAFE, Controller.STATELESS),
+            SharedController.PROCESSES : (Controller.STATELESS,),
+        }.get(self._pool_kind)
+
+        if required is None:
+            raise ValueError(f"{self.name}: Unknown worker pool kind: {self._pool_kind}")
+
+        if self._pool_size < 1:
+            raise ValueError(f"{self.name}: Invalid worker pool size: {self._pool_size}")
+
+        if self._pool_size > 1:
+            if isinstance(self._ctrl, AsyncController):
+                raise ValueError(f"{self.name}: Asynchronous controller doesn't need worker pool")
+
+            if self._ctrl.concurrency not in required:
+                raise ValueError(
+                    f"{self.name}: {self._pool_kind.capitalize()} worker pool requires "
+                    f"{' or '.join(required)} controller ({self._ctrl.concurrency} declared)")
+
+    def share(self, other: SharedController) -> None:
+        """
+        Serve another controller by this controller's worker
+        Must be called before the worker starts; the worker terminates when
+        this controller is stopped.
+        :param other: Controller sharing the worker
+        """
+        for member in (self, other):
+            if member._pool_size > 1 or isinstance(member._ctrl, AsyncController):
+                raise ValueError(
+                    f"{member.name}: Pooled or asynchronous controller can't share worker")
+
+        if other._ctrl.realtime != self._ctrl.realtime:
+            raise ValueError(
+                f"{other.name}: Controllers sharing worker must have the same real-time settings")
+
+        other._workers = []
+        self._members.append(other)
+        self._workers[0].name = \
+            f"{self.__class__.__name__}({', '.join(m.name for m in self._members)})"
+
+    def pids(self) -> List[Tuple[str, int]]:
+        """
+        :return: Worker process names and PIDs (read from shared memory if
+                 the workers are started by another process, i.e.
+                 the supervisor)
+        """
+        if self._workers and self._workers[0].pid is not None:
+            return [(worker.name, worker.pid) for worker in self._workers]
+
+        name = f"{self.__class__.__name__}({self.baseclass}.{self.name})"
+        if len(self._pids) == 1:
+            return [(name, self._pids[0])] if self._pids[0] else []
+
+        return [(f"{name}#{index}", pid) for index, pid in enumerate(self._pids) if pid]
 
-        log.info(f"{self.baseclass}.{self.name}: Controller created")
+    def realtime_status(self) -> Optional[Dict]:
+        """
+        Worker real-time settings
+        :return: Configured settings ("config"), startup "warnings" and
+                 the current settings of the worker processes ("workers",
+                 see Realtime.current) or None if not configured
+        """
+        if self._realtime is None:
+            return None
+
+        return {
+            "config" : self._realtime.config,
+            "warnings" : self._realtime.warnings,
+            "workers" : [Realtime.current(pid) for _, pid in self.pids()],
+        }
+
+    def status(self) -> Dict:
+        """
+        Worker status (read from shared memory)
+        :return: "status" ("initializing", "ready", "failed", "restarting"...), "setup"
+                 duration [s] and "ready" time (monotonic clock; None till
+                 the controller is ready) and setup "error" (if failed)
+        """
+        status = int(self._status[0])
+        report: Dict = {
+            "status" : SharedController._status_names[status],
+            "setup" : self._status[1] if status == SharedController.READY else None,
+            "ready" : self._status[2] if status == SharedController.READY else None,
+        }
+
+        if status == SharedController.FAILED:
+            report["error"] = self._error.value.decode(errors="replace")
+
+        return report
+
+    def check_ready(self) -> None:
+        """
+        Check that the controller is ready
+        :raise SharedController.NotReady: if it isn't
+        """
+        status = int(self._status[0])
+        if status == SharedController.INITIALIZING:
+            raise SharedController.NotReady(f"{self.name}: Controller is initializing", True)
+
+        if status == SharedController.FAILED:
+            raise SharedController.NotReady(
+                f"{self.name}: Controller setup failed: "
+                f"{self._error.value.decode(errors='replace')}", False)
+
+        if status in (SharedController.STOPPING, SharedController.STOPPED):
+            raise SharedController.NotReady(f"{self.name}: Controller is stopped", False)
+
+        if status == SharedController.RESTARTING:
+            raise SharedController.NotReady(f"{self.name}: Controller is restarting", True)
+
+    def _route(self, task: SharedController.Task) -> int:
+        """
+        Choose worker process for task
+        Called with the pipe writes lock acquired.
+        :param task: Worker task
+        :return: Worker process index
+        """
+        workers = len(self._pipes)
+        if workers == 1:
+            return 0
 
-    def _send(self, task: SharedController.Task) -> None:
+        key = task.key(self._ctrl)
+        if key is not None:
+            if self._ctrl.sinks:
+                return 0  # state changes are passed to sinks by the primary worker
+
+            return crc32(key.encode()) % workers
+
+        if isinstance(task, SharedController.DownstreamTask) and self._ctrl.acquisition_query is not None:
+            return 0  # acquisition subscription
+
+        self._next.value = (self._next.value + 1) % workers
+        return self._next.value
+
+    def _send(self, task: SharedController.Task) -> Tuple[int, int]:
         """
         Send task to worker over pipe
         Pipe writes are mutually exclusive.
         :param task: Worker task
+        :return: Worker process index and its crash counter (see _receive)
+        :raise SharedController.NotReady: if the task gives result and
+                                          the controller isn't ready
         """
         self._pipe_wl.acquire()
         try:
-            self._pipe_we.send(task)
+            if isinstance(task, SharedController.ResultTask):
+                self.check_ready()
+
+            elif int(self._status[0]) in (SharedController.STOPPING, SharedController.STOPPED):
+                log.warning(f"{self.baseclass}.{self.name}: Controller is stopped, "
+                    f"{task.__class__.__name__} discarded")
+                return 0, 0
+
+            index = self._route(task)
+            self._pipes[index][1].send(task)
+            return index, self._crashes[index]
+
         finally:
             self._pipe_wl.release()
 
+    def _receive(self, pipe_re: Connection, task: SharedController.ResultTask,
+        index: int, crashes: int) -> Any:
+        """
+        Receive task result
+        :param pipe_re: Reading end of multiprocessing.Pipe
+        :param task: Task sent
+        :param index: Worker process index (which got the task)
+        :param crashes: Worker crash counter when the task was sent
+        :return: Task result
+        :raise SharedController.NotReady: if the worker crashed meanwhile
+        """
+        try:
+            return receive(pipe_re, task.seq, lambda: self._crashes[index] != crashes)
+
+        except ConnectionAbortedError:
+            raise SharedController.NotReady(f"{self.name}: Controller worker crashed", True)
+
     def start(self) -> SharedController:
         """
         Start worker
         :return: self
         """
-        self._worker.start()
+        # Processes may only be started by their creator; the workers are
+        # started by the supervisor (see wipi.supervisor)
+        self._owner_pid = os.getpid()
+        self._workers = [self._process(index) for index in range(len(self._workers))]
+        for worker in self._workers:
+            worker.start()
         log.info(f"{self.baseclass}.{self.name}: Controller started")
 
         return self
@@ -165,8 +646,20 @@ class SharedController(Controller):
         :param pipe_we: Writing end of multiprocessing.Pipe
         :return: Current controlled device state
         """
-        self._send(SharedController.GetStateTask(pipe_we))
-        return pipe_re.recv()
+        return self.request_state(pipe_re, pipe_we)()
+
+    def request_state(self, pipe_re: Connection, pipe_we: Connection) -> Callable[[], Dict]:
+        """
+        Request controller state without waiting for it
+        States of several controllers (each requested with its own pipe)
+        are got in parallel that way (see Backend.get_state).
+        :param pipe_re: Reading end of multiprocessing.Pipe
+        :param pipe_we: Writing end of multiprocessing.Pipe
+        :return: Function receiving the state
+        :raise SharedController.NotReady: if the controller isn't ready
+        """
+        task = SharedController.GetStateTask(pipe_we)
+        return partial(self._receive, pipe_re, task, *self._send(task))
 
     def set_state(self, state: Dict, pipe_re: Connection, pipe_we: Connection) -> Dict:
         """
@@ -176,8 +669,8 @@ class SharedController(Controller):
         :param pipe_we: Writing end of multiprocessing.Pipe
         :return: Current controlled device state
         """
-        self._send(SharedController.SetStateTask(pipe_we, state))
-        return pipe_re.recv()
+        task = SharedController.SetStateTask(pipe_we, state)
+        return self._receive(pipe_re, task, *self._send(task))
 
     def mute_set_state(self, state: Dict) -> None:
         """
@@ -187,50 +680,500 @@ class SharedController(Controller):
         """
         self._send(SharedController.MuteSetStateTask(state))
 
+    def rule_set_state(self, state: Dict, source: str, rule: int, since: float) -> None:
+        """
+        Controlled device state setter (rule action, discards result)
+        Called directly by the rule source controller worker.
+        :param state: State changes
+        :param source: Rule source controller name
+        :param rule: Rule index
+        :param since: Triggering sample time (monotonic clock)
+        """
+        self._send(SharedController.RuleSetStateTask(state, source, rule, since))
+
     def downstream(self, query: Dict, pipe_re: Connection, pipe_we: Connection) -> Iterator[Dict]:
         """
         Downstream data from the controller
+        The pipe must be dedicated to the stream; it's closed when the stream
+        ends or its consumer is gone (so that the worker stops streaming).
         :param query: Query
         :param pipe_re: Reading end of multiprocessing.Pipe
         :param pipe_we: Writing end of multiprocessing.Pipe
-        :return: Generator of data chunks
+        :return: Generator of data chunks (if the worker crashes, the stream
+                 is concluded by error chunk)
+        :raise SharedController.NotReady: if the controller isn't ready
+                                          (raised immediately)
         """
-        self._send(SharedController.DownstreamTask(pipe_we, query))
-        while True:
-            chunk = pipe_re.recv()
-            if chunk is None:
-                return
+        task = SharedController.DownstreamTask(pipe_we, query)
+        return self._chunks(pipe_re, task, *self._send(task))
+
+    def _chunks(self, pipe_re: Connection, task: SharedController.DownstreamTask,
+        index: int, crashes: int) -> Iterator[Dict]:
+        """
+        Downstream chunks generator
+        :param pipe_re: Reading end of multiprocessing.Pipe
+        :param task: Task sent
+        :param index: Worker process index (which got the task)
+        :param crashes: Worker crash counter when the task was sent
+        :return: Generator of data chunks (None for heartbeats)
+        """
+        try:
+            while True:
+                try:
+                    chunk = self._receive(pipe_re, task, index, crashes)
+                except SharedController.NotReady as x:
+                    yield {"error" : str(x)}
+                    return
+
+                if chunk == SharedController.DownstreamTask.END:
+                    return
+
+                yield chunk
+
+        finally:
+            # The worker's sends fail with BrokenPipeError if the stream is closed early
+            pipe_re.close()
+
+    def get_history(self, query: Dict, *args, **kwargs) -> Dict:
+        """
+        Recent samples from the controller history buffer
+        The buffer is in shared memory, so it's read directly by the calling
+        (API worker) process.
+        :param query: History query
+        :return: Data chunk or None if the history isn't enabled
+        """
+        return None if self._ctrl is None else self._ctrl.get_history(query)
+
+    def get_rules(self, *args, **kwargs) -> List[Dict]:
+        """
+        Rules evaluated on the controller samples
+        The statistics are in shared memory, so they're read directly by
+        the calling (API worker) process.
+        :return: Rules statistics or None if there are no rules
+        """
+        return None if self._ctrl is None else self._ctrl.get_rules()
+
+    def get_recording(self, query: Dict, *args, **kwargs) -> Iterator[Dict]:
+        """
+        Recorded samples from the controller recorder
+        The segments are memory mapped and read directly by the calling
+        (API worker) process.
+        :param query: Recording query
+        :return: Generator of data chunks or None if the recorder isn't enabled
+        """
+        return None if self._ctrl is None else self._ctrl.get_recording(query)
+
+    def drain(self) -> None:
+        """
+        Stop accepting tasks
+        The worker executes the tasks queued so far and terminates.
+        """
+        with self._pipe_wl:
+            if int(self._status[0]) in (SharedController.STOPPING, SharedController.STOPPED):
+                return  # not running or already draining
+
+            self._status[0] = SharedController.STOPPING
+            for _, pipe_we in self._pipes:
+                pipe_we.send(None)  # worker shutdown trigger
+
+    def join(self, timeout: float = None) -> bool:
+        """
+        Wait for the worker to terminate
+        Workers started by another process (i.e. the supervisor) are waited
+        for by their status.
+        :param timeout: Timeout [s] (None means no timeout)
+        :return: True if the worker terminated
+        """
+        deadline = None if timeout is None else monotonic() + timeout
+        if self._owner_pid == os.getpid():
+            for worker in self._workers:
+                worker.join(None if deadline is None else max(0.0, deadline - monotonic()))
+
+            return not any(worker.is_alive() for worker in self._workers)
+
+        while int(self._status[0]) != SharedController.STOPPED:
+            if deadline is not None and monotonic() >= deadline:
+                return False
+
+            sleep(0.01)
+
+        return True
 
-            yield chunk
+    def kill(self) -> None:
+        """
+        Terminate the worker (by SIGTERM)
+        """
+        if self._owner_pid == os.getpid():
+            for worker in self._workers:
+                worker.terminate()
+                worker.join()
+
+        else:
+            for _, pid in self.pids():
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except OSError:
+                    pass  # already gone
 
-    def stop(self):
+        self._status[0] = SharedController.STOPPED
+        log.warning(f"{self.baseclass}.{self.name}: Controller worker killed")
+
+    def stop(self, timeout: float = None) -> None:
         """
         Stop worker
+        :param timeout: Worker is killed if it doesn't terminate in time [s]
+                        (e.g. busy with infinite stream; None means no timeout)
         """
-        self._send(None)  # worker shutdown trigger
-        self._worker.join()
+        self.drain()
+        if not self.join(timeout):
+            self.kill()
+
         log.info(f"{self.baseclass}.{self.name}: Controller stopped")
 
-    def _worker_routine(self):
+    def processes(self) -> List[Process]:
+        """
+        :return: Worker processes (supervised, see wipi.supervisor)
+        """
+        return self._workers
+
+    def expected(self, index: int, process: Process) -> bool:
+        """
+        :param index: Worker process index
+        :param process: Terminated worker process
+        :return: True if the worker was stopped (or replaced)
+        """
+        return \
+            index >= len(self._workers) or process is not self._workers[index] or \
+            int(self._status[0]) in (SharedController.STOPPING, SharedController.STOPPED)
+
+    def crashed(self, index: int, exitcode: int) -> None:
+        """
+        Handle worker crash (called by the supervisor)
+        The requests queued for the worker are dropped, so that they fail
+        the same way as the requests the worker was executing: by the crash
+        counter (see _receive). Tasks which don't give results are kept
+        for the respawned worker.
+        :param index: Worker process index
+        :param exitcode: Worker exit code
+        """
+        members = self._members if index == 0 else [self]
+        for member in members:
+            with member._pipe_wl:
+                member._crashes[index] += 1
+                if index == 0:
+                    member._status[0] = SharedController.RESTARTING
+                member.restarts.crashed(exitcode)
+
+                pipe_re, pipe_we = member._pipes[index]
+                kept: List[SharedController.Task] = []
+                while pipe_re.poll():
+                    task = pipe_re.recv()
+                    if task is not None and not isinstance(task, SharedController.ResultTask):
+                        kept.append(task)
+
+                for task in kept:
+                    pipe_we.send(task)
+
+            log.warning(f"{member.baseclass}.{member.name}: Worker {index} crashed "
+                f"(exit code {exitcode}), {len(kept)} tasks kept")
+
+    def respawn(self, index: int) -> None:
+        """
+        Start new worker process (called by the supervisor)
+        :param index: Worker process index
+        """
+        if int(self._status[0]) in (SharedController.STOPPING, SharedController.STOPPED):
+            return  # stopped meanwhile
+
+        self._workers[index] = self._process(index)
+        self._workers[index].start()
+        log.info(f"{self.baseclass}.{self.name}: Worker {index} respawned")
+
+    def _process(self, index: int) -> Process:
+        """
+        Create worker process (in the current process)
+        :param index: Worker process index
+        :return: Worker process (not started)
+        """
+        return Process(name=self._workers[index].name, target=self._worker_routine, args=(index,))
+
+    def _worker_routine(self, index: int = 0):
         """
         Controller wrapper worker routine
+        :param index: Worker process index (0 is the primary worker)
         """
-        log.info(f"{self.baseclass}.{self.name}: Worker starts")
+        if len(self._members) > 1:
+            self._shared_worker_routine()
+            return
+
+        log.info(f"{self.baseclass}.{self.name}: Worker {index} starts")
+        self._pids[index] = os.getpid()
+        if self._realtime is not None:
+            self._realtime.apply()
+
+        pipe_re = self._pipes[index][0]
+        error = self._setup(index)
+        if error is not None:
+            self._fail_tasks(pipe_re, error)
+            self._stopped(index)
+            return
+
+        if index == 0:
+            self._ctrl.postfork()
+        else:
+            self._ctrl.sinks = []  # acquisition and sinks are the primary worker's
 
+        try:
+            if isinstance(self._ctrl, AsyncController):
+                asyncio.run(self._event_loop(self._ctrl, pipe_re))
+
+            elif self._pool_kind == SharedController.THREADS and self._pool_size > 1:
+                self._thread_pool(pipe_re)
+
+            else:
+                while True:
+                    task = pipe_re.recv()
+                    if task is None:
+                        break  # shutdown immediately
+
+                    assert isinstance(task, SharedController.Task)
+                    self._execute_task(task)
+
+        except KeyboardInterrupt:
+            pass  # interrupted by SIGINT
+
+        finally:
+            self._ctrl.shutdown()
+
+        self._stopped(index)
+
+    def _stopped(self, index: int) -> None:
+        """
+        Worker termination (the primary worker records the status)
+        :param index: Worker process index
+        """
+        if index == 0:
+            self._status[0] = SharedController.STOPPED
+
+        log.info(f"{self.baseclass}.{self.name}: Worker {index} terminates")
+
+    def _shared_worker_routine(self) -> None:
+        """
+        Worker routine serving several controllers
+        """
+        names = ", ".join(member.name for member in self._members)
+        log.info(f"Shared worker starts: {names}")
+        for member in self._members:
+            member._pids[0] = os.getpid()
+        if self._realtime is not None:
+            self._realtime.apply()
+
+        members = {member._pipes[0][0]: member for member in self._members}
+        failed: Dict[SharedController, str] = {}  # setup errors
+        for member in self._members:
+            error = member._setup()
+            if error is not None:
+                failed[member] = error
+            else:
+                member._ctrl.postfork()
+
+        try:
+            while self._pipes[0][0] in members:
+                for ready in wait(list(members)):
+                    pipe_re = cast(Connection, ready)
+                    task = pipe_re.recv()
+                    if task is None:
+                        member = members.pop(pipe_re)  # the controller is stopped
+                        if member is not self:
+                            member._status[0] = SharedController.STOPPED
+                        continue
+
+                    assert isinstance(task, SharedController.Task)
+                    member = members[pipe_re]
+                    if member in failed:
+                        task.fail(f"Controller setup failed: {failed[member]}")
+                    else:
+                        member._execute_task(task)
+
+        except KeyboardInterrupt:
+            pass  # interrupted by SIGINT
+
+        finally:
+            for member in self._members:
+                if member not in failed:
+                    member._ctrl.shutdown()
+
+        for member in self._members:
+            member._status[0] = SharedController.STOPPED
+
+        log.info(f"Shared worker terminates: {names}")
+
+    def _setup(self, index: int = 0) -> Optional[str]:
+        """
+        Set the controller up (in the worker)
+        The primary worker records the worker status (see status).
+        :param index: Worker process index
+        :return: None or error message if the setup failed
+        """
+        started = monotonic()
+        try:
+            self._ctrl.setup()
+
+        except Exception as x:
+            error = f"{x.__class__.__name__}: {x}"
+            log.error(f"{self.baseclass}.{self.name}: Setup failed: {error}")
+            if index == 0:
+                self._error.value = error.encode()[:len(self._error) - 1]
+                self._status[0] = SharedController.FAILED
+
+            return error
+
+        duration = monotonic() - started
+        log.info(f"{self.baseclass}.{self.name}: Set up in {duration:.3f} s")
+        if index == 0:
+            self._status[1] = duration
+            self._status[2] = monotonic()
+            self._status[0] = SharedController.READY
+
+        self.restarts.recovered()
+        return None
+
+    def _fail_tasks(self, pipe_re: Connection, error: str) -> None:
+        """
+        Failed worker routine: report tasks failure till the worker is stopped
+        :param pipe_re: Tasks pipe reading end
+        :param error: Setup error message
+        """
         try:
             while True:
-                task = self._pipe_re.recv()
+                task = pipe_re.recv()
                 if task is None:
-                    break  # shutdown immediately
+                    break  # shutdown
 
                 assert isinstance(task, SharedController.Task)
-                task.execute(self._ctrl)
+                task.fail(f"Controller setup failed: {error}")
 
         except KeyboardInterrupt:
             pass  # interrupted by SIGINT
 
-        log.info(f"{self.baseclass}.{self.name}: Worker terminates")
+    def _execute_task(self, task: SharedController.Task) -> None:
+        """
+        Execute task (by the worker or pool thread)
+        Failed task is reported (so that the requester doesn't wait for ever),
+        the worker continues (controller exceptions don't make it crash,
+        i.e. be respawned and set up again; process faults do).
+        :param task: Worker task
+        """
+        try:
+            task.execute(self._ctrl)
+
+        except Exception as x:
+            log.error(f"{self.baseclass}.{self.name}: {task.__class__.__name__} failed: {x}")
+            task.fail(f"{x.__class__.__name__}: {x}")
+
+    def _thread_routine(self, queue: Queue) -> None:
+        """
+        Pool thread routine
+        :param queue: Thread tasks queue
+        """
+        while True:
+            task = queue.get()
+            try:
+                if task is None:
+                    break
+
+                self._execute_task(task)
+
+            finally:
+                queue.task_done()
+
+    def _thread_pool(self, pipe_re: Connection) -> None:
+        """
+        Receive tasks and dispatch them to pool threads
+        Ordered tasks of the same key go to the same thread, other tasks
+        go to the least loaded one.
+        :param pipe_re: Tasks pipe reading end
+        """
+        queues: List[Queue] = [Queue() for _ in range(self._pool_size)]
+        threads = [
+            Thread(name=f"{self.name}#{index}", target=self._thread_routine,
+                args=(queue,), daemon=True)
+            for index, queue in enumerate(queues)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                task = pipe_re.recv()
+                if task is None:
+                    break  # shutdown
+
+                assert isinstance(task, SharedController.Task)
+                key = task.key(self._ctrl)
+                if key is not None:
+                    queue = queues[crc32(key.encode()) % len(queues)]
+                else:
+                    queue = min(queues, key=lambda q: q.unfinished_tasks)
+
+                queue.put(task)
+
+        finally:
+            for queue in queues:
+                queue.put(None)
+            for thread in threads:
+                thread.join(SharedController.THREADS_JOIN_TIMEOUT)
+
+    async def _execute(self, ctrl: AsyncController, task: SharedController.Task) -> None:
+        """
+        Execute task on asynchronous controller
+        Failed task is reported (so that the requester doesn't wait for ever),
+        the worker continues.
+        :param ctrl: Wrapped controller
+        :param task: Worker task
+        """
+        try:
+            await task.aexecute(ctrl)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as x:
+            log.error(f"{self.baseclass}.{self.name}: {task.__class__.__name__} failed: {x}")
+            task.fail(f"{x.__class__.__name__}: {x}")
+
+    async def _event_loop(self, ctrl: AsyncController, pipe_re: Connection) -> None:
+        """
+        Asynchronous controller worker event loop
+        Tasks are received as soon as they arrive and executed concurrently.
+        :param ctrl: Wrapped controller
+        :param pipe_re: Tasks pipe reading end
+        """
+        loop = asyncio.get_running_loop()
+        shutdown = loop.create_future()
+        tasks: Set[asyncio.Task] = set()
+
+        def receive() -> None:
+            task = pipe_re.recv()
+            if task is None:  # shutdown
+                loop.remove_reader(pipe_re.fileno())
+                shutdown.set_result(None)
+                return
+
+            assert isinstance(task, SharedController.Task)
+            atask = loop.create_task(self._execute(ctrl, task))
+            tasks.add(atask)
+            atask.add_done_callback(tasks.discard)
+
+        await ctrl.started()
+        loop.add_reader(pipe_re.fileno(), receive)
+        await shutdown
+
+        for atask in tasks:
+            atask.cancel()  # e.g. infinite streams
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await ctrl.stopping()
 
     def __del__(self):
-        if self._worker.is_alive():
+        if self._owner_pid == os.getpid() and any(worker.is_alive() for worker in self._workers):
             self.stop()
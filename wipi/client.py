@@ -0,0 +1,829 @@
+"""
+wipi API client
+
+Covers all the API routes; Client is synchronous (thread safe), AsyncClient
+is its asyncio counterpart (the same calls, awaitable). Both keep a pool
+of keep-alive HTTP connections per node and execute batched calls
+concurrently over them.
+
+Streams (downstream, record) are decoded incrementally by StreamDecoder,
+chunks are yielded as they arrive.
+
+Example:
+    client = Client("http://pi1:8080")
+    client.set_state("3relays", {"relay1": "closed"})
+    for chunk in client.downstream("system", {"interval": 0.5}):
+        print(chunk)
+
+    states = client.batch([("get_state", "system"), ("get_state", "3relays")])
+"""
+
+from __future__ import annotations
+from typing import Any, Dict, Iterable, Iterator, AsyncIterator, List, Optional, Tuple
+from http.client import HTTPConnection, HTTPSConnection, HTTPResponse, HTTPException
+from urllib.parse import urlsplit, quote
+from abc import ABC, abstractmethod
+from threading import Lock, BoundedSemaphore
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import codecs
+import json
+import re
+import ssl
+
+from wipi.log import get_logger
+
+
+log = get_logger(__name__)
+
+
+class StreamDecoder:
+    """
+    Incremental decoder of JSON list streams
+    The stream is a JSON list of chunks appended incrementally, with white
+    space connection heartbeats in between (see wipi.api.Backend.downstream).
+
+    The received data are decoded to text once and the chunks are parsed
+    in place (by index) by the JSON decoder. An incomplete chunk is kept
+    (as the received pieces) and only the new data are scanned for its end
+    (nesting and strings are tracked), so that it's parsed once it's
+    complete; the decoding cost is linear in the stream size.
+    """
+
+    _separator = re.compile(r'[\s,]*')
+    _number_end = re.compile(r'[\s,\]]')
+    _structure = re.compile(r'["\[\]{}]')
+    _string_end = re.compile(r'["\\]')
+
+    def __init__(self):
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._json = json.JSONDecoder()
+        self._pending: List[str] = []  # incomplete chunk pieces
+        self._scalar = False           # the incomplete chunk is number or literal
+        self._depth = 0                # the incomplete chunk nesting depth
+        self._string = False           # within string
+        self._escape = False           # after backslash (within string)
+        self._started = False          # list opened
+        self.finished = False          # list closed
+
+    def _scan(self, text: str, pos: int) -> Optional[int]:
+        """
+        Scan the incomplete chunk for its end
+        :param text: Received text
+        :param pos: Scan start position
+        :return: Chunk end position in the text (None if it doesn't end there)
+        """
+        if self._scalar:
+            end = StreamDecoder._number_end.search(text, pos)
+            return None if end is None else end.start()
+
+        while True:
+            if self._escape:
+                if pos == len(text):
+                    return None
+                self._escape = False
+                pos += 1
+
+            if self._string:
+                match = StreamDecoder._string_end.search(text, pos)
+                if match is None:
+                    return None
+                pos = match.end()
+                if match.group() == '\\':
+                    self._escape = True
+                    continue
+
+                self._string = False
+                if self._depth == 0:
+                    return pos  # string chunk
+
+            else:
+                match = StreamDecoder._structure.search(text, pos)
+                if match is None:
+                    return None
+                pos = match.end()
+                char = match.group()
+                if char == '"':
+                    self._string = True
+                elif char in "[{":
+                    self._depth += 1
+                else:
+                    self._depth -= 1
+                    if self._depth == 0:
+                        return pos
+
+    def _keep(self, text: str, pos: int) -> None:
+        """
+        Keep incomplete chunk (and scan it)
+        :param text: Received text
+        :param pos: Chunk start position
+        """
+        self._scalar = text[pos] not in '[{"'
+        self._depth, self._string, self._escape = 0, False, False
+        if self._scan(text, pos) is not None:
+            raise ValueError(f"Invalid chunk: {text[pos:pos + 32]!r}")
+
+        self._pending = [text[pos:]]
+
+    def feed(self, data: bytes) -> List[Optional[Any]]:
+        """
+        Decode received data
+        :param data: Received data
+        :return: Chunks completed by the data (None for heartbeat, i.e. white
+                 space only data between chunks)
+        :raise ValueError: if the data isn't a JSON list stream
+        """
+        chunks: List[Optional[Any]] = []
+        text = self._text.decode(data)
+        pos = 0
+        if self._pending:
+            end = self._scan(text, 0)
+            if end is None:
+                self._pending.append(text)
+                return chunks
+
+            self._pending.append(text[:end])
+            chunks.append(self._json.decode("".join(self._pending)))
+            self._pending = []
+            pos = end
+
+        elif text.isspace():
+            chunks.append(None)
+
+        while True:
+            pos = StreamDecoder._separator.match(text, pos).end()
+            if pos == len(text):
+                break
+
+            if self.finished:
+                raise ValueError(f"Data after the stream end: {text[pos:pos + 32]!r}")
+
+            if not self._started:
+                if text[pos] != '[':
+                    raise ValueError(f"Not a JSON list stream: {text[pos:pos + 32]!r}")
+                self._started = True
+                pos += 1
+                continue
+
+            if text[pos] == ']':
+                self.finished = True
+                pos += 1
+                continue
+
+            try:
+                chunk, end = self._json.raw_decode(text, pos)
+            except json.JSONDecodeError:
+                self._keep(text, pos)  # incomplete chunk
+                break
+
+            if isinstance(chunk, (int, float)) and \
+                StreamDecoder._number_end.match(text, end) is None:
+                self._keep(text, pos)  # the number may continue (e.g. "12" of "12.5")
+                break
+
+            chunks.append(chunk)
+            pos = end
+
+        return chunks
+
+
+class Api(ABC):
+    """
+    wipi API calls (common to Client and AsyncClient)
+    The calls are implemented by the transport methods call and stream;
+    the asynchronous client calls are awaitable (and the streams are
+    asynchronous generators).
+    """
+
+    class Error(Exception):
+        """
+        Request failure (connection error or error response)
+        """
+
+        def __init__(self, message: str, status: int = None):
+            """
+            :param message: Error message
+            :param status: HTTP response status (None if the request failed
+                           before getting the response)
+            """
+            super().__init__(message)
+            self.status = status
+
+    STREAM_READ = 65536  # max. stream read size [B]
+
+    def __init__(self, url: str, connections: int = 4, timeout: float = 5.0,
+        stream_timeout: float = 60.0):
+        """
+        :param url: wipi API URL (e.g. http://pi1:8080)
+        :param connections: Max. number of connections (concurrent requests)
+        :param timeout: Connection and response timeout [s]
+        :param stream_timeout: Stream inactivity timeout [s] (the API sends
+                               heartbeats every 20 s by default)
+        """
+        parsed = urlsplit(url)
+        if parsed.scheme not in ("http", "https") or not parsed.hostname:
+            raise ValueError(f"Invalid wipi API URL: {url}")
+
+        self.url = url
+        self._host = parsed.hostname
+        self._port = parsed.port
+        self._https = parsed.scheme == "https"
+        self._prefix = parsed.path.rstrip('/')
+        self._connections = connections
+        self._timeout = timeout
+        self._stream_timeout = stream_timeout
+
+    @abstractmethod
+    def call(self, method: str, path: str, body: Any = None) -> Any:
+        """
+        Execute API request
+        :param method: HTTP method
+        :param path: Request path (e.g. /get_state)
+        :param body: JSON request body
+        :return: JSON response (None if empty)
+        :raise Api.Error: if the request failed
+        """
+
+    @abstractmethod
+    def stream(self, path: str, body: Any = None, heartbeats: bool = False) -> Iterator[Optional[Dict]]:
+        """
+        Execute streaming API request (POST)
+        The connection is held till the stream is read (or abandoned).
+        :param path: Request path (e.g. /downstream)
+        :param body: JSON request body (query)
+        :param heartbeats: Yield None for connection heartbeats
+        :return: Generator of the stream chunks
+        :raise Api.Error: if the request failed (also raised during
+                          the streaming)
+        """
+
+    def _fail(self, error: Exception) -> Api.Error:
+        """
+        :param error: Transport error
+        :return: Request failure
+        """
+        return Api.Error(f"{self.url}: {error.__class__.__name__}: {error}")
+
+    def _error(self, status: int, reason: str, data: bytes) -> Api.Error:
+        """
+        :param status: Error response status
+        :param reason: Error response reason phrase
+        :param data: Response body
+        :return: Error reported by the response
+        """
+        try:
+            message = json.loads(data)["error"]
+        except (ValueError, KeyError, TypeError):
+            message = reason
+
+        return Api.Error(f"{self.url}: {message}", status)
+
+    def _headers(self, body: Optional[bytes]) -> Dict[str, str]:
+        """
+        :param body: Encoded request body
+        :return: Request headers
+        """
+        headers = {"Accept" : "application/json"}
+        if body is not None:
+            headers["Content-Type"] = "application/json"
+
+        return headers
+
+    @staticmethod
+    def _path(endpoint: str, cname: str = None) -> str:
+        """
+        :param endpoint: API endpoint (e.g. get_state)
+        :param cname: Controller name or None
+        :return: Request path
+        """
+        return f"/{endpoint}" if cname is None else f"/{endpoint}/{quote(cname, safe='')}"
+
+    def contract(self) -> Dict:
+        """
+        :return: API contract description
+        """
+        return self.call("GET", "/")
+
+    def controllers(self) -> Dict[str, str]:
+        """
+        :return: Controllers names and types
+        """
+        return self.call("GET", "/controllers")
+
+    def get_state(self, cname: str = None) -> Dict:
+        """
+        :param cname: Controller name or None
+        :return: Controller state (or states of all of them)
+        """
+        return self.call("GET", Api._path("get_state", cname))
+
+    def set_state(self, cname: str = None, state: Dict = {}) -> Dict:
+        """
+        :param cname: Controller name or None
+        :param state: State change (or {"controllers": [{"name": ..., "state": ...}]})
+        :return: Controller state (or states of all of them)
+        """
+        return self.call("POST", Api._path("set_state", cname), state)
+
+    def set_states(self, states: Dict[str, Dict]) -> Dict:
+        """
+        Set states of several controllers by one request
+        :param states: State changes by controller names
+        :return: States of all the controllers
+        """
+        return self.set_state(None, {"controllers" : [
+            {"name" : cname, "state" : state} for cname, state in states.items()
+        ]})
+
+    def set_state_deferred(self, cname: str = None, request: Dict = {}) -> None:
+        """
+        :param cname: Controller name or None
+        :param request: Deferred state change ("state" or "controllers",
+                        "at", "repeat", as for the API)
+        """
+        return self.call("POST", Api._path("set_state_deferred", cname), request)
+
+    def list_deferred(self, cname: str = None) -> List[Dict]:
+        """
+        :param cname: Controller name or None
+        :return: Scheduled deferred actions
+        """
+        return self.call("GET", Api._path("list_deferred", cname))
+
+    def cancel_deferred(self) -> None:
+        """
+        Cancel all the deferred actions
+        """
+        return self.call("GET", "/cancel_deferred")
+
+    def downstream(self, cname: str = None, query: Dict = {},
+        heartbeats: bool = False) -> Iterator[Optional[Dict]]:
+        """
+        :param cname: Controller name or None
+        :param query: Downstream query (or {"controllers": [...], "align": ...})
+        :param heartbeats: Yield None for connection heartbeats
+        :return: Generator of data chunks
+        """
+        return self.stream(Api._path("downstream", cname), query, heartbeats)
+
+    def history(self, cname: str, query: Dict = {}) -> Dict:
+        """
+        :param cname: Controller name
+        :param query: History query (time range, decimation, axes)
+        :return: Samples history
+        """
+        return self.call("POST", Api._path("history", cname), query)
+
+    def record(self, cname: str, query: Dict = {}) -> Iterator[Dict]:
+        """
+        :param cname: Controller name
+        :param query: Recording query (time range, decimation, axes, block size)
+        :return: Generator of recorded sample blocks
+        """
+        return self.stream(Api._path("record", cname), query)
+
+    def rules(self) -> List[Dict]:
+        """
+        :return: Rules and their statistics
+        """
+        return self.call("GET", "/rules")
+
+    def buses(self) -> List[Dict]:
+        """
+        :return: Shared I2C buses statistics
+        """
+        return self.call("GET", "/buses")
+
+    def processes(self) -> List[Dict]:
+        """
+        :return: Processes memory usage
+        """
+        return self.call("GET", "/processes")
+
+    def startup(self) -> Dict:
+        """
+        :return: Startup timing and controllers status
+        """
+        return self.call("GET", "/startup")
+
+    def supervision(self) -> Dict:
+        """
+        :return: Worker supervision statistics
+        """
+        return self.call("GET", "/supervision")
+
+    def reload(self, config: Dict = None) -> Dict:
+        """
+        :param config: New configuration (None means the node re-reads its
+                       configuration file)
+        :return: Reconfiguration result
+        """
+        return self.call("POST", "/reload", config or {})
+
+
+class ConnectionPool:
+    """
+    Pool of keep-alive HTTP connections to one host (thread safe)
+    Connections are created on demand (at most the pool size of them may
+    be in use at once, the others wait) and the idle ones are reused.
+    """
+
+    def __init__(self, host: str, port: int = None, https: bool = False,
+        size: int = 4, timeout: float = 5.0):
+        """
+        :param host: Host
+        :param port: Port (default: by scheme)
+        :param https: Use TLS
+        :param size: Max. number of connections
+        :param timeout: Connection and socket operations timeout [s]
+        """
+        self._host = host
+        self._port = port
+        self._class = HTTPSConnection if https else HTTPConnection
+        self._timeout = timeout
+        self._idle: List[HTTPConnection] = []
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(size)
+
+    def acquire(self) -> Tuple[HTTPConnection, bool]:
+        """
+        Get connection (blocks till one is available)
+        :return: Connection and whether it's reused (an idle one)
+        """
+        self._slots.acquire()
+        with self._lock:
+            if self._idle:
+                return self._idle.pop(), True
+
+        return self._class(self._host, self._port, timeout=self._timeout), False
+
+    def release(self, conn: HTTPConnection, reuse: bool = True) -> None:
+        """
+        Return connection to the pool
+        :param conn: Connection
+        :param reuse: Keep the connection alive (False closes it; use
+                      if the response wasn't read completely or it failed)
+        """
+        if reuse:
+            if conn.sock is not None:
+                conn.sock.settimeout(self._timeout)  # (stream timeout reset)
+            with self._lock:
+                self._idle.append(conn)
+        else:
+            conn.close()
+
+        self._slots.release()
+
+    def close(self) -> None:
+        """
+        Close the idle connections
+        """
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for conn in idle:
+            conn.close()
+
+
+class Client(Api):
+    """
+    wipi API client
+    Requests go over pooled keep-alive HTTP connections (see ConnectionPool);
+    the client is thread safe.
+    """
+
+    def __init__(self, url: str, connections: int = 4, timeout: float = 5.0,
+        stream_timeout: float = 60.0):
+        """
+        :param url: wipi API URL (e.g. http://pi1:8080)
+        :param connections: Max. number of connections (concurrent requests)
+        :param timeout: Connection and response timeout [s]
+        :param stream_timeout: Stream inactivity timeout [s]
+        """
+        super().__init__(url, connections, timeout, stream_timeout)
+        self._pool = ConnectionPool(self._host, self._port, self._https, connections, timeout)
+        self._executor: ThreadPoolExecutor = None  # batch calls executor
+        self._executor_lock = Lock()
+
+    def _request(self, method: str, path: str, body: Any = None) -> Tuple[HTTPConnection, HTTPResponse]:
+        """
+        Send request, get the response (headers)
+        A request failed on a reused connection (closed by the server in the
+        meantime) is retried on a new one.
+        :param method: HTTP method
+        :param path: Request path
+        :param body: JSON request body
+        :return: Connection and response (the connection shall be released
+                 when the response is read)
+        :raise Client.Error: if the request failed
+        """
+        body = None if body is None else json.dumps(body).encode()
+        headers = self._headers(body)
+
+        while True:
+            conn, reused = self._pool.acquire()
+            try:
+                conn.request(method, self._prefix + path, body, headers)
+                return conn, conn.getresponse()
+
+            except (OSError, HTTPException) as x:
+                self._pool.release(conn, False)
+                if reused and isinstance(x, (ConnectionError, HTTPException)):
+                    continue  # stale keep-alive connection
+
+                raise self._fail(x)
+
+    def call(self, method: str, path: str, body: Any = None) -> Any:
+        conn, response = self._request(method, path, body)
+        try:
+            data = response.read()
+
+        except (OSError, HTTPException) as x:
+            self._pool.release(conn, False)
+            raise self._fail(x)
+
+        self._pool.release(conn, not response.will_close)
+        if response.status >= 400:
+            raise self._error(response.status, response.reason, data)
+
+        return json.loads(data) if data.strip() else None
+
+    def stream(self, path: str, body: Any = None, heartbeats: bool = False) -> Iterator[Optional[Dict]]:
+        conn, response = self._request("POST", path, body)
+        if response.status >= 400:
+            data = response.read()
+            self._pool.release(conn, not response.will_close)
+            raise self._error(response.status, response.reason, data)
+
+        decoder = StreamDecoder()
+        complete = False
+        try:
+            conn.sock.settimeout(self._stream_timeout)
+            while True:
+                data = response.read1(Api.STREAM_READ)
+                if not data:
+                    break
+
+                for chunk in decoder.feed(data):
+                    if chunk is not None or heartbeats:
+                        yield chunk
+
+            if not decoder.finished:
+                raise Api.Error(f"{self.url}: Stream interrupted")
+
+            complete = True
+
+        except (OSError, HTTPException, ValueError) as x:
+            raise self._fail(x)
+
+        finally:
+            self._pool.release(conn, complete and not response.will_close)
+
+    def batch(self, calls: Iterable[Tuple]) -> List[Any]:
+        """
+        Execute API calls concurrently (over the pooled connections)
+        :param calls: Calls: method name and arguments, e.g. ("get_state", "system")
+        :return: Results in order of the calls (Client.Error for failed ones)
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(self._connections, "wipi-client")
+
+        def execute(call: Tuple) -> Any:
+            try:
+                return getattr(self, call[0])(*call[1:])
+            except Api.Error as x:
+                return x
+
+        return list(self._executor.map(execute, calls))
+
+    def close(self) -> None:
+        """
+        Close the idle connections (and the batch calls executor)
+        """
+        self._pool.close()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+class AsyncClient(Api):
+    """
+    wipi API asyncio client
+    Requests go over pooled keep-alive HTTP/1.1 connections; the client
+    shall be used in one event loop.
+    """
+
+    class _Response:
+        """
+        HTTP response head
+        """
+
+        def __init__(self, head: bytes):
+            """
+            :param head: Status line and headers
+            """
+            lines = head.decode("latin-1").split("\r\n")
+            version, status, *reason = lines[0].split(" ", 2)
+            self.status = int(status)
+            self.reason = reason[0] if reason else ""
+            self.headers: Dict[str, str] = {}
+            for line in lines[1:]:
+                if line:
+                    name, _, value = line.partition(":")
+                    self.headers[name.strip().lower()] = value.strip()
+
+            connection = self.headers.get("connection", "").lower()
+            self.will_close = connection == "close" or (version == "HTTP/1.0" and connection != "keep-alive")
+
+    def __init__(self, url: str, connections: int = 4, timeout: float = 5.0,
+        stream_timeout: float = 60.0):
+        """
+        :param url: wipi API URL (e.g. http://pi1:8080)
+        :param connections: Max. number of connections (concurrent requests)
+        :param timeout: Connection and response timeout [s]
+        :param stream_timeout: Stream inactivity timeout [s]
+        """
+        super().__init__(url, connections, timeout, stream_timeout)
+        self._idle: List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]] = []
+        self._slots: asyncio.Semaphore = None  # created in the event loop
+
+    async def _acquire(self) -> Tuple[Tuple[asyncio.StreamReader, asyncio.StreamWriter], bool]:
+        """
+        Get connection (waits till one is available)
+        :return: Connection and whether it's reused (an idle one)
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self._connections)
+
+        await self._slots.acquire()
+        if self._idle:
+            return self._idle.pop(), True
+
+        try:
+            conn = await asyncio.wait_for(asyncio.open_connection(
+                self._host, self._port or (443 if self._https else 80),
+                ssl=ssl.create_default_context() if self._https else None), self._timeout)
+
+        except BaseException:
+            self._slots.release()
+            raise
+
+        return conn, False
+
+    def _release(self, conn: Tuple[asyncio.StreamReader, asyncio.StreamWriter], reuse: bool = True) -> None:
+        """
+        Return connection to the pool
+        :param conn: Connection
+        :param reuse: Keep the connection alive (False closes it)
+        """
+        if reuse:
+            self._idle.append(conn)
+        else:
+            conn[1].close()
+
+        self._slots.release()
+
+    async def _request(self, method: str, path: str, body: Any = None) -> Tuple[
+        Tuple[asyncio.StreamReader, asyncio.StreamWriter], AsyncClient._Response]:
+        """
+        Send request, get the response head
+        A request failed on a reused connection is retried on a new one.
+        :param method: HTTP method
+        :param path: Request path
+        :param body: JSON request body
+        :return: Connection and response (the connection shall be released
+                 when the response is read)
+        :raise AsyncClient.Error: if the request failed
+        """
+        body = None if body is None else json.dumps(body).encode()
+        headers = self._headers(body)
+        headers["Host"] = self._host if self._port is None else f"{self._host}:{self._port}"
+        headers["Content-Length"] = str(0 if body is None else len(body))
+        request = (
+            f"{method} {self._prefix + path} HTTP/1.1\r\n" +
+            "".join(f"{name}: {value}\r\n" for name, value in headers.items()) +
+            "\r\n").encode("latin-1") + (body or b"")
+
+        while True:
+            try:
+                conn, reused = await self._acquire()
+            except (OSError, asyncio.TimeoutError) as x:
+                raise self._fail(x)
+
+            try:
+                conn[1].write(request)
+                await conn[1].drain()
+                head = await asyncio.wait_for(conn[0].readuntil(b"\r\n\r\n"), self._timeout)
+                return conn, AsyncClient._Response(head)
+
+            except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                asyncio.TimeoutError, ValueError) as x:
+                self._release(conn, False)
+                if reused and isinstance(x, (ConnectionError, asyncio.IncompleteReadError)):
+                    continue  # stale keep-alive connection
+
+                raise self._fail(x)
+
+    async def _body(self, reader: asyncio.StreamReader, response: AsyncClient._Response,
+        timeout: float) -> AsyncIterator[bytes]:
+        """
+        Read response body
+        :param reader: Connection reader
+        :param response: Response head
+        :param timeout: Inactivity timeout [s]
+        :return: Generator of body data
+        """
+        if response.headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                line = await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout)
+                size = int(line.split(b";")[0], 16)
+                if size == 0:
+                    while await asyncio.wait_for(reader.readuntil(b"\r\n"), timeout) != b"\r\n":
+                        pass  # trailers
+                    return
+
+                data = await asyncio.wait_for(reader.readexactly(size + 2), timeout)
+                yield data[:-2]
+
+        elif "content-length" in response.headers:
+            length = int(response.headers["content-length"])
+            if length:
+                yield await asyncio.wait_for(reader.readexactly(length), timeout)
+
+        else:  # till the connection is closed
+            while True:
+                data = await asyncio.wait_for(reader.read(Api.STREAM_READ), timeout)
+                if not data:
+                    return
+                yield data
+
+    async def call(self, method: str, path: str, body: Any = None) -> Any:
+        conn, response = await self._request(method, path, body)
+        try:
+            data = b"".join([data async for data in self._body(conn[0], response, self._timeout)])
+
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+            asyncio.TimeoutError, ValueError) as x:
+            self._release(conn, False)
+            raise self._fail(x)
+
+        except BaseException:
+            self._release(conn, False)  # e.g. cancelled
+            raise
+
+        self._release(conn, not response.will_close)
+        if response.status >= 400:
+            raise self._error(response.status, response.reason, data)
+
+        return json.loads(data) if data.strip() else None
+
+    async def stream(self, path: str, body: Any = None,  # type: ignore[override]
+        heartbeats: bool = False) -> AsyncIterator[Optional[Dict]]:
+        conn, response = await self._request("POST", path, body)
+        complete = False
+        try:
+            if response.status >= 400:
+                data = b"".join([data async for data in self._body(conn[0], response, self._timeout)])
+                complete = True
+                raise self._error(response.status, response.reason, data)
+
+            decoder = StreamDecoder()
+            async for data in self._body(conn[0], response, self._stream_timeout):
+                for chunk in decoder.feed(data):
+                    if chunk is not None or heartbeats:
+                        yield chunk
+
+            if not decoder.finished:
+                raise Api.Error(f"{self.url}: Stream interrupted")
+
+            complete = True
+
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+            asyncio.TimeoutError, ValueError) as x:
+            raise self._fail(x)
+
+        finally:
+            self._release(conn, complete and not response.will_close)
+
+    async def batch(self, calls: Iterable[Tuple]) -> List[Any]:
+        """
+        Execute API calls concurrently (over the pooled connections)
+        :param calls: Calls: method name and arguments, e.g. ("get_state", "system")
+        :return: Results in order of the calls (AsyncClient.Error for failed ones)
+        """
+        async def execute(call: Tuple) -> Any:
+            try:
+                return await getattr(self, call[0])(*call[1:])
+            except Api.Error as x:
+                return x
+
+        return list(await asyncio.gather(*(execute(call) for call in calls)))
+
+    async def close(self) -> None:
+        """
+        Close the idle connections
+        """
+        idle, self._idle = self._idle, []
+        for _, writer in idle:
+            writer.close()
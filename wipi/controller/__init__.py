@@ -1,15 +1,24 @@
-from typing import List, Dict, Iterator, Type
+from typing import List, Dict, Iterator, Type, TYPE_CHECKING
+from time import monotonic
 import json
+import os
 import re
 from importlib import import_module
 from sys import argv
 
+from wipi import import_started
 from wipi.util import cc2sc
 
-from .interface import Controller
+from .interface import Controller, AsyncController
+
+# The sinks (numpy based) are imported only if configured (see sinks)
+if TYPE_CHECKING:
+    from .acquisition import Sink
 
 
 _controllers: List[Controller] = []
+_config: Dict = {}  # loaded configuration
+_startup: Dict = {"started": import_started, "controllers": {}}  # startup timing
 
 
 def add(controller: Controller) -> None:
@@ -27,24 +36,143 @@ def controllers() -> Iterator[Controller]:
     return iter(_controllers)
 
 
+def startup() -> Dict:
+    """
+    Startup timing
+    :return: Packages import start time ("started"; monotonic clock),
+             "import" time (w/o loading controllers),
+             controllers "load" time and per controller module import
+             and instance creation times [s]
+    """
+    return _startup
+
+
+def acquisition_rate(query: Dict) -> float:
+    """
+    Nominal acquisition sample rate
+    :param query: Acquisition query (setting sample "rate" [Hz]
+                  or sampling "interval" [s])
+    :return: Sample rate [Hz]
+    """
+    rate = query.get("rate")
+    if rate is None and query.get("interval"):
+        rate = 1.0 / query["interval"]
+
+    if not rate:
+        raise ValueError(f"Acquisition query doesn't set sample rate: {query}")
+
+    return float(rate)
+
+
+def sinks(controller: Controller, config: Dict) -> List["Sink"]:
+    """
+    Create configured acquisition sinks
+    :param controller: Controller instance
+    :param config: Controller configuration
+    :return: Sinks
+    """
+    query = config.get("acquisition")
+    channels = [] if query is None else controller.channels(query)
+    sinks: List["Sink"] = []
+
+    if query is None and ("history" in config or "record" in config or "rules" in config):
+        raise ValueError(f"{controller.name}: History, recording and rules require acquisition")
+
+    history = config.get("history")
+    if history is not None:
+        from .history import History
+        rate = acquisition_rate(query)
+        controller.history = History(channels, int(history["seconds"] * rate) + 1)
+        sinks.append(controller.history)
+
+    record = config.get("record")
+    if record is not None:
+        from .recorder import Recorder
+        record = dict(record)
+        directory = os.path.join(record.pop("directory"), controller.name)
+        controller.recorder = Recorder(channels, directory, **record)
+        sinks.append(controller.recorder)
+
+    rules = config.get("rules")
+    if rules is not None:
+        from .rules import Rules
+        controller.rules = Rules(controller.name, channels, acquisition_rate(query), rules)
+        sinks.insert(0, controller.rules)  # react ASAP
+
+    export = config.get("export")
+    if export is not None:
+        from .exporter import Exporter
+        sinks.append(Exporter(controller.name, channels, **export))
+
+    return sinks
+
+
+def create_controller(config: Dict) -> Controller:
+    """
+    Create configured controller
+    :param config: Controller configuration
+    :return: Controller instance (incl. acquisition and sinks)
+    """
+    name = config["name"]
+    class_name = config["class"]
+    args = config.get("args", [])
+    kwargs = config.get("kwargs", {})
+
+    started = monotonic()
+    module = import_module(cc2sc(class_name))
+    imported = monotonic()
+    instance = getattr(module, class_name.split('.')[-1])(name, *args, **kwargs)
+    _startup["controllers"][name] = {
+        "import": imported - started,
+        "create": monotonic() - imported,
+    }
+
+    if "pool" in config:
+        instance.pool = config["pool"]
+    if "worker" in config:
+        instance.worker = config["worker"]
+    if "realtime" in config:
+        instance.realtime = config["realtime"]
+
+    if "acquisition" in config or "export" in config:
+        instance.enable_acquisition(config.get("acquisition"), sinks(instance, config))
+
+    return instance
+
+
 def load_controllers(config: Dict) -> None:
     """
     Load configured controllers
     :param config: Controllers configuration
     """
+    loading = monotonic()
     for controller in config.get("controllers", []):
         if not controller.get("enabled", False):
             continue  # skip disabled/not explicitly enabled controller
 
-        name = controller["name"]
-        class_name = controller["class"]
-        args = controller.get("args", [])
-        kwargs = controller.get("kwargs", {})
+        _controllers.append(create_controller(controller))
+
+    _config.update(config)
+    _startup["load"] = _startup.get("load", 0.0) + monotonic() - loading
+
+
+def read_config() -> Dict:
+    """
+    Read configuration file (given by the first command line argument)
+    :return: Controllers configuration
+    """
+    with open(argv[1]) as config:
+        return json.load(config)
+
+
+def configuration() -> Dict:
+    """
+    :return: Loaded configuration
+    """
+    return _config
 
-        _controllers.append(getattr(
-            import_module(cc2sc(class_name)),
-            class_name.split('.')[-1])(name, *args, **kwargs))
 
+_startup["import"] = monotonic() - import_started
 
 if len(argv) > 1:
-    load_controllers(json.load(open(argv[1])))
+    load_controllers(read_config())
@@ -0,0 +1,204 @@
+"""
+Continuous data acquisition
+
+Controllers producing numeric samples (see Controller.blocks) may be set
+to acquire data continuously in their worker.
+The acquired sample blocks are passed to sinks (e.g. the history buffer)
+and to live subscribers (e.g. downstreams).
+"""
+
+from typing import List, Dict, Iterator, Tuple
+from abc import ABC, abstractmethod
+from threading import Thread, Event, Lock
+from queue import Queue, Full as QueueFull, Empty as QueueEmpty
+from time import monotonic
+
+import numpy as np
+
+from wipi.log import get_logger
+
+
+log = get_logger(__name__)
+
+
+class Sink(ABC):
+    """
+    Acquired samples consumer (interface)
+    """
+
+    @abstractmethod
+    def append(self, times: np.ndarray, values: np.ndarray) -> None:
+        """
+        Consume block of samples
+        Called from the acquisition thread; implementations must be quick.
+        :param times: Sample times (monotonic clock)
+        :param values: Sample values (samples in rows, channels in columns)
+        """
+
+    def state(self, state: Dict) -> None:
+        """
+        Controller state changed
+        Called from the controller worker (after state is set).
+        :param state: Current controller state
+        """
+
+    def close(self) -> None:
+        """
+        Acquisition stopped
+        """
+
+
+class Subscription:
+    """
+    Live subscription to acquired samples
+    Blocks are queued; if the subscriber doesn't keep up (queue is full),
+    they are dropped (and counted).
+    """
+
+    def __init__(self, acquisition: "Acquisition", maxsize: int):
+        """
+        :param acquisition: Acquisition
+        :param maxsize: Queue size limit (number of blocks)
+        """
+        self._acquisition = acquisition
+        self._queue: Queue = Queue(maxsize)
+        self.dropped = 0
+
+    def put(self, times: np.ndarray, values: np.ndarray) -> None:
+        try:
+            self._queue.put_nowait((times, values))
+        except QueueFull:
+            self.dropped += 1
+
+    def blocks(self, duration: float = None, timeout: float = 1.0) -> Iterator[Tuple[float, np.ndarray, np.ndarray]]:
+        """
+        Subscribed blocks
+        :param duration: Subscription duration [s] (None means indefinitely)
+        :param timeout: Max. time between blocks [s] (empty block is produced
+                        in case of timeout)
+        :return: Generator of arrival ticks and sample blocks
+        """
+        stop_at = monotonic() + duration if duration else None
+        try:
+            while self._acquisition.running():
+                if stop_at is not None and monotonic() >= stop_at:
+                    break
+
+                try:
+                    times, values = self._queue.get(timeout=timeout)
+                except QueueEmpty:
+                    times, values = np.empty(0), np.empty((0, len(self._acquisition.channels)))
+
+                yield monotonic(), times, values
+
+        finally:
+            self._acquisition.unsubscribe(self)
+
+
+class Acquisition:
+    """
+    Continuous data acquisition thread
+    """
+
+    def __init__(self, controller, query: Dict, sinks: List[Sink]):
+        """
+        :param controller: Controller (sample blocks producer)
+        :param query: Acquisition query (see the controller blocks)
+        :param sinks: Sample consumers
+        """
+        self.channels = controller.channels(query)
+        self._controller = controller
+        self._query = query
+        self._sinks = sinks
+        self._subscriptions: List[Subscription] = []
+        self._subscriptions_lock = Lock()
+        self._stop = Event()
+        self._stopped = False
+        self._thread: Thread = None
+
+    def _routine(self) -> None:
+        log.info(f"{self._controller.name}: Acquisition starts")
+
+        try:
+            for _, times, values in self._controller.blocks(self._query, self._stop):
+                if not len(times):
+                    continue
+
+                for sink in self._sinks:
+                    sink.append(times, values)
+
+                with self._subscriptions_lock:
+                    for subscription in self._subscriptions:
+                        subscription.put(times, values)
+
+        except Exception as x:
+            log.error(f"{self._controller.name}: Acquisition failed: {x}")
+
+        finally:
+            if not self._stop.is_set():
+                self._stopped = True  # failed (or finished), the subscriptions end
+
+        log.info(f"{self._controller.name}: Acquisition terminates")
+
+    def start(self) -> "Acquisition":
+        """
+        Start acquisition thread
+        :return: self
+        """
+        self._stop.clear()
+        self._stopped = False
+        self._thread = Thread(
+            name=f"Acquisition({self._controller.name})",
+            target=self._routine, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def running(self) -> bool:
+        """
+        :return: True iff the acquisition was started (and neither stopped
+                 nor failed)
+        """
+        return self._thread is not None and not self._stopped
+
+    def _halt(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def restart(self) -> None:
+        """
+        Restart acquisition thread (e.g. after device settings change)
+        """
+        self._halt()
+        self.start()
+
+    def stop(self) -> None:
+        """
+        Stop acquisition thread, close sinks
+        """
+        self._stopped = True
+        self._halt()
+        for sink in self._sinks:
+            sink.close()
+
+    def subscribe(self, maxsize: int = 64) -> Subscription:
+        """
+        Subscribe to acquired samples
+        :param maxsize: Subscription queue size limit (number of blocks)
+        :return: Subscription
+        """
+        subscription = Subscription(self, maxsize)
+        with self._subscriptions_lock:
+            self._subscriptions.append(subscription)
+
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        """
+        Cancel subscription
+        :param subscription: Subscription
+        """
+        with self._subscriptions_lock:
+            if subscription in self._subscriptions:
+                self._subscriptions.remove(subscription)
@@ -0,0 +1,213 @@
+"""
+Windowed aggregation and decimation of sample blocks
+
+Aggregation is specified in downstream query, e.g.
+
+    "aggregate" : {
+        "axes"      : ["accel_data.x", "accel_data.z"],
+        "decimate"  : 2,
+        "window"    : 100,
+        "functions" : ["rms", "max"],
+        "bands"     : [[0, 50], [50, 150]]
+    }
+
+* "axes" selects (projects) the streamed channels (default: all of them),
+* "decimate" keeps every n-th sample (default: 1),
+* "window" is number of (decimated) samples aggregated in one record;
+  if not set, the (projected and decimated) samples are streamed,
+* "functions" are the aggregate functions computed per window and channel,
+* "bands" are frequency bands [Hz] of which the signal power is computed
+  per window and channel.
+"""
+
+from typing import Dict, List, Tuple, Iterator, Callable
+
+import numpy as np
+
+from .sampler import timestamp
+
+
+class Decimator:
+    """
+    Channel projection and decimation
+    """
+
+    def __init__(self, channels: List[str], axes: List[str] = None, factor: int = 1):
+        """
+        :param channels: Input channel names
+        :param axes: Selected channel names (all if None)
+        :param factor: Decimation factor
+        """
+        if axes is None:
+            axes = channels
+
+        unknown = set(axes) - set(channels)
+        if unknown:
+            raise ValueError(f"Unknown axes: {sorted(unknown)} (available: {channels})")
+
+        if int(factor) < 1:
+            raise ValueError(f"Invalid decimation factor: {factor}")
+
+        self.channels = list(axes)
+        self._columns = [channels.index(axis) for axis in axes]
+        self._factor = int(factor)
+        self._phase = 0  # index of the next kept sample in the next block
+
+    def push(self, times: np.ndarray, values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Project and decimate block of samples
+        :param times: Sample times
+        :param values: Sample values (samples in rows, channels in columns)
+        :return: Projected and decimated block
+        """
+        keep = slice(self._phase, None, self._factor)
+        self._phase = (self._phase - len(times)) % self._factor
+
+        return times[keep], values[keep][:, self._columns]
+
+
+class Aggregator:
+    """
+    Windowed (tumbling windows) aggregation
+    Aggregates are computed for whole windows at once (vectorised).
+    """
+
+    _functions: Dict[str, Callable[[np.ndarray], np.ndarray]] = {
+        "mean"   : lambda w: w.mean(axis=0),
+        "min"    : lambda w: w.min(axis=0),
+        "max"    : lambda w: w.max(axis=0),
+        "peak"   : lambda w: np.abs(w).max(axis=0),
+        "rms"    : lambda w: np.sqrt(np.mean(np.square(w), axis=0)),
+        "stddev" : lambda w: w.std(axis=0),
+    }
+
+    def __init__(self, channels: List[str], window: int,
+        functions: List[str] = ["mean"], bands: List[Tuple[float, float]] = []):
+        """
+        :param channels: Channel names
+        :param window: Window size (number of samples)
+        :param functions: Aggregate functions
+        :param bands: Frequency bands [Hz] (lower bound inclusive, upper exclusive)
+        """
+        unknown = set(functions) - set(Aggregator._functions.keys())
+        if unknown:
+            raise ValueError(f"Unknown aggregate functions: {sorted(unknown)} "
+                f"(available: {sorted(Aggregator._functions.keys())})")
+
+        if int(window) < 1:
+            raise ValueError(f"Invalid window size: {window}")
+
+        self._channels = channels
+        self._window = int(window)
+        self._aggregates = list(functions)
+        self._bands = [Aggregator._band(band) for band in bands]
+
+        self._times = np.empty(self._window)
+        self._values = np.empty((self._window, len(channels)))
+        self._fill = 0
+
+        self._taper = np.hanning(self._window)
+        self._taper_power = np.sum(np.square(self._taper))
+
+    @staticmethod
+    def _band(band) -> Tuple[float, float]:
+        """
+        :param band: Frequency band [Hz] (lower and upper bound)
+        :return: Frequency band
+        :raise ValueError: if the band is invalid
+        """
+        if not isinstance(band, (list, tuple)) or len(band) != 2 or \
+            not all(type(f) in (int, float) for f in band) or not band[0] < band[1]:
+            raise ValueError(f"Invalid frequency band: {band} (expected [low, high])")
+
+        return float(band[0]), float(band[1])
+
+    def _band_power(self, times: np.ndarray, values: np.ndarray) -> np.ndarray:
+        """
+        Signal power in frequency bands
+        The window is tapered (Hann); sample rate is estimated from sample times.
+        :param times: Window sample times
+        :param values: Window sample values
+        :return: Mean square of the signal components in bands (bands in rows,
+                 channels in columns)
+        """
+        n = len(times)
+        duration = times[-1] - times[0]
+        rate = (n - 1) / duration if duration > 0.0 else 1.0
+
+        centered = values - values.mean(axis=0)
+        spectrum = np.square(np.abs(np.fft.rfft(centered * self._taper[:, None], axis=0)))
+        power = 2.0 * spectrum / (n * self._taper_power)
+        freqs = np.fft.rfftfreq(n, d=1.0 / rate)
+
+        return np.array([
+            power[(freqs >= lo) & (freqs < hi)].sum(axis=0)
+            for lo, hi in self._bands
+        ]).reshape(len(self._bands), len(self._channels))
+
+    def _aggregate(self) -> Dict:
+        """
+        Aggregate full window
+        :return: Data chunk
+        """
+        times, values = self._times, self._values
+
+        results = [(f, Aggregator._functions[f](values).tolist()) for f in self._aggregates]
+        if self._bands:
+            results.append(("bands", self._band_power(times, values).T.tolist()))
+
+        chunk: Dict = {
+            "timestamp" : float(timestamp(times[0])),
+            "duration" : float(times[-1] - times[0]),
+            "samples" : self._window,
+        }
+        for i, channel in enumerate(self._channels):
+            group, axis = channel.split('.')
+            chunk.setdefault(group, {})[axis] = dict(
+                (name, result[i]) for name, result in results)
+
+        return chunk
+
+    def push(self, times: np.ndarray, values: np.ndarray) -> Iterator[Dict]:
+        """
+        Add block of samples
+        :param times: Sample times
+        :param values: Sample values (samples in rows, channels in columns)
+        :return: Generator of aggregated windows (data chunks)
+        """
+        offset = 0
+        while offset < len(times):
+            n = min(self._window - self._fill, len(times) - offset)
+            self._times[self._fill:self._fill + n] = times[offset:offset + n]
+            self._values[self._fill:self._fill + n] = values[offset:offset + n]
+            self._fill += n
+            offset += n
+
+            if self._fill == self._window:
+                yield self._aggregate()
+                self._fill = 0
+
+
+def pipeline(spec: Dict, channels: List[str]) -> Tuple[Decimator, Aggregator]:
+    """
+    Create aggregation pipeline
+    :param spec: Aggregation specification (see module doc.)
+    :param channels: Input channel names
+    :return: Decimator and aggregator (or None if no window is set)
+    :raise ValueError: if the specification is invalid
+    """
+    if not isinstance(spec, dict):
+        raise ValueError(f"Invalid aggregation: {spec}")
+
+    for key, kind in (("axes", list), ("functions", list), ("bands", list)):
+        if not isinstance(spec.get(key, []), kind):
+            raise ValueError(f"Invalid aggregation {key}: {spec[key]} (expected a list)")
+
+    decimator = Decimator(channels, spec.get("axes"), spec.get("decimate", 1))
+    window = spec.get("window")
+    aggregator = Aggregator(
+        decimator.channels, window,
+        spec.get("functions", ["mean"]),
+        spec.get("bands", [])) if window else None
+
+    return decimator, aggregator
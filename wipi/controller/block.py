@@ -0,0 +1,49 @@
+"""
+Sample blocks
+
+Controllers producing numeric samples pass them in blocks: array of sample
+times (monotonic clock) and 2D array of values (samples in rows, channels
+in columns).
+Channel names (e.g. "accel_data.x") define structure of the data chunks.
+"""
+
+from typing import Dict, List
+
+import numpy as np
+
+from .sampler import timestamp
+
+
+def block_chunk(times: np.ndarray, values: np.ndarray, channels: List[str]) -> Dict:
+    """
+    Format block of samples as data chunk
+    :param times: Sample times (monotonic clock)
+    :param values: Sample values (samples in rows, channels in columns)
+    :param channels: Channel names
+    :return: Data chunk (with lists of values)
+    """
+    chunk: Dict = {"timestamp" : timestamp(times).tolist()}
+    for i, channel in enumerate(channels):
+        group, axis = channel.split('.')
+        chunk.setdefault(group, {})[axis] = values[:, i].tolist()
+
+    return chunk
+
+
+def sample_chunks(times: np.ndarray, values: np.ndarray, channels: List[str]) -> List[Dict]:
+    """
+    Format block of samples as data chunks (one per sample)
+    :param times: Sample times (monotonic clock)
+    :param values: Sample values (samples in rows, channels in columns)
+    :param channels: Channel names
+    :return: Data chunks (with scalar values)
+    """
+    chunks = []
+    for t, row in zip(timestamp(times).tolist(), values.tolist()):
+        chunk: Dict = {"timestamp" : t}
+        for channel, value in zip(channels, row):
+            group, axis = channel.split('.')
+            chunk.setdefault(group, {})[axis] = value
+        chunks.append(chunk)
+
+    return chunks
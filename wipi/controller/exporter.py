@@ -0,0 +1,410 @@
+"""
+Batched push exporter
+
+Exports acquired samples and controller state changes to a time-series
+database (or its agent) listening locally, e.g. Telegraf, InfluxDB or
+VictoriaMetrics.
+
+Supported formats:
+* "influx": InfluxDB line protocol,
+* "prometheus": Prometheus text exposition format (with timestamps).
+
+Supported transports (the connection is kept open and reused):
+* "udp://host:port",
+* "tcp://host:port",
+* "unix:///path/to/socket" (stream socket),
+* "unixgram:///path/to/socket" (datagram socket).
+
+Samples are buffered (up to buffer size limit; blocks which don't fit
+are dropped and counted) and sent by exporter thread when batch size
+is reached or flush interval elapses.
+"""
+
+from typing import List, Dict, Tuple, Iterator, Any
+from abc import ABC, abstractmethod
+from threading import Thread, Event, Lock
+from collections import deque
+from time import time
+import socket
+import re
+
+import numpy as np
+
+from wipi.log import get_logger
+
+from .acquisition import Sink
+from .sampler import timestamp
+
+
+log = get_logger(__name__)
+
+
+class Transport:
+    """
+    Persistent socket connection
+    """
+
+    def __init__(self, address: str, max_datagram: int = 8192):
+        """
+        :param address: Address URL (see module doc.)
+        :param max_datagram: Datagram size limit [B]
+        """
+        scheme, _, location = address.partition("://")
+        families = {
+            "udp" : (socket.AF_INET, socket.SOCK_DGRAM),
+            "tcp" : (socket.AF_INET, socket.SOCK_STREAM),
+            "unix" : (socket.AF_UNIX, socket.SOCK_STREAM),
+            "unixgram" : (socket.AF_UNIX, socket.SOCK_DGRAM),
+        }
+        if scheme not in families:
+            raise ValueError(f"Unsupported exporter transport: {address}")
+
+        self.address = address
+        self._family, self._type = families[scheme]
+        if self._family == socket.AF_UNIX:
+            self._target: Any = location
+        else:
+            host, _, port = location.rpartition(':')
+            self._target = (host, int(port))
+
+        self._max_datagram = max_datagram
+        self._socket: socket.socket = None
+        self.connects = 0
+
+    def _connect(self) -> socket.socket:
+        if self._socket is None:
+            sock = socket.socket(self._family, self._type)
+            try:
+                sock.connect(self._target)
+            except OSError:
+                sock.close()
+                raise
+
+            self._socket = sock
+            self.connects += 1
+
+        return self._socket
+
+    def close(self) -> None:
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def send(self, lines: List[bytes]) -> int:
+        """
+        Send lines
+        Stream transports send all lines at once, datagram transports
+        pack the lines into datagrams (up to the size limit).
+        Connection is closed on error (and re-established on next send).
+        :param lines: Lines (incl. line ends)
+        :return: Number of bytes sent
+        """
+        try:
+            sock = self._connect()
+            if self._type == socket.SOCK_STREAM:
+                payload = b"".join(lines)
+                sock.sendall(payload)
+                return len(payload)
+
+            sent = 0
+            datagram: List[bytes] = []
+            size = 0
+            for line in lines:
+                if datagram and size + len(line) > self._max_datagram:
+                    sent += sock.send(b"".join(datagram))
+                    datagram, size = [], 0
+                datagram.append(line)
+                size += len(line)
+            if datagram:
+                sent += sock.send(b"".join(datagram))
+
+            return sent
+
+        except OSError:
+            self.close()
+            raise
+
+
+class Format(ABC):
+    """
+    Export format (interface)
+    """
+
+    def __init__(self, measurement: str, tags: Dict[str, str]):
+        """
+        :param measurement: Measurement (metric name prefix)
+        :param tags: Tags (labels)
+        """
+        self.measurement = measurement
+        self.tags = tags
+
+    @abstractmethod
+    def samples(self, times: np.ndarray, values: np.ndarray, channels: List[str]) -> Iterator[bytes]:
+        """
+        Format sample block
+        :param times: Sample timestamps (epoch)
+        :param values: Sample values
+        :param channels: Channel names
+        :return: Lines
+        """
+
+    @abstractmethod
+    def state(self, ts: float, state: Dict[str, Any]) -> Iterator[bytes]:
+        """
+        Format state
+        :param ts: Timestamp (epoch)
+        :param state: Flat state (numbers, booleans and strings)
+        :return: Lines
+        """
+
+
+class InfluxFormat(Format):
+    """
+    InfluxDB line protocol
+    """
+
+    @staticmethod
+    def _key(key: str) -> str:
+        return re.sub(r"([,= ])", r"\\\1", key)
+
+    def __init__(self, measurement: str, tags: Dict[str, str]):
+        super().__init__(measurement, tags)
+        self._prefix = InfluxFormat._key(measurement) + "".join(
+            f",{InfluxFormat._key(k)}={InfluxFormat._key(str(v))}"
+            for k, v in sorted(tags.items()))
+
+    def samples(self, times: np.ndarray, values: np.ndarray, channels: List[str]) -> Iterator[bytes]:
+        keys = [InfluxFormat._key(channel) for channel in channels]
+        for ts, row in zip((times * 1e9).astype(np.int64).tolist(), values.tolist()):
+            fields = ",".join(f"{key}={value!r}" for key, value in zip(keys, row))
+            yield f"{self._prefix} {fields} {ts}\n".encode()
+
+    @staticmethod
+    def _field(value: Any) -> str:
+        if isinstance(value, bool):
+            return "true" if value else "false"
+        if isinstance(value, (int, float)):
+            return repr(float(value))
+
+        escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+        return f'"{escaped}"'
+
+    def state(self, ts: float, state: Dict[str, Any]) -> Iterator[bytes]:
+        if state:
+            fields = ",".join(
+                f"{InfluxFormat._key(key)}={InfluxFormat._field(value)}"
+                for key, value in state.items())
+            yield f"{self._prefix},kind=state {fields} {int(ts * 1e9)}\n".encode()
+
+
+class PrometheusFormat(Format):
+    """
+    Prometheus text exposition format
+    """
+
+    @staticmethod
+    def _name(name: str) -> str:
+        return re.sub(r"[^a-zA-Z0-9_:]", "_", name)
+
+    @staticmethod
+    def _labels(labels: Dict[str, str]) -> str:
+        def escape(value: str) -> str:
+            return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+        return "{" + ",".join(
+            f'{PrometheusFormat._name(k)}="{escape(str(v))}"'
+            for k, v in sorted(labels.items())) + "}"
+
+    def samples(self, times: np.ndarray, values: np.ndarray, channels: List[str]) -> Iterator[bytes]:
+        labels = PrometheusFormat._labels(self.tags)
+        names = [PrometheusFormat._name(f"{self.measurement}_{channel}") for channel in channels]
+        for ts, row in zip((times * 1e3).astype(np.int64).tolist(), values.tolist()):
+            for name, value in zip(names, row):
+                yield f"{name}{labels} {value!r} {ts}\n".encode()
+
+    def state(self, ts: float, state: Dict[str, Any]) -> Iterator[bytes]:
+        ts_ms = int(ts * 1e3)
+        for key, value in state.items():
+            name = PrometheusFormat._name(f"{self.measurement}_state_{key}")
+            if isinstance(value, (bool, int, float)):
+                labels = PrometheusFormat._labels(self.tags)
+                yield f"{name}{labels} {float(value)!r} {ts_ms}\n".encode()
+            else:  # enumerated state (info style metric)
+                labels = PrometheusFormat._labels(dict(self.tags, state=value))
+                yield f"{name}{labels} 1.0 {ts_ms}\n".encode()
+
+
+class Exporter(Sink):
+    """
+    Batched push exporter of samples and states
+    """
+
+    _formats = {
+        "influx" : InfluxFormat,
+        "prometheus" : PrometheusFormat,
+    }
+
+    def __init__(self, name: str, channels: List[str], address: str,
+        format: str = "influx", measurement: str = "wipi", tags: Dict[str, str] = {},
+        batch: int = 1000, flush: float = 1.0, buffer: int = 100000):
+        """
+        :param name: Controller name (exported as "controller" tag)
+        :param channels: Channel names
+        :param address: Destination address (see module doc.)
+        :param format: Export format ("influx" or "prometheus")
+        :param measurement: Measurement name (metric names prefix)
+        :param tags: Additional tags (labels)
+        :param batch: Send when this many samples are buffered
+        :param flush: Send buffered samples at least this often [s]
+        :param buffer: Buffer size limit (number of samples)
+        """
+        if format not in Exporter._formats:
+            raise ValueError(f"Unknown export format: {format} "
+                f"(available: {sorted(Exporter._formats.keys())})")
+
+        self.channels = list(channels)
+        self._format: Format = Exporter._formats[format](
+            measurement, dict(tags, controller=name))
+        self._transport = Transport(address)
+        self._batch = int(batch)
+        self._flush = flush
+        self._limit = int(buffer)
+
+        self._queue: deque = deque()  # sample blocks and states
+        self._buffered = 0  # samples (states count as 1)
+        self._lock = Lock()
+        self._due = Event()
+        self._stop = Event()
+        self._thread: Thread = None
+
+        # Statistics
+        self.exported = 0
+        self.dropped = 0
+        self.failed = 0
+        self.sent_lines = 0
+        self.sent_bytes = 0
+
+    def _start(self) -> None:
+        """
+        Start exporter thread (in the writer process)
+        """
+        self._thread = Thread(
+            name=f"Exporter({self._transport.address})",
+            target=self._routine, daemon=True)
+        self._thread.start()
+
+    def _put(self, item: Tuple, size: int) -> None:
+        """
+        Buffer item, drop it if the buffer is full
+        :param item: Buffered item
+        :param size: Number of samples
+        """
+        if self._thread is None:
+            self._start()
+
+        with self._lock:
+            if self._buffered + size > self._limit:
+                self.dropped += size
+                return
+
+            self._queue.append(item)
+            self._buffered += size
+            due = self._buffered >= self._batch
+
+        if due:
+            self._due.set()
+
+    def append(self, times: np.ndarray, values: np.ndarray) -> None:
+        """
+        Buffer block of samples
+        :param times: Sample times (monotonic clock)
+        :param values: Sample values (samples in rows, channels in columns)
+        """
+        self._put((timestamp(times), values), len(times))
+
+    @staticmethod
+    def _flatten(state: Dict, prefix: str = "") -> Dict[str, Any]:
+        flat = {}
+        for key, value in state.items():
+            if isinstance(value, dict):
+                flat.update(Exporter._flatten(value, f"{prefix}{key}."))
+            elif isinstance(value, (bool, int, float, str)):
+                flat[prefix + key] = value
+
+        return flat
+
+    def state(self, state: Dict) -> None:
+        """
+        Buffer controller state
+        :param state: Controller state
+        """
+        self._put((time(), Exporter._flatten(state)), 1)
+
+    def _lines(self, items: List[Tuple]) -> List[bytes]:
+        lines: List[bytes] = []
+        for ts, data in items:
+            if isinstance(data, dict):
+                lines.extend(self._format.state(ts, data))
+            else:
+                lines.extend(self._format.samples(ts, data, self.channels))
+
+        return lines
+
+    def _send(self) -> None:
+        """
+        Send buffered items
+        """
+        with self._lock:
+            items = list(self._queue)
+            count = self._buffered
+            self._queue.clear()
+            self._buffered = 0
+
+        if not items:
+            return
+
+        lines = self._lines(items)
+        try:
+            self.sent_bytes += self._transport.send(lines)
+            self.sent_lines += len(lines)
+            self.exported += count
+
+        except OSError as x:
+            self.failed += count
+            log.warning(f"Exporter: Failed to send {count} samples to "
+                f"{self._transport.address}: {x}")
+
+    def _routine(self) -> None:
+        while not self._stop.is_set():
+            self._due.wait(self._flush)
+            self._due.clear()
+            self._send()
+
+        self._send()
+        self._transport.close()
+
+    def close(self) -> None:
+        """
+        Send buffered samples, stop exporter thread
+        """
+        if self._thread is not None:
+            self._stop.set()
+            self._due.set()
+            self._thread.join()
+            self._thread = None
+
+            log.info(f"Exporter: {self.stats()}")
+
+    def stats(self) -> Dict:
+        """
+        :return: Samples exported, dropped (buffer full), failed to send,
+                 lines and bytes sent and connections made
+        """
+        return {
+            "exported" : self.exported,
+            "dropped" : self.dropped,
+            "failed" : self.failed,
+            "sent_lines" : self.sent_lines,
+            "sent_bytes" : self.sent_bytes,
+            "connects" : self._transport.connects,
+        }
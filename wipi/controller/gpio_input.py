@@ -0,0 +1,428 @@
+"""
+GPIO inputs controller
+
+Watches GPIO inputs (buttons, limit switches, flow meters...) using kernel
+edge detection: edge events are requested from the GPIO character device
+(`/dev/gpiochip0`, v1 uAPI line events), so the edges are timestamped
+by the kernel at interrupt time and the controller worker just reads batches
+of queued events (no polling of the input levels).
+
+Edges are debounced in-process (edges closer than "debounce" seconds
+after an accepted edge are dropped as bounces) and pulses (edges
+of the configured kind) are counted.
+
+The controller acquires the events continuously (see Controller.blocks):
+each event is a sample of the "edge.<input name>" channels, the value being
+1 for rising, -1 for falling edge (and 0 for the other inputs).
+So, the events may be downstreamed, kept in history, recorded or exported
+just like any other samples.
+
+    "inputs" : {
+        "flow"   : {"channel": 17, "edge": "rising"},
+        "button" : {"channel": 27, "edge": "both", "debounce": 0.02, "bias": "pull_up"}
+    }
+"""
+
+from typing import Any, Dict, List, Tuple, Iterator
+from threading import Lock, Event
+from time import monotonic, time, sleep
+import fcntl
+import os
+import select
+import struct
+
+import numpy as np
+
+from wipi.controller import Controller
+from wipi.log import get_logger
+
+from .sampler import timestamp
+from .block import block_chunk
+
+
+log = get_logger(__name__)
+
+
+class Chardev:
+    """
+    GPIO character device edge events source (v1 uAPI)
+    """
+
+    # ioctl requests
+    GPIO_GET_LINEEVENT_IOCTL = 0xc030b404
+    GPIOHANDLE_GET_LINE_VALUES_IOCTL = 0xc040b408
+
+    # Line request flags
+    GPIOHANDLE_REQUEST_INPUT = 1 << 0
+    GPIOHANDLE_REQUEST_BIAS_PULL_UP = 1 << 5
+    GPIOHANDLE_REQUEST_BIAS_PULL_DOWN = 1 << 6
+    GPIOHANDLE_REQUEST_BIAS_DISABLE = 1 << 7
+
+    # Event request flags and event IDs
+    GPIOEVENT_REQUEST_RISING_EDGE = 1 << 0
+    GPIOEVENT_REQUEST_FALLING_EDGE = 1 << 1
+    GPIOEVENT_EVENT_RISING_EDGE = 0x01
+
+    _request = struct.Struct("=III32si")  # struct gpioevent_request
+    _event = np.dtype([("timestamp", "<u8"), ("id", "<u4"), ("pad", "<u4")])  # struct gpioevent_data
+
+    _edges = {
+        "rising" : GPIOEVENT_REQUEST_RISING_EDGE,
+        "falling" : GPIOEVENT_REQUEST_FALLING_EDGE,
+        "both" : GPIOEVENT_REQUEST_RISING_EDGE | GPIOEVENT_REQUEST_FALLING_EDGE,
+    }
+
+    _biases = {
+        None : 0,
+        "disable" : GPIOHANDLE_REQUEST_BIAS_DISABLE,
+        "pull_up" : GPIOHANDLE_REQUEST_BIAS_PULL_UP,
+        "pull_down" : GPIOHANDLE_REQUEST_BIAS_PULL_DOWN,
+    }
+
+    def __init__(self, lines: List[Dict], batch: float = 0.005,
+        chip: str = "/dev/gpiochip0", consumer: str = "wipi"):
+        """
+        :param lines: Requested lines ({"channel": line offset, "edge": "rising",
+                      "falling" or "both", "bias": None, "disable", "pull_up"
+                      or "pull_down"})
+        :param batch: Let events queue for this long after the first one [s]
+                      (note that the kernel queue holds 16 events per line)
+        :param chip: GPIO chip device
+        :param consumer: Consumer label
+        """
+        self._batch = batch
+        self._fds: List[int] = []
+        self._offset: float = None  # kernel timestamp to monotonic clock offset
+
+        chip_fd = os.open(chip, os.O_RDONLY)
+        try:
+            for line in lines:
+                request = bytearray(Chardev._request.pack(
+                    line["channel"],
+                    Chardev.GPIOHANDLE_REQUEST_INPUT | Chardev._biases[line.get("bias")],
+                    Chardev._edges[line.get("edge", "rising")],
+                    consumer.encode()[:31], 0))
+                fcntl.ioctl(chip_fd, Chardev.GPIO_GET_LINEEVENT_IOCTL, request)
+                fd = Chardev._request.unpack(request)[-1]
+                os.set_blocking(fd, False)
+                self._fds.append(fd)
+
+        except OSError:
+            self.close()
+            raise
+
+        finally:
+            os.close(chip_fd)
+
+        self._poll = select.poll()
+        for fd in self._fds:
+            self._poll.register(fd, select.POLLIN | select.POLLPRI)
+
+    def _clock(self, ts: float) -> float:
+        """
+        Kernel timestamp clock offset
+        Kernels before 5.7 timestamp events by the real time clock, newer ones
+        by the monotonic clock.
+        :param ts: Event timestamp [s]
+        :return: Offset to the monotonic clock
+        """
+        if self._offset is None:
+            self._offset = monotonic() - time() if abs(ts - time()) < abs(ts - monotonic()) else 0.0
+
+        return self._offset
+
+    def read(self, timeout: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Wait for batch of events
+        :param timeout: Max. waiting time [s] (if there are no events)
+        :return: Event times (monotonic clock), line indices and rising flags
+        """
+        if not self._poll.poll(timeout * 1e3):
+            return np.empty(0), np.empty(0, dtype=int), np.empty(0, dtype=bool)
+
+        if self._batch:
+            sleep(self._batch)
+
+        batches, indices = [], []
+        for i, fd in enumerate(self._fds):
+            data = bytearray()
+            while True:
+                try:
+                    chunk = os.read(fd, 64 * Chardev._event.itemsize)
+                except BlockingIOError:
+                    break
+                if not chunk:
+                    break
+                data += chunk
+
+            if data:
+                line_events = np.frombuffer(bytes(data), dtype=Chardev._event)
+                batches.append(line_events)
+                indices.append(np.full(len(line_events), i))
+
+        if not batches:
+            return np.empty(0), np.empty(0, dtype=int), np.empty(0, dtype=bool)
+
+        events, index = np.concatenate(batches), np.concatenate(indices)
+        order = np.argsort(events["timestamp"], kind="stable")
+        events, index = events[order], index[order]
+
+        times = events["timestamp"] * 1e-9
+        times += self._clock(float(times[0]))
+        return times, index, events["id"] == Chardev.GPIOEVENT_EVENT_RISING_EDGE
+
+    def level(self, i: int) -> int:
+        """
+        :param i: Line index
+        :return: Current line level
+        """
+        data = bytearray(64)  # struct gpiohandle_data
+        fcntl.ioctl(self._fds[i], Chardev.GPIOHANDLE_GET_LINE_VALUES_IOCTL, data)
+        return data[0]
+
+    def close(self) -> None:
+        for fd in self._fds:
+            os.close(fd)
+        self._fds = []
+
+
+def source(backend: str, lines: List[Dict], batch: float, **kwargs):
+    """
+    Edge events source
+    :param backend: Backend name ("chardev" or "simulator")
+    :param lines: Requested lines
+    :param batch: Events batching [s]
+    :param kwargs: Backend parameters
+    :return: Events source (Chardev or compatible object)
+    """
+    if backend == "chardev":
+        return Chardev(lines, batch, **kwargs)
+
+    if backend == "simulator":
+        from .simulator import EdgeEvents
+        return EdgeEvents(lines, batch, **kwargs)
+
+    raise ValueError(f"Unknown GPIO input backend: {backend}")
+
+
+class GpioInput(Controller):
+    """
+    GPIO inputs edge events, pulse counters
+
+    The events are acquired continuously (even if the acquisition isn't
+    configured), so the counters in the state are always up to date.
+    """
+
+    _edges = ("rising", "falling", "both")
+
+    def __init__(self, name: str, inputs: Dict[str, Dict], backend: str = "chardev",
+        chip: str = "/dev/gpiochip0", batch: float = 0.005, simulator: Dict = {}):
+        """
+        :param name: Controller name
+        :param inputs: Inputs by name ({"channel": BCM channel, "edge": counted
+                       edges ("rising", "falling" or "both"), "debounce":
+                       debouncing time [s], "bias": "pull_up", "pull_down"
+                       or "disable"})
+        :param backend: Events source ("chardev" or "simulator")
+        :param chip: GPIO chip device
+        :param batch: Events batching [s]
+        :param simulator: Simulated events parameters (see simulator.EdgeEvents)
+        """
+        super().__init__(name)
+
+        for iname, config in inputs.items():
+            if config.get("edge", "rising") not in GpioInput._edges:
+                raise ValueError(f"{name}: Input {iname}: Unknown edge: {config['edge']} "
+                    f"(available: {GpioInput._edges})")
+
+        self._names = list(inputs.keys())
+        self._lines = [dict(inputs[iname]) for iname in self._names]
+        self._backend = backend
+        self._batch = batch
+        self._kwargs = simulator if backend == "simulator" else {"chip" : chip}
+        self._source: Any = None  # events source (while acquiring)
+        self._source_lock = Lock()  # the source is closed by the acquisition thread
+
+        n = len(self._names)
+        self._debounce = np.array([line.get("debounce", 0.0) for line in self._lines])
+        self._both = np.array([line.get("edge", "rising") == "both" for line in self._lines])
+        self._count_rising = np.array([line.get("edge", "rising") != "falling" for line in self._lines])
+        self._count_falling = np.array([line.get("edge", "rising") != "rising" for line in self._lines])
+
+        self._lock = Lock()  # counters (updated in the acquisition thread)
+        self._counts = np.zeros(n, dtype=np.int64)
+        self._edge_counts = np.zeros(n, dtype=np.int64)
+        self._bounces = np.zeros(n, dtype=np.int64)
+        self._last = np.full(n, np.nan)  # last counted pulse time
+        self._rates = np.zeros(n)
+        self._rate_at = monotonic()
+        self._rate_counts = np.zeros(n, dtype=np.int64)
+
+        # Debouncing state (last accepted edge time and direction)
+        self._accepted_at = np.full(n, -np.inf)
+        self._accepted_rising = np.zeros(n, dtype=bool)
+
+        self.acquisition_query = {}
+
+    def enable_acquisition(self, query: Dict, sinks: List) -> None:
+        super().enable_acquisition({} if query is None else query, sinks)
+
+    def channels(self, query: Dict) -> List[str]:
+        """
+        :param query: Acquisition query
+        :return: Edge channels
+        """
+        return [f"edge.{iname}" for iname in self._names]
+
+    def _debounced(self, times: np.ndarray, index: np.ndarray, rising: np.ndarray) -> np.ndarray:
+        """
+        Debounce edges
+        An edge is accepted if it comes at least "debounce" seconds after
+        the last accepted edge (and, if both edges are detected, it changes
+        the level).
+        :param times: Event times
+        :param index: Event line indices
+        :param rising: Event rising flags
+        :return: Accepted events mask
+        """
+        accepted = np.ones(len(times), dtype=bool)
+        if not self._debounce.any():
+            return accepted
+
+        for j, (t, i, r) in enumerate(zip(times.tolist(), index.tolist(), rising.tolist())):
+            debounce = self._debounce[i]
+            if not debounce:
+                continue
+
+            if t - self._accepted_at[i] < debounce or (self._both[i] and r == self._accepted_rising[i]):
+                accepted[j] = False
+            else:
+                self._accepted_at[i] = t
+                self._accepted_rising[i] = r
+
+        return accepted
+
+    def _count(self, times: np.ndarray, index: np.ndarray, rising: np.ndarray, accepted: np.ndarray) -> None:
+        """
+        Update counters
+        :param times: Event times
+        :param index: Event line indices
+        :param rising: Event rising flags
+        :param accepted: Accepted events mask
+        """
+        n = len(self._names)
+        counted = accepted & np.where(rising, self._count_rising[index], self._count_falling[index])
+        now = monotonic()
+
+        with self._lock:
+            self._counts += np.bincount(index[counted], minlength=n)
+            self._edge_counts += np.bincount(index[accepted], minlength=n)
+            self._bounces += np.bincount(index[~accepted], minlength=n)
+            if counted.any():
+                self._last[index[counted]] = times[counted]  # times are sorted
+
+            if now - self._rate_at >= 1.0:
+                self._rates = (self._counts - self._rate_counts) / (now - self._rate_at)
+                self._rate_counts = self._counts.copy()
+                self._rate_at = now
+
+    def blocks(self, query: Dict, stop: Event) -> Iterator[Tuple[float, np.ndarray, np.ndarray]]:
+        """
+        Edge events (for continuous acquisition)
+        :param query: Acquisition query
+        :param stop: Stop acquisition when set
+        :return: Generator of event batches (times and edge channels values)
+        """
+        source_ = source(self._backend, self._lines, self._batch, **self._kwargs)
+        with self._source_lock:
+            self._source = source_
+
+        try:
+            while not stop.is_set():
+                times, index, rising = source_.read(timeout=0.1)
+                accepted = self._debounced(times, index, rising)
+                self._count(times, index, rising, accepted)
+
+                times, index, rising = times[accepted], index[accepted], rising[accepted]
+                values = np.zeros((len(times), len(self._names)))
+                values[np.arange(len(times)), index] = np.where(rising, 1.0, -1.0)
+                yield monotonic(), times, values
+
+        finally:
+            with self._source_lock:  # no level is being read
+                self._source = None
+            source_.close()
+
+    def get_state(self) -> Dict:
+        """
+        :return: Inputs state (level, pulse count and rate [Hz], last pulse
+                 timestamp, accepted edges and bounces)
+        """
+        with self._source_lock:
+            levels = [None] * len(self._names) if self._source is None else [
+                self._source.level(i) for i in range(len(self._names))]
+
+        state = {}
+        with self._lock:
+            for i, iname in enumerate(self._names):
+                state[iname] = {
+                    "channel" : self._lines[i]["channel"],
+                    "level" : levels[i],
+                    "count" : int(self._counts[i]),
+                    "rate" : float(self._rates[i]),
+                    "last" : None if np.isnan(self._last[i]) else timestamp(float(self._last[i])),
+                    "edges" : int(self._edge_counts[i]),
+                    "bounces" : int(self._bounces[i]),
+                }
+
+        return state
+
+    def set_state(self, state: Dict) -> Dict:
+        """
+        Reset counters ({"reset": "all" or list of input names})
+        :param state: State changes
+        :return: Current state
+        """
+        reset = state.get("reset")
+        if reset is not None:
+            inputs = self._names if reset == "all" else [i for i in reset if i in self._names]
+            with self._lock:
+                for iname in inputs:
+                    i = self._names.index(iname)
+                    self._counts[i] = self._edge_counts[i] = self._bounces[i] = 0
+                    self._rate_counts[i] = 0
+                    self._last[i] = np.nan
+
+        return self.get_state()
+
+    def downstream(self, query: Dict) -> Iterator[Dict]:
+        """
+        Downstream edge events
+
+        Each chunk contains a batch of events (lists of timestamps and edges
+        of the "inputs" listed in the query, all by default).
+
+        :param query: Query
+        :return: Generator of data chunks
+        """
+        inputs = query.get("inputs", self._names)
+        unknown = set(inputs) - set(self._names)
+        if unknown:
+            yield {"error" : f"Unknown inputs: {sorted(unknown)} (available: {self._names})"}
+            return
+
+        if self.acquisition is None:
+            yield {"error" : "Events acquisition isn't running"}
+            return
+
+        columns = [self._names.index(iname) for iname in inputs]
+        channels = [f"edge.{iname}" for iname in inputs]
+
+        subscription = self.acquisition.subscribe()
+        for _, times, values in subscription.blocks(query.get("duration", 0.0) or None):
+            values = values[:, columns]
+            events = values.any(axis=1)
+            if events.any():
+                yield block_chunk(times[events], values[events], channels)
+
+        log.info(f"{self.name}: Stream finished (dropped blocks: {subscription.dropped})")
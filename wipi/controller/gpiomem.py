@@ -0,0 +1,236 @@
+"""
+Memory mapped GPIO backend
+
+Maps the GPIO register block of BCM283x/BCM2711 SoCs (via `/dev/gpiomem`,
+accessible to members of the gpio group, no root needed) and accesses
+the registers directly.
+
+The backend provides (the used subset of) the RPi.GPIO module interface,
+however multi-channel output is done by a single write to the output set
+register (channels going high) and a single write to the output clear
+register (channels going low), per bank.
+So the channels switch simultaneously (a transition which only sets or only
+clears channels is atomic) and the whole transition takes well under
+a microsecond (compared to several microseconds per channel with RPi.GPIO).
+
+Any (existing) regular file may be used instead of the device (it's extended
+to the register block size if needed); the backend then emulates the pin level
+registers, so that the register map may be inspected off-Pi.
+"""
+
+from typing import Dict, List, Tuple, Union, Iterable
+import mmap
+import os
+import stat
+from time import sleep
+
+
+class GPIO:
+    """
+    Memory mapped GPIO (RPi.GPIO compatible)
+    """
+
+    BOARD = 10
+    BCM = 11
+
+    OUT = 0
+    IN = 1
+
+    LOW = 0
+    HIGH = 1
+
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+
+    CHANNELS = 54  # BCM GPIO channels (2 banks)
+
+    # Register word offsets
+    _GPFSEL0 = 0x00 // 4  # function select (10 channels per register, 3 bits each)
+    _GPSET0 = 0x1c // 4  # output set (bank 0, bank 1 follows)
+    _GPCLR0 = 0x28 // 4  # output clear
+    _GPLEV0 = 0x34 // 4  # pin level
+    _GPPUD = 0x94 // 4  # pull-up/down enable (BCM283x)
+    _GPPUDCLK0 = 0x98 // 4  # pull-up/down enable clock
+    _GPPUPPDN0 = 0xe4 // 4  # pull-up/down control (BCM2711, 16 channels per register)
+
+    _LEGACY_PUD = 0x6770696f  # "gpio" (reads of unimplemented BCM283x registers)
+
+    _SIZE = 4096  # register block mapping size
+    _MASK = 0xffffffff
+
+    def __init__(self, path: str = "/dev/gpiomem"):
+        """
+        :param path: GPIO memory device or file-backed fake register map
+        """
+        fd = os.open(path, os.O_RDWR | os.O_SYNC)
+        try:
+            self.emulated = not stat.S_ISCHR(os.fstat(fd).st_mode)
+            if self.emulated and os.fstat(fd).st_size < GPIO._SIZE:
+                os.ftruncate(fd, GPIO._SIZE)
+
+            self._mmap = mmap.mmap(fd, GPIO._SIZE, mmap.MAP_SHARED,
+                mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)  # the mapping stays valid
+
+        self.path = path
+        self._reg = memoryview(self._mmap).cast('I')  # 32 bit registers
+        self._mode: int = None
+        self._channels: Dict[int, int] = {}  # set up channels (direction)
+
+        self.writes = 0  # number of register writes done (by output)
+
+    def setwarnings(self, flag: bool) -> None:
+        pass
+
+    def setmode(self, mode: int) -> None:
+        if mode != GPIO.BCM:
+            raise ValueError("Memory mapped GPIO supports BCM channel numbering only")
+
+        self._mode = mode
+
+    @staticmethod
+    def _check(channel: int) -> None:
+        if not 0 <= channel < GPIO.CHANNELS:
+            raise ValueError(f"Invalid GPIO channel: {channel}")
+
+    def _function(self, channel: int, function: int) -> None:
+        """
+        Set channel function (0b000 is input, 0b001 is output)
+        :param channel: Channel
+        :param function: Function code
+        """
+        reg = GPIO._GPFSEL0 + channel // 10
+        shift = (channel % 10) * 3
+        self._reg[reg] = (self._reg[reg] & ~(0b111 << shift) & GPIO._MASK) | (function << shift)
+
+    def _pull(self, channel: int, pull_up_down: int) -> None:
+        """
+        Set channel pull-up/pull-down resistor
+        :param channel: Channel
+        :param pull_up_down: GPIO.PUD_OFF, GPIO.PUD_DOWN or GPIO.PUD_UP
+        """
+        if self._reg[GPIO._GPPUPPDN0 + 3] != GPIO._LEGACY_PUD:  # BCM2711
+            code = {GPIO.PUD_OFF: 0b00, GPIO.PUD_UP: 0b01, GPIO.PUD_DOWN: 0b10}[pull_up_down]
+            reg = GPIO._GPPUPPDN0 + channel // 16
+            shift = (channel % 16) * 2
+            self._reg[reg] = (self._reg[reg] & ~(0b11 << shift) & GPIO._MASK) | (code << shift)
+
+        else:  # BCM283x: control signal, clock it to the channel, remove both
+            code = {GPIO.PUD_OFF: 0b00, GPIO.PUD_DOWN: 0b01, GPIO.PUD_UP: 0b10}[pull_up_down]
+            clock = GPIO._GPPUDCLK0 + channel // 32
+            self._reg[GPIO._GPPUD] = code
+            sleep(10e-6)  # at least 150 cycles
+            self._reg[clock] = 1 << (channel % 32)
+            sleep(10e-6)
+            self._reg[GPIO._GPPUD] = 0
+            self._reg[clock] = 0
+
+    def setup(self, channel: Union[int, Iterable[int]], direction: int,
+        pull_up_down: int = PUD_OFF, initial: int = None) -> None:
+        """
+        Set up channel(s)
+        Initial output value is set before the channel becomes output.
+        :param channel: Channel or list of channels
+        :param direction: GPIO.IN or GPIO.OUT
+        :param pull_up_down: Pull-up/pull-down resistor setting
+        :param initial: Initial output value
+        """
+        if self._mode is None:
+            raise RuntimeError("GPIO mode not set")
+
+        channels = [channel] if isinstance(channel, int) else list(channel)
+        for ch in channels:
+            GPIO._check(ch)
+
+        if direction == GPIO.OUT:
+            if initial is not None:
+                self.output(channels, initial)
+            for ch in channels:
+                self._function(ch, 0b001)
+        else:
+            for ch in channels:
+                self._function(ch, 0b000)
+                self._pull(ch, pull_up_down)
+
+        for ch in channels:
+            self._channels[ch] = direction
+
+    @staticmethod
+    def masks(channels: List[int], values: List[int]) -> Tuple[List[int], List[int]]:
+        """
+        Output set & clear masks
+        :param channels: Channels
+        :param values: Values (one per channel)
+        :return: Set and clear masks (per bank)
+        """
+        set_masks = [0, 0]
+        clr_masks = [0, 0]
+        for ch, val in zip(channels, values):
+            if val:
+                set_masks[ch >> 5] |= 1 << (ch & 31)
+            else:
+                clr_masks[ch >> 5] |= 1 << (ch & 31)
+
+        return set_masks, clr_masks
+
+    def write(self, set_masks: List[int], clr_masks: List[int]) -> None:
+        """
+        Write output set & clear registers
+        Channels with bits set in the set mask go high, channels with bits set
+        in the clear mask go low, other channels are untouched.
+        :param set_masks: Set masks (per bank)
+        :param clr_masks: Clear masks (per bank)
+        """
+        for bank in (0, 1):
+            if set_masks[bank]:
+                self._reg[GPIO._GPSET0 + bank] = set_masks[bank]
+                self.writes += 1
+            if clr_masks[bank]:
+                self._reg[GPIO._GPCLR0 + bank] = clr_masks[bank]
+                self.writes += 1
+
+            if self.emulated:  # pin levels follow the outputs
+                level = GPIO._GPLEV0 + bank
+                self._reg[level] = (self._reg[level] | set_masks[bank]) & ~clr_masks[bank] & GPIO._MASK
+
+    def output(self, channel: Union[int, Iterable[int]],
+        value: Union[int, Iterable[int]]) -> None:
+        """
+        Set output channel(s) value(s)
+        All the channels are written at once.
+        :param channel: Channel or list of channels
+        :param value: Value or list of values (one per channel)
+        """
+        channels = [channel] if isinstance(channel, int) else list(channel)
+        values = [value] * len(channels) if isinstance(value, int) else list(value)
+        if len(values) != len(channels):
+            raise ValueError("Number of values doesn't match number of channels")
+
+        self.write(*GPIO.masks(channels, values))
+
+    def input(self, channel: int) -> int:
+        """
+        :param channel: Channel
+        :return: Channel level
+        """
+        GPIO._check(channel)
+        return (self._reg[GPIO._GPLEV0 + (channel >> 5)] >> (channel & 31)) & 1
+
+    def cleanup(self, channel: Union[int, Iterable[int]] = None) -> None:
+        """
+        Reset channel(s) to input (without pull-up/down)
+        :param channel: Channel or list of channels (all set up if None)
+        """
+        if channel is None:
+            channels = list(self._channels.keys())
+        else:
+            channels = [channel] if isinstance(channel, int) else list(channel)
+
+        for ch in channels:
+            direction = self._channels.pop(ch, None)
+            if direction is not None:
+                self._function(ch, 0b000)
+                if direction == GPIO.IN:
+                    self._pull(ch, GPIO.PUD_OFF)
@@ -0,0 +1,158 @@
+"""
+Sensor history ring buffer
+
+Recent samples are kept in a fixed size ring buffer in shared memory
+(a typed array allocated before the workers fork).
+The controller worker acquisition appends to it, API workers read it directly,
+without any round trip to the controller worker.
+
+The buffer is single-writer, multiple-readers.
+Readers don't lock; instead, they check the write counters before and after
+copying the data and discard samples overwritten meanwhile.
+"""
+
+from typing import Any, List, Dict, Tuple
+from multiprocessing.sharedctypes import RawArray, RawValue
+
+import numpy as np
+
+from .acquisition import Sink
+from .sampler import from_timestamp
+
+
+class History(Sink):
+    """
+    Shared memory ring buffer of samples
+    """
+
+    def __init__(self, channels: List[str], capacity: int):
+        """
+        :param channels: Channel names
+        :param capacity: Buffer capacity (number of samples)
+        """
+        self.channels = list(channels)
+        self.capacity = int(capacity)
+
+        # Sample time and values per row
+        self._buffer = RawArray('d', self.capacity * (1 + len(self.channels)))
+        self._written = RawValue('Q', 0)   # number of samples written so far
+        self._reserved = RawValue('Q', 0)  # ... incl. those being written
+        self._rows: np.ndarray = None     # buffer view (per process)
+
+    def _view(self) -> np.ndarray:
+        if self._rows is None:
+            self._rows = np.frombuffer(self._buffer, dtype=np.float64).reshape(
+                self.capacity, 1 + len(self.channels))
+
+        return self._rows
+
+    @staticmethod
+    def _load(value: Any) -> int:
+        """
+        Read shared counter
+        64b value may be read in two parts (on 32b platforms), so read it
+        until it's stable.
+        :param value: Shared counter (RawValue)
+        :return: Counter value
+        """
+        current = value.value
+        while True:
+            again = value.value
+            if again == current:
+                return current
+            current = again
+
+    def append(self, times: np.ndarray, values: np.ndarray) -> None:
+        """
+        Append block of samples
+        :param times: Sample times (monotonic clock)
+        :param values: Sample values (samples in rows, channels in columns)
+        """
+        rows = self._view()
+        written = self._written.value  # the only writer
+
+        # Only the last capacity samples would survive
+        skip = max(0, len(times) - self.capacity)
+        times = times[skip:]
+        values = values[skip:]
+        n = len(times)
+
+        # Announce the overwritten region first
+        self._reserved.value = written + skip + n
+
+        start = (written + skip) % self.capacity
+        head = min(n, self.capacity - start)
+        rows[start:start + head, 0] = times[:head]
+        rows[start:start + head, 1:] = values[:head]
+        rows[:n - head, 0] = times[head:]
+        rows[:n - head, 1:] = values[head:]
+
+        self._written.value = written + skip + n
+
+    def read(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Read all buffered samples
+        :return: Sample times (monotonic clock) and values (consistent copy)
+        """
+        rows = self._view()
+
+        before = History._load(self._written)
+        first = max(0, before - self.capacity)
+        start = first % self.capacity
+        end = before % self.capacity
+
+        if before - first == self.capacity:
+            data = np.concatenate((rows[start:], rows[:end]))
+        else:
+            data = rows[start:start + before - first].copy()
+
+        # Discard samples overwritten during the copy (incl. those being written)
+        reserved = History._load(self._reserved)
+        overwritten = max(0, reserved - self.capacity - first)
+        data = data[overwritten:]
+
+        return data[:, 0], data[:, 1:]
+
+    def query(self, query: Dict) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """
+        Query samples
+        The query may specify time range by "seconds" (last N seconds) or
+        by "from" and/or "to" (epoch timestamps), "decimate" factor and
+        "axes" (channels selection).
+        :param query: Query
+        :return: Sample times (monotonic clock), values and channel names
+        """
+        times, values = self.read()
+
+        seconds = query.get("seconds")
+        start = query.get("from")
+        end = query.get("to")
+
+        lo = 0 if start is None else np.searchsorted(times, from_timestamp(float(start)), "left")
+        hi = len(times) if end is None else np.searchsorted(times, from_timestamp(float(end)), "right")
+        if seconds is not None and len(times):
+            lo = np.searchsorted(times, times[-1] - float(seconds), "left")
+
+        axes = query.get("axes", self.channels)
+        unknown = set(axes) - set(self.channels)
+        if unknown:
+            raise ValueError(f"Unknown axes: {sorted(unknown)} (available: {self.channels})")
+        columns = [self.channels.index(axis) for axis in axes]
+
+        decimate = int(query.get("decimate", 1))
+        if decimate < 1:
+            raise ValueError(f"Invalid decimation factor: {decimate}")
+
+        keep = slice(lo, hi, decimate)
+        return times[keep], values[keep][:, columns], list(axes)
+
+    def stats(self) -> Dict:
+        """
+        :return: Buffer capacity, number of samples written and buffered time span
+        """
+        times, _ = self.read()
+        return {
+            "capacity" : self.capacity,
+            "written" : History._load(self._written),
+            "span" : float(times[-1] - times[0]) if len(times) > 1 else 0.0,
+        }
@@ -0,0 +1,396 @@
+"""
+Shared I2C bus arbiter
+
+Controllers of devices on the same I2C bus (e.g. 2 MPU6050 modules at 0x68
+and 0x69) run in separate worker processes.
+Instead of driving the bus independently, they may send their transactions
+to the bus arbiter, a process which owns the bus:
+* transactions are serialised (each request, i.e. batch of transactions,
+  is done as a whole, without interleaving with other requests),
+* pending requests are executed in order of their priority (latency sensitive
+  reads, e.g. sample reads, should have higher priority than configuration),
+* batched byte reads of subsequent registers of the same device are done
+  by a single block read.
+
+Bus utilisation statistics (time spent by transactions, request waiting
+times...) are kept in shared memory, so that API workers read them directly.
+
+Transactions are tuples (operation, address, register[, value, length or data]):
+* ("read_byte", address, register) -> int
+* ("write_byte", address, register, value) -> None
+* ("read_block", address, register, length) -> List[int]
+* ("write_block", address, register, data) -> None
+"""
+
+from typing import List, Dict, Tuple, Any, cast
+from multiprocessing import Process, Pipe
+from multiprocessing.connection import Connection, wait
+from multiprocessing.sharedctypes import RawArray
+from threading import Lock
+from time import monotonic
+import heapq
+import os
+
+from wipi.log import get_logger
+from wipi.util import sequence, receive
+
+
+log = get_logger(__name__)
+
+
+Transaction = Tuple
+
+
+def bus(backend: str, number: int, **kwargs):
+    """
+    I2C bus
+    :param backend: Backend name ("smbus" or "simulator")
+    :param number: Bus number
+    :param kwargs: Backend parameters
+    :return: Bus (smbus.SMBus or compatible object)
+    """
+    if backend == "smbus":
+        from smbus import SMBus
+        return SMBus(number)
+
+    if backend == "simulator":
+        from .simulator import SMBus
+        return SMBus(number, **kwargs)
+
+    raise ValueError(f"Unknown I2C bus backend: {backend}")
+
+
+def coalesce(transactions: List[Transaction]) -> List[Tuple[Transaction, bool]]:
+    """
+    Merge byte reads of subsequent registers of the same device to block reads
+    :param transactions: Transactions
+    :return: Bus transactions and flags of block reads which replace byte reads
+             (one per each byte read)
+    """
+    merged: List[Tuple[Transaction, bool]] = []
+    for transaction in transactions:
+        if merged and transaction[0] == "read_byte":
+            (op, address, register, *args), coalesced = merged[-1]
+            length = args[0] if coalesced else 1
+            if (op == "read_byte" or coalesced) and address == transaction[1] and \
+                register + length == transaction[2] and length < 32:
+                merged[-1] = (("read_block", address, register, length + 1), True)
+                continue
+
+        merged.append((transaction, False))
+
+    return merged
+
+
+def execute(smbus, transactions: List[Transaction]) -> List[Any]:
+    """
+    Execute transactions (without arbiter)
+    :param smbus: Bus
+    :param transactions: Transactions
+    :return: Results
+    """
+    results: List[Any] = []
+    for op, address, register, *args in transactions:
+        if op == "read_byte":
+            results.append(smbus.read_byte_data(address, register))
+        elif op == "write_byte":
+            results.append(smbus.write_byte_data(address, register, *args))
+        elif op == "read_block":
+            results.append(smbus.read_i2c_block_data(address, register, *args))
+        elif op == "write_block":
+            results.append(smbus.write_i2c_block_data(address, register, *args))
+        else:
+            raise ValueError(f"Unknown I2C transaction: {op}")
+
+    return results
+
+
+def transact(smbus, transactions: List[Transaction], priority: int = None) -> List[Any]:
+    """
+    Execute batch of transactions
+    The batch is sent to the bus arbiter at once (if the bus is arbitrated),
+    otherwise the transactions are done one by one.
+    :param smbus: Bus (or arbiter client)
+    :param transactions: Transactions
+    :param priority: Request priority (client default if None)
+    :return: Results
+    """
+    if isinstance(smbus, Client):
+        return smbus.transact(transactions, priority)
+
+    return execute(smbus, transactions)
+
+
+class Client:
+    """
+    Bus arbiter client
+    Provides (the used subset of) the smbus.SMBus interface; reads are
+    requested with the client priority, writes (configuration) with the write
+    priority.
+    If the arbiter doesn't reply in time (e.g. it has died), the request fails
+    (OSError).
+    Requests are tagged (by the client process ID and a sequence number),
+    so that late replies (to timed out requests or to requests of a crashed
+    worker, if the client is inherited by its respawned successor) are dropped.
+    """
+
+    def __init__(self, arbiter: "Arbiter", conn: Connection, priority: int,
+        write_priority: int, timeout: float = 5.0):
+        """
+        :param arbiter: Bus arbiter
+        :param conn: Connection to the arbiter
+        :param priority: Default request priority
+        :param write_priority: Write requests priority
+        :param timeout: Reply timeout [s]
+        """
+        self.bus = arbiter.number
+        self.priority = priority
+        self.write_priority = write_priority
+        self.timeout = timeout
+        self._conn = conn
+        self._lock = Lock()
+
+    def transact(self, transactions: List[Transaction], priority: int = None) -> List[Any]:
+        """
+        Execute batch of transactions (as a whole)
+        :param transactions: Transactions
+        :param priority: Request priority (the client default if None)
+        :return: Results
+        """
+        tag = (os.getpid(), sequence())
+        with self._lock:
+            self._conn.send((tag, self.priority if priority is None else priority, transactions))
+            deadline = monotonic() + self.timeout
+            try:
+                ok, results = receive(self._conn, tag, lambda: monotonic() > deadline)
+            except ConnectionAbortedError:
+                raise OSError(f"I2C bus {self.bus} arbiter doesn't reply")
+
+        if not ok:
+            raise OSError(*results)
+
+        return results
+
+    def read_byte_data(self, address: int, register: int) -> int:
+        return self.transact([("read_byte", address, register)])[0]
+
+    def write_byte_data(self, address: int, register: int, value: int) -> None:
+        self.transact([("write_byte", address, register, value)], self.write_priority)
+
+    def read_i2c_block_data(self, address: int, register: int, length: int = 32) -> List[int]:
+        return self.transact([("read_block", address, register, length)])[0]
+
+    def write_i2c_block_data(self, address: int, register: int, data: List[int]) -> None:
+        self.transact([("write_block", address, register, data)], self.write_priority)
+
+    def close(self) -> None:
+        pass
+
+
+class Arbiter:
+    """
+    I2C bus arbiter process
+    """
+
+    # Shared statistics fields
+    _fields = ("requests", "transactions", "bus_transactions", "coalesced", "errors",
+        "busy", "wait_sum", "wait_max", "pending_max", "utilisation_recent")
+
+    def __init__(self, number: int, backend: str = "smbus", window: float = 1.0, **kwargs):
+        """
+        :param number: Bus number
+        :param backend: Bus backend ("smbus" or "simulator")
+        :param window: Recent utilisation window [s]
+        :param kwargs: Bus backend parameters
+        """
+        self.number = number
+        self._backend = backend
+        self._kwargs = kwargs
+        self._window = window
+        self._conns: List[Connection] = []  # arbiter ends of client connections
+        self._stats = RawArray('d', len(Arbiter._fields))
+        self._started: float = None
+        self._ctrl_re, self._ctrl_we = Pipe(duplex=False)
+        self._process: Process = None
+
+    def _set(self, field: str, value: float) -> None:
+        self._stats[Arbiter._fields.index(field)] = value
+
+    def _get(self, field: str) -> float:
+        return self._stats[Arbiter._fields.index(field)]
+
+    def _add(self, field: str, value: float) -> None:
+        i = Arbiter._fields.index(field)
+        self._stats[i] += value
+
+    def client(self, priority: int = 0, write_priority: int = 0,
+        timeout: float = 5.0) -> Client:
+        """
+        Create client
+        Must be called before the arbiter starts.
+        :param priority: Default request priority (higher is more urgent)
+        :param write_priority: Write requests priority
+        :param timeout: Reply timeout [s]
+        :return: Client
+        """
+        assert self._process is None, "Arbiter already started"
+        arbiter_end, client_end = Pipe()
+        self._conns.append(arbiter_end)
+
+        return Client(self, client_end, priority, write_priority, timeout)
+
+    def start(self) -> "Arbiter":
+        """
+        Start arbiter process
+        :return: self
+        """
+        if self._process is not None:
+            return self  # already started (shared by controllers)
+
+        self._started = monotonic()
+        self._process = Process(name=f"Arbiter(i2c-{self.number})", target=self._routine)
+        self._process.start()
+        log.info(f"I2C bus {self.number} arbiter started ({len(self._conns)} clients)")
+
+        return self
+
+    @property
+    def pid(self) -> int:
+        """
+        :return: Arbiter process ID (None if not started)
+        """
+        return None if self._process is None else self._process.pid
+
+    def _execute(self, smbus, transactions: List[Transaction]) -> Tuple[bool, Any]:
+        """
+        Execute request
+        :param smbus: Bus
+        :param transactions: Transactions
+        :return: Success flag and results (or error arguments)
+        """
+        merged = coalesce(transactions)
+        results: List[Any] = []
+        try:
+            for (_, coalesced), result in zip(merged, execute(smbus, [t for t, _ in merged])):
+                if coalesced:
+                    results.extend(result)  # byte reads results
+                else:
+                    results.append(result)
+
+        except OSError as x:
+            self._add("errors", 1)
+            return False, x.args
+
+        except Exception as x:  # e.g. malformed transaction, the arbiter must survive
+            self._add("errors", 1)
+            return False, (str(x),)
+
+        self._add("transactions", len(transactions))
+        self._add("bus_transactions", len(merged))
+        self._add("coalesced", len(transactions) - len(merged))
+        return True, results
+
+    def _routine(self) -> None:
+        smbus = bus(self._backend, self.number, **self._kwargs)
+        pending: List[Tuple[int, int, float, Connection, Tuple, List[Transaction]]] = []
+        seq = 0
+        window_start = monotonic()
+        window_busy = 0.0
+
+        conns = self._conns + [self._ctrl_re]
+        while True:
+            # Collect all the arrived requests (don't wait if there are pending ones)
+            for ready in wait(conns, timeout=0.0 if pending else self._window):
+                conn = cast(Connection, ready)
+                if conn is self._ctrl_re:
+                    return  # shutdown
+
+                try:
+                    tag, priority, transactions = conn.recv()
+                except EOFError:
+                    conns.remove(conn)  # client has gone
+                    continue
+
+                heapq.heappush(pending, (-priority, seq, monotonic(), conn, tag, transactions))
+                seq += 1
+
+            self._set("pending_max", max(self._get("pending_max"), len(pending)))
+
+            if pending:
+                _, _, arrived, conn, tag, transactions = heapq.heappop(pending)
+                started = monotonic()
+                result = self._execute(smbus, transactions)
+                done = monotonic()
+                conn.send((tag, result))
+
+                waited = started - arrived
+                self._add("requests", 1)
+                self._add("busy", done - started)
+                self._add("wait_sum", waited)
+                self._set("wait_max", max(self._get("wait_max"), waited))
+                window_busy += done - started
+
+            now = monotonic()
+            if now - window_start >= self._window:
+                self._set("utilisation_recent", window_busy / (now - window_start))
+                window_start, window_busy = now, 0.0
+
+    def stop(self) -> None:
+        """
+        Stop arbiter process
+        """
+        if self._process is not None:
+            self._ctrl_we.send(None)
+            self._process.join()
+            self._process = None
+            log.info(f"I2C bus {self.number} arbiter stopped: {self.stats()}")
+
+    def stats(self) -> Dict:
+        """
+        :return: Bus statistics: requests (batches) and transactions done,
+                 bus transactions (after coalescing), coalesced transactions,
+                 errors, bus utilisation (overall and recent), request waiting
+                 time [s] (mean and max.) and max. number of pending requests
+        """
+        requests = int(self._get("requests"))
+        elapsed = monotonic() - self._started if self._started is not None else None
+        return {
+            "bus" : self.number,
+            "clients" : len(self._conns),
+            "requests" : requests,
+            "transactions" : int(self._get("transactions")),
+            "bus_transactions" : int(self._get("bus_transactions")),
+            "coalesced" : int(self._get("coalesced")),
+            "errors" : int(self._get("errors")),
+            "utilisation" : self._get("busy") / elapsed if elapsed else None,
+            "utilisation_recent" : self._get("utilisation_recent"),
+            "wait" : {
+                "mean" : self._get("wait_sum") / requests if requests else None,
+                "max" : self._get("wait_max") if requests else None,
+            },
+            "pending_max" : int(self._get("pending_max")),
+        }
+
+
+_arbiters: Dict[int, Arbiter] = {}
+
+
+def arbiter(number: int, backend: str = "smbus", **kwargs) -> Arbiter:
+    """
+    Get bus arbiter (create it if it doesn't exist yet)
+    :param number: Bus number
+    :param backend: Bus backend ("smbus" or "simulator")
+    :param kwargs: Bus backend parameters
+    :return: Arbiter
+    """
+    if number not in _arbiters:
+        _arbiters[number] = Arbiter(number, backend, **kwargs)
+
+    return _arbiters[number]
+
+
+def arbiters() -> List[Arbiter]:
+    """
+    :return: Bus arbiters
+    """
+    return list(_arbiters.values())
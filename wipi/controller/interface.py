@@ -1,14 +1,38 @@
-from typing import Dict, Iterator
+from typing import Dict, Iterator, AsyncGenerator, List, Tuple, TYPE_CHECKING
 from abc import ABC, abstractmethod
+from threading import Event
 
 from wipi.util import cc2sc
 
+# The numpy based modules are imported by the controllers which acquire
+# data, so that the others (and their workers) don't load numpy
+if TYPE_CHECKING:
+    import numpy as np
+
+    from .acquisition import Acquisition, Sink
+    from .history import History
+    from .recorder import Recorder
+    from .rules import Rules
+
 
 class Controller(ABC):
     """
     Raspberry Pi used as controller of <specified by implementation>
+
+    Implementations declare their concurrency model, which limits
+    the controller worker pool (see SharedController):
+    * SERIAL: actions are executed one by one (single worker),
+    * THREAD_SAFE: actions may be executed concurrently by threads,
+    * STATELESS: besides, instances in separate processes are equivalent
+      (the instance holds no state other than that of the device).
     """
 
+    SERIAL = "serial"
+    THREAD_SAFE = "thread_safe"
+    STATELESS = "stateless"
+
+    concurrency = SERIAL
+
     def __init__(self, name: str, bclass: str = None):
         """
         :param name: Controller name
@@ -17,6 +41,62 @@ class Controller(ABC):
         self.name = name
         self.baseclass = cc2sc(self.__class__.__name__) if bclass is None else bclass
 
+        # Continuous acquisition (see enable_acquisition)
+        self.acquisition_query: Dict = None
+        self.acquisition: "Acquisition" = None
+        self.sinks: List["Sink"] = []
+        self.history: "History" = None
+        self.recorder: "Recorder" = None
+        self.rules: "Rules" = None
+
+        # Worker pool configuration, shared worker name and worker real-time
+        # settings (see SharedController and wipi.realtime)
+        self.pool: Dict = None
+        self.worker: str = None
+        self.realtime: Dict = None
+
+    def setup(self) -> None:
+        """
+        Called in the controller worker process first (before postfork).
+        Implementations shall initialise the device (and import its driver)
+        here rather than in the constructor, so that the API starts right away
+        and devices are initialised in parallel (each in its worker).
+        The controller isn't available till the setup is done.
+        Note that the default implementation does nothing.
+        """
+
+    def postfork(self) -> None:
+        """
+        Called in the controller worker process before it starts
+        processing tasks.
+        Starts continuous acquisition (if enabled).
+        """
+        if self.acquisition_query is not None:
+            from .acquisition import Acquisition
+            self.acquisition = Acquisition(self, self.acquisition_query, self.sinks).start()
+
+        if self.sinks:
+            self.state_changed(self.get_state())  # initial state
+
+    def shutdown(self) -> None:
+        """
+        Called in the controller worker process when it terminates.
+        """
+        if self.acquisition is not None:
+            self.acquisition.stop()  # closes sinks
+        else:
+            for sink in self.sinks:
+                sink.close()
+
+    def state_changed(self, state: Dict) -> None:
+        """
+        Pass current state to sinks
+        Called in the controller worker process after state is set.
+        :param state: Current state
+        """
+        for sink in self.sinks:
+            sink.state(state)
+
     @abstractmethod
     def get_state(self, *args, **kwargs) -> Dict:
         """
@@ -37,8 +117,8 @@ class Controller(ABC):
         Downstream data from the controller
         Generated data chunks shall be streamed to the API user as (incrementally
         appended) list of dicts (using chunked encoding on the HTTP level).
-        Use incremental JSON parser (e.g. jsonslicer) as client to decode
-        the response in online manner.
+        Use incremental JSON parser (e.g. wipi.client.StreamDecoder) as client
+        to decode the response in online manner.
 
         Note that the default implementation provides en empty iterator.
         This way, Controller implementations which don't have anything to stream,
@@ -47,3 +127,150 @@ class Controller(ABC):
         :return: Generator of data chunks
         """
         return iter(())
+
+    def ordering_key(self, state: Dict) -> str:
+        """
+        State changes ordering key
+        State changes of the same key are executed in order of arrival (by
+        the same pool worker), those of different keys may be executed
+        concurrently.
+        Note that the default implementation gives the same key to all
+        the state changes (i.e. they're all ordered).
+        :param state: State changes
+        :return: Ordering key
+        """
+        return ""
+
+    def channels(self, query: Dict) -> List[str]:
+        """
+        Numeric sample channels produced by blocks
+        Note that the default implementation provides no channels
+        (i.e. the controller doesn't produce sample blocks).
+        :param query: Sampling query
+        :return: Channel names (e.g. "accel_data.x")
+        """
+        return []
+
+    def blocks(self, query: Dict, stop: Event) -> Iterator[Tuple[float, "np.ndarray", "np.ndarray"]]:
+        """
+        Sample blocks
+        Controllers producing numeric samples may implement this in order
+        to support continuous acquisition.
+        :param query: Sampling query
+        :param stop: Stop sampling when set
+        :return: Generator of sampling ticks and blocks of sample times
+                 (monotonic clock) and values (samples in rows, channels
+                 in columns)
+        """
+        return iter(())
+
+    def enable_acquisition(self, query: Dict, sinks: List["Sink"]) -> None:
+        """
+        Enable continuous acquisition
+        Must be called before the worker starts.
+        :param query: Acquisition (sampling) query or None (sinks only
+                      receive state changes)
+        :param sinks: Acquired samples (and state changes) consumers
+        """
+        self.acquisition_query = query
+        self.sinks.extend(sinks)
+
+    def get_history(self, query: Dict, *args, **kwargs) -> Dict:
+        """
+        Recent samples from the history buffer
+        :param query: History query (see History.query)
+        :return: Data chunk (lists of timestamps and values) or None if
+                 the history isn't enabled
+        """
+        if self.history is None:
+            return None
+
+        from .block import block_chunk
+        times, values, channels = self.history.query(query)
+        return block_chunk(times, values, channels)
+
+    def get_rules(self, *args, **kwargs) -> List[Dict]:
+        """
+        Rules evaluated on the controller samples
+        :return: Rules statistics or None if there are no rules
+        """
+        return None if self.rules is None else self.rules.stats()
+
+    def get_recording(self, query: Dict, *args, **kwargs) -> Iterator[Dict]:
+        """
+        Recorded samples
+        :param query: Recording query (see Recorder.query)
+        :return: Generator of data chunks (lists of timestamps and values)
+                 or None if the recorder isn't enabled
+        """
+        if self.recorder is None:
+            return None
+
+        from .block import block_chunk
+        channels, blocks = self.recorder.query(query)
+        return (block_chunk(times, values, channels) for times, values in blocks)
+
+
+class AsyncController(Controller):
+    """
+    Asynchronous controller (interface)
+
+    The state getter and setter are coroutines and the downstream is
+    an asynchronous generator.
+    They're executed on an asyncio event loop in the controller worker,
+    so that many requests and streams may be in flight concurrently (while
+    one of them awaits I/O, e.g. a sensor conversion or a network device,
+    the others proceed).
+    Note that the coroutines mustn't block (use run_in_executor for blocking
+    calls).
+    """
+
+    def postfork(self) -> None:
+        """
+        Called in the controller worker process before its event loop starts.
+        Starts continuous acquisition (if enabled).
+        """
+        if self.acquisition_query is not None:
+            from .acquisition import Acquisition
+            self.acquisition = Acquisition(self, self.acquisition_query, self.sinks).start()
+
+    async def started(self) -> None:
+        """
+        Called on the event loop before it starts processing tasks.
+        Passes initial state to sinks (if any); implementations may open their
+        asynchronous resources (connections...) here.
+        """
+        if self.sinks:
+            self.state_changed(await self.get_state())  # initial state
+
+    async def stopping(self) -> None:
+        """
+        Called on the event loop when the worker terminates (after all
+        the in-flight tasks are cancelled, before shutdown is called).
+        """
+
+    @abstractmethod
+    async def get_state(self, *args, **kwargs) -> Dict:  # type: ignore[override]
+        """
+        Controlled device state getter
+        :return: Current controlled device state
+        """
+
+    @abstractmethod
+    async def set_state(self, state: Dict, *args, **kwargs) -> Dict:  # type: ignore[override]
+        """
+        Controlled device state setter
+        :param state: State changes
+        :return: Current controlled device state
+        """
+
+    async def downstream(  # type: ignore[override]
+        self, query: Dict, *args, **kwargs) -> AsyncGenerator[Dict, None]:
+        """
+        Downstream data from the controller
+        The default implementation provides an empty stream.
+        :param query: Query
+        :return: Asynchronous generator of data chunks
+        """
+        return
+        yield  # noqa (makes the function an asynchronous generator)
@@ -1,37 +1,275 @@
-from typing import Dict, Iterator
-from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Tuple, Callable
+from time import monotonic
+from threading import Lock, Event
 
-import pause
-from mpu6050 import mpu6050 as MPU6050
+import numpy as np
 
 from wipi.controller import Controller
+from wipi.log import get_logger
+
+from .sampler import Sampler, timestamp
+from .block import block_chunk, sample_chunks
+from .aggregate import pipeline
+from . import i2c
+
+
+log = get_logger(__name__)
+
+
+def driver(backend: str, address: int, **kwargs):
+    """
+    MPU6050 driver
+    :param backend: Backend name ("smbus" or "simulator")
+    :param address: MPU6050 module SMB address
+    :param kwargs: Backend parameters
+    :return: Driver instance (mpu6050.mpu6050 or compatible object)
+    """
+    if backend == "smbus":
+        from mpu6050 import mpu6050 as MPU6050
+        return MPU6050(address, **kwargs)
+
+    if backend == "simulator":
+        from .simulator import MPU6050
+        return MPU6050(address, **kwargs)
+
+    raise ValueError(f"Unknown MPU6050 backend: {backend}")
+
+
+class Fifo:
+    """
+    MPU6050 FIFO burst reader
+
+    Sets the sensor sample rate (using the sample rate divider) and enables
+    the on-chip FIFO, which is then drained by SMBus block reads.
+    Samples are decoded and scaled in batches (vectorised).
+
+    Note that FIFO frame is 12 B (accelerometer and gyroscope data), i.e.
+    1 kHz sample rate requires ~110 kbit/s bus throughput (incl. overhead);
+    set the I2C bus clock to 400 kHz for high sample rates.
+
+    Samples are timed by the (nominal) sensor sample clock.
+    On FIFO overflow, the FIFO content is lost; the gap is recorded (see gaps).
+    """
+
+    SMPLRT_DIV = 0x19
+    CONFIG = 0x1A
+    FIFO_EN = 0x23
+    USER_CTRL = 0x6A
+    FIFO_COUNTH = 0x72
+    FIFO_R_W = 0x74
+
+    SIZE = 1024  # FIFO size [B]
+    BLOCK = 32   # SMBus block read length limit [B]
+
+    _accel_scale = {0x00 : 16384.0, 0x08 : 8192.0, 0x10 : 4096.0, 0x18 : 2048.0}
+    _gyro_scale = {0x00 : 131.0, 0x08 : 65.5, 0x10 : 32.8, 0x18 : 16.4}
+
+    def __init__(self, dev, rate: float = 1000.0,
+        accel_data: bool = True, gyro_data: bool = True, accel_unit_g: bool = False):
+        """
+        :param dev: MPU6050 driver
+        :param rate: Sample rate [Hz] (4 Hz--1 kHz, rounded to available rates)
+        :param accel_data: Sample accelerometer data
+        :param gyro_data: Sample gyroscope data
+        :param accel_unit_g: Accelerometer data in g (m/s^2 otherwise)
+        """
+        assert accel_data or gyro_data, "No data sampled"
+
+        self._bus = dev.bus
+        self._address = dev.address
+
+        div = min(255, max(0, round(1000.0 / rate) - 1))
+        self.rate = 1000.0 / (1 + div)
+        self.period = 1.0 / self.rate
+
+        fifo_en = 0
+        channels: List[str] = []
+        scale: List[float] = []
+
+        if accel_data:
+            fifo_en |= 0x08
+            channels += ["accel_data.x", "accel_data.y", "accel_data.z"]
+            accel_scale = Fifo._accel_scale[dev.read_accel_range(True) & 0x18]
+            scale += [1.0 / accel_scale if accel_unit_g else dev.GRAVITIY_MS2 / accel_scale] * 3
+
+        if gyro_data:
+            fifo_en |= 0x70
+            channels += ["gyro_data.x", "gyro_data.y", "gyro_data.z"]
+            scale += [1.0 / Fifo._gyro_scale[dev.read_gyro_range(True) & 0x18]] * 3
+
+        self.channels = channels
+        self._scale = np.array(scale)
+        self._frame = 2 * len(channels)
+
+        self.samples = 0
+        self.overflows = 0
+        self.transactions = 0
+        self.gaps: List[Tuple[float, float]] = []  # lost intervals (not yet reported)
+
+        self._restore = [
+            (reg, self._bus.read_byte_data(self._address, reg))
+            for reg in (Fifo.CONFIG, Fifo.SMPLRT_DIV)
+        ]
+
+        self._write(Fifo.CONFIG, 0x01)  # DLPF 184/188 Hz => 1 kHz base rate
+        self._write(Fifo.SMPLRT_DIV, div)
+        self._write(Fifo.FIFO_EN, fifo_en)
+        self._reset()
+
+    def _write(self, register: int, value: int) -> None:
+        self._bus.write_byte_data(self._address, register, value)
+        self.transactions += 1
+
+    def _reset(self) -> None:
+        """
+        Reset and enable FIFO, start sample clock
+        """
+        self._write(Fifo.USER_CTRL, 0x04)  # FIFO reset
+        self._write(Fifo.USER_CTRL, 0x40)  # FIFO enable
+        self._t0 = monotonic()
+        self._index = 0
+
+    def read(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Drain FIFO
+        :return: Sample times (monotonic clock) and values (samples in rows,
+                 channels in columns); empty on FIFO overflow (the lost
+                 interval is appended to gaps)
+        """
+        high, low = self._bus.read_i2c_block_data(self._address, Fifo.FIFO_COUNTH, 2)
+        self.transactions += 1
+
+        count = (high << 8) | low
+        if count >= Fifo.SIZE:
+            self.overflows += 1
+            lost_from = self._t0 + self._index * self.period  # last sample read
+            self._reset()  # data are lost and frames misaligned
+            self.gaps.append((lost_from, self._t0))
+            return np.empty(0), np.empty((0, len(self.channels)))
+
+        length = count - count % self._frame
+        blocks = i2c.transact(self._bus, [
+            ("read_block", self._address, Fifo.FIFO_R_W, min(Fifo.BLOCK, length - offset))
+            for offset in range(0, length, Fifo.BLOCK)
+        ])  # one request if the bus is arbitrated
+        self.transactions += len(blocks)
+
+        data = bytearray()
+        for block in blocks:
+            data += bytes(block)
+
+        values = np.frombuffer(bytes(data), dtype=">i2").reshape(-1, len(self.channels))
+        n = values.shape[0]
+        times = self._t0 + (self._index + 1 + np.arange(n)) * self.period
+
+        self._index += n
+        self.samples += n
+
+        return times, values * self._scale
+
+    def stats(self) -> Dict:
+        """
+        :return: Sample rate, number of samples, FIFO overflows and bus transactions
+        """
+        return {
+            "rate" : self.rate,
+            "samples" : self.samples,
+            "overflows" : self.overflows,
+            "transactions" : self.transactions,
+        }
+
+    def close(self) -> None:
+        """
+        Disable FIFO, restore sample rate settings
+        """
+        self._write(Fifo.USER_CTRL, 0x00)
+        self._write(Fifo.FIFO_EN, 0x00)
+        for reg, value in self._restore:
+            self._write(reg, value)
 
 
 class mpu6050(Controller):
     """
     MPU6050 accelerometer & gyroscope
+
+    Supports continuous acquisition (see Controller.enable_acquisition);
+    the acquisition query is the same as the downstream one (e.g.
+    {"fifo": true, "rate": 200}).
+    While the acquisition runs, downstreams get the acquired samples.
+    The device access is locked, so that the controller may be served by
+    a thread pool.
+    There's only one FIFO, though: while a FIFO stream runs, another one
+    gets an error chunk.
     """
 
-    def __init__(self, name: str, address: int = 0x68, accel_range: float = MPU6050.ACCEL_RANGE_2G, gyro_range: float = MPU6050.GYRO_RANGE_250DEG):
+    concurrency = Controller.THREAD_SAFE
+
+    GYRO_CONFIG = 0x1B
+    ACCEL_CONFIG = 0x1C
+    ACCEL_XOUT0 = 0x3B
+
+    def __init__(self, name: str, address: int = 0x68,
+        accel_range: int = 0x00, gyro_range: int = 0x00,
+        backend: str = "smbus", simulator: Dict = {}, arbiter: Dict = None,
+        bus: int = 1):
         """
         :param name: Controller name
         :param address: MPU6050 module SMB address
         :param accel_range: Accelerometer measurement range/precision
+                            (register value, default is 2G)
+        :param gyro_range: Gyroscope measurement range/precision
+                           (register value, default is 250 deg/s)
+        :param backend: Driver backend ("smbus" or "simulator")
+        :param simulator: Simulated device parameters (see simulator.MPU6050)
+        :param arbiter: Use the shared bus arbiter (see i2c.Arbiter.client
+                        for parameters, e.g. {"priority": 10})
+        :param bus: I2C bus number (the simulated bus number is set
+                    by the simulator parameters, if there)
         """
         super().__init__(name)
-        self._dev = MPU6050(address)
-        self._dev.set_accel_range(accel_range)
-        self._dev.set_gyro_range(gyro_range)
+        self._backend = backend
+        self._address = address
+        self._bus_number = simulator.get("bus", bus) if backend == "simulator" else bus
+        self._ranges = accel_range, gyro_range
+
+        # Simulated device is attached to the simulated bus before the workers
+        # fork (as the arbiter is); the real one is created by setup
+        self._dev = driver(backend, address, **simulator) if backend == "simulator" else None
+
+        self._bus_client: i2c.Client = None
+        if arbiter is not None:  # client must be created before the arbiter starts
+            bus_kwargs = dict(
+                (k, v) for k, v in simulator.items()
+                if k in ("clock", "overhead")) if backend == "simulator" else {}
+            self._bus_client = i2c.arbiter(
+                self._bus_number, backend, **bus_kwargs).client(**arbiter)
+
+        self._lock = Lock()  # device access (acquisition runs in a thread)
+        self._fifo_lock = Lock()  # FIFO in use
+
+    def setup(self) -> None:
+        """
+        Create the driver (if not simulated), set measurement ranges
+        """
+        if self._dev is None:
+            self._dev = driver(self._backend, self._address, bus=self._bus_number)
+
+        if self._bus_client is not None:  # bus is owned by the arbiter from now on
+            self._dev.bus = self._bus_client
+
+        self._dev.set_accel_range(self._ranges[0])
+        self._dev.set_gyro_range(self._ranges[1])
 
     def get_state(self) -> Dict:
         """
         :return: Current state
         """
-        return {
-            "address" : self._dev.address,
-            "accel_range" : self._dev.read_accel_range(),
-            "gyro_range" : self._dev.read_gyro_range(),
-        }
+        with self._lock:
+            return {
+                "address" : self._dev.address,
+                "accel_range" : self._dev.read_accel_range(),
+                "gyro_range" : self._dev.read_gyro_range(),
+            }
 
     def set_state(self, state: Dict) -> Dict:
         """
@@ -39,50 +277,244 @@ class mpu6050(Controller):
         :return: Current state
         """
         accel_range = {
-            2  : MPU6050.ACCEL_RANGE_2G,
-            4  : MPU6050.ACCEL_RANGE_4G,
-            8  : MPU6050.ACCEL_RANGE_8G,
-            16 : MPU6050.ACCEL_RANGE_16G,
+            2  : self._dev.ACCEL_RANGE_2G,
+            4  : self._dev.ACCEL_RANGE_4G,
+            8  : self._dev.ACCEL_RANGE_8G,
+            16 : self._dev.ACCEL_RANGE_16G,
         }.get(state.get("accel_range", -1))
-        if accel_range:
-            self._dev.set_accel_range(accel_range)
 
         gyro_range = {
-            250  : MPU6050.GYRO_RANGE_250DEG,
-            500  : MPU6050.GYRO_RANGE_500DEG,
-            1000 : MPU6050.GYRO_RANGE_1000DEG,
-            2000 : MPU6050.GYRO_RANGE_2000DEG,
+            250  : self._dev.GYRO_RANGE_250DEG,
+            500  : self._dev.GYRO_RANGE_500DEG,
+            1000 : self._dev.GYRO_RANGE_1000DEG,
+            2000 : self._dev.GYRO_RANGE_2000DEG,
         }.get(state.get("gyro_range", -1))
-        if gyro_range:
-            self._dev.set_gyro_range(accel_range)
+
+        with self._lock:
+            if accel_range is not None:
+                self._dev.set_accel_range(accel_range)
+            if gyro_range is not None:
+                self._dev.set_gyro_range(gyro_range)
+
+        # Acquired data scaling has changed
+        if self.acquisition is not None and (accel_range, gyro_range) != (None, None):
+            self.acquisition.restart()
 
         return self.get_state()
 
+    def channels(self, query: Dict) -> List[str]:
+        """
+        :param query: Sampling query
+        :return: Sampled channels
+        """
+        return \
+            (["accel_data.x", "accel_data.y", "accel_data.z"]
+                if query.get("accel_data", True) else []) + \
+            (["gyro_data.x", "gyro_data.y", "gyro_data.z"]
+                if query.get("gyro_data", True) else [])
+
+    def _poll_blocks(self, sampler: Sampler, query: Dict, stop: Event) -> Iterator[Tuple[float, np.ndarray, np.ndarray]]:
+        """
+        Sample data registers
+        :param sampler: Sampling clock
+        :param query: Query
+        :param stop: Stop sampling when set
+        :return: Generator of sampling ticks and sample blocks (single samples)
+        """
+        columns = \
+            ([0, 1, 2] if query.get("accel_data", True) else []) + \
+            ([4, 5, 6] if query.get("gyro_data", True) else [])
+        gravity = 1.0 if query.get("accel_unit_g", False) else self._dev.GRAVITIY_MS2
+        address = self._dev.address
+
+        # Ranges and all the data registers (accel., temperature, gyro.) are read
+        # by 2 block reads (1 request if the bus is arbitrated)
+        transactions = [
+            ("read_byte", address, mpu6050.GYRO_CONFIG),
+            ("read_byte", address, mpu6050.ACCEL_CONFIG),
+            ("read_block", address, mpu6050.ACCEL_XOUT0, 14),
+        ]
+
+        for tick in sampler:
+            if stop.is_set():
+                break
+
+            with self._lock:
+                gyro_range, accel_range, data = i2c.transact(self._dev.bus, transactions)
+
+            raw = np.frombuffer(bytes(data), dtype=">i2")
+            scale = np.array(
+                [gravity / Fifo._accel_scale[accel_range & 0x18]] * 4 +
+                [1.0 / Fifo._gyro_scale[gyro_range & 0x18]] * 3)
+            yield tick, np.array([tick]), (raw * scale)[columns].reshape(1, -1)
+
+    def _fifo_blocks(self, sampler: Sampler, fifo: Fifo, stop: Event) -> Iterator[Tuple[float, np.ndarray, np.ndarray]]:
+        """
+        Drain FIFO
+        :param sampler: FIFO draining clock
+        :param fifo: FIFO reader
+        :param stop: Stop sampling when set
+        :return: Generator of sampling ticks and sample blocks (sample batches)
+        """
+        try:
+            for tick in sampler:
+                if stop.is_set():
+                    break
+
+                with self._lock:
+                    times, values = fifo.read()
+                yield tick, times, values
+
+        finally:
+            with self._lock:
+                fifo.close()
+            self._fifo_lock.release()
+
+    def _sampling(self, query: Dict, stop: Event) -> Tuple[Iterator, Callable, Callable, Callable]:
+        """
+        Set up sampling
+        :param query: Sampling query
+        :param stop: Stop sampling when set
+        :return: Generator of sampling ticks and sample blocks,
+                 sample blocks to data chunks formatter,
+                 sampling statistics getter and sampling gaps getter
+                 (marker chunks of the gaps since the last call)
+        :raise RuntimeError: if FIFO sampling is requested and the FIFO
+                             is in use
+        """
+        duration = query.get("duration", 0.0) or None
+
+        if query.get("fifo", False):
+            if not self._fifo_lock.acquire(blocking=False):  # released by _fifo_blocks
+                raise RuntimeError(f"{self.name}: FIFO is in use by another stream")
+
+            try:
+                with self._lock:
+                    fifo = Fifo(self._dev,
+                        rate=query.get("rate", 1000.0),
+                        accel_data=query.get("accel_data", True),
+                        gyro_data=query.get("gyro_data", True),
+                        accel_unit_g=query.get("accel_unit_g", False))
+                sampler = Sampler(interval=query.get("batch", 0.05), duration=duration)
+
+            except Exception:
+                self._fifo_lock.release()
+                raise
+
+            def gaps() -> List[Dict]:
+                markers = [
+                    {"overflow" : {"from" : timestamp(start), "to" : timestamp(end)}}
+                    for start, end in fifo.gaps]
+                fifo.gaps.clear()
+                return markers
+
+            return \
+                self._fifo_blocks(sampler, fifo, stop), \
+                lambda times, values, channels: [block_chunk(times, values, channels)], \
+                lambda: dict(sampler.stats(), fifo=fifo.stats()), \
+                gaps
+
+        sampler = Sampler(
+            interval=query.get("interval", 0.0),
+            duration=duration,
+            policy=query.get("policy", Sampler.SKIP))
+
+        return self._poll_blocks(sampler, query, stop), sample_chunks, sampler.stats, list
+
+    def blocks(self, query: Dict, stop: Event) -> Iterator[Tuple[float, np.ndarray, np.ndarray]]:
+        """
+        Sample blocks (for continuous acquisition)
+        :param query: Sampling query (as for downstream)
+        :param stop: Stop sampling when set
+        :return: Generator of sampling ticks and sample blocks
+        """
+        blocks, _, stats, _ = self._sampling(query, stop)
+        yield from blocks
+        log.info(f"{self.name}: Sampling finished: {stats()}")
+
     def downstream(self, query: Dict) -> Iterator[Dict]:
         """
         Downstream data from the accelerometer and gyroscope
+
+        By default, data registers are sampled in the query "interval".
+        Samples are timestamped by (numeric, high resolution) epoch time.
+
+        If the query sets "fifo", the sensor samples data at "rate" [Hz]
+        to its FIFO, which is drained each "batch" [s] (default: 0.05).
+        Each chunk then contains a batch of samples (lists of timestamps
+        and values).
+        Only one FIFO stream may run at a time (another one only gets
+        an error chunk).
+        If the FIFO overflows, its content is lost; the stream then contains
+        a marker chunk of the lost interval (before the following samples):
+
+            {"overflow": {"from": <last sample timestamp>, "to": <timestamp>}}
+
+        The same applies if continuous acquisition is running, the stream
+        then consists of the acquired samples (the sampling settings in
+        the query don't apply).
+
+        If the query sets "aggregate", the samples are projected, decimated
+        and/or aggregated in windows (see wipi.controller.aggregate).
+
+        If the query sets "stats", the stream is concluded by the sampling
+        statistics chunk (see Sampler.stats); if it's a number, the statistics
+        are also sent periodically (in that interval [s]).
+
         :param query: Query
         :return: Generator of data chunks
         """
-        interval = timedelta(seconds=query.get("interval", 0.0))
-        duration = timedelta(seconds=query.get("duration", 0.0))
+        channels = self.channels(query)
+        aggregate = query.get("aggregate", {})
+        acquisition = self.acquisition
 
-        accel_data = query.get("accel_data", True)
-        gyro_data = query.get("gyro_data", True)
-        accel_unit_g = query.get("accel_unit_g", False)
+        # Sampled channels are given by the acquisition
+        if acquisition is not None:
+            if isinstance(aggregate, dict) and "axes" not in aggregate:
+                aggregate = dict(aggregate, axes=[
+                    c for c in acquisition.channels if c in channels])
+            channels = acquisition.channels
 
-        stop_at = datetime.now() + duration if duration else None
-        while True:
-            now = datetime.now()
-            if stop_at and now >= stop_at:
-                break
+        try:
+            decimator, aggregator = pipeline(aggregate, channels)
+        except (TypeError, ValueError) as x:
+            yield {"error" : str(x)}
+            return
+
+        if acquisition is not None:
+            subscription = acquisition.subscribe()
+            blocks = subscription.blocks(query.get("duration", 0.0) or None)
+            chunks = lambda times, values, channels: [block_chunk(times, values, channels)]
+            stats: Callable[[], Dict] = lambda: {"dropped" : subscription.dropped}
+            gaps: Callable[[], List[Dict]] = list
+
+        else:
+            try:
+                blocks, chunks, stats, gaps = self._sampling(query, Event())
+            except RuntimeError as x:  # FIFO is in use
+                yield {"error" : str(x)}
+                return
+
+        send_stats = query.get("stats", False)
+        stats_interval = float(send_stats) if send_stats and send_stats is not True else None
+        stats_at: float = None
+
+        for tick, times, values in blocks:
+            yield from gaps()
+
+            times, values = decimator.push(times, values)
+            if aggregator is not None:
+                yield from aggregator.push(times, values)
+            elif len(times):
+                yield from chunks(times, values, decimator.channels)
 
-            data: Dict = {"timestamp" : now.strftime("%Y/%m/%d %H:%M:%S.%f")}
-            if accel_data:
-                data["accel_data"] = self._dev.get_accel_data(accel_unit_g)
-            if gyro_data:
-                data["gyro_data"] = self._dev.get_gyro_data()
-            yield data
+            if stats_interval:
+                if stats_at is None:
+                    stats_at = tick + stats_interval
+                elif tick >= stats_at:
+                    yield {"stats" : stats()}
+                    stats_at += stats_interval
 
-            if interval:
-                pause.until(now + interval)
+        log.info(f"{self.name}: Stream finished: {stats()}")
+        if send_stats:
+            yield {"stats" : stats()}
@@ -0,0 +1,365 @@
+"""
+Binary time-series recorder
+
+Acquired samples are persisted in append-only segment files:
+
+    <directory>/<first sample timestamp [us]>.rec
+
+Segment starts with a fixed size header (magic and JSON with channel names),
+followed by fixed width rows of little-endian doubles: sample timestamp
+(epoch) and channel values.
+Row N is therefore at a known offset and segments are read via mmap, without
+any parsing.
+
+Each segment has a sparse time index (.idx file) with timestamp of every
+index_stride-th row, so that range reads only touch the pages they need.
+
+Samples are buffered and written in batches (SD card friendly); segments are
+rotated when they reach the size limit and old segments are removed
+by the size and/or age retention policy.
+"""
+
+from typing import List, Dict, Tuple, Iterator
+import json
+import os
+from time import monotonic, time
+
+import numpy as np
+
+from wipi.log import get_logger
+
+from .acquisition import Sink
+from .sampler import timestamp, from_timestamp
+
+
+log = get_logger(__name__)
+
+
+class Recorder(Sink):
+    """
+    Segmented binary recorder of samples
+    """
+
+    MAGIC = b"WIPIREC1"
+    HEADER = 4096  # header size (data rows start page aligned)
+    SUFFIX = ".rec"
+    INDEX_SUFFIX = ".idx"
+
+    _index_dtype = np.dtype([("time", "<f8"), ("row", "<u8")])
+
+    def __init__(self, channels: List[str], directory: str,
+        segment_size: int = 16 << 20, max_size: int = None, max_age: float = None,
+        batch: int = 4096, flush: float = 5.0, index_stride: int = 1024, fsync: bool = False):
+        """
+        :param channels: Channel names
+        :param directory: Segments directory
+        :param segment_size: Segment size limit [B]
+        :param max_size: Retention: total size limit of segments [B] (None means no limit)
+        :param max_age: Retention: segments age limit [s] (None means no limit)
+        :param batch: Write buffer size (number of samples)
+        :param flush: Write buffered samples at least this often [s]
+        :param index_stride: Sparse index stride (number of rows)
+        :param fsync: Sync segment to storage after each write
+        """
+        self.channels = list(channels)
+        self.directory = directory
+        self._row_dtype = np.dtype("<f8")
+        self._row_size = (1 + len(self.channels)) * self._row_dtype.itemsize
+        self._segment_rows = max(1, (int(segment_size) - Recorder.HEADER) // self._row_size)
+        self._max_size = max_size
+        self._max_age = max_age
+        self._flush = flush
+        self._index_stride = int(index_stride)
+        self._fsync = fsync
+
+        # Write buffer (allocated in the writer process)
+        self._batch = max(1, int(batch))
+        self._buffer: np.ndarray = None
+        self._buffered = 0
+        self._flushed_at = 0.0
+
+        # Current segment
+        self._fd: int = None
+        self._index_fd: int = None
+        self._rows = 0  # rows written to the current segment
+
+        # Writer statistics
+        self.written = 0
+        self.writes = 0
+        self.opened = 0
+        self.removed = 0
+
+    @staticmethod
+    def _write(fd: int, data: memoryview) -> None:
+        """
+        Write all data (os.write may write only part of it)
+        """
+        while len(data):
+            data = data[os.write(fd, data):]
+
+    def _header(self) -> bytes:
+        header = Recorder.MAGIC + json.dumps({"channels": self.channels}).encode()
+        if len(header) > Recorder.HEADER:
+            raise ValueError(f"Too many channels for segment header: {self.channels}")
+
+        return header.ljust(Recorder.HEADER, b' ')
+
+    def _open(self, first: float) -> None:
+        """
+        Open new segment
+        :param first: First sample timestamp
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{int(first * 1e6):020d}")
+
+        flags = os.O_WRONLY | os.O_CREAT | os.O_EXCL | os.O_APPEND
+        self._fd = os.open(path + Recorder.SUFFIX, flags, 0o644)
+        self._index_fd = os.open(path + Recorder.INDEX_SUFFIX, flags, 0o644)
+        Recorder._write(self._fd, memoryview(self._header()))
+        self._rows = 0
+        self.opened += 1
+
+        log.info(f"Recorder: Segment {path}{Recorder.SUFFIX} opened")
+        self._retain()
+
+    def _close(self) -> None:
+        """
+        Close current segment
+        """
+        if self._fd is not None:
+            os.close(self._fd)
+            os.close(self._index_fd)
+            self._fd = self._index_fd = None
+
+    def _write_rows(self, rows: np.ndarray) -> None:
+        """
+        Write rows to segment(s), rotate segments
+        :param rows: Rows (timestamps in the first column)
+        """
+        while len(rows):
+            if self._fd is None:
+                self._open(float(rows[0, 0]))
+
+            n = min(len(rows), self._segment_rows - self._rows)
+            chunk = rows[:n]
+
+            # Data first, then index (readers never see index beyond data)
+            Recorder._write(self._fd, chunk.data.cast('B'))
+            first = -self._rows % self._index_stride
+            index = np.empty(len(range(first, n, self._index_stride)), Recorder._index_dtype)
+            index["time"] = chunk[first::self._index_stride, 0]
+            index["row"] = np.arange(first, n, self._index_stride) + self._rows
+            if len(index):
+                Recorder._write(self._index_fd, memoryview(index.tobytes()))
+
+            if self._fsync:
+                os.fsync(self._fd)
+
+            self._rows += n
+            self.writes += 1
+            rows = rows[n:]
+
+            if self._rows == self._segment_rows:
+                self._close()
+
+    def flush(self) -> None:
+        """
+        Write buffered samples
+        """
+        if self._buffered:
+            self._write_rows(self._buffer[:self._buffered])
+            self.written += self._buffered
+            self._buffered = 0
+
+        self._flushed_at = monotonic()
+
+    def append(self, times: np.ndarray, values: np.ndarray) -> None:
+        """
+        Buffer block of samples, write the buffer when full or due
+        :param times: Sample times (monotonic clock)
+        :param values: Sample values (samples in rows, channels in columns)
+        """
+        if self._buffer is None:
+            self._buffer = np.empty((self._batch, 1 + len(self.channels)), self._row_dtype)
+            self._flushed_at = monotonic()
+
+        stamps = timestamp(times)
+        offset = 0
+        while offset < len(times):
+            n = min(self._batch - self._buffered, len(times) - offset)
+            self._buffer[self._buffered:self._buffered + n, 0] = stamps[offset:offset + n]
+            self._buffer[self._buffered:self._buffered + n, 1:] = values[offset:offset + n]
+            self._buffered += n
+            offset += n
+
+            if self._buffered == self._batch:
+                self.flush()
+
+        if monotonic() - self._flushed_at >= self._flush:
+            self.flush()
+
+    def close(self) -> None:
+        """
+        Write buffered samples, close segment
+        """
+        self.flush()
+        self._close()
+
+    def _paths(self) -> List[str]:
+        """
+        :return: Segment paths (oldest first)
+        """
+        try:
+            names = sorted(
+                name for name in os.listdir(self.directory)
+                if name.endswith(Recorder.SUFFIX))
+        except FileNotFoundError:
+            return []
+
+        return [os.path.join(self.directory, name) for name in names]
+
+    def _retain(self) -> None:
+        """
+        Remove old segments (the current one is always kept)
+        Done when a new segment is opened.
+        """
+        segments = self._paths()
+        sizes = [os.path.getsize(path) for path in segments]
+        total = sum(sizes)
+        now = time()
+
+        for path, size in zip(segments[:-1], sizes):
+            too_big = self._max_size is not None and total > self._max_size
+            too_old = self._max_age is not None and \
+                os.path.getmtime(path) < now - self._max_age
+
+            if not (too_big or too_old):
+                break
+
+            os.remove(path)
+            index = path[:-len(Recorder.SUFFIX)] + Recorder.INDEX_SUFFIX
+            if os.path.exists(index):
+                os.remove(index)
+
+            total -= size
+            self.removed += 1
+            log.info(f"Recorder: Segment {path} removed")
+
+    def _segment(self, path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Map segment
+        :param path: Segment path
+        :return: Segment rows (memory mapped) and sparse index
+        """
+        with open(path, "rb") as segment:
+            header = segment.read(Recorder.HEADER)
+
+        if not header.startswith(Recorder.MAGIC):
+            raise ValueError(f"Not a recorder segment: {path}")
+
+        channels = json.loads(header[len(Recorder.MAGIC):].decode())["channels"]
+        if channels != self.channels:
+            raise ValueError(f"Segment {path} channels differ: {channels}")
+
+        # Only complete rows (the writer may be appending)
+        rows = (os.path.getsize(path) - Recorder.HEADER) // self._row_size
+        data = np.memmap(path, self._row_dtype, "r", Recorder.HEADER,
+            (rows, 1 + len(self.channels))) if rows else \
+            np.empty((0, 1 + len(self.channels)), self._row_dtype)
+
+        index = np.fromfile(path[:-len(Recorder.SUFFIX)] + Recorder.INDEX_SUFFIX,
+            Recorder._index_dtype)
+        return data, index[index["row"] < rows]
+
+    @staticmethod
+    def _search(data: np.ndarray, index: np.ndarray, ts: float, right: bool) -> int:
+        """
+        Find row by timestamp
+        The sparse index narrows the search down to one stride of rows.
+        :param data: Segment rows
+        :param index: Segment sparse index
+        :param ts: Timestamp
+        :param right: Search the right side (see numpy.searchsorted)
+        :return: Row
+        """
+        i = np.searchsorted(index["time"], ts, "right" if right else "left")
+        lo = int(index["row"][i - 1]) if i > 0 else 0
+        hi = int(index["row"][i]) + 1 if i < len(index) else len(data)
+
+        return lo + int(np.searchsorted(data[lo:hi, 0], ts, "right" if right else "left"))
+
+    def query(self, query: Dict) -> Tuple[List[str], Iterator[Tuple[np.ndarray, np.ndarray]]]:
+        """
+        Query recorded samples
+        The query may specify time range by "seconds" (last N seconds) or
+        by "from" and/or "to" (epoch timestamps), "decimate" factor,
+        "axes" (channels selection) and "block" (max. number of samples per
+        produced block).
+        Note that samples which weren't written yet (are buffered) aren't
+        available.
+        :param query: Query
+        :return: Channel names and generator of sample blocks (sample times
+                 (monotonic clock) and values)
+        """
+        axes = query.get("axes", self.channels)
+        unknown = set(axes) - set(self.channels)
+        if unknown:
+            raise ValueError(f"Unknown axes: {sorted(unknown)} (available: {self.channels})")
+        columns = [1 + self.channels.index(axis) for axis in axes]
+
+        decimate = int(query.get("decimate", 1))
+        if decimate < 1:
+            raise ValueError(f"Invalid decimation factor: {decimate}")
+
+        block = int(query.get("block", 1000))
+        if block < 1:
+            raise ValueError(f"Invalid block size: {block}")
+
+        start = query.get("from")
+        end = query.get("to")
+        if query.get("seconds") is not None:
+            start = time() - float(query["seconds"])
+
+        start = -np.inf if start is None else float(start)
+        end = np.inf if end is None else float(end)
+
+        segments = self._paths()
+        firsts = [int(os.path.basename(path)[:-len(Recorder.SUFFIX)]) / 1e6 for path in segments]
+
+        def blocks() -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+            phase = 0  # decimation continues across segments
+            for i, path in enumerate(segments):
+                if firsts[i] > end:
+                    break
+                if i + 1 < len(segments) and firsts[i + 1] < start:
+                    continue
+
+                try:
+                    data, index = self._segment(path)
+                except FileNotFoundError:
+                    continue  # removed by retention meanwhile
+
+                lo = Recorder._search(data, index, start, False) if start > -np.inf else 0
+                hi = Recorder._search(data, index, end, True) if end < np.inf else len(data)
+
+                for offset in range(lo + phase, hi, block * decimate):
+                    rows = data[offset:min(hi, offset + block * decimate):decimate]
+                    yield from_timestamp(rows[:, 0]), rows[:, columns]
+
+                if hi > lo:
+                    phase = (phase - (hi - lo)) % decimate
+
+        return list(axes), blocks()
+
+    def stats(self) -> Dict:
+        """
+        :return: Samples written, writes, segments opened and removed,
+                 samples buffered
+        """
+        return {
+            "written" : self.written,
+            "writes" : self.writes,
+            "opened" : self.opened,
+            "removed" : self.removed,
+            "buffered" : self._buffered,
+        }
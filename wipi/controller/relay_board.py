@@ -1,8 +1,236 @@
-from typing import Dict
+"""
+RPi Relay Board controller
 
-import RPi.GPIO as GPIO
+Besides plain relay state changes, the controller executes relay programs
+(in its worker, against the monotonic clock, with millisecond accuracy):
+
+* pulse: set relay(s) state for "duration" seconds, then restore it
+
+    {"pulse": {"relay": "relay1", "state": "closed", "duration": 0.25}}
+
+* PWM: switch relay(s) periodically, "duty" being the fraction of "period"
+  spent in the "state" ("cycles" times or indefinitely if null/unset)
+
+    {"pwm": {"relay": "relay2", "state": "closed", "period": 0.75, "duty": 0.333,
+             "cycles": 10}}
+
+* sequence: timed state changes across relays ("at" seconds since
+  the sequence start), repeated "cycles" times (1 by default, null means
+  indefinitely) each "period" seconds (the last step time by default)
+
+    {"sequence": {"steps": [
+        {"at": 0.0, "state": {"relay1": "closed"}},
+        {"at": 0.5, "state": {"relay1": "open", "relay2": "closed"}},
+        {"at": 1.0, "state": {"relay2": "open"}}], "cycles": 3, "period": 1.5}}
+
+* cancel: release all or listed relays from programs control, relays are
+  left in their current state
+
+    {"cancel": "all"}
+    {"cancel": ["relay1"]}
+
+Each relay is controlled by at most one program; a program takes its relays
+over from running programs and plain relay state change releases the relay
+(programs which don't control any relay any more are cancelled).
+Programs are listed (by relay) in the controller state, under "programs".
+"""
+
+from typing import Any, Dict, List, Tuple, Iterator, Optional, Callable
+from threading import Thread, Condition
+from time import monotonic
+import heapq
 
 from wipi.controller import Controller
+from wipi.log import get_logger
+
+
+log = get_logger(__name__)
+
+
+def gpio(backend: str, **kwargs):
+    """
+    GPIO backend
+    :param backend: Backend name ("RPi.GPIO", "gpiomem" or "simulator")
+    :param kwargs: Backend parameters
+    :return: GPIO interface (RPi.GPIO module or compatible object)
+    """
+    if backend == "RPi.GPIO":
+        import RPi.GPIO as GPIO
+        return GPIO
+
+    if backend == "gpiomem":
+        from .gpiomem import GPIO
+        return GPIO(**kwargs)
+
+    if backend == "simulator":
+        from .simulator import GPIO
+        return GPIO(**kwargs)
+
+    raise ValueError(f"Unknown GPIO backend: {backend}")
+
+
+Steps = Iterator[Tuple[float, Dict[str, str]]]  # program steps (offset [s], relays state)
+
+
+class Sequencer:
+    """
+    Relay programs executor
+    Program steps are executed by the sequencer thread, the thread sleeps
+    till shortly before the step is due and spins for the rest.
+    """
+
+    def __init__(self, execute: Callable[[Dict[str, str]], None], spin: float = 0.5e-3):
+        """
+        :param execute: Step executor (called with relays state)
+        :param spin: Spin (rather than sleep) for at most this long [s]
+        """
+        self._execute = execute
+        self._spin = spin
+        self._cond = Condition()
+        self._queue: List[Tuple[float, int, Dict[str, str]]] = []  # (deadline, program, state)
+        self._programs: Dict[int, Tuple[str, List[str], Steps]] = {}  # kind, relays, steps
+        self._started: Dict[int, float] = {}
+        self._next_id = 0
+        self._stop = False
+        self._thread: Thread = None
+
+        # Statistics
+        self.steps = 0
+        self.lateness_max = 0.0  # max. step execution delay [s]
+
+    @property
+    def lock(self) -> Condition:
+        """
+        Steps are executed with the lock held
+        """
+        return self._cond
+
+    def _start(self) -> None:
+        """
+        Start sequencer thread (in the controller worker process)
+        """
+        self._thread = Thread(name="Sequencer", target=self._routine, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify()
+
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _schedule(self, program: int) -> None:
+        """
+        Queue next step of program (or drop the program if it's finished)
+        Called with the condition lock held.
+        :param program: Program ID
+        """
+        _, _, steps = self._programs[program]
+        step = next(steps, None)
+        if step is None:
+            del self._programs[program]
+            del self._started[program]
+            return
+
+        offset, state = step
+        heapq.heappush(self._queue, (self._started[program] + offset, program, state))
+
+    def _step(self) -> None:
+        """
+        Execute the first queued step, queue next step of its program
+        Called with the condition lock held.
+        """
+        deadline, program, state = heapq.heappop(self._queue)
+        relays = self._programs[program][1]
+        self._execute(dict((r, s) for r, s in state.items() if r in relays))
+        self.steps += 1
+        self.lateness_max = max(self.lateness_max, monotonic() - deadline)
+        self._schedule(program)
+
+    def run(self, kind: str, relays: List[str], steps: Steps) -> int:
+        """
+        Run program
+        The relays are released from other programs control.
+        :param kind: Program kind
+        :param relays: Controlled relays
+        :param steps: Program steps (offsets must not decrease)
+        :return: Program ID
+        """
+        if self._thread is None:
+            self._start()
+
+        with self._cond:
+            self._cancel(relays)
+            program = self._next_id
+            self._next_id += 1
+            self._programs[program] = (kind, list(relays), steps)
+            self._started[program] = monotonic()
+            self._schedule(program)
+
+            # Steps due immediately are done synchronously
+            while self._queue and self._queue[0][0] <= self._started[program]:
+                self._step()
+
+            self._cond.notify()
+
+        return program
+
+    def _cancel(self, relays: Optional[List[str]]) -> None:
+        cancelled = set()
+        for program, (_, prelays, _) in self._programs.items():
+            prelays[:] = [] if relays is None else [r for r in prelays if r not in relays]
+            if not prelays:
+                cancelled.add(program)
+
+        for program in cancelled:
+            del self._programs[program]
+            del self._started[program]
+
+        if cancelled:
+            self._queue = [item for item in self._queue if item[1] not in cancelled]
+            heapq.heapify(self._queue)
+
+    def cancel(self, relays: List[str] = None) -> None:
+        """
+        Release relays from programs control
+        Programs which don't control any relay are cancelled.
+        :param relays: Released relays (all if None)
+        """
+        with self._cond:
+            self._cancel(relays)
+
+    def programs(self) -> Dict[str, str]:
+        """
+        :return: Running programs kinds (by relay)
+        """
+        with self._cond:
+            return dict(
+                (relay, kind)
+                for kind, relays, _ in self._programs.values()
+                for relay in relays)
+
+    def _routine(self) -> None:
+        while True:
+            with self._cond:
+                while not self._stop:
+                    timeout = self._queue[0][0] - monotonic() if self._queue else None
+                    if timeout is not None and timeout <= self._spin:
+                        break
+                    self._cond.wait(None if timeout is None else timeout - self._spin)
+
+                if self._stop:
+                    return
+
+                deadline, program, state = self._queue[0]
+
+            while monotonic() < deadline:
+                pass  # spin
+
+            with self._cond:
+                if self._queue and self._queue[0][1] == program:  # not cancelled meanwhile
+                    self._step()
 
 
 class RelayBoard(Controller):
@@ -18,77 +246,264 @@ class RelayBoard(Controller):
         "relay3" : 21,
     }
 
-    _states = {
-        "open"   : GPIO.HIGH,
-        "closed" : GPIO.LOW,
-    }
-
     @staticmethod
-    def _io_channel(relay: int) -> int:
+    def _io_channel(relay: str) -> int:
         """
         Get relay I/O channel
-        :param relay: Relay number
+        :param relay: Relay name
         :return: Relay I/O channel
         """
         return RelayBoard._relays[relay]
 
-    @staticmethod
-    def _io_state(state: str) -> int:
+    def _io_state(self, state: str) -> int:
         """
         Relay state to GPIO state translation
         :param state: Relay state
         :return: GPIO state
         """
-        return RelayBoard._states[state]
+        return self._states[state]
 
-    def __init__(self, name: str, initial_state: str = "open"):
+    def __init__(self, name: str, initial_state: str = "open",
+        backend: str = "RPi.GPIO", simulator: Dict = {}, gpiomem: Dict = {}):
+        """
+        :param name: Controller name
+        :param initial_state: Initial relays state
+        :param backend: GPIO backend ("RPi.GPIO", "gpiomem" or "simulator")
+        :param simulator: Simulated GPIO parameters (see simulator.GPIO)
+        :param gpiomem: Memory mapped GPIO parameters (see gpiomem.GPIO)
+        """
         super().__init__(name)
         self._initial_state = initial_state
+        self._backend = backend
+        self._backend_kwargs = {"simulator": simulator, "gpiomem": gpiomem}.get(backend, {})
 
-        GPIO.setwarnings(False)
-        GPIO.setmode(GPIO.BCM)
+        self._gpio: Any = None  # see setup
+        self._states: Dict[str, int] = {}
+        self._state: Dict[str, str] = dict(
+            (relay, self._initial_state) for relay in RelayBoard._relays.keys())
+        self._restore: Dict[str, str] = {}  # relays state before pulse (see _pulse)
+
+        self._sequencer = Sequencer(self._program_step)
+
+    def setup(self) -> None:
+        """
+        Set GPIO up (the relays are set to the initial state)
+        """
+        self._gpio = gpio(self._backend, **self._backend_kwargs)
+        self._states = {
+            "open"   : self._gpio.HIGH,
+            "closed" : self._gpio.LOW,
+        }
+
+        self._gpio.setwarnings(False)
+        self._gpio.setmode(self._gpio.BCM)
 
-        self._state: Dict[int, int] = dict()
         for relay, channel in RelayBoard._relays.items():
-            self._state[relay] = self._initial_state
-            GPIO.setup(
-                channel, GPIO.OUT,
-                initial=RelayBoard._io_state(self._initial_state))
+            self._gpio.setup(
+                channel, self._gpio.OUT,
+                initial=self._io_state(self._state[relay]))
+
+    def shutdown(self) -> None:
+        self._sequencer.stop()
+        log.info(f"{self.name}: Program steps done: {self._sequencer.steps}, "
+            f"max. lateness: {self._sequencer.lateness_max * 1e3:.3f} ms")
+        super().shutdown()
 
-    def _set_state(self, relay: int, state: str) -> None:
+    def _set_state(self, state: Dict[str, str]) -> None:
         """
-        Set state of relay
-        :param relay: Relay number
-        :param state: Relay state
+        Set state of relays
+        All the relays are set by one GPIO output call (so the gpiomem backend
+        switches them at once).
+        :param state: Relays state
         """
-        self._state[relay] = state
-        GPIO.output(RelayBoard._io_channel(relay), RelayBoard._io_state(state))
+        if not state:
+            return
+
+        self._state.update(state)
+        self._gpio.output(
+            [RelayBoard._io_channel(relay) for relay in state.keys()],
+            [self._io_state(rstate) for rstate in state.values()])
+
+    def _program_step(self, state: Dict[str, str]) -> None:
+        """
+        Execute relay program step (in the sequencer thread)
+        :param state: Relays state
+        """
+        self._set_state(dict(
+            (relay, rstate) for relay, rstate in state.items()
+            if rstate != self._state[relay]))
+
+        if self.sinks:
+            self.state_changed(self.get_state())
+
+    def _relays_arg(self, relay) -> List[str]:
+        relays = [relay] if isinstance(relay, str) else list(relay)
+        unknown = set(relays) - set(self._state.keys())
+        if unknown or not relays:
+            raise ValueError(f"{self.name}: Unknown relays: {sorted(unknown)}")
+
+        return relays
+
+    def _rstate_arg(self, rstate: str) -> str:
+        if rstate not in self._states:
+            raise ValueError(f"{self.name}: Unknown relay state: {rstate} "
+                f"(available: {sorted(self._states.keys())})")
+
+        return rstate
+
+    def _pulse(self, relay, duration: float, state: str = "closed") -> Tuple[List[str], Steps]:
+        """
+        Pulse program
+        A retriggered pulse (i.e. taking a relay over from a running pulse)
+        restores the relay to the state before the running pulse.
+        :param relay: Relay or list of relays
+        :param duration: Pulse duration [s]
+        :param state: Pulse state
+        :return: Controlled relays and program steps
+        """
+        relays = self._relays_arg(relay)
+        state = self._rstate_arg(state)
+
+        with self._sequencer.lock:
+            programs = self._sequencer.programs()
+            restore = dict(
+                (r, self._restore[r] if programs.get(r) == "pulse" else self._state[r])
+                for r in relays)
+            self._restore.update(restore)
+
+        def steps() -> Steps:
+            yield 0.0, dict((r, state) for r in relays)
+            yield float(duration), restore
+
+        return relays, steps()
+
+    def _pwm(self, relay, period: float, duty: float, state: str = "closed",
+        cycles: int = None) -> Tuple[List[str], Steps]:
+        """
+        PWM program
+        :param relay: Relay or list of relays
+        :param period: Period [s]
+        :param duty: Duty cycle (fraction of period in state)
+        :param state: Active state
+        :param cycles: Number of periods (indefinitely if None)
+        :return: Controlled relays and program steps
+        """
+        relays = self._relays_arg(relay)
+        state = self._rstate_arg(state)
+        if not period > 0.0 or not 0.0 <= duty <= 1.0:
+            raise ValueError(f"{self.name}: Invalid PWM period/duty: {period}/{duty}")
+
+        other = [s for s in self._states if s != state][0]
+        active = dict((r, state) for r in relays)
+        inactive = dict((r, other) for r in relays)
+
+        def steps() -> Steps:
+            cycle = 0
+            while cycles is None or cycle < cycles:
+                start = cycle * period
+                if duty > 0.0:
+                    yield start, active
+                if duty < 1.0:
+                    yield start + duty * period, inactive
+                cycle += 1
+
+            yield cycle * period, inactive
+
+        return relays, steps()
+
+    def _sequence(self, steps: List[Dict], cycles: int = 1,
+        period: float = None) -> Tuple[List[str], Steps]:
+        """
+        Sequence program
+        :param steps: Steps ({"at": offset [s], "state": relays state})
+        :param cycles: Number of repetitions (indefinitely if None)
+        :param period: Repetition period [s] (the last step offset by default)
+        :return: Controlled relays and program steps
+        """
+        program = sorted(
+            ((float(step["at"]), step["state"]) for step in steps),
+            key=lambda step: step[0])
+        if not program:
+            raise ValueError(f"{self.name}: Empty sequence")
+
+        relays: List[str] = []
+        for _, state in program:
+            for relay, rstate in state.items():
+                self._relays_arg(relay)
+                self._rstate_arg(rstate)
+                if relay not in relays:
+                    relays.append(relay)
+
+        period = program[-1][0] if period is None else float(period)
+        if cycles != 1 and not period > 0.0:
+            raise ValueError(f"{self.name}: Invalid sequence period: {period}")
+
+        def generate() -> Steps:
+            cycle = 0
+            while cycles is None or cycle < cycles:
+                for at, state in program:
+                    yield cycle * period + at, state
+                cycle += 1
+
+        return relays, generate()
 
     def get_state(self) -> Dict:
         """
-        :return: Current relays state
+        :return: Current relays state and running programs (by relay)
         """
-        return self._state
+        with self._sequencer.lock:
+            state: Dict = dict(self._state)
+        state["programs"] = self._sequencer.programs()
+        return state
 
     def set_state(self, state: Dict) -> Dict:
         """
+        Set relays state, run or cancel relay programs (see module doc.)
         :param state: State change
         :return: Current relays state
         """
-        for relay, rstate in state.items():
-            if relay not in self._state.keys():
-                continue  # non-existing relay
+        if "cancel" in state:
+            cancel = state["cancel"]
+            try:
+                self._sequencer.cancel(None if cancel == "all" else self._relays_arg(cancel))
+            except (ValueError, TypeError) as x:
+                log.warning(f"{self.name}: Invalid cancel: {x}")
+
+        relays_state = dict(
+            (relay, rstate) for relay, rstate in state.items()
+            if relay in self._state.keys() and rstate in self._states)  # existing relays
 
-            if rstate == self._state[relay]:
-                continue  # nothing to do
+        if relays_state:
+            with self._sequencer.lock:
+                self._sequencer.cancel(list(relays_state.keys()))
+                self._set_state(dict(
+                    (relay, rstate) for relay, rstate in relays_state.items()
+                    if rstate != self._state[relay]))
 
-            if rstate in RelayBoard._states:
-                self._set_state(relay, rstate)
+        for kind, program in (
+            ("pulse", self._pulse),
+            ("pwm", self._pwm),
+            ("sequence", self._sequence),
+        ):
+            if kind in state:
+                try:
+                    relays, steps = program(**state[kind])
+                except (ValueError, TypeError, KeyError) as x:
+                    log.warning(f"{self.name}: Invalid {kind} program: {x!r}")
+                    continue  # invalid program is ignored (like invalid state)
+
+                self._sequencer.run(kind, relays, steps)
 
         return self.get_state()
 
     def __del__(self):
-        for relay in self._state.keys():
-            self._set_state(relay, self._initial_state)
+        sequencer = getattr(self, "_sequencer", None)
+        if sequencer is not None:
+            sequencer.stop()
+
+        if getattr(self, "_gpio", None) is None:
+            return  # not set up (e.g. in the master process) or not created
+
+        self._set_state(dict((relay, self._initial_state) for relay in self._state.keys()))
 
-        GPIO.cleanup()
+        self._gpio.cleanup()
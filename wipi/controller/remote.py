@@ -0,0 +1,135 @@
+from typing import Dict, Iterator, Optional, Tuple
+from threading import Lock
+from time import monotonic
+
+from wipi.client import Client
+from wipi.log import get_logger
+
+from . import Controller
+
+
+log = get_logger(__name__)
+
+
+class Remote(Controller):
+    """
+    Proxy of remote wipi node (federation)
+
+    The controller forwards get_state, set_state and downstream to another
+    wipi instance over pooled keep-alive HTTP connections (see wipi.client).
+    It proxies either one remote controller (given by "controller") or
+    the whole node: then, the state is that of all the node's controllers
+    and set_state and downstream take the node's /set_state and /downstream
+    requests (i.e. {"controllers": [...]}).
+    Deferred actions are scheduled locally and forwarded when due.
+
+    The state is cached for a short time ("cache_ttl"), so that frequent
+    polling (e.g. by several dashboards) doesn't multiply the remote
+    requests; concurrent requests of an expired state wait for one fetch.
+    Remote failures are reported as {"error": ...} state.
+
+    The controller is thread safe; requests are executed by a pool of
+    "connections" threads by default (each may hold a connection).
+    State changes are all ordered (the node's controllers they change may
+    overlap), see Controller.ordering_key.
+    """
+
+    concurrency = Controller.THREAD_SAFE
+
+    def __init__(self, name: str, url: str, controller: str = None,
+        connections: int = 8, timeout: float = 5.0, cache_ttl: float = 0.5):
+        """
+        :param name: Controller name
+        :param url: Remote node API URL (e.g. http://pi1:8080)
+        :param controller: Remote controller name (None means the whole node)
+        :param connections: Max. number of connections to the node
+        :param timeout: Connection and socket operations timeout [s]
+        :param cache_ttl: State cache time-to-live [s] (0 disables caching)
+        """
+        super().__init__(name)
+        self.pool = {"kind": "threads", "size": connections}
+
+        self._url = url
+        self._controller = controller
+        self._connections = connections
+        self._timeout = timeout
+        self._cache_ttl = cache_ttl
+        self._client: Client = None
+        self._cache: Tuple[float, Dict] = (None, None)  # fetch time (monotonic clock), state
+        self._lock = Lock()  # state fetch & cache update
+
+    def setup(self) -> None:
+        """
+        Create the node client (connections are opened on demand)
+        """
+        self._client = Client(self._url, self._connections, self._timeout)
+
+    def _error(self, error: Client.Error) -> Dict:
+        """
+        :param error: Request failure
+        :return: Error state
+        """
+        log.warning(f"{self.name}: {error}")
+        return {"error" : str(error)}
+
+    def _fetch(self) -> Dict:
+        """
+        :return: Remote state
+        """
+        try:
+            return self._client.get_state(self._controller)
+        except Client.Error as x:
+            return self._error(x)
+
+    def get_state(self) -> Dict:
+        """
+        :return: Remote state (cached)
+        """
+        if self._cache_ttl <= 0:
+            return self._fetch()
+
+        with self._lock:
+            fetched, state = self._cache
+            if fetched is None or monotonic() - fetched > self._cache_ttl:
+                fetched, state = monotonic(), self._fetch()
+                self._cache = (None, None) if "error" in state else (fetched, state)
+
+            return state
+
+    def set_state(self, state: Dict) -> Dict:
+        """
+        :param state: State change (remote controller state change or
+                      the node /set_state request)
+        :return: Remote state
+        """
+        try:
+            state = self._client.set_state(self._controller, state)
+        except Client.Error as x:
+            with self._lock:
+                self._cache = (None, None)
+            return self._error(x)
+
+        with self._lock:
+            self._cache = (monotonic(), state)
+        return state
+
+    def downstream(self, query: Dict) -> Iterator[Optional[Dict]]:
+        """
+        Proxy remote stream (incl. heartbeats)
+        :param query: Remote controller downstream query or the node
+                      /downstream request
+        :return: Generator of data chunks (concluded by error chunk if
+                 the remote stream fails)
+        """
+        try:
+            yield from self._client.downstream(self._controller, query, heartbeats=True)
+        except Client.Error as x:
+            yield self._error(x)
+
+    def shutdown(self) -> None:
+        """
+        Close the node connections
+        """
+        super().shutdown()
+        if self._client is not None:
+            self._client.close()
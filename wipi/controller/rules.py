@@ -0,0 +1,252 @@
+"""
+Rules engine
+
+Rules are evaluated in the acquisition thread of the source controller,
+right after each sample block is acquired, and their actions (state changes)
+are dispatched directly to the target controller worker (no API round trip).
+
+Rules are configured per (source) controller, e.g.
+
+    "rules" : [{
+        "name"          : "vibration cutoff",
+        "axes"          : ["accel_data.x", "accel_data.y"],
+        "function"      : "rms",
+        "window"        : 0.1,
+        "above"         : 12.0,
+        "release"       : 10.0,
+        "target"        : "3relays",
+        "state"         : {"relay1": "open"},
+        "release_state" : {"relay1": "closed"},
+        "min_interval"  : 1.0
+    }]
+
+* "function" (see aggregate functions) is computed over the last "window"
+  seconds of samples, per axis,
+* the rule triggers when the value (of any axis) gets "above" (or "below")
+  the threshold; then, "state" is set to the "target" controller,
+* the rule releases when the value crosses the "release" threshold back
+  (hysteresis, the trigger threshold by default; it may not be beyond
+  the trigger threshold); then, "release_state" is set (if any),
+* actions are dispatched at most once per "min_interval" seconds
+  (rate limit); suppressed actions are retried with the next block.
+
+Rule statistics (incl. reaction latency, i.e. time from acquisition of
+the triggering sample till the target state is set) are kept in shared
+memory, so that API workers read them directly.
+"""
+
+from typing import List, Dict, Callable
+from multiprocessing.sharedctypes import RawArray
+from time import monotonic
+
+import numpy as np
+
+from wipi.log import get_logger, fields
+
+from .acquisition import Sink
+from .aggregate import Aggregator
+
+
+log = get_logger(__name__)
+
+
+class Rule:
+    """
+    Threshold rule with hysteresis and rate limit
+    """
+
+    class Suppressed(Exception):
+        """
+        Action suppressed by rate limit
+        """
+
+    def __init__(self, channels: List[str], rate: float, target: str, state: Dict,
+        name: str = None, axes: List[str] = None, function: str = "rms", window: float = 0.1,
+        above: float = None, below: float = None, release: float = None,
+        release_state: Dict = None, min_interval: float = 0.0):
+        """
+        :param channels: Source channel names
+        :param rate: Source sample rate [Hz]
+        :param target: Target controller name
+        :param state: Target state set on trigger
+        :param name: Rule name
+        :param axes: Evaluated channels (all if None)
+        :param function: Aggregate function
+        :param window: Evaluation window [s]
+        :param above: Trigger threshold (value above)
+        :param below: Trigger threshold (value below)
+        :param release: Release threshold (trigger threshold by default, not beyond it)
+        :param release_state: Target state set on release
+        :param min_interval: Min. time between actions [s]
+        """
+        if (above is None) == (below is None):
+            raise ValueError(f"Rule {name}: Exactly one of above/below threshold required")
+
+        if release is not None and (release > above if below is None else release < below):
+            raise ValueError(f"Rule {name}: Release threshold {release} beyond "
+                f"the trigger threshold {above if below is None else below}")
+
+        if function not in Aggregator._functions:
+            raise ValueError(f"Rule {name}: Unknown function: {function} "
+                f"(available: {sorted(Aggregator._functions.keys())})")
+
+        axes = channels if axes is None else axes
+        unknown = set(axes) - set(channels)
+        if unknown:
+            raise ValueError(f"Rule {name}: Unknown axes: {sorted(unknown)} (available: {channels})")
+
+        self.name = name
+        self.target = target
+        self.state = state
+        self.release_state = release_state
+        self._columns = [channels.index(axis) for axis in axes]
+        self._function = Aggregator._functions[function]
+        self._window = max(1, int(round(window * rate)))
+        self._above = above is not None
+        self._threshold = above if self._above else below
+        self._release = self._threshold if release is None else release
+        self._min_interval = min_interval
+
+        self._samples = np.empty((0, len(self._columns)))
+        self._dispatched_at = -np.inf
+        self.active = False
+
+    def _crossed(self, value: float, threshold: float) -> bool:
+        return value > threshold if self._above else value < threshold
+
+    def evaluate(self, values: np.ndarray) -> float:
+        """
+        Evaluate rule function over the window
+        :param values: New sample values (all channels)
+        :return: Value (max. or min. over axes, for above or below
+                 threshold, respectively) or None if the window isn't full
+        """
+        self._samples = np.concatenate((self._samples, values[:, self._columns]))[-self._window:]
+        if len(self._samples) < self._window:
+            return None
+
+        values = self._function(self._samples)
+        return float(values.max() if self._above else values.min())
+
+    def transition(self, value: float) -> Dict:
+        """
+        Evaluate thresholds and rate limit
+        :param value: Rule function value
+        :return: Target state to set (or None)
+        """
+        if value is None:
+            return None
+
+        if not self.active and self._crossed(value, self._threshold):
+            state = self.state
+        elif self.active and not self._crossed(value, self._release):
+            state = self.release_state or {}
+        else:
+            return None
+
+        now = monotonic()
+        if now - self._dispatched_at < self._min_interval:
+            raise Rule.Suppressed()
+
+        self.active = not self.active
+        self._dispatched_at = now
+        return state
+
+
+class Rules(Sink):
+    """
+    Rules evaluated on acquired samples
+    """
+
+    # Shared statistics fields (per rule)
+    _fields = ("active", "value", "triggers", "releases", "suppressed",
+        "reactions", "latency_last", "latency_sum", "latency_max")
+
+    def __init__(self, source: str, channels: List[str], rate: float, rules: List[Dict]):
+        """
+        :param source: Source controller name
+        :param channels: Source channel names
+        :param rate: Source sample rate [Hz]
+        :param rules: Rules configuration (see module doc.)
+        """
+        self.source = source
+        self.rules = [Rule(channels, rate, **rule) for rule in rules]
+        self._stats = RawArray('d', len(self.rules) * len(Rules._fields))
+
+        # Action dispatcher: (target, state, source, rule index, trigger time)
+        self.dispatch: Callable[[str, Dict, str, int, float], None] = None
+
+    def _set(self, i: int, field: str, value: float) -> None:
+        self._stats[i * len(Rules._fields) + Rules._fields.index(field)] = value
+
+    def _get(self, i: int, field: str) -> float:
+        return self._stats[i * len(Rules._fields) + Rules._fields.index(field)]
+
+    def append(self, times: np.ndarray, values: np.ndarray) -> None:
+        """
+        Evaluate rules, dispatch actions
+        :param times: Sample times (monotonic clock)
+        :param values: Sample values (samples in rows, channels in columns)
+        """
+        for i, rule in enumerate(self.rules):
+            value = rule.evaluate(values)
+            if value is not None:
+                self._set(i, "value", value)
+
+            try:
+                state = rule.transition(value)
+            except Rule.Suppressed:
+                self._set(i, "suppressed", self._get(i, "suppressed") + 1)
+                continue
+
+            if state is None:
+                continue
+
+            field = "triggers" if rule.active else "releases"
+            self._set(i, field, self._get(i, field) + 1)
+            self._set(i, "active", float(rule.active))
+
+            if state and self.dispatch is not None:
+                self.dispatch(rule.target, state, self.source, i, float(times[-1]))
+
+            log.info("%s: Rule %s %s", self.source, rule.name,
+                "triggered" if rule.active else "released", extra=fields(value=value))
+
+    def reacted(self, i: int, since: float) -> None:
+        """
+        Record reaction latency
+        Called by the target controller worker when the action is done.
+        :param i: Rule index
+        :param since: Triggering sample time (monotonic clock)
+        """
+        latency = monotonic() - since
+        self._set(i, "reactions", self._get(i, "reactions") + 1)
+        self._set(i, "latency_last", latency)
+        self._set(i, "latency_sum", self._get(i, "latency_sum") + latency)
+        self._set(i, "latency_max", max(self._get(i, "latency_max"), latency))
+
+    def stats(self) -> List[Dict]:
+        """
+        :return: Rules statistics (active flag, last value, number of triggers,
+                 releases, suppressed actions and reactions, reaction latency [s])
+        """
+        stats = []
+        for i, rule in enumerate(self.rules):
+            reactions = int(self._get(i, "reactions"))
+            stats.append({
+                "name" : rule.name,
+                "target" : rule.target,
+                "active" : bool(self._get(i, "active")),
+                "value" : self._get(i, "value"),
+                "triggers" : int(self._get(i, "triggers")),
+                "releases" : int(self._get(i, "releases")),
+                "suppressed" : int(self._get(i, "suppressed")),
+                "reactions" : reactions,
+                "latency" : {
+                    "last" : self._get(i, "latency_last") if reactions else None,
+                    "mean" : self._get(i, "latency_sum") / reactions if reactions else None,
+                    "max" : self._get(i, "latency_max") if reactions else None,
+                },
+            })
+
+        return stats
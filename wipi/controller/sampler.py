@@ -0,0 +1,169 @@
+from typing import Dict, Iterator, TypeVar, overload, TYPE_CHECKING
+from time import monotonic, sleep, time
+from math import sqrt
+
+if TYPE_CHECKING:
+    import numpy as np
+
+
+# Epoch time of the monotonic clock origin
+# Taken once at import, so that all processes forked from the same parent
+# share the same timebase.
+_epoch = time() - monotonic()
+
+# Time or array of times
+_Time = TypeVar("_Time", float, "np.ndarray")
+
+
+@overload
+def timestamp() -> float: ...
+@overload
+def timestamp(mono: _Time) -> _Time: ...
+
+
+def timestamp(mono=None):
+    """
+    Convert monotonic clock time to (high resolution) epoch timestamp
+    :param mono: Monotonic clock time(s) (default is now)
+    :return: Timestamp(s) [s since epoch]
+    """
+    return _epoch + (monotonic() if mono is None else mono)
+
+
+def from_timestamp(ts: _Time) -> _Time:
+    """
+    Convert epoch timestamp to monotonic clock time
+    :param ts: Timestamp(s) [s since epoch]
+    :return: Monotonic clock time(s)
+    """
+    return ts - _epoch
+
+
+class Sampler:
+    """
+    Periodic sampling clock
+
+    Ticks are scheduled at monotonic clock deadlines (start + n * interval),
+    so that timing errors don't accumulate (i.e. the sampling rate doesn't drift).
+
+    If the sampling loop is late by more than one interval (e.g. when blocked
+    by stream back-pressure), it's an overrun (counted once, until the clock
+    is back on schedule); the missed ticks are then either
+    * produced immediately, one after another (catch-up policy) or
+    * skipped, the clock resynchronises to the next deadline (skip policy).
+    """
+
+    CATCH_UP = "catch_up"
+    SKIP = "skip"
+
+    def __init__(self, interval: float = 0.0, duration: float = None,
+        policy: str = SKIP, spin: float = 0.0):
+        """
+        :param interval: Sampling interval [s] (0 means as fast as possible)
+        :param duration: Sampling duration [s] (None means indefinitely)
+        :param policy: Overrun policy (Sampler.CATCH_UP or Sampler.SKIP)
+        :param spin: Busy-wait for (at most) this long before deadlines [s]
+                     (improves precision at cost of CPU time)
+        """
+        if policy not in (Sampler.CATCH_UP, Sampler.SKIP):
+            raise ValueError(f"Unknown sampler overrun policy: {policy}")
+
+        self.interval = float(interval)
+        self.duration = duration
+        self.policy = policy
+        self._spin = spin
+
+        self._start: float = None
+        self._last: float = None
+        self._samples = 0
+        self._overruns = 0
+        self._overrun = False  # the current tick belongs to an overrun
+        self._skipped = 0
+
+        # Lateness statistics (running mean and sum of squared deviations)
+        self._lateness_mean = 0.0
+        self._lateness_m2 = 0.0
+        self._lateness_max = 0.0
+
+    def _wait(self, deadline: float) -> float:
+        """
+        Wait for deadline
+        :param deadline: Monotonic clock deadline
+        :return: Current monotonic clock time
+        """
+        now = monotonic()
+        if now + self._spin < deadline:
+            sleep(deadline - now - self._spin)
+
+        now = monotonic()
+        while now < deadline:
+            now = monotonic()
+
+        return now
+
+    def _account(self, lateness: float) -> None:
+        """
+        Update lateness statistics
+        :param lateness: Tick lateness [s]
+        """
+        self._samples += 1
+        delta = lateness - self._lateness_mean
+        self._lateness_mean += delta / self._samples
+        self._lateness_m2 += delta * (lateness - self._lateness_mean)
+        self._lateness_max = max(self._lateness_max, lateness)
+
+    def __iter__(self) -> Iterator[float]:
+        """
+        Sampling ticks
+        :return: Generator of tick times (monotonic clock)
+        """
+        self._start = deadline = monotonic()
+        stop_at = self._start + self.duration if self.duration else None
+
+        while True:
+            now = self._wait(deadline) if self.interval else monotonic()
+            if stop_at is not None and now >= stop_at:
+                break
+
+            if self.interval:
+                late = now - deadline
+                if late < self.interval:
+                    self._overrun = False
+
+                else:
+                    if not self._overrun:
+                        self._overruns += 1  # catch-up ticks don't count again
+                        self._overrun = True
+
+                    if self.policy == Sampler.SKIP:
+                        skip = int(late / self.interval)
+                        self._skipped += skip
+                        deadline += skip * self.interval
+
+                self._account(now - deadline)
+                deadline += self.interval
+
+            else:
+                self._account(0.0)
+
+            self._last = now
+            yield now
+
+    def stats(self) -> Dict:
+        """
+        Sampling statistics
+        :return: Number of samples, achieved rate [Hz], mean and maximal tick
+                 lateness [s], jitter (tick lateness std. deviation) [s],
+                 number of overruns and skipped ticks
+        """
+        elapsed = self._last - self._start if self._samples > 1 else 0.0
+
+        return {
+            "samples" : self._samples,
+            "rate" : (self._samples - 1) / elapsed if elapsed > 0.0 else None,
+            "lateness" : self._lateness_mean,
+            "max_lateness" : self._lateness_max,
+            "jitter" : sqrt(self._lateness_m2 / self._samples) if self._samples else 0.0,
+            "overruns" : self._overruns,
+            "skipped" : self._skipped,
+        }
@@ -0,0 +1,800 @@
+"""
+Simulated hardware backends
+
+Drop-in replacements for the hardware access libraries used by the controllers
+(`RPi.GPIO`, GPIO character device edge events, the `mpu6050` I2C driver
+and 1-Wire thermometers),
+so that the controllers may be instantiated and profiled off-Pi (on developer
+machines and CI).
+
+Bus and port timing is modelled after Raspberry Pi Zero (default I2C clock
+of 100 kHz, Python-level call overheads of the hardware libraries).
+The model is simple but it makes sure that the simulated transactions take
+roughly as long as on the real HW, including mutual exclusion of transactions
+on the same I2C bus (also among controller worker processes).
+"""
+
+from typing import Dict, List, Tuple, Union, Iterable
+from abc import ABC, abstractmethod
+from multiprocessing import Lock, synchronize
+from time import perf_counter, sleep, monotonic
+from math import sin, pi
+from random import Random
+
+import numpy as np
+
+
+def _wait(duration: float, spin: float = 200e-6) -> None:
+    """
+    Wait for specified time
+    Sleeping isn't precise enough for short waits, so the last bit of
+    the wait is done by spinning.
+    :param duration: Wait duration [s]
+    :param spin: Spin (rather than sleep) for at most this long [s]
+    """
+    deadline = perf_counter() + duration
+    if duration > spin:
+        sleep(duration - spin)
+
+    while perf_counter() < deadline:
+        pass
+
+
+class GPIO:
+    """
+    Simulated RPi.GPIO module
+    Provides (the used subset of) the RPi.GPIO module interface.
+    """
+
+    BOARD = 10
+    BCM = 11
+
+    OUT = 0
+    IN = 1
+
+    LOW = 0
+    HIGH = 1
+
+    PUD_OFF = 20
+    PUD_DOWN = 21
+    PUD_UP = 22
+
+    def __init__(self, write_latency: float = 8e-6, read_latency: float = 6e-6):
+        """
+        :param write_latency: Port write latency (per channel) [s]
+                              (RPi.GPIO.output call from Python on RPi Zero)
+        :param read_latency: Port read latency [s]
+        """
+        self._write_latency = write_latency
+        self._read_latency = read_latency
+        self._mode: int = None
+        self._channels: Dict[int, Dict] = {}
+
+        self.writes = 0  # number of channel writes done
+
+    def setwarnings(self, flag: bool) -> None:
+        pass
+
+    def setmode(self, mode: int) -> None:
+        self._mode = mode
+
+    def setup(self, channel: Union[int, Iterable[int]], direction: int,
+        pull_up_down: int = PUD_OFF, initial: int = None) -> None:
+        """
+        Set up channel(s)
+        :param channel: Channel or list of channels
+        :param direction: GPIO.IN or GPIO.OUT
+        :param pull_up_down: Pull-up/pull-down resistor setting
+        :param initial: Initial output value
+        """
+        assert self._mode is not None, "GPIO mode not set"
+        for ch in ([channel] if isinstance(channel, int) else channel):
+            self._channels[ch] = {
+                "direction" : direction,
+                "value" : GPIO.HIGH if pull_up_down == GPIO.PUD_UP else GPIO.LOW,
+            }
+            if direction == GPIO.OUT and initial is not None:
+                self._channels[ch]["value"] = initial
+
+    def output(self, channel: Union[int, Iterable[int]],
+        value: Union[int, Iterable[int]]) -> None:
+        """
+        Set output channel(s) value(s)
+        Channels are written one by one (as RPi.GPIO does).
+        :param channel: Channel or list of channels
+        :param value: Value or list of values (one per channel)
+        """
+        channels = [channel] if isinstance(channel, int) else list(channel)
+        values = [value] * len(channels) if isinstance(value, int) else list(value)
+        assert len(values) == len(channels)
+
+        for ch, val in zip(channels, values):
+            assert self._channels[ch]["direction"] == GPIO.OUT, \
+                f"Channel {ch} not set up for output"
+            _wait(self._write_latency)
+            self._channels[ch]["value"] = GPIO.HIGH if val else GPIO.LOW
+            self.writes += 1
+
+    def input(self, channel: int) -> int:
+        """
+        :param channel: Channel
+        :return: Channel value
+        """
+        _wait(self._read_latency)
+        return self._channels[channel]["value"]
+
+    def cleanup(self, channel: Union[int, Iterable[int]] = None) -> None:
+        """
+        Reset channel(s)
+        :param channel: Channel or list of channels (all if None)
+        """
+        if channel is None:
+            self._channels = {}
+        else:
+            for ch in ([channel] if isinstance(channel, int) else channel):
+                self._channels.pop(ch, None)
+
+
+class EdgeEvents:
+    """
+    Simulated GPIO edge events source
+    Provides the edge events source interface (see gpio_input.Chardev).
+    Inputs are driven by pulse trains (e.g. flow meter, with period jitter),
+    each edge may be followed by contact bounces.
+    """
+
+    def __init__(self, lines: List[Dict], batch: float = 0.005,
+        signals: Dict[str, Dict] = {}, seed: int = 0):
+        """
+        :param lines: Requested lines ({"channel": BCM channel, "edge": "rising",
+                      "falling" or "both"}, see gpio_input.Chardev)
+        :param batch: Events are delivered in batches (each batch seconds)
+        :param signals: Pulse trains (by channel number), e.g.
+                        {"17": {"frequency": 1000.0, "duty": 0.5, "jitter": 0.01,
+                        "bounce": 2, "bounce_time": 0.001}}
+                        (jitter is relative to the period, each edge is followed
+                        by bounce pairs of spurious edges within bounce_time)
+        :param seed: Random generator seed
+        """
+        self._batch = batch
+        self._rng = np.random.default_rng(seed)
+        self._t0 = monotonic()
+        self._t = self._t0
+
+        self._lines: List[Dict] = []
+        for line in lines:
+            signal = signals.get(str(line["channel"]))
+            self._lines.append({
+                "rising" : line.get("edge", "rising") in ("rising", "both"),
+                "falling" : line.get("edge", "rising") in ("falling", "both"),
+                "signal" : None if signal is None else dict({
+                    "duty" : 0.5, "jitter" : 0.0, "bounce" : 0, "bounce_time" : 0.001,
+                }, **signal),
+                "next" : 0,  # next period index
+                "pending" : (np.empty(0), np.empty(0, dtype=bool)),  # edges after the batch
+            })
+
+    def _edges(self, line: Dict, until: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Generate pulse train edges till time
+        Edges of the started periods which are past the time limit are kept
+        for the next batch (so that events are delivered in time order).
+        :param line: Line
+        :param until: Time limit
+        :return: Edge times and rising flags
+        """
+        signal = line["signal"]
+        period = 1.0 / signal["frequency"]
+        high = signal["duty"] * period
+
+        end = int((until - self._t0) / period) + 1
+        ks = np.arange(line["next"], max(line["next"], end))
+        line["next"] += len(ks)
+
+        rising = self._t0 + ks * period + \
+            self._rng.normal(0.0, signal["jitter"] * period, len(ks))
+        edges = [(rising, True), (rising + high, False)]
+
+        for _ in range(int(signal["bounce"])):  # spurious opposite & repeated edges
+            for times, direction in ((rising, True), (rising + high, False)):
+                offset = self._rng.uniform(0.0, signal["bounce_time"], (2, len(ks)))
+                offset.sort(axis=0)
+                edges += [(times + offset[0], not direction), (times + offset[1], direction)]
+
+        pending_times, pending_flags = line["pending"]
+        times = np.concatenate([pending_times] + [t for t, _ in edges])
+        flags = np.concatenate([pending_flags] + [np.full(len(t), d) for t, d in edges])
+        order = np.argsort(times, kind="stable")
+        times, flags = times[order], flags[order]
+
+        due = np.searchsorted(times, until, side="right")
+        line["pending"] = times[due:], flags[due:]
+        return times[:due], flags[:due]
+
+    def read(self, timeout: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Wait for batch of events
+        :param timeout: Max. waiting time [s] (if there are no events)
+        :return: Event times (monotonic clock), line indices and rising flags
+        """
+        signals = any(line["signal"] is not None for line in self._lines)
+        sleep(max(0.0, self._t + (self._batch if signals else timeout) - monotonic()))
+        self._t = monotonic()
+
+        parts = [(np.empty(0), np.empty(0, dtype=int), np.empty(0, dtype=bool))]
+        for i, line in enumerate(self._lines):
+            if line["signal"] is None:
+                continue
+
+            t, r = self._edges(line, self._t)
+            mask = (r & line["rising"]) | (~r & line["falling"])
+            parts.append((t[mask], np.full(mask.sum(), i), r[mask]))
+
+        times, index, rising = (np.concatenate(part) for part in zip(*parts))
+        order = np.argsort(times, kind="stable")
+        return times[order], index[order], rising[order]
+
+    def level(self, i: int) -> int:
+        """
+        :param i: Line index
+        :return: Current line level
+        """
+        signal = self._lines[i]["signal"]
+        if signal is None:
+            return 0
+
+        period = 1.0 / signal["frequency"]
+        return int((monotonic() - self._t0) % period < signal["duty"] * period)
+
+    def close(self) -> None:
+        pass
+
+
+class I2CDevice(ABC):
+    """
+    Simulated I2C device (register map)
+    """
+
+    @abstractmethod
+    def read(self, register: int) -> int:
+        """
+        :param register: Register address
+        :return: Register value
+        """
+
+    def read_block(self, register: int, length: int) -> List[int]:
+        """
+        Block read (of subsequent registers by default)
+        :param register: Register address
+        :param length: Number of bytes
+        :return: Data
+        """
+        return [self.read(register + i) for i in range(length)]
+
+    @abstractmethod
+    def write(self, register: int, value: int) -> None:
+        """
+        :param register: Register address
+        :param value: Written value
+        """
+
+
+class SMBus:
+    """
+    Simulated SMBus (I2C bus)
+
+    Provides (the used subset of) the smbus.SMBus interface.
+    Each transaction occupies the bus for the time it would take on the wire
+    (plus the per-transaction software overhead).
+    Transactions on the same bus number are mutually exclusive, even among
+    processes (as long as the bus is created before the processes fork).
+    """
+
+    # Bus locks and attached devices (per bus number)
+    _locks: Dict[int, synchronize.Lock] = {}
+    _devices: Dict[Tuple[int, int], I2CDevice] = {}
+
+    def __init__(self, bus: int = 1, clock: float = 100e3, overhead: float = 60e-6):
+        """
+        :param bus: Bus number
+        :param clock: Bus clock frequency [Hz]
+        :param overhead: Software overhead per transaction [s]
+                         (ioctl and Python call on RPi Zero)
+        """
+        self.bus = bus
+        self._bit_time = 1.0 / clock
+        self._overhead = overhead
+
+        if bus not in SMBus._locks:
+            SMBus._locks[bus] = Lock()
+        self._lock = SMBus._locks[bus]
+
+        self.transactions = 0  # number of transactions done
+        self.busy = 0.0        # time spent by transactions [s]
+        self.contention = 0.0  # time spent waiting for the bus [s]
+
+    @staticmethod
+    def attach(bus: int, address: int, device: I2CDevice) -> None:
+        """
+        Attach device to bus
+        :param bus: Bus number
+        :param address: Device address
+        :param device: Device
+        """
+        SMBus._devices[(bus, address)] = device
+
+    def _device(self, address: int) -> I2CDevice:
+        device = SMBus._devices.get((self.bus, address))
+        if device is None:
+            raise OSError(121, f"Remote I/O error (no device at 0x{address:02x})")
+
+        return device
+
+    def _transaction(self, bits: int) -> None:
+        """
+        Occupy the bus for a transaction
+        :param bits: Number of bits transferred (incl. start/stop conditions
+                     and ACKs)
+        """
+        duration = self._overhead + bits * self._bit_time
+
+        wait_start = perf_counter()
+        with self._lock:
+            self.contention += perf_counter() - wait_start
+            _wait(duration)
+
+        self.transactions += 1
+        self.busy += duration
+
+    # Each transferred byte takes 9 bits (8 data bits and ACK),
+    # start, repeated start and stop conditions take 1 bit time each.
+
+    def read_byte_data(self, address: int, register: int) -> int:
+        self._transaction(1 + 9 + 9 + 1 + 9 + 9 + 1)
+        return self._device(address).read(register)
+
+    def write_byte_data(self, address: int, register: int, value: int) -> None:
+        self._transaction(1 + 9 + 9 + 9 + 1)
+        self._device(address).write(register, value)
+
+    def read_i2c_block_data(self, address: int, register: int, length: int = 32) -> List[int]:
+        assert 0 < length <= 32, "SMBus block length is limited to 32 bytes"
+        self._transaction(1 + 9 + 9 + 1 + 9 + 9 * length + 1)
+        return self._device(address).read_block(register, length)
+
+    def write_i2c_block_data(self, address: int, register: int, data: List[int]) -> None:
+        assert 0 < len(data) <= 32, "SMBus block length is limited to 32 bytes"
+        self._transaction(1 + 9 + 9 + 9 * len(data) + 1)
+        device = self._device(address)
+        for i, value in enumerate(data):
+            device.write(register + i, value)
+
+    def close(self) -> None:
+        pass
+
+
+class MPU6050Device(I2CDevice):
+    """
+    Simulated MPU6050 accelerometer & gyroscope (register map)
+
+    Produces synthetic signals: gravity along the Z axis with a vibration
+    along the X and Y axes, slow rotation around the Z axis and white noise.
+    Sensor samples are updated at the configured sample rate (see SMPLRT_DIV
+    and CONFIG registers), the FIFO is supported.
+    """
+
+    SMPLRT_DIV = 0x19
+    CONFIG = 0x1A
+    GYRO_CONFIG = 0x1B
+    ACCEL_CONFIG = 0x1C
+    FIFO_EN = 0x23
+    INT_STATUS = 0x3A
+    ACCEL_XOUT0 = 0x3B
+    GYRO_ZOUT1 = 0x48
+    USER_CTRL = 0x6A
+    PWR_MGMT_1 = 0x6B
+    FIFO_COUNTH = 0x72
+    FIFO_COUNTL = 0x73
+    FIFO_R_W = 0x74
+    WHO_AM_I = 0x75
+
+    FIFO_SIZE = 1024
+
+    def __init__(self,
+        vibration_hz: float = 50.0,
+        vibration_g: float = 0.2,
+        rotation_dps: float = 5.0,
+        noise_g: float = 0.01,
+        noise_dps: float = 0.5,
+        seed: int = None):
+        """
+        :param vibration_hz: Vibration frequency [Hz]
+        :param vibration_g: Vibration amplitude [g]
+        :param rotation_dps: Rotation amplitude [deg/s]
+        :param noise_g: Accelerometer noise standard deviation [g]
+        :param noise_dps: Gyroscope noise standard deviation [deg/s]
+        :param seed: Noise generator seed
+        """
+        self._vibration_hz = vibration_hz
+        self._vibration_g = vibration_g
+        self._rotation_dps = rotation_dps
+        self._noise_g = noise_g
+        self._noise_dps = noise_dps
+        self._random = Random(seed)
+
+        self._regs = bytearray(0x80)
+        self._regs[MPU6050Device.PWR_MGMT_1] = 0x40  # sleep mode after reset
+        self._regs[MPU6050Device.WHO_AM_I] = 0x68
+
+        self._t0 = monotonic()
+        self._sample_no: int = None
+
+        self._fifo = bytearray()
+        self._fifo_t0 = self._t0
+        self._fifo_samples = 0
+        self._fifo_count = 0  # latched FIFO count
+
+    @staticmethod
+    def _raw(value: float, sensitivity: float) -> Tuple[int, int]:
+        """
+        Convert value to raw register representation (big endian 16b int)
+        :param value: Measured value
+        :param sensitivity: Sensor sensitivity [LSB/unit]
+        :return: High and low byte
+        """
+        raw = max(-0x8000, min(0x7fff, round(value * sensitivity))) & 0xffff
+        return raw >> 8, raw & 0xff
+
+    def sample(self, t: float) -> Tuple[Tuple[float, float, float], Tuple[float, float, float]]:
+        """
+        Synthetic signals
+        :param t: Time [s]
+        :return: Acceleration [g] and angular velocity [deg/s] (X, Y, Z)
+        """
+        gauss = self._random.gauss
+        phase = 2 * pi * self._vibration_hz * t
+
+        accel = (
+            self._vibration_g * sin(phase) + gauss(0.0, self._noise_g),
+            0.5 * self._vibration_g * sin(2 * phase + 1.0) + gauss(0.0, self._noise_g),
+            1.0 + gauss(0.0, self._noise_g),
+        )
+        gyro = (
+            gauss(0.0, self._noise_dps),
+            gauss(0.0, self._noise_dps),
+            self._rotation_dps * sin(2 * pi * 0.1 * t) + gauss(0.0, self._noise_dps),
+        )
+        return accel, gyro
+
+    def _rate(self) -> float:
+        """
+        :return: Sample rate [Hz]
+        """
+        dlpf = self._regs[MPU6050Device.CONFIG] & 0x7
+        gyro_rate = 8000.0 if dlpf in (0, 7) else 1000.0
+        return gyro_rate / (1 + self._regs[MPU6050Device.SMPLRT_DIV])
+
+    def _data(self, t: float) -> bytes:
+        """
+        Data registers content (accelerometer, temperature and gyroscope)
+        :param t: Time [s]
+        :return: Data registers content
+        """
+        accel, gyro = self.sample(t)
+
+        accel_sens = 16384.0 / (1 << ((self._regs[MPU6050Device.ACCEL_CONFIG] >> 3) & 0x3))
+        gyro_sens = 131.0 / (1 << ((self._regs[MPU6050Device.GYRO_CONFIG] >> 3) & 0x3))
+        temp = 25.0  # [deg C]
+
+        data: List[int] = []
+        for value in accel:
+            data.extend(MPU6050Device._raw(value, accel_sens))
+        data.extend(MPU6050Device._raw(temp - 36.53, 340.0))
+        for value in gyro:
+            data.extend(MPU6050Device._raw(value, gyro_sens))
+
+        return bytes(data)
+
+    def _update(self) -> None:
+        """
+        Update data registers (if a new sample is due)
+        """
+        rate = self._rate()
+        sample_no = int((monotonic() - self._t0) * rate)
+        if sample_no == self._sample_no:
+            return
+
+        self._sample_no = sample_no
+        self._regs[MPU6050Device.ACCEL_XOUT0:MPU6050Device.GYRO_ZOUT1 + 1] = \
+            self._data(sample_no / rate)
+
+    def _fifo_frame(self, data: bytes) -> bytes:
+        """
+        FIFO frame (data enabled in FIFO_EN register, in register order)
+        :param data: Data registers content
+        :return: FIFO frame
+        """
+        fifo_en = self._regs[MPU6050Device.FIFO_EN]
+        frame = b""
+        if fifo_en & 0x08:
+            frame += data[0:6]    # accelerometer X, Y, Z
+        if fifo_en & 0x80:
+            frame += data[6:8]    # temperature
+        if fifo_en & 0x40:
+            frame += data[8:10]   # gyroscope X
+        if fifo_en & 0x20:
+            frame += data[10:12]  # gyroscope Y
+        if fifo_en & 0x10:
+            frame += data[12:14]  # gyroscope Z
+
+        return frame
+
+    def _fifo_fill(self) -> None:
+        """
+        Push samples produced since the last fill to FIFO
+        """
+        if not self._regs[MPU6050Device.USER_CTRL] & 0x40:
+            return  # FIFO disabled
+
+        frame_size = len(self._fifo_frame(bytes(14)))
+        if frame_size == 0:
+            return  # no data enabled
+
+        rate = self._rate()
+        due = int((monotonic() - self._fifo_t0) * rate)
+
+        # Don't bother producing samples which would be overwritten anyway
+        first = max(self._fifo_samples, due - MPU6050Device.FIFO_SIZE // frame_size - 1)
+        lost = first > self._fifo_samples
+        for sample_no in range(first, due):
+            t = self._fifo_t0 - self._t0 + (sample_no + 1) / rate
+            self._fifo += self._fifo_frame(self._data(t))
+
+        self._fifo_samples = due
+
+        overflow = len(self._fifo) - MPU6050Device.FIFO_SIZE
+        if overflow > 0 or lost:
+            del self._fifo[:max(overflow, 0)]  # oldest data are lost
+            self._regs[MPU6050Device.INT_STATUS] |= 0x10
+
+    def _fifo_reset(self) -> None:
+        self._fifo = bytearray()
+        self._fifo_t0 = monotonic()
+        self._fifo_samples = 0
+
+    def read(self, register: int) -> int:
+        # Update data on high byte reads (so that words don't get torn)
+        if MPU6050Device.ACCEL_XOUT0 <= register <= MPU6050Device.GYRO_ZOUT1 and \
+            (register - MPU6050Device.ACCEL_XOUT0) % 2 == 0:
+            self._update()
+
+        elif register == MPU6050Device.INT_STATUS:
+            self._fifo_fill()
+            value = self._regs[register]
+            self._regs[register] = 0  # cleared on read
+            return value
+
+        elif register == MPU6050Device.FIFO_COUNTH:
+            self._fifo_fill()
+            self._fifo_count = len(self._fifo)
+            return self._fifo_count >> 8
+
+        elif register == MPU6050Device.FIFO_COUNTL:
+            return self._fifo_count & 0xff
+
+        elif register == MPU6050Device.FIFO_R_W:
+            return self.read_block(register, 1)[0]
+
+        return self._regs[register]
+
+    def read_block(self, register: int, length: int) -> List[int]:
+        if register != MPU6050Device.FIFO_R_W:
+            return super().read_block(register, length)
+
+        # FIFO read doesn't auto-increment register address
+        self._fifo_fill()
+        data = list(self._fifo[:length])
+        del self._fifo[:length]
+
+        return data + [0] * (length - len(data))
+
+    def write(self, register: int, value: int) -> None:
+        value &= 0xff
+
+        if register in (MPU6050Device.SMPLRT_DIV, MPU6050Device.CONFIG,
+            MPU6050Device.FIFO_EN, MPU6050Device.USER_CTRL):
+            self._fifo_fill()  # samples produced with the previous settings
+
+            fifo_enabled = self._regs[MPU6050Device.USER_CTRL] & 0x40
+            if register == MPU6050Device.USER_CTRL:
+                if value & 0x04 or (value & 0x40 and not fifo_enabled):
+                    self._fifo_reset()
+                value &= ~0x04  # reset bit is cleared automatically
+
+            self._fifo_t0 = monotonic()
+            self._fifo_samples = 0
+
+        self._regs[register] = value
+
+
+class MPU6050:
+    """
+    Simulated MPU6050 driver
+    Provides the `mpu6050.mpu6050` driver interface, the bus transactions
+    are the same as those done by the real driver.
+    """
+
+    GRAVITIY_MS2 = 9.80665
+
+    ACCEL_SCALE_MODIFIER_2G = 16384.0
+    ACCEL_SCALE_MODIFIER_4G = 8192.0
+    ACCEL_SCALE_MODIFIER_8G = 4096.0
+    ACCEL_SCALE_MODIFIER_16G = 2048.0
+
+    GYRO_SCALE_MODIFIER_250DEG = 131.0
+    GYRO_SCALE_MODIFIER_500DEG = 65.5
+    GYRO_SCALE_MODIFIER_1000DEG = 32.8
+    GYRO_SCALE_MODIFIER_2000DEG = 16.4
+
+    ACCEL_RANGE_2G = 0x00
+    ACCEL_RANGE_4G = 0x08
+    ACCEL_RANGE_8G = 0x10
+    ACCEL_RANGE_16G = 0x18
+
+    GYRO_RANGE_250DEG = 0x00
+    GYRO_RANGE_500DEG = 0x08
+    GYRO_RANGE_1000DEG = 0x10
+    GYRO_RANGE_2000DEG = 0x18
+
+    PWR_MGMT_1 = 0x6B
+    PWR_MGMT_2 = 0x6C
+
+    ACCEL_XOUT0 = 0x3B
+    ACCEL_YOUT0 = 0x3D
+    ACCEL_ZOUT0 = 0x3F
+
+    TEMP_OUT0 = 0x41
+
+    GYRO_XOUT0 = 0x43
+    GYRO_YOUT0 = 0x45
+    GYRO_ZOUT0 = 0x47
+
+    ACCEL_CONFIG = 0x1C
+    GYRO_CONFIG = 0x1B
+
+    _accel_scale = {
+        ACCEL_RANGE_2G  : (2, ACCEL_SCALE_MODIFIER_2G),
+        ACCEL_RANGE_4G  : (4, ACCEL_SCALE_MODIFIER_4G),
+        ACCEL_RANGE_8G  : (8, ACCEL_SCALE_MODIFIER_8G),
+        ACCEL_RANGE_16G : (16, ACCEL_SCALE_MODIFIER_16G),
+    }
+
+    _gyro_scale = {
+        GYRO_RANGE_250DEG  : (250, GYRO_SCALE_MODIFIER_250DEG),
+        GYRO_RANGE_500DEG  : (500, GYRO_SCALE_MODIFIER_500DEG),
+        GYRO_RANGE_1000DEG : (1000, GYRO_SCALE_MODIFIER_1000DEG),
+        GYRO_RANGE_2000DEG : (2000, GYRO_SCALE_MODIFIER_2000DEG),
+    }
+
+    def __init__(self, address: int, bus: int = 1, clock: float = 100e3, **kwargs):
+        """
+        :param address: Device address
+        :param bus: Bus number
+        :param clock: Bus clock frequency [Hz]
+        :param kwargs: Simulated device parameters (see MPU6050Device)
+        """
+        SMBus.attach(bus, address, MPU6050Device(**kwargs))
+
+        self.address = address
+        self.bus = SMBus(bus, clock)
+        self.bus.write_byte_data(self.address, self.PWR_MGMT_1, 0x00)
+
+    def read_i2c_word(self, register: int) -> int:
+        high = self.bus.read_byte_data(self.address, register)
+        low = self.bus.read_byte_data(self.address, register + 1)
+
+        value = (high << 8) + low
+        return value - 0x10000 if value >= 0x8000 else value
+
+    def get_temp(self) -> float:
+        return self.read_i2c_word(self.TEMP_OUT0) / 340.0 + 36.53
+
+    def set_accel_range(self, accel_range: int) -> None:
+        self.bus.write_byte_data(self.address, self.ACCEL_CONFIG, 0x00)
+        self.bus.write_byte_data(self.address, self.ACCEL_CONFIG, accel_range)
+
+    def read_accel_range(self, raw: bool = False) -> int:
+        raw_data = self.bus.read_byte_data(self.address, self.ACCEL_CONFIG)
+        if raw:
+            return raw_data
+
+        return MPU6050._accel_scale.get(raw_data, (-1, None))[0]
+
+    def get_accel_data(self, g: bool = False) -> Dict[str, float]:
+        x = self.read_i2c_word(self.ACCEL_XOUT0)
+        y = self.read_i2c_word(self.ACCEL_YOUT0)
+        z = self.read_i2c_word(self.ACCEL_ZOUT0)
+
+        scale = MPU6050._accel_scale.get(
+            self.read_accel_range(True), (None, self.ACCEL_SCALE_MODIFIER_2G))[1]
+        if not g:
+            scale /= self.GRAVITIY_MS2
+
+        return {"x" : x / scale, "y" : y / scale, "z" : z / scale}
+
+    def set_gyro_range(self, gyro_range: int) -> None:
+        self.bus.write_byte_data(self.address, self.GYRO_CONFIG, 0x00)
+        self.bus.write_byte_data(self.address, self.GYRO_CONFIG, gyro_range)
+
+    def read_gyro_range(self, raw: bool = False) -> int:
+        raw_data = self.bus.read_byte_data(self.address, self.GYRO_CONFIG)
+        if raw:
+            return raw_data
+
+        return MPU6050._gyro_scale.get(raw_data, (-1, None))[0]
+
+    def get_gyro_data(self) -> Dict[str, float]:
+        x = self.read_i2c_word(self.GYRO_XOUT0)
+        y = self.read_i2c_word(self.GYRO_YOUT0)
+        z = self.read_i2c_word(self.GYRO_ZOUT0)
+
+        scale = MPU6050._gyro_scale.get(
+            self.read_gyro_range(True), (None, self.GYRO_SCALE_MODIFIER_250DEG))[1]
+
+        return {"x" : x / scale, "y" : y / scale, "z" : z / scale}
+
+    def get_all_data(self) -> List:
+        return [self.get_accel_data(), self.get_gyro_data(), self.get_temp()]
+
+
+class DS18B20:
+    """
+    Simulated DS18B20 1-Wire thermometer
+    Provides the sensor interface of thermometer.W1 (reads block for
+    the conversion time of the set resolution, e.g. 750 ms at 12 bits).
+    The temperature slowly oscillates around the base value (with noise).
+    """
+
+    def __init__(self, sensor: str = "28-000000000001", temperature: float = 21.0,
+        swing: float = 0.5, period: float = 600.0, noise: float = 0.02, seed: int = None):
+        """
+        :param sensor: Sensor ID
+        :param temperature: Base temperature [deg C]
+        :param swing: Oscillation amplitude [deg C]
+        :param period: Oscillation period [s]
+        :param noise: Noise std. deviation [deg C]
+        :param seed: Random generator seed
+        """
+        self.sensor = sensor
+        self._temperature = temperature
+        self._swing = swing
+        self._period = period
+        self._noise = noise
+        self._rng = Random(seed)
+        self._resolution = 12
+        self.conversions = 0  # number of conversions done
+
+    def read(self) -> float:
+        """
+        Convert and read temperature
+        :return: Temperature [deg C]
+        """
+        sleep(0.09375 * 2 ** (self._resolution - 9))
+        self.conversions += 1
+
+        value = self._temperature + self._swing * sin(2.0 * pi * monotonic() / self._period) + \
+            self._rng.gauss(0.0, self._noise)
+        step = 0.5 / 2 ** (self._resolution - 9)
+        return round(value / step) * step
+
+    def resolution(self) -> int:
+        """
+        :return: Conversion resolution [bits]
+        """
+        return self._resolution
+
+    def set_resolution(self, bits: int) -> None:
+        """
+        :param bits: Conversion resolution [bits]
+        """
+        self._resolution = bits
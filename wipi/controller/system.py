@@ -1,23 +1,47 @@
-from typing import Dict
+from typing import Dict, List, Iterator, Tuple
 from os import system
+from threading import Event, Lock
+import math
+
+import numpy as np
+
+from wipi.log import get_logger
 
 from . import Controller
+from .sampler import Sampler
+from .block import sample_chunks
+from .telemetry import Telemetry
+
+
+log = get_logger(__name__)
 
 
 class System(Controller):
     """
     Controller of the Raspberry Pi itself
+
+    Besides power control, the controller provides the system telemetry
+    (see wipi.controller.telemetry) in its state and as samples (for
+    downstream and continuous acquisition).
+    The controller is thread safe (telemetry sources are read by pread).
     """
 
-    def __init__(self, name: str):
+    concurrency = Controller.THREAD_SAFE
+
+    def __init__(self, name: str, telemetry: Dict = {}):
         """
         :param name: Controller name
+        :param telemetry: Telemetry parameters (see Telemetry)
         """
         super().__init__(name)
         self._state: Dict = {
             "power": "on",
         }
 
+        self._telemetry = Telemetry(**telemetry)
+        self._snapshot = self._telemetry.snapshot()  # get_state reference
+        self._lock = Lock()  # get_state reference update
+
     def _power(self, state: str) -> None:
         """
         Control power state
@@ -33,9 +57,20 @@ class System(Controller):
 
     def get_state(self) -> Dict:
         """
-        :return: Current machine state
+        :return: Current machine state, incl. telemetry (counters are
+                 differentiated since the previous get_state)
         """
-        return self._state
+        with self._lock:
+            snapshot = self._telemetry.snapshot()
+            values = self._telemetry.metrics(snapshot, self._snapshot)
+            self._snapshot = snapshot
+
+        telemetry: Dict = {}
+        for channel, value in zip(self._telemetry.channels, values.tolist()):
+            group, metric = channel.split('.')
+            telemetry.setdefault(group, {})[metric] = None if math.isnan(value) else value
+
+        return dict(self._state, telemetry=telemetry)
 
     def set_state(self, state: Dict) -> Dict:
         """
@@ -47,3 +82,86 @@ class System(Controller):
             self._power(power_state)
 
         return self.get_state()
+
+    def channels(self, query: Dict) -> List[str]:
+        """
+        :param query: Sampling query (may list "metrics" groups,
+                      e.g. ["cpu", "memory"]; all by default)
+        :return: Sampled channels
+        """
+        groups = query.get("metrics")
+        return [
+            channel for channel in self._telemetry.channels
+            if groups is None or channel.split('.')[0] in groups
+        ]
+
+    def blocks(self, query: Dict, stop: Event) -> Iterator[Tuple[float, np.ndarray, np.ndarray]]:
+        """
+        Sample telemetry
+        :param query: Sampling query: "interval" [s] (default: 1), "duration" [s],
+                      "metrics" (see channels)
+        :param stop: Stop sampling when set
+        :return: Generator of sampling ticks and sample blocks (single samples)
+        """
+        channels = self.channels(query)
+        columns = [self._telemetry.channels.index(channel) for channel in channels]
+        sampler = Sampler(
+            interval=query.get("interval", 1.0),
+            duration=query.get("duration", 0.0) or None,
+            policy=query.get("policy", Sampler.SKIP))
+
+        prev = None  # the first tick only takes the reference snapshot
+        for tick in sampler:
+            if stop.is_set():
+                break
+
+            snapshot = self._telemetry.snapshot()
+            if prev is not None:
+                values = self._telemetry.metrics(snapshot, prev)[columns]
+                yield tick, np.array([snapshot[0]]), values.reshape(1, -1)
+            prev = snapshot
+
+        log.info(f"{self.name}: Sampling finished: {sampler.stats()}")
+
+    def downstream(self, query: Dict) -> Iterator[Dict]:
+        """
+        Downstream telemetry
+
+        Telemetry is sampled in the query "interval" (see blocks); if continuous
+        acquisition is running, the stream consists of the acquired samples
+        instead.
+        Metrics which aren't available are null.
+
+        :param query: Query
+        :return: Generator of data chunks
+        """
+        channels = self.channels(query)
+
+        if self.acquisition is not None:
+            columns = [
+                self.acquisition.channels.index(channel) for channel in channels
+                if channel in self.acquisition.channels
+            ]
+            channels = [self.acquisition.channels[i] for i in columns]
+            subscription = self.acquisition.subscribe()
+            blocks: Iterator[Tuple[float, np.ndarray, np.ndarray]] = (
+                (tick, times, values[:, columns])
+                for tick, times, values in subscription.blocks(query.get("duration", 0.0) or None))
+        else:
+            blocks = self.blocks(query, Event())
+
+        for _, times, values in blocks:
+            for chunk in sample_chunks(times, values, channels):
+                for group in chunk.values():
+                    if isinstance(group, dict):
+                        for metric, value in group.items():
+                            if math.isnan(value):
+                                group[metric] = None
+                yield chunk
+
+    def shutdown(self) -> None:
+        """
+        Stop acquisition, close telemetry sources
+        """
+        super().shutdown()
+        self._telemetry.close()
@@ -0,0 +1,292 @@
+"""
+System telemetry
+
+Metrics of the machine itself (CPU usage, load and frequency, memory, SoC
+temperature, throttling, Wi-Fi signal and network traffic) read from /proc
+and /sys.
+
+The collector is cheap enough to run at 10 Hz on RPi Zero:
+* the files are opened once and re-read by a single pread each (only
+  the needed prefix of larger files, e.g. the first line of /proc/stat),
+* nothing is spawned (no vcgencmd, iwconfig...),
+* counters (CPU time, network bytes) are kept raw and turned to usage
+  and rates by differences of subsequent snapshots.
+
+Sources which don't exist on the machine are left out (with their channels).
+Metrics which aren't available at the moment (e.g. Wi-Fi interface is down)
+are NaN.
+"""
+
+from typing import List, Tuple, Optional
+from abc import ABC, abstractmethod
+import glob
+import math
+import os
+from time import monotonic
+
+import numpy as np
+
+from wipi.log import get_logger
+
+
+log = get_logger(__name__)
+
+
+class Source(ABC):
+    """
+    Telemetry source (persistently opened file)
+    """
+
+    counters = False  # metrics are computed from differences of raw values
+
+    def __init__(self, path: str, size: int, channels: List[str]):
+        """
+        :param path: File path
+        :param size: Number of bytes read (file prefix)
+        :param channels: Metric channels (e.g. "cpu.usage")
+        """
+        self.path = path
+        self.channels = channels
+        self._size = size
+        self._fd = os.open(path, os.O_RDONLY)
+
+    def read(self) -> bytes:
+        """
+        :return: File content (prefix)
+        """
+        return os.pread(self._fd, self._size, 0)
+
+    @abstractmethod
+    def raw(self) -> Tuple:
+        """
+        :return: Raw values (counters and/or gauges) or None if not available
+        """
+
+    def metrics(self, raw: Tuple, prev: Tuple, elapsed: float) -> List[float]:
+        """
+        Metrics values
+        The default implementation passes gauges through.
+        :param raw: Current raw values
+        :param prev: Previous raw values (counters only)
+        :param elapsed: Time between the snapshots [s]
+        :return: Metric values (one per channel)
+        """
+        return list(raw)
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+class CPU(Source):
+    """
+    CPU usage and I/O wait (fractions of CPU time), from /proc/stat
+    """
+
+    counters = True
+
+    def __init__(self):
+        super().__init__("/proc/stat", 256, ["cpu.usage", "cpu.iowait"])
+
+    def raw(self) -> Tuple:
+        # cpu  user nice system idle iowait irq softirq steal ...
+        times = [int(t) for t in self.read().split(b'\n', 1)[0].split()[1:9]]
+        return sum(times), times[3] + times[4], times[4]
+
+    def metrics(self, raw: Tuple, prev: Tuple, elapsed: float) -> List[float]:
+        total = raw[0] - prev[0]
+        if total <= 0:
+            return [math.nan, math.nan]
+
+        return [1.0 - (raw[1] - prev[1]) / total, (raw[2] - prev[2]) / total]
+
+
+class Load(Source):
+    """
+    1 minute load average, from /proc/loadavg
+    """
+
+    def __init__(self):
+        super().__init__("/proc/loadavg", 64, ["cpu.load"])
+
+    def raw(self) -> Tuple:
+        return float(self.read().split(None, 1)[0]),
+
+
+class Frequency(Source):
+    """
+    CPU clock frequency [MHz], from cpufreq
+    """
+
+    def __init__(self, cpu: int = 0):
+        super().__init__(
+            f"/sys/devices/system/cpu/cpu{cpu}/cpufreq/scaling_cur_freq", 32, ["cpu.freq"])
+
+    def raw(self) -> Tuple:
+        return int(self.read()) / 1000.0,
+
+
+class Memory(Source):
+    """
+    Available memory [MiB] and used memory (fraction), from /proc/meminfo
+    """
+
+    def __init__(self):
+        super().__init__("/proc/meminfo", 128, ["memory.available", "memory.used"])
+
+    def raw(self) -> Tuple:
+        # MemTotal, MemFree and MemAvailable are the first 3 lines [kB]
+        lines = self.read().split(b'\n', 3)
+        total = int(lines[0].split()[1])
+        available = int(lines[2].split()[1])
+        return available / 1024.0, 1.0 - available / total
+
+
+class Temperature(Source):
+    """
+    Thermal zone temperature [deg C], from /sys/class/thermal
+    """
+
+    def __init__(self, zone: str):
+        """
+        :param zone: Thermal zone directory name (e.g. "thermal_zone0")
+        """
+        super().__init__(f"/sys/class/thermal/{zone}/temp", 16,
+            [f"temperature.{zone.replace('thermal_', '')}"])
+
+    def raw(self) -> Tuple:
+        return int(self.read()) / 1000.0,
+
+
+class Throttling(Source):
+    """
+    Under-voltage, frequency capping and throttling flags (as vcgencmd
+    get_throttled reports them), from the Raspberry Pi firmware driver
+    """
+
+    def __init__(self):
+        super().__init__(
+            "/sys/devices/platform/soc/soc:firmware/get_throttled", 16, ["throttled.flags"])
+
+    def raw(self) -> Tuple:
+        return int(self.read(), 16),
+
+
+class Wireless(Source):
+    """
+    Wi-Fi link quality and signal level [dBm], from /proc/net/wireless
+    """
+
+    def __init__(self, interface: str):
+        """
+        :param interface: Network interface
+        """
+        super().__init__("/proc/net/wireless", 1024, ["wifi.link", "wifi.level"])
+        self._prefix = interface.encode() + b':'
+
+    def raw(self) -> Tuple:
+        for line in self.read().split(b'\n')[2:]:
+            fields = line.split()
+            if fields and fields[0] == self._prefix:
+                return float(fields[2].rstrip(b'.')), float(fields[3].rstrip(b'.'))
+
+        return math.nan, math.nan  # interface is down
+
+
+class Network(Source):
+    """
+    Network interface traffic [B/s], from /proc/net/dev
+    """
+
+    counters = True
+
+    def __init__(self, interface: str):
+        """
+        :param interface: Network interface
+        """
+        super().__init__("/proc/net/dev", 4096, ["network.rx", "network.tx"])
+        self._prefix = interface.encode() + b':'
+
+    def raw(self) -> Tuple:
+        for line in self.read().split(b'\n')[2:]:
+            name, _, counters = line.strip().partition(b':')
+            if name + b':' == self._prefix:
+                fields = counters.split()
+                return int(fields[0]), int(fields[8])
+
+        return None  # interface is gone
+
+    def metrics(self, raw: Tuple, prev: Tuple, elapsed: float) -> List[float]:
+        if elapsed <= 0.0:
+            return [math.nan, math.nan]
+
+        return [(raw[0] - prev[0]) / elapsed, (raw[1] - prev[1]) / elapsed]
+
+
+class Telemetry:
+    """
+    System telemetry collector
+    """
+
+    def __init__(self, interface: str = "wlan0", cpu: int = 0):
+        """
+        :param interface: Network (Wi-Fi) interface
+        :param cpu: CPU which clock frequency is reported
+        """
+        factories = [
+            CPU, Load, lambda: Frequency(cpu), Memory,
+            *(lambda zone=zone: Temperature(zone) for zone in sorted(
+                os.path.basename(path)
+                for path in glob.glob("/sys/class/thermal/thermal_zone*"))),
+            Throttling, lambda: Wireless(interface), lambda: Network(interface),
+        ]
+
+        self._sources: List[Source] = []
+        for factory in factories:
+            try:
+                self._sources.append(factory())
+            except OSError as x:
+                log.debug(f"Telemetry source not available: {x}")
+
+        self.channels: List[str] = [
+            channel for source in self._sources for channel in source.channels]
+
+    def snapshot(self) -> Tuple[float, List[Optional[Tuple]]]:
+        """
+        Read all sources
+        :return: Snapshot time (monotonic clock) and raw values (per source;
+                 None if the source read failed)
+        """
+        raw: List[Optional[Tuple]] = []
+        for source in self._sources:
+            try:
+                raw.append(source.raw())
+            except (OSError, ValueError, IndexError):
+                raw.append(None)
+
+        return monotonic(), raw
+
+    def metrics(self, snapshot: Tuple[float, List], prev: Tuple[float, List]) -> np.ndarray:
+        """
+        Compute metrics
+        :param snapshot: Current snapshot
+        :param prev: Previous snapshot (counters are differentiated)
+        :return: Metric values (one per channel)
+        """
+        elapsed = snapshot[0] - prev[0]
+        values: List[float] = []
+        for source, raw, prev_raw in zip(self._sources, snapshot[1], prev[1]):
+            if raw is None or (source.counters and prev_raw is None):
+                values.extend([math.nan] * len(source.channels))
+            else:
+                values.extend(source.metrics(raw, prev_raw, elapsed))
+
+        return np.array(values, dtype=float)
+
+    def close(self) -> None:
+        """
+        Close the sources
+        """
+        for source in self._sources:
+            source.close()
+
+        self._sources = []
@@ -0,0 +1,213 @@
+"""
+DS18B20 1-Wire thermometer controller
+
+An asynchronous controller (see AsyncController): temperature conversion
+takes up to 750 ms (at 12 bit resolution), the worker serves other requests
+and streams meanwhile.
+The sensor is read via the kernel w1_therm driver (sysfs); reads block
+for the conversion, so they're done by the controller's own executor thread
+(one per sensor, so that conversions don't occupy the event loop's default
+executor).
+Concurrent readers (state requests, streams) share the conversion
+in progress.
+
+    "kwargs" : {"sensor": "28-0316a2791eff", "resolution": 11}
+"""
+
+from typing import Any, Dict, AsyncGenerator
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+import asyncio
+import glob
+import os
+
+from wipi.controller import AsyncController
+from wipi.log import get_logger
+
+from .sampler import timestamp
+
+
+log = get_logger(__name__)
+
+
+class W1:
+    """
+    DS18B20 sensor attached to the 1-Wire bus (w1_therm sysfs interface)
+    """
+
+    DEVICES = "/sys/bus/w1/devices"
+
+    def __init__(self, sensor: str = None):
+        """
+        :param sensor: Sensor ID (the first DS18B20 found if None)
+        """
+        if sensor is None:
+            sensors = sorted(glob.glob(os.path.join(W1.DEVICES, "28-*")))
+            if not sensors:
+                raise OSError(f"No DS18B20 sensor found in {W1.DEVICES}")
+            sensor = os.path.basename(sensors[0])
+
+        self.sensor = sensor
+        self._path = os.path.join(W1.DEVICES, sensor)
+
+    def _read(self, attribute: str) -> str:
+        with open(os.path.join(self._path, attribute)) as file:
+            return file.read().strip()
+
+    def read(self) -> float:
+        """
+        Convert and read temperature (blocks for the conversion)
+        :return: Temperature [deg C]
+        """
+        return int(self._read("temperature")) / 1000.0
+
+    def resolution(self) -> int:
+        """
+        :return: Conversion resolution [bits]
+        """
+        return int(self._read("resolution"))
+
+    def set_resolution(self, bits: int) -> None:
+        """
+        :param bits: Conversion resolution [bits]
+        """
+        with open(os.path.join(self._path, "resolution"), 'w') as file:
+            file.write(str(bits))
+
+
+def sensor(backend: str, **kwargs):
+    """
+    Thermometer sensor
+    :param backend: Backend name ("w1" or "simulator")
+    :param kwargs: Backend parameters
+    :return: Sensor (W1 or compatible object)
+    """
+    if backend == "w1":
+        return W1(**kwargs)
+
+    if backend == "simulator":
+        from .simulator import DS18B20
+        return DS18B20(**kwargs)
+
+    raise ValueError(f"Unknown thermometer backend: {backend}")
+
+
+class Thermometer(AsyncController):
+    """
+    DS18B20 thermometer
+    """
+
+    RESOLUTIONS = (9, 10, 11, 12)
+
+    def __init__(self, name: str, sensor: str = None, resolution: int = None,
+        backend: str = "w1", simulator: Dict = {}):
+        """
+        :param name: Controller name
+        :param sensor: Sensor ID (e.g. "28-0316a2791eff"; the first one found
+                       if not set)
+        :param resolution: Conversion resolution [bits] (9 to 12; the sensor's
+                           current one if not set)
+        :param backend: Sensor backend ("w1" or "simulator")
+        :param simulator: Simulated sensor parameters (see simulator.DS18B20)
+        """
+        super().__init__(name)
+        if resolution is not None:
+            self._check_resolution(resolution)
+
+        self._backend = backend
+        self._kwargs = simulator if backend == "simulator" else {"sensor" : sensor}
+        self._resolution = resolution
+
+        self._sensor: Any = None
+        self._executor: ThreadPoolExecutor = None  # sensor access
+        self._conversion: asyncio.Future = None  # conversion in progress
+
+    @staticmethod
+    def _check_resolution(bits: int) -> None:
+        if bits not in Thermometer.RESOLUTIONS:
+            raise ValueError(f"Invalid DS18B20 resolution: {bits}")
+
+    def setup(self) -> None:
+        """
+        Open the sensor, set resolution
+        """
+        self._sensor = sensor(self._backend, **self._kwargs)
+        if self._resolution is not None:
+            self._sensor.set_resolution(self._resolution)
+
+        log.info(f"{self.name}: DS18B20 {self._sensor.sensor}, "
+            f"resolution: {self._sensor.resolution()} bits")
+
+    async def started(self) -> None:
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix=f"{self.name}-sensor")
+        await super().started()
+
+    async def stopping(self) -> None:
+        self._executor.shutdown(wait=False)
+
+    async def _access(self, function, *args):
+        """
+        Access the sensor (by the sensor executor thread)
+        :param function: Sensor function
+        :param args: Function arguments
+        :return: Function result
+        """
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    def _converted(self, _: asyncio.Future) -> None:
+        self._conversion = None
+
+    async def temperature(self) -> float:
+        """
+        Read temperature
+        If a conversion is in progress, its result is awaited (rather than
+        starting another one).
+        :return: Temperature [deg C]
+        """
+        if self._conversion is None:
+            self._conversion = asyncio.ensure_future(self._access(self._sensor.read))
+            self._conversion.add_done_callback(self._converted)
+
+        # Cancelled reader mustn't cancel the conversion for the others
+        return await asyncio.shield(self._conversion)
+
+    async def get_state(self) -> Dict:  # type: ignore[override]
+        """
+        :return: Sensor ID, resolution [bits] and temperature [deg C]
+        """
+        return {
+            "sensor" : self._sensor.sensor,
+            "resolution" : await self._access(self._sensor.resolution),
+            "temperature" : await self.temperature(),
+        }
+
+    async def set_state(self, state: Dict) -> Dict:  # type: ignore[override]
+        """
+        :param state: State changes ("resolution" [bits])
+        :return: Current state
+        """
+        resolution = state.get("resolution")
+        if resolution is not None:
+            self._check_resolution(resolution)
+            await self._access(self._sensor.set_resolution, resolution)
+
+        return await self.get_state()
+
+    async def downstream(self, query: Dict) -> AsyncGenerator[Dict, None]:  # type: ignore[override]
+        """
+        Stream temperature readings
+        :param query: Query: "interval" [s] (default: 1; successive conversions
+                      if shorter than the conversion time), "duration" [s]
+                      (infinite stream by default)
+        :return: Asynchronous generator of readings
+        """
+        interval = float(query.get("interval", 1.0))
+        duration = query.get("duration", 0.0) or None
+
+        start = deadline = monotonic()
+        while duration is None or monotonic() - start < duration:
+            temperature = await self.temperature()
+            yield {"timestamp" : timestamp(), "temperature" : temperature}
+
+            deadline += interval
+            await asyncio.sleep(max(0.0, deadline - monotonic()))
@@ -1,7 +1,46 @@
+"""
+Logging set-up
+
+Logging is configured by the logging.ini file (WIPI_CONFIG environment
+variable overrides its path) or logs to stderr by default.
+
+Besides, the environment variables select
+* WIPI_LOG_QUEUE: non-blocking logging (queue size [records]): the records
+  are handed over to a background writer thread of each process via a queue
+  (and formatted by it); records are dropped (and their number reported
+  by the next one) if the queue is full (error records wait for space),
+* WIPI_LOG_RATE: rate limit [records/s] per call site (records of higher
+  level than WARNING aren't limited; the number of suppressed records is
+  reported by the next one),
+* WIPI_LOG_FORMAT: "json" for structured output (one JSON object per record),
+* WIPI_LOG_FIELDS: "0" leaves the text formatters as configured (the record
+  fields aren't appended).
+
+Pending records of the non-blocking logging are written at the process exit
+(by exit finalisers); processes exiting by os._exit (e.g. uWSGI workers)
+shall call flush before. Records of killed processes are lost.
+
+Hot paths shall log with lazy formatting (%-style arguments, which must not
+change after the call) and structured fields (see fields), e.g.:
+
+    log.info("Executing %s", name, extra=fields(lateness=0.001))
+
+The fields are appended to the message (as key=value) or set in the JSON object.
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+import json
 import logging
+import os
+from logging.handlers import QueueHandler, QueueListener
+from multiprocessing.util import Finalize
 from os import environ as env
 from os.path import dirname
 from pathlib import Path
+from datetime import date, datetime
+from queue import Queue, Full
+from threading import Lock
+from time import monotonic
 
 
 _etc = dirname(__file__) + "/../etc"
@@ -16,3 +55,280 @@ else:
 
 
 get_logger = logging.getLogger
+
+
+def fields(**kwargs) -> Dict[str, Dict[str, Any]]:
+    """
+    Structured log record fields
+    :param kwargs: Fields (values must not change after the call)
+    :return: Logging call extra argument
+    """
+    return {"fields": kwargs}
+
+
+def _record_fields(record: logging.LogRecord, **kwargs) -> None:
+    """
+    Add fields to log record (the caller's fields aren't changed)
+    :param record: Log record
+    :param kwargs: Fields
+    """
+    record.fields = dict(getattr(record, "fields", {}), **kwargs)
+
+
+class FieldsFormatter(logging.Formatter):
+    """
+    Text formatter appending the record fields (as key=value)
+    The text is formatted by the wrapped formatter (so its class and style
+    are kept).
+    """
+
+    def __init__(self, formatter: logging.Formatter = None):
+        """
+        :param formatter: Wrapped formatter (default: the logging default one)
+        """
+        super().__init__()
+        self.formatter = formatter or logging.Formatter()
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = self.formatter.format(record)
+        record_fields = getattr(record, "fields", None)
+        if not record_fields:
+            return text
+
+        return text + " " + " ".join(
+            f"{key}={FieldsFormatter._value(value)}" for key, value in record_fields.items())
+
+    @staticmethod
+    def _value(value: Any) -> str:
+        """
+        :param value: Field value
+        :return: Formatted value (strings are quoted, times in ISO format)
+        """
+        if isinstance(value, str):
+            return repr(value)
+
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+
+        return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Structured formatter (one JSON object per record)
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time" : record.created,
+            "level" : record.levelname,
+            "process" : record.process,
+            "logger" : record.name,
+            "message" : record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=lambda value:
+            value.isoformat() if isinstance(value, (datetime, date)) else str(value))
+
+
+class RateLimit(logging.Filter):
+    """
+    Rate limit per call site (token bucket)
+    Records of higher level than WARNING pass; the number of suppressed
+    records is reported by the next passed record of the call site
+    (as "suppressed" field).
+    """
+
+    def __init__(self, rate: float, burst: int = None):
+        """
+        :param rate: Records per second (per call site)
+        :param burst: Max. burst of records (default: rate, at least 1)
+        """
+        super().__init__()
+        self._rate = rate
+        self._burst = burst or max(1, int(rate))
+        self._sites: Dict[Tuple[str, int], List[float]] = {}  # tokens, last time, suppressed
+        self._lock = Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        verdict = getattr(record, "_rate_limit", None)
+        if verdict is not None:
+            return verdict  # already filtered (by another handler)
+
+        if record.levelno > logging.WARNING:
+            verdict = True
+
+        else:
+            now = monotonic()
+            with self._lock:
+                site = self._sites.setdefault((record.pathname, record.lineno), [self._burst, now, 0])
+                site[0] = min(self._burst, site[0] + (now - site[1]) * self._rate)
+                site[1] = now
+                verdict = site[0] >= 1.0
+                if verdict:
+                    site[0] -= 1.0
+                    suppressed, site[2] = int(site[2]), 0
+                    if suppressed:
+                        _record_fields(record, suppressed=suppressed)
+                else:
+                    site[2] += 1
+
+        record._rate_limit = verdict
+        return verdict
+
+
+class _Listener(QueueListener):
+    """
+    Background writer (waits for space for the termination sentinel)
+    """
+
+    def __init__(self, queue: Queue, *handlers: logging.Handler, respect_handler_level: bool = False):
+        super().__init__(queue, *handlers, respect_handler_level=respect_handler_level)
+        self._queue = queue
+
+    def enqueue_sentinel(self) -> None:
+        self._queue.put(None)  # QueueListener._sentinel
+
+
+class NonBlockingHandler(QueueHandler):
+    """
+    Handler passing records to background writer thread via queue
+    The records are formatted by the writer (i.e. lazily, so the logging
+    call arguments must not change after the call).
+    If the queue is full, records are dropped (error records wait).
+    Each process has its own writer (started again in a forked process
+    by its first record); pending records are written at the process exit
+    or by flush.
+    """
+
+    def __init__(self, handlers: List[logging.Handler], size: int):
+        """
+        :param handlers: Output handlers (used by the writer)
+        :param size: Queue size [records] (records are dropped if it's full)
+        """
+        self._queue: Queue = Queue(size)
+        super().__init__(self._queue)
+        self._handlers = handlers
+        self._pid: int = None
+        self._listener: _Listener = None
+        self.dropped = 0
+        self._start()
+
+    def _start(self) -> None:
+        """
+        Start writer (in the current process)
+        """
+        self._pid = os.getpid()
+        self._queue = Queue(self._queue.maxsize)  # a forked copy may be inconsistent
+        self.queue = self._queue
+        self._listener = _Listener(self._queue, *self._handlers, respect_handler_level=True)
+        self._listener.start()
+        self._listener._thread.name = "wipi.log"
+        Finalize(self, self._stop, exitpriority=-100)  # after other exit finalisers
+
+    def _stop(self) -> None:
+        """
+        Write pending records and stop writer
+        """
+        if self._pid == os.getpid() and self._listener._thread is not None:
+            if self.dropped:
+                self._queue.put(logging.LogRecord(
+                    __name__, logging.WARNING, __file__, 0, "%d log records dropped",
+                    (self.dropped,), None))
+                self.dropped = 0
+
+            self._listener.stop()
+            self._pid = None  # the next record starts the writer again
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record  # formatted by the writer
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._pid != os.getpid():
+            self._start()  # forked
+
+        if self.dropped:
+            _record_fields(record, dropped=self.dropped)
+
+        try:
+            self._queue.put(record, block=record.levelno > logging.WARNING)
+            self.dropped = 0
+        except Full:
+            self.dropped += 1
+
+    def flush(self) -> None:
+        """
+        Write pending records (the writer is stopped till the next record)
+        """
+        with self.lock:
+            self._stop()
+
+    def close(self) -> None:
+        self._stop()
+        super().close()
+
+
+_handlers: List[logging.Handler] = list(logging.getLogger().handlers)  # output handlers
+_formatters: Dict[logging.Handler, Optional[logging.Formatter]] = dict(
+    (handler, handler.formatter) for handler in _handlers)
+_entry: List[logging.Handler] = list(_handlers)  # handlers the root logger uses
+
+
+def configure(queue: int = 0, rate: float = 0.0, structured: bool = False,
+    fields: bool = True, handlers: List[logging.Handler] = None) -> None:
+    """
+    (Re)configure logging output
+    :param queue: Queue size [records] (0 means synchronous logging)
+    :param rate: Rate limit [records/s] per call site (0 means no limit)
+    :param structured: JSON output
+    :param fields: Append the record fields to text output (otherwise,
+                   the handlers' formatters are used as configured)
+    :param handlers: Output handlers (default: those configured at import)
+    """
+    global _entry
+
+    root = logging.getLogger()
+    for handler in _entry:
+        root.removeHandler(handler)
+        if isinstance(handler, NonBlockingHandler):
+            handler.close()  # pending records are written
+
+    if handlers is not None:
+        _handlers[:] = handlers
+
+    limit = RateLimit(rate) if rate > 0 else None
+    for handler in _handlers:
+        for old in [f for f in handler.filters if isinstance(f, RateLimit)]:
+            handler.removeFilter(old)
+
+        formatter = _formatters.setdefault(handler, handler.formatter)
+        if structured:
+            handler.setFormatter(JsonFormatter())
+        elif fields:
+            handler.setFormatter(FieldsFormatter(formatter))
+        else:
+            handler.setFormatter(formatter)
+
+    _entry = [NonBlockingHandler(_handlers, queue)] if queue > 0 else list(_handlers)
+    for handler in _entry:
+        if limit is not None:
+            handler.addFilter(limit)
+        root.addHandler(handler)
+
+
+def flush() -> None:
+    """
+    Write pending records (of non-blocking logging; see the module doc)
+    """
+    for handler in _entry:
+        handler.flush()
+
+
+configure(
+    queue=int(env.get("WIPI_LOG_QUEUE", 0)),
+    rate=float(env.get("WIPI_LOG_RATE", 0.0)),
+    structured=env.get("WIPI_LOG_FORMAT", "text") == "json",
+    fields=env.get("WIPI_LOG_FIELDS", "1") != "0")
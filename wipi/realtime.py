@@ -0,0 +1,217 @@
+from typing import Dict, List, Optional
+import ctypes
+import os
+import resource
+
+from wipi.log import get_logger
+
+
+log = get_logger(__name__)
+
+
+# Capabilities (see capabilities(7)) and mlockall flags (see mlockall(2))
+_CAP_IPC_LOCK = 14
+_CAP_SYS_NICE = 23
+_MCL_CURRENT = 1
+_MCL_FUTURE = 2
+
+
+def _capable(capability: int) -> bool:
+    """
+    :param capability: Capability number
+    :return: True if the process has the capability (effective)
+    """
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("CapEff:"):
+                    return bool(int(line.split()[1], 16) >> capability & 1)
+
+    except (OSError, ValueError, IndexError):
+        pass  # no procfs
+
+    return os.geteuid() == 0
+
+
+def _locked(pid: int) -> Optional[int]:
+    """
+    :param pid: Process ID
+    :return: Process locked memory size [B] (or None if not available)
+    """
+    try:
+        with open(f"/proc/{pid}/status") as status:
+            for line in status:
+                if line.startswith("VmLck:"):
+                    return int(line.split()[1]) * 1024  # reported in kB
+
+    except OSError:
+        pass  # no such process or no procfs
+
+    return None
+
+
+class Realtime:
+    """
+    Worker process real-time settings
+
+    Configured by the "realtime" controller (or scheduler) configuration:
+    * "cpus": CPU affinity (list of CPU numbers, e.g. a core reserved for
+      sampling by the isolcpus kernel parameter),
+    * "nice": nice level (-20 .. 19) or
+    * "fifo": SCHED_FIFO real-time priority (1 .. 99; the worker then
+      preempts any normal process, so it must not busy-wait for long),
+    * "mlock": lock the worker memory (so that it isn't paged out and page
+      faults don't delay it).
+
+    The settings are validated when the configuration is loaded (invalid ones
+    raise ValueError); settings the process lacks privileges for (CAP_SYS_NICE,
+    CAP_IPC_LOCK or the RTPRIO, NICE and MEMLOCK resource limits) are reported
+    as warnings, they're attempted anyway.
+    The worker applies the settings (see apply) when it starts, before
+    the controller setup, so that threads started by the worker (e.g.
+    acquisition, thread pool) inherit them.
+    """
+
+    _keys = ("cpus", "nice", "fifo", "mlock")
+
+    def __init__(self, name: str, config: Dict):
+        """
+        :param name: Worker (controller) name
+        :param config: Real-time settings
+        :raise ValueError: if the settings are invalid
+        """
+        self.name = name
+        self.config = dict(config)
+
+        unknown = set(self.config) - set(Realtime._keys)
+        if unknown:
+            raise ValueError(f"{name}: Unknown real-time settings: {', '.join(sorted(unknown))}")
+
+        self.cpus: Optional[List[int]] = self.config.get("cpus")
+        self.nice: Optional[int] = self.config.get("nice")
+        self.fifo: Optional[int] = self.config.get("fifo")
+        self.mlock = bool(self.config.get("mlock", False))
+
+        if self.cpus is not None:
+            if not isinstance(self.cpus, list) or not self.cpus or not all(type(cpu) is int for cpu in self.cpus):
+                raise ValueError(f"{name}: Invalid CPU affinity: {self.cpus}")
+
+            available = os.sched_getaffinity(0)
+            missing = sorted(set(self.cpus) - available)
+            if missing:
+                raise ValueError(
+                    f"{name}: CPUs {missing} aren't available (available: {sorted(available)})")
+
+        if self.nice is not None and self.fifo is not None:
+            raise ValueError(f"{name}: Nice level and SCHED_FIFO priority are exclusive")
+
+        if self.nice is not None and (type(self.nice) is not int or not -20 <= self.nice <= 19):
+            raise ValueError(f"{name}: Invalid nice level: {self.nice}")
+
+        if self.fifo is not None:
+            low, high = os.sched_get_priority_min(os.SCHED_FIFO), os.sched_get_priority_max(os.SCHED_FIFO)
+            if type(self.fifo) is not int or not low <= self.fifo <= high:
+                raise ValueError(f"{name}: Invalid SCHED_FIFO priority: {self.fifo} ({low} .. {high})")
+
+        self.warnings = self._check_privileges()
+        for warning in self.warnings:
+            log.warning(f"{name}: {warning}")
+
+    def _check_privileges(self) -> List[str]:
+        """
+        Check that the process may apply the settings
+        :return: Warnings (settings which are likely to fail)
+        """
+        warnings: List[str] = []
+
+        if self.fifo is not None and not _capable(_CAP_SYS_NICE):
+            limit = resource.getrlimit(resource.RLIMIT_RTPRIO)[0]
+            if limit != resource.RLIM_INFINITY and limit < self.fifo:
+                warnings.append(
+                    f"SCHED_FIFO priority {self.fifo} exceeds RTPRIO limit {limit} "
+                    "(and CAP_SYS_NICE is missing)")
+
+        if self.nice is not None and self.nice < os.getpriority(os.PRIO_PROCESS, 0) and \
+            not _capable(_CAP_SYS_NICE):
+            limit = resource.getrlimit(resource.RLIMIT_NICE)[0]
+            if limit != resource.RLIM_INFINITY and 20 - limit > self.nice:
+                warnings.append(
+                    f"Nice level {self.nice} is below the NICE limit {20 - limit} "
+                    "(and CAP_SYS_NICE is missing)")
+
+        if self.mlock and not _capable(_CAP_IPC_LOCK):
+            limit = resource.getrlimit(resource.RLIMIT_MEMLOCK)[0]
+            if limit != resource.RLIM_INFINITY:
+                warnings.append(
+                    f"Memory locking is limited to {limit // 1024} kB by MEMLOCK limit "
+                    "(and CAP_IPC_LOCK is missing)")
+
+        return warnings
+
+    def apply(self) -> List[str]:
+        """
+        Apply the settings to the calling process (its calling thread,
+        that is; threads started later inherit them)
+        Failures are logged (the worker runs with the settings which succeeded).
+        :return: Errors
+        """
+        errors: List[str] = []
+
+        def attempt(setting: str, action, *args) -> None:
+            try:
+                action(*args)
+            except OSError as x:
+                errors.append(f"{setting}: {x.strerror or x}")
+
+        if self.cpus is not None:
+            attempt("cpus", os.sched_setaffinity, 0, self.cpus)
+        if self.fifo is not None:
+            attempt("fifo", os.sched_setscheduler, 0, os.SCHED_FIFO, os.sched_param(self.fifo))
+        if self.nice is not None:
+            attempt("nice", os.setpriority, os.PRIO_PROCESS, 0, self.nice)
+        if self.mlock:
+            attempt("mlock", Realtime._mlockall)
+
+        if errors:
+            log.warning(f"{self.name}: Real-time settings failed: {'; '.join(errors)}")
+        else:
+            log.info(f"{self.name}: Real-time settings applied: {self.config}")
+
+        return errors
+
+    @staticmethod
+    def _mlockall() -> None:
+        """
+        Lock the process memory (current and future mappings)
+        :raise OSError: if it fails
+        """
+        libc = ctypes.CDLL(None, use_errno=True)
+        if libc.mlockall(_MCL_CURRENT | _MCL_FUTURE) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    @staticmethod
+    def current(pid: int) -> Optional[Dict]:
+        """
+        Current settings of a process (as seen by the kernel)
+        :param pid: Process ID
+        :return: CPU affinity ("cpus"), scheduling "policy" ("fifo", "other"...),
+                 "priority" (real-time), "nice" level and "locked" memory [B]
+                 or None if the process doesn't exist
+        """
+        policies = {
+            os.SCHED_OTHER : "other", os.SCHED_FIFO : "fifo", os.SCHED_RR : "rr",
+            os.SCHED_BATCH : "batch", os.SCHED_IDLE : "idle",
+        }
+
+        try:
+            return {
+                "cpus" : sorted(os.sched_getaffinity(pid)),
+                "policy" : policies.get(os.sched_getscheduler(pid), "unknown"),
+                "priority" : os.sched_getparam(pid).sched_priority,
+                "nice" : os.getpriority(os.PRIO_PROCESS, pid),
+                "locked" : _locked(pid),
+            }
+
+        except OSError:
+            return None  # no such process
@@ -1,22 +1,32 @@
 from __future__ import annotations
-from typing import Callable, List, Union, Optional
+from typing import Callable, Dict, List, Tuple, Union, Optional
 from multiprocessing import Process, Pipe, Lock
 from multiprocessing.connection import Connection
-from functools import total_ordering
+from multiprocessing.sharedctypes import RawValue, RawArray
+from functools import total_ordering, partial
 from heapq import heappush, heappop
 from datetime import datetime, timedelta
+from math import sqrt
+import os
 
-from wipi.log import get_logger
+from wipi.log import get_logger, fields
+from wipi.realtime import Realtime
+from wipi.supervisor import Supervised, Restarts
+from wipi.util import sequence, receive
 
 
 log = get_logger(__name__)
 
 
-class Scheduler:
+class Scheduler(Supervised):
     """
     Deferred actions scheduler
     Tasks are executed in a separate worker at specified times.
     They may be added at any time.
+    The worker is supervised (see wipi.supervisor); note that if it crashes,
+    the scheduled tasks are lost.
+    The worker may run with real-time settings (see wipi.realtime);
+    the task execution lateness is measured (see timing).
     """
 
     @total_ordering
@@ -34,6 +44,7 @@ class Scheduler:
                        default is now)
             """
             self.action = action
+            self.name = Scheduler.Task.Description(action)  # for logging
 
             if at is None:
                 at = datetime.now()
@@ -42,6 +53,26 @@ class Scheduler:
 
             self.forever_interval: timedelta = None
 
+        class Description:
+            """
+            Task action description (function name and keyword arguments)
+            It's only built when formatted, i.e. when a log record is emitted.
+            """
+
+            def __init__(self, action: Callable):
+                """
+                :param action: Task action
+                """
+                self.action = action
+
+            def __str__(self) -> str:
+                action = self.action
+                if isinstance(action, partial):
+                    keywords = ", ".join(f"{key}={value!r}" for key, value in action.keywords.items())
+                    return f"{Scheduler.Task.Description(action.func)}({keywords})"
+
+                return getattr(action, "__qualname__", repr(action))
+
         def repeat(self, times: Union[int, str], interval: float) -> Scheduler.Task:
             """
             Set task repetition
@@ -80,7 +111,7 @@ class Scheduler:
             """
             action = self.action
 
-            log.info(f"Executing {self}: {action}({args}, {kwargs})")
+            log.info("Executing %s", self.name, extra=fields(at=self.at[0], remaining=len(self.at) - 1))
             action(*args, **kwargs)
 
             exec_time = self.at.pop(0)
@@ -121,14 +152,22 @@ class Scheduler:
                             the query result
             """
             self.pipe_we = pipe_we
+            self.seq = sequence()
 
     _shutdown = "shutdown"  # worker shutdown sentinel
     _cancel = "cancel"      # scheduled tasks cancelation sentinel
 
-    def __init__(self, args: List = [], kwargs: Dict = {}):
+    # Timing fields
+    _EXECUTED = 0
+    _LATENESS_MEAN = 1
+    _LATENESS_M2 = 2    # sum of squared lateness deviations
+    _LATENESS_MAX = 3
+
+    def __init__(self, args: List = [], kwargs: Dict = {}, realtime: Dict = None):
         """
         :param args: Arguments passed to the task action
         :param kwargs: Arguments passed to the task action
+        :param realtime: Worker real-time settings (see wipi.realtime)
         """
         rend, wend = Pipe(duplex=False)
 
@@ -140,6 +179,13 @@ class Scheduler:
         self._worker = Process(
             name=self.__class__.__name__,
             target=self._worker_routine)
+        self._owner_pid: int = None  # the process which started the worker
+        self._stopped = False
+        self._pid = RawValue('i', 0)      # worker process ID (shared)
+        self._crashes = RawValue('i', 0)  # worker crash counter (see tasks)
+        self._timing = RawArray('d', 4)   # task execution lateness (written by the worker)
+        self._realtime = None if realtime is None else Realtime(self.__class__.__name__, realtime)
+        self.restarts = Restarts()
 
         log.info("Scheduler created")
 
@@ -160,11 +206,64 @@ class Scheduler:
         Start scheduler worker
         :return: self
         """
+        self._owner_pid = os.getpid()
+        self._worker = Process(name=self._worker.name, target=self._worker_routine)
         self._worker.start()
         log.info("Scheduler started")
 
         return self
 
+    @property
+    def pid(self) -> int:
+        """
+        :return: Worker process ID (None if not started)
+        """
+        return self._pid.value or None
+
+    def timing(self) -> Dict:
+        """
+        Task execution timing (since the scheduler start)
+        :return: Number of "executed" tasks, mean and max. execution
+                 "lateness" (actual vs. scheduled time) and "jitter"
+                 (lateness std. deviation) [s]
+        """
+        timing = self._timing[:]
+        executed = int(timing[Scheduler._EXECUTED])
+        return {
+            "executed" : executed,
+            "lateness" : timing[Scheduler._LATENESS_MEAN],
+            "max_lateness" : timing[Scheduler._LATENESS_MAX],
+            "jitter" : sqrt(timing[Scheduler._LATENESS_M2] / executed) if executed else 0.0,
+        }
+
+    def realtime_status(self) -> Optional[Dict]:
+        """
+        Worker real-time settings
+        :return: Configured settings ("config"), startup "warnings" and
+                 the current settings of the worker ("worker", see
+                 Realtime.current) or None if not configured
+        """
+        if self._realtime is None:
+            return None
+
+        return {
+            "config" : self._realtime.config,
+            "warnings" : self._realtime.warnings,
+            "worker" : Realtime.current(self.pid) if self.pid is not None else None,
+        }
+
+    def _account(self, lateness: float) -> None:
+        """
+        Update task execution timing (in the worker)
+        :param lateness: Execution lateness [s]
+        """
+        timing = self._timing
+        timing[Scheduler._EXECUTED] += 1
+        delta = lateness - timing[Scheduler._LATENESS_MEAN]
+        timing[Scheduler._LATENESS_MEAN] += delta / timing[Scheduler._EXECUTED]
+        timing[Scheduler._LATENESS_M2] += delta * (lateness - timing[Scheduler._LATENESS_MEAN])
+        timing[Scheduler._LATENESS_MAX] = max(timing[Scheduler._LATENESS_MAX], lateness)
+
     def schedule(self, task: Scheduler.Task) -> None:
         """
         Schedule task
@@ -176,9 +275,12 @@ class Scheduler:
         """
         :param pipe: multiprocessing.Pipe read & write ends (in that order)
         :return: List of scheduled tasks (in order of scheduled execution times)
+        :raise ConnectionAbortedError: if the worker crashed
         """
-        self._send(Scheduler.TasksQuery(pipe[1]))
-        return pipe[0].recv();
+        query = Scheduler.TasksQuery(pipe[1])
+        crashes = self._crashes.value
+        self._send(query)
+        return receive(pipe[0], query.seq, lambda: self._crashes.value != crashes)
 
     def cancel(self) -> None:
         """
@@ -190,13 +292,54 @@ class Scheduler:
         """
         Stop scheduler worker
         """
+        self._stopped = True
         self._send(Scheduler._shutdown)
         self._worker.join()
 
         log.info("Scheduler stopped")
 
+    def processes(self) -> List[Process]:
+        """
+        :return: Worker process (supervised, see wipi.supervisor)
+        """
+        return [self._worker]
+
+    def expected(self, index: int, process: Process) -> bool:
+        """
+        :param index: Worker process index
+        :param process: Terminated worker process
+        :return: True if the worker was stopped (or replaced)
+        """
+        return self._stopped or process is not self._worker
+
+    def crashed(self, index: int, exitcode: int) -> None:
+        """
+        Handle worker crash (called by the supervisor)
+        Pending tasks queries fail (see tasks).
+        :param index: Worker process index
+        :param exitcode: Worker exit code
+        """
+        self._pid.value = 0
+        self._crashes.value += 1
+        self.restarts.crashed(exitcode)
+        log.warning(f"Worker crashed (exit code {exitcode}), scheduled tasks are lost")
+
+    def respawn(self, index: int) -> None:
+        """
+        Start new worker process (called by the supervisor)
+        :param index: Worker process index
+        """
+        if not self._stopped:
+            self._worker = Process(name=self._worker.name, target=self._worker_routine)
+            self._worker.start()
+            log.info("Worker respawned")
+
     def _worker_routine(self) -> None:
         log.info("Worker starts")
+        if self._realtime is not None:
+            self._realtime.apply()
+        self._pid.value = os.getpid()
+        self.restarts.recovered()
 
         try:
             tasks: List[Scheduler.Task] = []
@@ -215,29 +358,30 @@ class Scheduler:
 
                         # Cancel all scheduled tasks
                         if task == Scheduler._cancel:
-                            log.info(f"Cancelling {len(tasks)} scheduled tasks")
+                            log.info("Cancelling %d scheduled tasks", len(tasks))
                             tasks = []
 
                     # State query
                     elif isinstance(task, Scheduler.TasksQuery):
-                        task.pipe_we.send(sorted(tasks))
+                        task.pipe_we.send((task.seq, sorted(tasks)))
 
                     # Schedule task
                     else:
                         assert isinstance(task, Scheduler.Task)
 
-                        log.info(f"Scheduling {task}")
+                        log.info("Scheduling %s", task.name, extra=fields(at=task.at[0], times=len(task.at)))
                         heappush(tasks, task)
 
                 # An action is due
                 else:
                     while len(tasks) > 0 and tasks[0].at[0] <= datetime.now():
+                        self._account((datetime.now() - tasks[0].at[0]).total_seconds())
                         task = heappop(tasks).execute(
                             args=self._args, kwargs=self._kwargs)
 
                         # Reschedule
                         if task is not None:
-                            log.info(f"Rescheduling {task}")
+                            log.info("Rescheduling %s", task.name, extra=fields(at=task.at[0]))
                             heappush(tasks, task)
 
                 # Set polling timeout (i.e. time to earliest task execution)
@@ -252,5 +396,5 @@ class Scheduler:
         log.info("Worker terminates")
 
     def __del__(self):
-        if self._worker.is_alive():
+        if self._owner_pid == os.getpid() and not self._stopped and self._worker.is_alive():
             self.stop()
@@ -0,0 +1,312 @@
+from __future__ import annotations
+from typing import Callable, Dict, List, Tuple, Iterable
+from abc import ABC, abstractmethod
+from multiprocessing import Process, Pipe, Lock
+from multiprocessing.connection import Connection, wait
+from multiprocessing.sharedctypes import RawArray
+from time import monotonic
+from weakref import WeakSet
+import heapq
+
+from wipi.log import get_logger
+from wipi.util import sequence, receive
+
+
+log = get_logger(__name__)
+
+
+class Restarts:
+    """
+    Worker restarts statistics (in shared memory)
+    Written by the supervisor (crashes) and the worker (recovery), read
+    by any process.
+    """
+
+    # Fields
+    _RESTARTS = 0
+    _EXITCODE = 1
+    _CRASHED = 2    # last crash time (monotonic clock)
+    _DOWN = 3       # down since (monotonic clock, 0 if up)
+    _RECOVERY = 4   # last recovery time [s]
+    _RECOVERY_MAX = 5
+
+    def __init__(self):
+        self._stats = RawArray('d', 6)
+
+    def crashed(self, exitcode: int) -> None:
+        """
+        Record worker crash (called by the supervisor)
+        :param exitcode: Worker exit code (negative signal number if killed)
+        """
+        now = monotonic()
+        self._stats[Restarts._RESTARTS] += 1
+        self._stats[Restarts._EXITCODE] = exitcode
+        self._stats[Restarts._CRASHED] = now
+        if not self._stats[Restarts._DOWN]:
+            self._stats[Restarts._DOWN] = now
+
+    def recovered(self) -> None:
+        """
+        Record worker recovery (called by the worker once it's ready)
+        """
+        down = self._stats[Restarts._DOWN]
+        if down:
+            recovery = monotonic() - down
+            self._stats[Restarts._RECOVERY] = recovery
+            self._stats[Restarts._RECOVERY_MAX] = max(self._stats[Restarts._RECOVERY_MAX], recovery)
+            self._stats[Restarts._DOWN] = 0.0
+
+    def stats(self) -> Dict:
+        """
+        :return: Number of "restarts", "exitcode" and time since the last crash
+                 ("crashed_ago" [s]), whether the worker is "down" and the last
+                 and max. "recovery" time (crash till ready again) [s]
+                 (None if not applicable)
+        """
+        stats = self._stats[:]
+        restarts = int(stats[Restarts._RESTARTS])
+        return {
+            "restarts" : restarts,
+            "exitcode" : int(stats[Restarts._EXITCODE]) if restarts else None,
+            "crashed_ago" : monotonic() - stats[Restarts._CRASHED] if restarts else None,
+            "down" : bool(stats[Restarts._DOWN]),
+            "recovery" : {
+                "last" : stats[Restarts._RECOVERY] if stats[Restarts._RECOVERY] else None,
+                "max" : stats[Restarts._RECOVERY_MAX] if stats[Restarts._RECOVERY_MAX] else None,
+            },
+        }
+
+
+class Supervised(ABC):
+    """
+    Object which workers are supervised (interface)
+    """
+
+    @abstractmethod
+    def processes(self) -> List[Process]:
+        """
+        :return: Worker processes (index is the worker index)
+        """
+
+    @abstractmethod
+    def expected(self, index: int, process: Process) -> bool:
+        """
+        :param index: Worker process index
+        :param process: Terminated worker process
+        :return: True if the process exit was expected (e.g. the worker
+                 was stopped)
+        """
+
+    @abstractmethod
+    def crashed(self, index: int, exitcode: int) -> None:
+        """
+        Handle worker crash (e.g. fail queued requests)
+        :param index: Worker process index
+        :param exitcode: Worker exit code
+        """
+
+    @abstractmethod
+    def respawn(self, index: int) -> None:
+        """
+        Start new worker process
+        :param index: Worker process index
+        """
+
+
+class Supervisor:
+    """
+    Workers supervisor
+
+    The supervisor process starts the (controller and scheduler) workers,
+    so that it's their parent: it learns about a worker death at once
+    (by the process sentinel) and respawns the worker, with exponential
+    backoff if it keeps crashing (see Supervised).
+
+    Besides, the supervisor executes reconfiguration requests (see
+    wipi.api.Backend.reload); it's forked before the API workers, so that
+    the controller workers it starts later are reachable by all of them.
+    """
+
+    BACKOFF_MIN = 0.1     # first respawn delay [s]
+    BACKOFF_MAX = 30.0    # max. respawn delay [s]
+    BACKOFF_RESET = 60.0  # worker running this long is considered stable [s]
+
+    class Request:
+        """
+        Reconfiguration request
+        """
+
+        def __init__(self, config: Dict, pipe_we: Connection):
+            """
+            :param config: New configuration (None means re-read the file)
+            :param pipe_we: Writing end of multiprocessing.Pipe where to write
+                            the request result (tagged by the request sequence
+                            number)
+            """
+            self.config = config
+            self.pipe_we = pipe_we
+            self.seq = sequence()
+
+    _shutdown = "shutdown"  # worker shutdown sentinel
+
+    def __init__(self,
+        start: Callable[[], None],
+        supervised: Callable[[], Iterable[Supervised]],
+        reconfigure: Callable[[Dict], Dict],
+        cleanup: Callable[[], None],
+        shutdown: Callable[[], None]):
+        """
+        :param start: Starts the workers (executed by the supervisor)
+        :param supervised: Provides the supervised objects (see above)
+        :param reconfigure: Reconfiguration (executed by the supervisor; gets
+                            the new configuration, returns the result)
+        :param cleanup: Executed by the supervisor after reconfiguration result
+                        is sent (e.g. joining stopped controller workers)
+        :param shutdown: Stops the workers (executed by the supervisor when
+                         it terminates)
+        """
+        rend, wend = Pipe(duplex=False)
+
+        self._start = start
+        self._supervised = supervised
+        self._reconfigure = reconfigure
+        self._cleanup = cleanup
+        self._shutdown_action = shutdown
+        self._pipe_re = rend
+        self._pipe_we = wend
+        self._pipe_wl = Lock()
+        self._worker = Process(
+            name=self.__class__.__name__,
+            target=self._worker_routine)
+
+        log.info("Supervisor created")
+
+    def start(self) -> Supervisor:
+        """
+        Start supervisor worker
+        :return: self
+        """
+        self._worker.start()
+        log.info("Supervisor started")
+
+        return self
+
+    @property
+    def pid(self) -> int:
+        """
+        :return: Worker process ID (None if not started)
+        """
+        return self._worker.pid
+
+    def reload(self, config: Dict, pipe: Tuple[Connection, Connection]) -> Dict:
+        """
+        Reconfigure controllers
+        :param config: New configuration (None means re-read the file)
+        :param pipe: multiprocessing.Pipe read & write ends (in that order)
+        :return: Reconfiguration result
+        :raise ConnectionAbortedError: if the supervisor is gone
+        """
+        request = Supervisor.Request(config, pipe[1])
+        with self._pipe_wl:
+            self._pipe_we.send(request)
+
+        # The pipe is shared with other requests; the supervisor process
+        # sentinel is ready once it's gone
+        return receive(pipe[0], request.seq, lambda: bool(wait([self._worker.sentinel], 0.0)))
+
+    def stop(self) -> None:
+        """
+        Stop supervisor worker (and the supervised workers)
+        """
+        with self._pipe_wl:
+            self._pipe_we.send(Supervisor._shutdown)
+        self._worker.join()
+
+        log.info("Supervisor stopped")
+
+    def _request(self) -> bool:
+        """
+        Execute reconfiguration request
+        :return: False if shutdown is requested
+        """
+        request = self._pipe_re.recv()
+        if request == Supervisor._shutdown:
+            return False
+
+        assert isinstance(request, Supervisor.Request)
+        try:
+            result = self._reconfigure(request.config)
+
+        except Exception as x:
+            log.error(f"Reconfiguration failed: {x}")
+            result = {"error" : str(x)}
+
+        request.pipe_we.send((request.seq, result))
+        self._cleanup()
+
+        return True
+
+    def _worker_routine(self) -> None:
+        log.info("Worker starts")
+
+        seen: WeakSet = WeakSet()  # supervised processes (incl. the dead ones)
+        watched: Dict[int, Tuple[Supervised, int, Process]] = {}  # by sentinel
+        crashes: Dict[Tuple[int, int], Tuple[int, float]] = {}  # consecutive crashes, respawn time
+        respawns: List[Tuple[float, int, Supervised, int]] = []  # heap of (due time, seq, object, index)
+
+        def watch() -> None:
+            for supervised in self._supervised():
+                for index, process in enumerate(supervised.processes()):
+                    if process.pid is not None and process not in seen:
+                        seen.add(process)
+                        watched[process.sentinel] = (supervised, index, process)
+
+        try:
+            self._start()
+            watch()
+
+            while True:
+                timeout = None if not respawns else max(0.0, respawns[0][0] - monotonic())
+                ready = wait([self._pipe_re, *watched.keys()], timeout)
+
+                if self._pipe_re in ready:
+                    if not self._request():
+                        break
+
+                for sentinel in ready:
+                    if sentinel not in watched:
+                        continue
+
+                    supervised, index, process = watched.pop(sentinel)
+                    process.join()
+                    if supervised.expected(index, process):
+                        continue
+
+                    # Exponential backoff (reset if the worker ran long enough)
+                    key = (id(supervised), index)
+                    count, respawned = crashes.get(key, (0, 0.0))
+                    if monotonic() - respawned > Supervisor.BACKOFF_RESET:
+                        count = 0
+                    delay = min(Supervisor.BACKOFF_MAX, Supervisor.BACKOFF_MIN * 2 ** count)
+                    crashes[key] = (count + 1, respawned)
+
+                    log.error(f"{process.name} crashed (exit code {process.exitcode}), "
+                        f"respawning in {delay:.1f} s")
+                    supervised.crashed(index, process.exitcode)
+                    heapq.heappush(respawns, (monotonic() + delay, id(process), supervised, index))
+
+                while respawns and respawns[0][0] <= monotonic():
+                    _, _, supervised, index = heapq.heappop(respawns)
+                    key = (id(supervised), index)
+                    crashes[key] = (crashes[key][0], monotonic())
+                    supervised.respawn(index)
+
+                watch()
+
+        except KeyboardInterrupt:
+            pass  # interrupted by SIGINT
+
+        finally:
+            self._shutdown_action()
+
+        log.info("Worker terminates")
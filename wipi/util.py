@@ -1,4 +1,9 @@
+from typing import Any, Callable, Dict, Hashable, Optional
+from multiprocessing.connection import Connection
+from itertools import count
+import os
 import re
+import time
 
 _sc_re = re.compile(r'(?<!^)(?=[A-Z])')
 
@@ -10,3 +15,103 @@ def cc2sc(cc_str: str) -> str:
     :return: String in snake_case
     """
     return '.'.join([re.sub(_sc_re, '_', t).lower() for t in cc_str.split('.')])
+
+
+def rss(pid: int = None) -> int:
+    """
+    Process resident set size
+    :param pid: Process ID (default is the current process)
+    :return: Resident set size [B] (or None if not available)
+    """
+    try:
+        with open(f"/proc/{'self' if pid is None else pid}/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024  # reported in kB
+
+    except OSError:
+        pass  # no such process or no procfs
+
+    return None
+
+
+def memory(pid: int = None) -> dict:
+    """
+    Process memory usage
+    Unlike RSS, proportional set size (PSS) splits pages shared among processes
+    (e.g. copy-on-write pages of forked workers) among the sharers; private
+    size counts pages used by the process only.
+    :param pid: Process ID (default is the current process)
+    :return: RSS, PSS and private size [B] (PSS and private size are None
+             if not available), or None if the process doesn't exist
+    """
+    fields = {"Rss:": "rss", "Pss:": "pss", "Private_Clean:": "private", "Private_Dirty:": "private"}
+    usage: Dict[str, Optional[int]] = {"rss": None, "pss": None, "private": None}
+    try:
+        with open(f"/proc/{'self' if pid is None else pid}/smaps_rollup") as smaps:
+            for line in smaps:
+                field = fields.get(line.split(None, 1)[0])
+                if field is not None:
+                    usage[field] = (usage[field] or 0) + int(line.split()[1]) * 1024  # kB
+
+        return usage
+
+    except OSError:
+        pass  # no such process or kernel too old
+
+    usage["rss"] = rss(pid)
+    return usage if usage["rss"] is not None else None
+
+
+def started(pid: int = None) -> float:
+    """
+    Process start time
+    :param pid: Process ID (default is the current process)
+    :return: Process start time (monotonic clock) [s] (or None if not available)
+    """
+    try:
+        with open(f"/proc/{'self' if pid is None else pid}/stat") as stat:
+            # starttime is the 22nd field (20th after the parenthesised comm)
+            ticks = int(stat.read().rsplit(')', 1)[1].split()[19])
+
+        since = time.clock_gettime(time.CLOCK_BOOTTIME) - ticks / os.sysconf("SC_CLK_TCK")
+        return time.monotonic() - since
+
+    except (OSError, ValueError, IndexError):
+        return None  # no such process or no procfs
+
+
+_sequence = count(1)
+
+
+def sequence() -> int:
+    """
+    Request sequence number
+    The numbers are unique in the process, so that replies to requests
+    of any kind may come by the same pipe (see receive).
+    :return: Next sequence number
+    """
+    return next(_sequence)
+
+
+def receive(conn: Connection, seq: Hashable, failed: Callable[[], bool], interval: float = 0.1) -> Any:
+    """
+    Receive reply to a request sent to a worker
+    Replies are (seq, payload) pairs; replies to other (abandoned) requests
+    are discarded.
+    :param conn: Reading end of the replies pipe
+    :param seq: Request sequence number (or other tag)
+    :param failed: Tells that the request won't be replied (e.g. the worker
+                   crashed; checked when no reply comes in the interval)
+    :param interval: Check interval [s]
+    :return: Reply payload
+    :raise ConnectionAbortedError: if the request failed
+    """
+    while True:
+        if conn.poll(interval):
+            reply_seq, payload = conn.recv()
+            if reply_seq == seq:
+                return payload
+
+        elif failed():
+            raise ConnectionAbortedError("Worker crashed")